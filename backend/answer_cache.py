@@ -0,0 +1,347 @@
+# backend/answer_cache.py
+"""
+Caché de respuestas en dos niveles para preguntas repetidas.
+
+1. Exacto: clave = pregunta normalizada + modo + versión del prompt + k +
+   historial + versión del índice.
+2. Semántico: dentro del mismo ámbito (todo lo anterior salvo la pregunta),
+   reutiliza una respuesta si el embedding de la consulta está a una
+   distancia coseno <= ANSWER_CACHE_SEMANTIC_DISTANCE de uno ya cacheado.
+
+Expulsión por TTL y LRU. Cuando la ingesta publica una nueva versión del
+índice (current.json, o manifest.json en índices sin versiones), la caché
+se vacía sola.
+
+Las rutas asíncronas usan aget() / aput(): leer la versión del índice y
+consultar el almacén compartido es E/S bloqueante y no debe ir en el event
+loop.
+
+Con varios workers, las entradas se escriben también en el almacén
+compartido (CACHE_BACKEND, ver shared_store.py): un fallo exacto en memoria
+se consulta ahí antes de darlo por fallo, y el acierto se copia a la memoria
+del worker. El nivel semántico trabaja sobre la memoria de cada worker. La
+versión del índice forma parte de la clave, así que las entradas de
+versiones anteriores del almacén compartido nunca se reutilizan.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.config import (
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_MAX_ITEMS,
+    ANSWER_CACHE_TTL_S,
+    ANSWER_CACHE_SEMANTIC_DISTANCE,
+)
+from backend.index_versions import current_version, pointer_path
+from backend.manifest import load_manifest, manifest_path
+from backend.shared_store import open_shared_store
+
+_PUNCT_EDGES = "¿?¡!.,;:…\"'«» "
+
+
+def normalize_question(text: str) -> str:
+    """Minúsculas, espacios colapsados y sin signos de puntuación en los bordes."""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = re.sub(r"\s+", " ", text)
+    return text.strip(_PUNCT_EDGES)
+
+
+def prompt_version(prompt: str) -> str:
+    """Versión de un prompt = hash corto de su texto (cambia si se edita)."""
+    return hashlib.sha256((prompt or "").encode("utf-8")).hexdigest()[:12]
+
+
+def _digest(payload: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class _Entry:
+    value: Dict[str, Any]
+    scope: str
+    vector: Optional[np.ndarray]
+    expires_at: float
+
+
+class AnswerCache:
+    """Caché LRU+TTL con nivel exacto y nivel semántico (coseno)."""
+
+    def __init__(
+        self,
+        max_items: int = ANSWER_CACHE_MAX_ITEMS,
+        ttl_s: float = ANSWER_CACHE_TTL_S,
+        semantic_distance: float = ANSWER_CACHE_SEMANTIC_DISTANCE,
+        store: Any = None,
+    ):
+        self.max_items = max_items
+        self.store = store
+        self.ttl_s = ttl_s
+        self.semantic_distance = semantic_distance
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._scope_index: Dict[str, Tuple[List[str], Optional[np.ndarray]]] = {}
+        self._lock = threading.Lock()
+        self._index_version: Optional[str] = None
+        self._manifest_mtime: Optional[float] = None
+        self.counters = {
+            "hits_exact": 0,
+            "hits_semantic": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+            "hits_shared": 0,
+            "shared_errors": 0,
+        }
+
+    # ========================================
+    # Versión del índice (invalidación)
+    # ========================================
+
+    def _check_index_version(self) -> Optional[str]:
+        """
+        Relee la versión del índice solo si cambió el mtime de current.json
+        (o del manifiesto si no existe). Si la versión cambia, vacía la caché.
+        """
+        pointer = pointer_path()
+        path = pointer if pointer.exists() else manifest_path()
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            mtime = None
+
+        if mtime != self._manifest_mtime:
+            self._manifest_mtime = mtime
+            if path == pointer:
+                version = current_version()
+            else:
+                manifest = load_manifest() if mtime is not None else None
+                version = manifest.get("index_version") if manifest else None
+            if version != self._index_version:
+                if self._entries:
+                    self.counters["invalidations"] += 1
+                self._entries.clear()
+                self._scope_index.clear()
+                self._index_version = version
+        return self._index_version
+
+    # ========================================
+    # Claves
+    # ========================================
+
+    def _keys(self, question: str, scope: Dict[str, Any]) -> Tuple[str, str]:
+        scope_key = _digest({**scope, "index_version": self._index_version})
+        exact_key = _digest({"scope": scope_key, "q": normalize_question(question)})
+        return exact_key, scope_key
+
+    # ========================================
+    # API
+    # ========================================
+
+    def get(
+        self,
+        question: str,
+        scope: Dict[str, Any],
+        embedding: Optional[Sequence[float]] = None,
+        count_miss: bool = True,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Busca una respuesta cacheada. Devuelve una copia del dict con
+        "cache": "exact" | "semantic", o None si no hay acierto.
+        - embedding: si se pasa, también se consulta el nivel semántico.
+        - count_miss: False para sondeos previos que se repetirán después.
+        """
+        with self._lock:
+            self._check_index_version()
+            exact_key, scope_key = self._keys(question, scope)
+            now = time.time()
+
+            entry = self._entries.get(exact_key)
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(exact_key)
+                self.counters["hits_exact"] += 1
+                return {**entry.value, "cache": "exact"}
+
+        # Fuera del lock: la consulta al almacén compartido es E/S
+        shared = self._shared_get(exact_key) if self.store is not None else None
+
+        with self._lock:
+            now = time.time()
+            if shared is not None and shared.expires_at > now:
+                self._insert(exact_key, shared)
+                self.counters["hits_exact"] += 1
+                self.counters["hits_shared"] += 1
+                return {**shared.value, "cache": "exact"}
+
+            if embedding is not None and self.semantic_distance > 0:
+                hit = self._semantic_lookup(scope_key, np.asarray(embedding, dtype=np.float32), now)
+                if hit is not None:
+                    self.counters["hits_semantic"] += 1
+                    return {**hit.value, "cache": "semantic"}
+
+            if count_miss:
+                self.counters["misses"] += 1
+            return None
+
+    async def aget(
+        self,
+        question: str,
+        scope: Dict[str, Any],
+        embedding: Optional[Sequence[float]] = None,
+        count_miss: bool = True,
+    ) -> Optional[Dict[str, Any]]:
+        """get() en un hilo: la versión del índice y el almacén compartido son E/S."""
+        return await asyncio.to_thread(self.get, question, scope, embedding, count_miss)
+
+    def _scope_matrix(self, scope_key: str) -> Tuple[List[str], Optional[np.ndarray]]:
+        """
+        Matriz (n, dim) con los vectores de un ámbito. Se reconstruye solo
+        cuando el ámbito cambia (put / expulsión), no en cada consulta.
+        """
+        cached = self._scope_index.get(scope_key)
+        if cached is None:
+            keys = [
+                key for key, entry in self._entries.items()
+                if entry.scope == scope_key and entry.vector is not None
+            ]
+            matrix = np.stack([self._entries[k].vector for k in keys]) if keys else None
+            cached = self._scope_index[scope_key] = (keys, matrix)
+        return cached
+
+    def _semantic_lookup(self, scope_key: str, query: np.ndarray, now: float) -> Optional[_Entry]:
+        keys, matrix = self._scope_matrix(scope_key)
+        norm = np.linalg.norm(query)
+        if matrix is None or norm == 0:
+            return None
+
+        sims = matrix @ (query / norm)
+        for best in np.argsort(-sims)[:3]:
+            if 1.0 - float(sims[best]) > self.semantic_distance:
+                return None
+            entry = self._entries.get(keys[best])
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(keys[best])
+                return entry
+        return None
+
+    def put(
+        self,
+        question: str,
+        scope: Dict[str, Any],
+        value: Dict[str, Any],
+        embedding: Optional[Sequence[float]] = None,
+    ) -> None:
+        vector = None
+        if embedding is not None:
+            vector = np.asarray(embedding, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            vector = vector / norm if norm else None
+
+        with self._lock:
+            self._check_index_version()
+            exact_key, scope_key = self._keys(question, scope)
+            entry = _Entry(
+                value={k: v for k, v in value.items() if k not in ("timings", "cache")},
+                scope=scope_key,
+                vector=vector,
+                expires_at=time.time() + self.ttl_s,
+            )
+            self._insert(exact_key, entry)
+            self.counters["stores"] += 1
+
+        if self.store is not None:
+            self._shared_put(exact_key, entry)
+
+    async def aput(
+        self,
+        question: str,
+        scope: Dict[str, Any],
+        value: Dict[str, Any],
+        embedding: Optional[Sequence[float]] = None,
+    ) -> None:
+        """put() en un hilo, por lo mismo que aget()."""
+        await asyncio.to_thread(self.put, question, scope, value, embedding)
+
+    def _insert(self, exact_key: str, entry: _Entry) -> None:
+        self._entries[exact_key] = entry
+        self._entries.move_to_end(exact_key)
+        self._scope_index.pop(entry.scope, None)
+        self._evict()
+
+    # ========================================
+    # Almacén compartido entre workers
+    # ========================================
+
+    def _shared_get(self, exact_key: str) -> Optional[_Entry]:
+        try:
+            raw = self.store.get(exact_key)
+            if raw is None:
+                return None
+            data = json.loads(raw)
+        except Exception as e:
+            self.counters["shared_errors"] += 1
+            print(f"[answer_cache] ⚠️ Almacén compartido no disponible: {e}")
+            return None
+        vector = data.get("vector")
+        return _Entry(
+            value=data["value"],
+            scope=data["scope"],
+            vector=np.frombuffer(base64.b64decode(vector), dtype=np.float32) if vector else None,
+            expires_at=data["expires_at"],
+        )
+
+    def _shared_put(self, exact_key: str, entry: _Entry) -> None:
+        payload = {
+            "value": entry.value,
+            "scope": entry.scope,
+            "vector": base64.b64encode(entry.vector.tobytes()).decode("ascii") if entry.vector is not None else None,
+            "expires_at": entry.expires_at,
+        }
+        try:
+            self.store.set(exact_key, json.dumps(payload, ensure_ascii=False).encode("utf-8"), ttl_s=self.ttl_s)
+        except Exception as e:
+            self.counters["shared_errors"] += 1
+            print(f"[answer_cache] ⚠️ No se pudo escribir en el almacén compartido: {e}")
+
+    def _evict(self) -> None:
+        now = time.time()
+        expired = [k for k, e in self._entries.items() if e.expires_at <= now]
+        for k in expired:
+            self._scope_index.pop(self._entries.pop(k).scope, None)
+        self.counters["expirations"] += len(expired)
+
+        while len(self._entries) > self.max_items:
+            _, entry = self._entries.popitem(last=False)
+            self._scope_index.pop(entry.scope, None)
+            self.counters["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._scope_index.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.counters["hits_exact"] + self.counters["hits_semantic"]
+        lookups = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "items": len(self._entries),
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "index_version": self._index_version,
+        }
+
+
+# Instancia del proceso (None si la caché está desactivada)
+answer_cache: Optional[AnswerCache] = AnswerCache(store=open_shared_store("answers")) if ANSWER_CACHE_ENABLED else None
@@ -1,18 +1,80 @@
-from fastapi import FastAPI
+import asyncio
+import secrets
+from contextlib import asynccontextmanager
+from typing import Callable, Dict
+
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 from pathlib import Path
 
+from backend import metrics, sessions
+from backend.answer_cache import answer_cache
+from backend.config import (
+    ADMIN_TOKEN,
+    CACHE_PURGE_INTERVAL_S,
+    INDEX_LEASE_TTL_S,
+    METRICS_ENABLED,
+    SERVER_TIMING_ENABLED,
+    WARMUP_MODE,
+    ensure_dirs,
+)
+from backend.query_router import router as query_router
+from backend.resources import registry
+from backend.scheduler import scheduler
+from backend.shared_store import apurge_periodically
+from backend.singleflight import flights
+
 # Rutas de API
 from backend.routes.generate import router as generate_router
 from backend.routes.teacher import router as teacher_router
 from backend.routes.answer import router as answer_router  # (opcional)
 
+# ========================================
+# Ciclo de vida: warm pool de clientes
+# ========================================
+def _expiring_stores() -> Dict[str, Callable[[], int]]:
+    """Almacenes SQLite con entradas caducadas que hay que borrar de vez en cuando."""
+    stores = {"sessions": sessions.store.purge_expired}
+    if answer_cache and answer_cache.store is not None:
+        stores["answers"] = answer_cache.store.purge_expired
+    return stores
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Un único vector store / embeddings / chat para todo el proceso.
+    # Uvicorn no abre el puerto hasta que termina este arranque: en modo
+    # "background" la carga pesada sigue en un hilo y /health responde ya.
+    ensure_dirs()
+    warmup = None
+    if WARMUP_MODE == "blocking":
+        registry.init()
+    elif WARMUP_MODE == "background":
+        warmup = asyncio.create_task(registry.awarm_up())
+    purger = None
+    if CACHE_PURGE_INTERVAL_S > 0:
+        purger = asyncio.create_task(apurge_periodically(_expiring_stores(), CACHE_PURGE_INTERVAL_S))
+    lease = None
+    if INDEX_LEASE_TTL_S > 0:
+        lease = asyncio.create_task(registry.akeep_index_lease(INDEX_LEASE_TTL_S / 3))
+    yield
+    if purger is not None:
+        purger.cancel()
+    if lease is not None:
+        lease.cancel()
+    if warmup is not None:
+        await asyncio.gather(warmup, return_exceptions=True)   # no cerrar clientes a medio construir
+    await sessions.adrain()   # resúmenes de sesión en curso (usan el chat del registro)
+    await registry.aclose()
+
+
 # Crear la app
 app = FastAPI(
     title="ZOLTAR • Dos Chatbots",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # ========================================
@@ -24,8 +86,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# Latencia por ruta y cabecera Server-Timing (ver backend/metrics.py)
+if METRICS_ENABLED or SERVER_TIMING_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
 # ========================================
 # Incluir rutas de la API
 # ========================================
@@ -40,6 +107,60 @@ app.include_router(answer_router,   prefix="/api", tags=["answer"])    # Extra (
 def health():
     return {"status": "healthy"}
 
+
+# Readiness: 503 hasta que el índice y los clientes estén cargados
+@app.get("/ready")
+def ready():
+    status = registry.health()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+# Recarga de clientes e índice sin reiniciar (requiere ADMIN_TOKEN)
+@app.post("/admin/reload")
+async def admin_reload(x_admin_token: str = Header(default="")):
+    if not ADMIN_TOKEN or not secrets.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not await registry.areload():
+        # Los clientes anteriores siguen sirviendo; el motivo queda en /ready
+        return JSONResponse({"reloaded": False, **registry.health()}, status_code=500)
+    return {"reloaded": True, **registry.health()}
+
+
+# Métricas de caché (aciertos / fallos / expulsiones)
+@app.get("/cache/stats")
+def cache_stats():
+    from backend.embedding_cache import get_embedding_cache
+
+    return {
+        "answers": answer_cache.stats() if answer_cache else {"enabled": False},
+        "embeddings": get_embedding_cache().stats(),
+        "coalescing": flights.stats(),
+        "rerank": registry.reranker_stats() or {"enabled": False},
+        "router": query_router.stats(),
+        "llm": registry.chat_client_stats() or {"calls": 0},
+        "scheduler": scheduler.stats(),
+    }
+
+
+# Métricas en formato Prometheus (etapas, tokens, contexto, k, caché)
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    if not METRICS_ENABLED:
+        return PlainTextResponse("# métricas desactivadas (METRICS_ENABLED=false)\n", status_code=404)
+    from backend.embedding_cache import get_embedding_cache
+
+    if answer_cache:
+        metrics.set_component_stats("answer_cache", answer_cache.stats())
+    metrics.set_component_stats("embedding_cache", get_embedding_cache().stats())
+    metrics.set_component_stats("coalescing", flights.stats())
+    if registry.reranker_stats() is not None:
+        metrics.set_component_stats("rerank", registry.reranker_stats())
+    metrics.set_component_stats("router", query_router.stats())
+    if registry.chat_client_stats() is not None:
+        metrics.set_component_stats("llm", registry.chat_client_stats())
+    metrics.set_component_stats("scheduler", scheduler.stats())
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # ========================================
 # Servir frontend y archivos estáticos
 # ========================================
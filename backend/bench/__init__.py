@@ -0,0 +1,9 @@
+# backend/bench/__init__.py
+# Marca la carpeta "bench" como un paquete de Python
+#
+# Benchmarks offline y deterministas (sin clave de OpenAI):
+#   python -m backend.bench.run --sizes 10,50 --out bench.json --baseline bench_anterior.json
+# Ver backend/bench/run.py
+#
+# Coste de importar la app (arranque en frío):
+#   python -m backend.bench.importtime --budget-ms 1200
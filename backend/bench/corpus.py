@@ -0,0 +1,148 @@
+# backend/bench/corpus.py
+"""
+Corpus sintético de PDFs para el benchmark: mismo seed, mismos ficheros
+(byte a byte), sin depender de librerías de generación de PDF.
+
+Cada documento tiene varias páginas de texto en español con vocabulario
+del dominio (evaluación, planificación, IA en el aula...), de modo que la
+recuperación léxica y vectorial tenga algo que distinguir.
+
+    python -m backend.bench.corpus /tmp/corpus --docs 50 --pages 8
+"""
+
+import argparse
+import random
+from pathlib import Path
+from typing import List
+
+# Temas: cada documento mezcla sobre todo uno de ellos
+TOPICS = {
+    "evaluacion": "evaluación formativa sumativa rúbrica criterios retroalimentación evidencias logro desempeño calificación autoevaluación coevaluación",
+    "planificacion": "planificación diseño inverso UbD objetivos comprensión duradera preguntas esenciales secuencia unidad metas transferencia",
+    "ia": "inteligencia artificial modelo lenguaje prompt chatbot automatización sesgo ética datos privacidad generativa",
+    "inclusion": "inclusión diversidad accesibilidad DUA necesidades apoyos adecuaciones barreras participación equidad",
+    "convivencia": "convivencia clima aula normas conflicto mediación bienestar emociones vínculo comunidad respeto",
+    "didactica": "didáctica estrategia metodología proyectos aprendizaje basado problemas indagación colaborativo andamiaje modelado",
+}
+COMMON = (
+    "el la los las un una de del en con para por que se como su sus al es son más "
+    "estudiantes docentes escuela clase curso aprendizaje enseñanza proceso práctica"
+).split()
+
+# Caracteres que WinAnsiEncoding (cp1252) representa; el resto se sustituye
+_WIN_ANSI = "cp1252"
+
+
+def _sentence(rng: random.Random, topic_words: List[str]) -> str:
+    n = rng.randint(8, 18)
+    words = [rng.choice(topic_words) if rng.random() < 0.45 else rng.choice(COMMON) for _ in range(n)]
+    return " ".join(words).capitalize() + "."
+
+
+def _page_lines(rng: random.Random, topic_words: List[str], n_lines: int, width: int = 90) -> List[str]:
+    text = " ".join(_sentence(rng, topic_words) for _ in range(n_lines))
+    lines, current = [], ""
+    for word in text.split():
+        if len(current) + len(word) + 1 > width:
+            lines.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+        if len(lines) >= n_lines:
+            break
+    if current and len(lines) < n_lines:
+        lines.append(current)
+    return lines
+
+
+def _pdf_string(text: str) -> bytes:
+    raw = text.encode(_WIN_ANSI, errors="replace")
+    return b"(" + raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def build_pdf(pages: List[List[str]], title: str = "") -> bytes:
+    """
+    PDF 1.4 mínimo: una fuente Helvetica (WinAnsi), un content stream por
+    página y tabla xref con offsets exactos (pypdf lo lee sin avisos).
+    """
+    objects: List[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(b"")   # se rellena al final (necesita el id de /Pages)
+    pages_id = add(b"")
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+
+    page_ids = []
+    for lines in pages:
+        ops = [b"BT /F1 10 Tf 14 TL 50 790 Td"]
+        for line in lines:
+            ops.append(_pdf_string(line) + b" '")
+        ops.append(b"ET")
+        stream = b"\n".join(ops)
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_id, font_id, content_id)
+        ))
+
+    kids = b" ".join(b"%d 0 R" % pid for pid in page_ids)
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id
+    info_id = add(b"<< /Title " + _pdf_string(title) + b" /Producer (zoltar-bench) >>")
+
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+    xref_at = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, catalog, info_id, xref_at
+    )
+    return bytes(out)
+
+
+def generate_corpus(out_dir: Path, n_docs: int, pages_per_doc: int = 8, lines_per_page: int = 45, seed: int = 0) -> List[Path]:
+    """Escribe n_docs PDFs deterministas en out_dir y devuelve sus rutas."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    topics = sorted(TOPICS)
+    paths = []
+    for i in range(n_docs):
+        rng = random.Random(f"{seed}:{i}")
+        topic = topics[i % len(topics)]
+        # Tema principal + un poco de otro, como en documentos reales
+        words = TOPICS[topic].split() * 3 + TOPICS[rng.choice(topics)].split()
+        pages = [_page_lines(rng, words, lines_per_page) for _ in range(pages_per_doc)]
+        path = out_dir / f"bench_{i:04d}_{topic}.pdf"
+        path.write_bytes(build_pdf(pages, title=f"Documento {i} sobre {topic}"))
+        paths.append(path)
+    return paths
+
+
+def sample_queries(n: int, seed: int = 0) -> List[str]:
+    """Preguntas deterministas con vocabulario del corpus."""
+    rng = random.Random(f"queries:{seed}")
+    topics = sorted(TOPICS)
+    queries = []
+    for i in range(n):
+        words = TOPICS[topics[i % len(topics)]].split()
+        queries.append(f"¿Cómo se relaciona {rng.choice(words)} con {rng.choice(words)} en el {rng.choice(['aula', 'curso', 'proceso'])}?")
+    return queries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera un corpus sintético de PDFs")
+    parser.add_argument("out_dir")
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    written = generate_corpus(Path(args.out_dir), args.docs, args.pages, seed=args.seed)
+    print(f"📄 {len(written)} PDFs en {args.out_dir}")
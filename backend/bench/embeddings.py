@@ -0,0 +1,129 @@
+# backend/bench/embeddings.py
+"""
+Throughput de los embeddings locales (backend/onnx_embeddings.py).
+
+    python -m backend.bench.embeddings --queries 512 --threads 1,8,32 --out emb.json
+    python -m backend.bench.embeddings --compare-torch      # + HuggingFaceEmbeddings y paridad
+
+Mide:
+- carga del modelo (s) y RSS
+- latencia de una consulta suelta (p50/p95)
+- consultas/s con N hilos concurrentes a través del micro-batcher
+  (y tamaño medio de lote conseguido)
+- documentos/s en embed_documents (ingesta)
+- con --compare-torch: lo mismo con sentence-transformers + coseno mínimo
+  y medio entre ambos (paridad con un índice ya construido)
+
+Necesita el modelo (HF_EMBEDDINGS_DIR o descarga/caché del Hub).
+"""
+
+import argparse
+import json
+import resource
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from backend.bench.corpus import sample_queries
+from backend.bench.run import _percentiles
+from backend.config import HF_EMBEDDINGS_MODEL
+
+
+def _rss_mb() -> float:
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+
+def _documents(n: int) -> List[str]:
+    queries = sample_queries(n * 4, seed=1)
+    return [" ".join(queries[i * 4:(i + 1) * 4]) for i in range(n)]
+
+
+def _single_latency(embed_one: Callable[[str], Any], queries: List[str]) -> Dict[str, float]:
+    embed_one(queries[0])   # calentamiento
+    samples = []
+    for q in queries:
+        t0 = time.perf_counter()
+        embed_one(q)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return _percentiles(samples)
+
+
+def _concurrent(embed_one: Callable[[str], Any], queries: List[str], threads: int) -> Dict[str, float]:
+    samples: List[float] = []
+
+    def one(q: str) -> None:
+        t0 = time.perf_counter()
+        embed_one(q)
+        samples.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, queries))
+    wall = time.perf_counter() - t0
+    return {"threads": threads, "qps": round(len(queries) / wall, 1), **_percentiles(samples)}
+
+
+def _documents_per_s(embed_documents: Callable[[List[str]], Any], docs: List[str]) -> float:
+    embed_documents(docs[:8])
+    t0 = time.perf_counter()
+    embed_documents(docs)
+    return round(len(docs) / (time.perf_counter() - t0), 1)
+
+
+def _main(args: argparse.Namespace) -> None:
+    from backend.onnx_embeddings import OnnxEmbeddingEngine, OnnxEmbeddings, _onnx_file
+
+    queries = sample_queries(args.queries, seed=0)
+    docs = _documents(args.docs)
+    levels = [int(t) for t in args.threads.split(",") if t.strip()]
+    report: Dict[str, Any] = {"model": HF_EMBEDDINGS_MODEL, "queries": len(queries), "docs": len(docs)}
+
+    t0 = time.perf_counter()
+    onnx = OnnxEmbeddings(OnnxEmbeddingEngine())
+    report["onnx"] = {"file": _onnx_file(), "load_s": round(time.perf_counter() - t0, 2), "rss_mb": _rss_mb()}
+    report["onnx"]["single"] = _single_latency(lambda q: onnx.engine.encode([q]), queries)
+    report["onnx"]["concurrent"] = []
+    for threads in levels:
+        before = onnx.batcher.stats()
+        row = _concurrent(onnx.embed_query, queries, threads)
+        after = onnx.batcher.stats()
+        batches = after["batches"] - before["batches"]
+        row["avg_batch"] = round((after["items"] - before["items"]) / batches, 2) if batches else 0.0
+        report["onnx"]["concurrent"].append(row)
+    report["onnx"]["docs_per_s"] = _documents_per_s(onnx.embed_documents, docs)
+    print(f"⚡ ONNX: {json.dumps(report['onnx'])}")
+
+    if args.compare_torch:
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        t0 = time.perf_counter()
+        torch_emb = HuggingFaceEmbeddings(model_name=HF_EMBEDDINGS_MODEL, encode_kwargs={"normalize_embeddings": True})
+        report["torch"] = {"load_s": round(time.perf_counter() - t0, 2), "rss_mb": _rss_mb()}
+        report["torch"]["single"] = _single_latency(torch_emb.embed_query, queries)
+        report["torch"]["concurrent"] = [_concurrent(torch_emb.embed_query, queries, t) for t in levels]
+        report["torch"]["docs_per_s"] = _documents_per_s(torch_emb.embed_documents, docs)
+
+        sample = queries[:64] + docs[:64]
+        cosine = (np.asarray(onnx.embed_documents(sample)) * np.asarray(torch_emb.embed_documents(sample))).sum(axis=1)
+        report["parity"] = {"min_cosine": round(float(cosine.min()), 5), "mean_cosine": round(float(cosine.mean()), 5)}
+        print(f"🔥 PyTorch: {json.dumps(report['torch'])}")
+        print(f"🎯 Paridad: {json.dumps(report['parity'])}")
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"💾 Resultados en {args.out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput de embeddings locales (ONNX vs PyTorch)")
+    parser.add_argument("--queries", type=int, default=512, help="Consultas cortas")
+    parser.add_argument("--docs", type=int, default=512, help="Textos tipo chunk para embed_documents")
+    parser.add_argument("--threads", default="1,8,32", help="Hilos concurrentes llamando a embed_query")
+    parser.add_argument("--compare-torch", action="store_true", help="Comparar con HuggingFaceEmbeddings (PyTorch)")
+    parser.add_argument("--out", default=None, help="Fichero JSON de resultados")
+    _main(parser.parse_args())
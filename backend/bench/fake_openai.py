@@ -0,0 +1,353 @@
+# backend/bench/fake_openai.py
+"""
+Servidor local que imita la API HTTP de OpenAI (chat y embeddings) para
+medir el pipeline sin red ni clave real.
+
+- POST /v1/embeddings        -> vectores deterministas (mismo texto, mismo
+                                vector; textos con palabras comunes quedan cerca)
+- POST /v1/chat/completions  -> respuesta determinista, con o sin stream (SSE)
+
+Latencia y fallos configurables:
+    python -m backend.bench.fake_openai --port 8765 --latency-ms 300 --token-ms 15 --fail-rate 0.02
+
+- fail_rate / fail_status: fracción de respuestas de error (429 por defecto, o 500/503...)
+- slow_rate / slow_ms:     fracción de llamadas de chat con latencia extra (cola lenta)
+- down_models:             modelos de chat que siempre responden 503
+- rpm_limit:               límite de requests por minuto de la "clave": cabeceras
+                           x-ratelimit-* en cada respuesta y 429 al pasarse
+
+Uso desde código: server, base_url = start_fake_server(latency_ms=50)
+y luego OPENAI_BASE_URL=base_url.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class FakeOpenAIConfig:
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        token_ms: float = 0.0,
+        embed_latency_ms: float = 0.0,
+        dim: int = 256,
+        completion_words: int = 80,
+        fail_rate: float = 0.0,
+        fail_status: int = 429,
+        slow_rate: float = 0.0,
+        slow_ms: float = 0.0,
+        down_models: Tuple[str, ...] = (),
+        rpm_limit: int = 0,
+        seed: int = 0,
+    ):
+        self.latency_ms = latency_ms              # hasta la respuesta / primer token
+        self.token_ms = token_ms                  # entre tokens en streaming
+        self.embed_latency_ms = embed_latency_ms  # por llamada de embeddings
+        self.dim = dim
+        self.completion_words = completion_words
+        self.fail_rate = fail_rate                # fracción de errores inyectados
+        self.fail_status = fail_status
+        self.slow_rate = slow_rate                # fracción de llamadas de chat lentas
+        self.slow_ms = slow_ms
+        self.down_models = set(down_models)
+        self.rpm_limit = rpm_limit                # 0 = sin límite ni cabeceras
+        self.request_times: List[float] = []      # ventana del último minuto
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters = {"chat": 0, "chat_stream": 0, "embeddings": 0, "embedded_texts": 0, "failures": 0, "slow": 0, "rate_limited": 0}
+
+
+# ========================================
+# Vectores deterministas
+# ========================================
+
+_word_vectors: Dict[Tuple[str, int], np.ndarray] = {}
+
+
+def _word_vector(word: str, dim: int) -> np.ndarray:
+    key = (word, dim)
+    vec = _word_vectors.get(key)
+    if vec is None:
+        seed = int.from_bytes(hashlib.sha256(word.encode("utf-8")).digest()[:8], "little")
+        vec = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+        _word_vectors[key] = vec
+    return vec
+
+
+def fake_embedding(item: Any, dim: int) -> np.ndarray:
+    """Suma de vectores por palabra, normalizada (bolsa de palabras aleatoria)."""
+    if isinstance(item, list):   # ids de tokens (check_embedding_ctx_length=True)
+        words = [str(t) for t in item]
+    else:
+        words = _WORD_RE.findall(str(item).lower()) or [str(item)]
+    vec = np.sum([_word_vector(w, dim) for w in words], axis=0)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+def fake_answer(messages: List[Dict], n_words: int) -> str:
+    seed = hashlib.sha256(json.dumps(messages, sort_keys=True).encode("utf-8")).digest()
+    vocab = ("la", "evaluación", "formativa", "permite", "ajustar", "la", "enseñanza", "con", "evidencias",
+             "del", "aprendizaje", "y", "la", "IA", "ayuda", "a", "diseñar", "rúbricas", "claras.")
+    return " ".join(vocab[(seed[i % len(seed)] + i) % len(vocab)] for i in range(n_words))
+
+
+def _approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+# ========================================
+# HTTP
+# ========================================
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive como la API real
+    config: FakeOpenAIConfig
+    rate_headers: Dict[str, str] = {}
+
+    def log_message(self, fmt, *args):  # silencio: no ensuciar la salida del benchmark
+        pass
+
+    def _send_json(self, status: int, payload: Dict, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in {**self.rate_headers, **(headers or {})}.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _maybe_fail(self) -> bool:
+        cfg = self.config
+        with cfg.lock:
+            fail = cfg.fail_rate > 0 and cfg.rng.random() < cfg.fail_rate
+            if fail:
+                cfg.counters["failures"] += 1
+        if fail:
+            self._send_error(cfg.fail_status)
+        return fail
+
+    def _send_error(self, status: int) -> None:
+        if status == 429:
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit (simulado)", "type": "rate_limit_error", "code": "rate_limit_exceeded"}},
+                {"Retry-After": "0.05"},
+            )
+        else:
+            self._send_json(status, {"error": {"message": f"Error {status} (simulado)", "type": "server_error"}})
+
+    def _rate_limited(self) -> bool:
+        """Ventana deslizante de rpm_limit requests por minuto, como los límites de la API."""
+        cfg = self.config
+        if cfg.rpm_limit <= 0:
+            return False
+        now = time.monotonic()
+        with cfg.lock:
+            cfg.request_times = [t for t in cfg.request_times if now - t < 60]
+            limited = len(cfg.request_times) >= cfg.rpm_limit
+            if limited:
+                cfg.counters["rate_limited"] += 1
+            else:
+                cfg.request_times.append(now)
+            reset = 60 - (now - cfg.request_times[0])
+            remaining = max(0, cfg.rpm_limit - len(cfg.request_times))
+        self.rate_headers = {
+            "x-ratelimit-limit-requests": str(cfg.rpm_limit),
+            "x-ratelimit-remaining-requests": str(remaining),
+            "x-ratelimit-reset-requests": f"{reset:.3f}s",
+        }
+        if limited:
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit (simulado)", "type": "requests", "code": "rate_limit_exceeded"}},
+            )
+        return limited
+
+    def _chat_delay_s(self) -> float:
+        cfg = self.config
+        with cfg.lock:
+            slow = cfg.slow_rate > 0 and cfg.rng.random() < cfg.slow_rate
+            if slow:
+                cfg.counters["slow"] += 1
+        return (cfg.latency_ms + (cfg.slow_ms if slow else 0.0)) / 1000
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "JSON inválido"}})
+            return
+        if self._rate_limited():
+            return
+
+        if self.path.endswith("/embeddings"):
+            self._embeddings(payload)
+        elif self.path.endswith("/chat/completions"):
+            self._chat(payload)
+        else:
+            self._send_json(404, {"error": {"message": f"Ruta desconocida {self.path}"}})
+
+    def _embeddings(self, payload: Dict) -> None:
+        cfg = self.config
+        if self._maybe_fail():
+            return
+        inputs = payload.get("input")
+        if isinstance(inputs, str) or (isinstance(inputs, list) and inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        time.sleep(cfg.embed_latency_ms / 1000)
+
+        base64_out = payload.get("encoding_format") == "base64"
+        data = []
+        for i, item in enumerate(inputs or []):
+            vec = fake_embedding(item, cfg.dim)
+            value = base64.b64encode(vec.astype(np.float32).tobytes()).decode("ascii") if base64_out else vec.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": value})
+
+        with cfg.lock:
+            cfg.counters["embeddings"] += 1
+            cfg.counters["embedded_texts"] += len(data)
+        tokens = sum(_approx_tokens(json.dumps(item)) for item in inputs or [])
+        self._send_json(200, {
+            "object": "list",
+            "data": data,
+            "model": payload.get("model", "fake-embeddings"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    def _chat(self, payload: Dict) -> None:
+        cfg = self.config
+        messages = payload.get("messages", [])
+        model = payload.get("model", "fake-chat")
+        if model in cfg.down_models:
+            with cfg.lock:
+                cfg.counters["failures"] += 1
+            self._send_error(503)
+            return
+        if self._maybe_fail():
+            return
+        answer = fake_answer(messages, cfg.completion_words)
+        prompt_tokens = sum(_approx_tokens(str(m.get("content", ""))) for m in messages)
+        completion_tokens = _approx_tokens(answer)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        time.sleep(self._chat_delay_s())
+
+        if not payload.get("stream"):
+            with cfg.lock:
+                cfg.counters["chat"] += 1
+            self._send_json(200, {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": answer},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+            return
+
+        with cfg.lock:
+            cfg.counters["chat_stream"] += 1
+        # Sin Content-Length: el stream termina cerrando la conexión
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        for key, value in self.rate_headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.close_connection = True
+
+        def send(choices: List[Dict], **extra: Any) -> None:
+            body = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": choices,
+                **extra,
+            }
+            self.wfile.write(f"data: {json.dumps(body)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        def delta(content: Dict, finish: Optional[str] = None) -> None:
+            send([{"index": 0, "delta": content, "finish_reason": finish}])
+
+        try:
+            delta({"role": "assistant", "content": ""})
+            for i, word in enumerate(answer.split(" ")):
+                if i and cfg.token_ms:
+                    time.sleep(cfg.token_ms / 1000)
+                delta({"content": word if i == 0 else " " + word})
+            delta({}, finish="stop")
+            if (payload.get("stream_options") or {}).get("include_usage"):
+                send([], usage=usage)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass   # el cliente cortó el stream
+
+
+def start_fake_server(host: str = "127.0.0.1", port: int = 0, **config: Any) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Arranca el servidor en un hilo daemon. port=0 elige uno libre.
+    Devuelve (servidor, base_url); server.config tiene los contadores.
+    """
+    cfg = FakeOpenAIConfig(**config)
+    handler = type("FakeOpenAIHandler", (_Handler,), {"config": cfg})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.config = cfg
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor falso compatible con la API de OpenAI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Latencia hasta la respuesta / primer token")
+    parser.add_argument("--token-ms", type=float, default=0.0, help="Pausa entre tokens en streaming")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="Latencia por llamada de embeddings")
+    parser.add_argument("--dim", type=int, default=256, help="Dimensión de los embeddings")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fracción de respuestas de error")
+    parser.add_argument("--fail-status", type=int, default=429, help="Status de los errores inyectados")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fracción de llamadas de chat lentas")
+    parser.add_argument("--slow-ms", type=float, default=0.0, help="Latencia extra de las llamadas lentas")
+    parser.add_argument("--down-models", default="", help="Modelos de chat que siempre fallan (503), separados por comas")
+    parser.add_argument("--rpm-limit", type=int, default=0, help="Límite simulado de requests por minuto (0 = sin límite)")
+    args = parser.parse_args()
+
+    server, base_url = start_fake_server(
+        args.host, args.port,
+        latency_ms=args.latency_ms, token_ms=args.token_ms, embed_latency_ms=args.embed_latency_ms,
+        dim=args.dim, fail_rate=args.fail_rate, fail_status=args.fail_status,
+        slow_rate=args.slow_rate, slow_ms=args.slow_ms,
+        down_models=tuple(m.strip() for m in args.down_models.split(",") if m.strip()),
+        rpm_limit=args.rpm_limit,
+    )
+    print(f"🧪 Servidor OpenAI falso en {base_url} (Ctrl+C para salir)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
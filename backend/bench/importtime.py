@@ -0,0 +1,98 @@
+# backend/bench/importtime.py
+"""
+Informe del coste de importar la app (arranque en frío), a partir de
+`python -X importtime`.
+
+    python -m backend.bench.importtime                     # top 25 módulos
+    python -m backend.bench.importtime --budget-ms 1200    # exit 1 si se supera
+    python -m backend.bench.importtime --forbid langchain_openai,chromadb
+
+Cada medición corre en un intérprete nuevo (sin .pyc calientes de otros
+módulos del proceso). Se repite --runs veces y se toma la mediana.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+
+# Módulos pesados que no deben cargarse al importar la app (se cargan en el
+# calentamiento en segundo plano, ver backend/resources.py)
+DEFAULT_FORBIDDEN = (
+    "langchain_openai", "langchain_community", "chromadb", "openai", "tiktoken",
+    "sentence_transformers", "onnxruntime",
+)
+
+
+def measure(target: str = "backend.app") -> Tuple[Dict[str, Tuple[int, int]], List[str]]:
+    """
+    Importa target en un subproceso. Devuelve ({módulo: (self_us, cumulative_us)},
+    módulos de primer nivel importados en orden).
+    """
+    env = {**os.environ, "DATA_DIR": os.environ.get("DATA_DIR") or tempfile.mkdtemp(prefix="zoltar-importtime-")}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {target}:\n{proc.stderr[-2000:]}")
+
+    modules: Dict[str, Tuple[int, int]] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules, sorted({name.split(".")[0] for name in modules})
+
+
+def _main(args: argparse.Namespace) -> int:
+    runs = [measure(args.target) for _ in range(max(1, args.runs))]
+    modules, top_level = runs[-1]
+    total_ms = statistics.median(run[0][args.target][1] for run in runs) / 1000
+
+    forbidden = [m.strip() for m in args.forbid.split(",") if m.strip()]
+    loaded_forbidden = [m for m in forbidden if m in top_level]
+
+    ranking = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)
+    if args.json:
+        print(json.dumps({
+            "target": args.target,
+            "total_ms": round(total_ms, 1),
+            "modules": len(modules),
+            "forbidden_loaded": loaded_forbidden,
+            "top": [{"module": n, "cumulative_ms": round(c / 1000, 1), "self_ms": round(s / 1000, 1)}
+                    for n, (s, c) in ranking[:args.top]],
+        }, indent=2))
+    else:
+        print(f"⏱️ import {args.target}: {total_ms:.0f} ms (mediana de {len(runs)}) · {len(modules)} módulos")
+        print(f"{'acumulado':>11} {'propio':>9}  módulo")
+        for name, (self_us, cumulative_us) in ranking[:args.top]:
+            print(f"{cumulative_us / 1000:>8.1f} ms {self_us / 1000:>6.1f} ms  {name}")
+
+    failed = False
+    if loaded_forbidden:
+        print(f"❌ Módulos pesados cargados al importar: {', '.join(loaded_forbidden)}")
+        failed = True
+    if args.budget_ms and total_ms > args.budget_ms:
+        print(f"❌ {total_ms:.0f} ms supera el presupuesto de {args.budget_ms:.0f} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coste de importación de la app (python -X importtime)")
+    parser.add_argument("--target", default="backend.app", help="Módulo a importar")
+    parser.add_argument("--top", type=int, default=25, help="Módulos a listar (por tiempo acumulado)")
+    parser.add_argument("--runs", type=int, default=3, help="Repeticiones (se usa la mediana)")
+    parser.add_argument("--budget-ms", type=float, default=0.0, help="Falla si el import supera este tiempo")
+    parser.add_argument("--forbid", default=",".join(DEFAULT_FORBIDDEN), help="Módulos que no deben cargarse al importar")
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    sys.exit(_main(parser.parse_args()))
@@ -0,0 +1,126 @@
+# backend/bench/mmr.py
+"""
+Microbenchmark de MMR con el backend Chroma.
+
+    python -m backend.bench.mmr --chunks 2000,20000 --dim 3072 --out mmr.json
+
+Compara, sobre una colección sintética (vectores aleatorios normalizados,
+sin API ni ingesta):
+
+- langchain: Chroma.max_marginal_relevance_search_by_vector, lo que ejecuta
+  search_type="mmr" después de embeber la consulta (Chroma devuelve los
+  fetch_k embeddings y MMR itera en Python)
+- sidecar:   retrieve.SidecarChroma (Chroma devuelve solo los candidatos;
+  MMR en NumPy sobre la submatriz de npindex/vectors.f32)
+
+y, aislando solo el cálculo de MMR sobre los mismos candidatos,
+langchain maximal_marginal_relevance frente a vector_index.mmr_select.
+También informa de cuántas selecciones coinciden (mismo conjunto).
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from backend.bench.run import _percentiles
+
+
+def _time(fn: Callable[[Any], Any], inputs: List[Any]) -> Dict[str, float]:
+    fn(inputs[0])   # calentamiento
+    samples = []
+    for x in inputs:
+        t0 = time.perf_counter()
+        fn(x)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return _percentiles(samples)
+
+
+def _build(root: Path, n: int, dim: int, seed: int):
+    """Colección Chroma + sidecar con los mismos n vectores."""
+    from langchain_community.vectorstores import Chroma
+
+    from backend.vector_index import load_chunk_matrix, normalize_rows, write_numpy_index
+
+    rng = np.random.default_rng(seed)
+    vectors = normalize_rows(rng.standard_normal((n, dim)).astype(np.float32))
+    ids = [f"c{i:07d}" for i in range(n)]
+    texts = [f"fragmento {i}" for i in range(n)]
+    metadatas = [{"chunk_id": cid, "source": "bench.pdf"} for cid in ids]
+
+    plain = Chroma(collection_name="bench", persist_directory=str(root / "chroma"))
+    for i in range(0, n, 1000):
+        plain._collection.add(
+            ids=ids[i:i + 1000], embeddings=vectors[i:i + 1000].tolist(),
+            documents=texts[i:i + 1000], metadatas=metadatas[i:i + 1000],
+        )
+    write_numpy_index(zip(ids, texts, metadatas, vectors), {"bench": True}, index_dir=root / "npindex")
+    return plain, load_chunk_matrix(root / "npindex"), vectors
+
+
+def _bench_size(n: int, args: argparse.Namespace) -> Dict[str, Any]:
+    from langchain_community.vectorstores.utils import maximal_marginal_relevance
+
+    from backend.retrieve import SidecarChroma
+    from backend.vector_index import mmr_select
+
+    with tempfile.TemporaryDirectory(prefix="zoltar-mmr-") as tmp:
+        plain, matrix, vectors = _build(Path(tmp), n, args.dim, args.seed)
+        sidecar = SidecarChroma(collection_name="bench", persist_directory=str(Path(tmp) / "chroma"), chunk_matrix=matrix)
+        rng = np.random.default_rng(args.seed + 1)
+        queries = [q.tolist() for q in rng.standard_normal((args.queries, args.dim)).astype(np.float32)]
+        search = dict(k=args.k, fetch_k=args.fetch_k, lambda_mult=args.lambda_mult)
+
+        report: Dict[str, Any] = {"chunks": n, "dim": args.dim, **search}
+        report["langchain"] = _time(lambda q: plain.max_marginal_relevance_search_by_vector(q, **search), queries)
+        report["sidecar"] = _time(lambda q: sidecar.max_marginal_relevance_search_by_vector(q, **search), queries)
+
+        # Solo el cálculo de MMR, con los mismos candidatos ya en memoria
+        q0 = np.asarray(queries[0], dtype=np.float32)
+        candidates = vectors[np.argsort(-(vectors @ q0))[:args.fetch_k]]
+        report["mmr_only"] = {
+            "langchain": _time(lambda c: maximal_marginal_relevance(q0, list(c), args.lambda_mult, args.k),
+                               [candidates] * args.queries),
+            "numpy": _time(lambda c: mmr_select(q0, c, args.k, args.lambda_mult), [candidates] * args.queries),
+        }
+
+        same = sum(
+            {d.metadata["chunk_id"] for d in plain.max_marginal_relevance_search_by_vector(q, **search)}
+            == {d.metadata["chunk_id"] for d in sidecar.max_marginal_relevance_search_by_vector(q, **search)}
+            for q in queries
+        )
+        report["same_selection"] = round(same / len(queries), 3)
+        report["speedup_p50"] = round(report["langchain"]["p50_ms"] / max(report["sidecar"]["p50_ms"], 1e-6), 2)
+        return report
+
+
+def _main(args: argparse.Namespace) -> None:
+    results = []
+    for n in [int(s) for s in args.chunks.split(",") if s.strip()]:
+        row = _bench_size(n, args)
+        results.append(row)
+        print(
+            f"📏 {n} chunks: langchain p50 {row['langchain']['p50_ms']} ms · "
+            f"sidecar p50 {row['sidecar']['p50_ms']} ms (x{row['speedup_p50']}) · "
+            f"misma selección {row['same_selection']:.0%}"
+        )
+    if args.out:
+        Path(args.out).write_text(json.dumps({"results": results}, indent=2), encoding="utf-8")
+        print(f"💾 Resultados en {args.out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MMR con Chroma: LangChain vs sidecar NumPy")
+    parser.add_argument("--chunks", default="2000,20000", help="Tamaños de la colección")
+    parser.add_argument("--dim", type=int, default=3072, help="Dimensión (3072 = text-embedding-3-large)")
+    parser.add_argument("--queries", type=int, default=200, help="Consultas por tamaño")
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--fetch-k", type=int, default=24)
+    parser.add_argument("--lambda-mult", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="Fichero JSON de resultados")
+    _main(parser.parse_args())
@@ -0,0 +1,318 @@
+# backend/bench/run.py
+"""
+Benchmark offline y determinista del pipeline completo.
+
+    python -m backend.bench.run --sizes 10,50,200 --out bench.json
+    python -m backend.bench.run --sizes 10,50,200 --out new.json --baseline bench.json --fail-on-regression
+
+Arranca el servidor OpenAI falso (backend/bench/fake_openai.py) y, por cada
+tamaño de corpus, lanza un subproceso aislado (DATA_DIR temporal propio) que:
+
+  1. genera el corpus sintético (backend/bench/corpus.py)
+  2. ingesta      -> pages/s, chunks/s (ingest.main)
+  3. recuperación -> p50/p95/p99 por backend (chroma / numpy) y modo
+                     (vectorial / híbrido), con las consultas ya embebidas
+  4. end-to-end   -> /api/teacher bajo varias concurrencias (p50/p95/p99, rps)
+  5. memoria      -> pico de RSS tras cada fase
+
+El resultado es un JSON (meta + resultados) comparable con --baseline:
+se imprime la variación de cada métrica y se marcan las regresiones.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from backend.bench.fake_openai import start_fake_server
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+
+# Métricas donde más es mejor; el resto de métricas numéricas (ms, MB,
+# segundos) se interpretan como "menos es mejor"
+HIGHER_IS_BETTER = ("pages_per_s", "chunks_per_s", "rps")
+# Campos que describen la ejecución, no se comparan
+NOT_METRICS = ("files", "pages", "chunks", "queries", "requests", "concurrency", "errors", "k")
+
+
+def _percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    if not samples_ms:
+        return {}
+    p50, p95, p99 = np.percentile(samples_ms, [50, 95, 99])
+    return {
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(np.mean(samples_ms)), 3),
+    }
+
+
+def _peak_rss_mb() -> Dict[str, float]:
+    # ru_maxrss en KB en Linux (bytes en macOS)
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+# ========================================
+# Subproceso: un tamaño de corpus
+# ========================================
+
+def _bench_retrieval(queries: List[str], k: int, repeats: int) -> Dict[str, Any]:
+    from backend.resources import registry
+    from backend.index_versions import current_paths
+    from backend.retrieve import get_vectordb, search_contexts
+    from backend.vector_index import has_numpy_index
+
+    vectors = registry.embeddings.embed_documents(queries)
+    lexical_index = registry.lexical_index
+    stores = {"chroma": get_vectordb(registry.embeddings, backend="chroma")}
+    if has_numpy_index(current_paths().numpy_dir):
+        stores["numpy"] = get_vectordb(registry.embeddings, backend="numpy")
+
+    results: Dict[str, Any] = {}
+    for backend_name, store in stores.items():
+        modes = {"vector": None}
+        if lexical_index is not None:
+            modes["hybrid"] = lexical_index
+        for mode, lexical in modes.items():
+            search_contexts(store, queries[0], vectors[0], k=k, lexical_index=lexical)   # calentamiento
+            samples = []
+            for _ in range(repeats):
+                for question, vector in zip(queries, vectors):
+                    t0 = time.perf_counter()
+                    search_contexts(store, question, vector, k=k, lexical_index=lexical)
+                    samples.append((time.perf_counter() - t0) * 1000)
+            results[f"{backend_name}_{mode}"] = {"queries": len(samples), **_percentiles(samples)}
+    return results
+
+
+async def _bench_teacher(queries: List[str], concurrency_levels: List[int], requests_per_level: int) -> Dict[str, Any]:
+    import httpx
+    from backend.app import app
+
+    results: Dict[str, Any] = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        for concurrency in concurrency_levels:
+            slots = asyncio.Semaphore(concurrency)
+            samples: List[float] = []
+            errors = 0
+
+            async def one(i: int) -> None:
+                nonlocal errors
+                async with slots:
+                    t0 = time.perf_counter()
+                    r = await client.post("/api/teacher", json={"text": queries[i % len(queries)]})
+                    if r.status_code == 200:
+                        samples.append((time.perf_counter() - t0) * 1000)
+                    else:
+                        errors += 1
+
+            t_start = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(requests_per_level)))
+            wall = time.perf_counter() - t_start
+            results[f"c{concurrency}"] = {
+                "concurrency": concurrency,
+                "requests": requests_per_level,
+                "errors": errors,
+                "rps": round(len(samples) / wall, 2) if wall else 0.0,
+                **_percentiles(samples),
+            }
+    return results
+
+
+def _child(args: argparse.Namespace) -> None:
+    """Se ejecuta con DATA_DIR/OPENAI_BASE_URL ya en el entorno (ver _run_size)."""
+    from backend.bench.corpus import generate_corpus, sample_queries
+    from backend.config import DOCS_DIR
+    from backend import ingest
+    from backend.resources import registry
+
+    result: Dict[str, Any] = {"docs": args.size, "pages_per_doc": args.pages}
+    generate_corpus(DOCS_DIR, args.size, args.pages, seed=args.seed)
+
+    stats = ingest.main(rebuild=True, export_numpy=True)
+    result["ingest"] = {key: value for key, value in stats.items() if key != "peak_rss_mb"}
+    result["memory_mb"] = {"after_ingest": _peak_rss_mb()}
+
+    registry.init()
+    queries = sample_queries(args.queries, seed=args.seed)
+    result["retrieval"] = _bench_retrieval(queries, k=6, repeats=args.repeats)
+    result["memory_mb"]["after_retrieval"] = _peak_rss_mb()
+
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    result["teacher"] = asyncio.run(_bench_teacher(queries, levels, args.requests))
+    result["memory_mb"]["after_teacher"] = _peak_rss_mb()
+
+    Path(args.result).write_text(json.dumps(result, indent=2), encoding="utf-8")
+
+
+# ========================================
+# Orquestador
+# ========================================
+
+def _run_size(size: int, base_url: str, args: argparse.Namespace) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory(prefix=f"zoltar-bench-{size}-") as tmp:
+        result_path = Path(tmp) / "result.json"
+        env = {
+            **os.environ,
+            "DATA_DIR": str(Path(tmp) / "data"),
+            "OPENAI_BASE_URL": base_url,
+            "OPENAI_API_KEY": "fake",
+            "EMBEDDINGS_PROVIDER": "openai",
+            # El servidor falso no necesita tokenizar (y tiktoken podría no
+            # tener sus ficheros sin red)
+            "EMBEDDINGS_CHECK_CTX_LENGTH": "false",
+            # Medimos el pipeline, no las cachés ni la coalescencia
+            "ANSWER_CACHE_ENABLED": "false",
+            "EMBEDDING_CACHE_ENABLED": "false",
+            "COALESCE_REQUESTS": "false",
+        }
+        cmd = [
+            sys.executable, "-m", "backend.bench.run", "--_child",
+            "--size", str(size), "--pages", str(args.pages), "--seed", str(args.seed),
+            "--queries", str(args.queries), "--repeats", str(args.repeats),
+            "--concurrency", args.concurrency, "--requests", str(args.requests),
+            "--result", str(result_path),
+        ]
+        print(f"▶️ Corpus de {size} documentos…")
+        proc = subprocess.run(
+            cmd, cwd=ROOT_DIR, env=env,
+            stdout=None if args.verbose else subprocess.DEVNULL,
+        )
+        if proc.returncode != 0 or not result_path.exists():
+            raise RuntimeError(f"El benchmark con {size} documentos falló (código {proc.returncode})")
+        return json.loads(result_path.read_text(encoding="utf-8"))
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _flatten(data: Any, prefix: str = "") -> Dict[str, float]:
+    flat: Dict[str, float] = {}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            flat.update(_flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        flat[prefix] = float(data)
+    return flat
+
+
+def compare(
+    current: Dict, baseline: Dict, threshold: float, min_abs: float = 0.5
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Compara results de dos ejecuciones. Devuelve (todas las filas, regresiones).
+    threshold es la variación relativa tolerada (0.1 = 10 %); diferencias
+    absolutas menores que min_abs (p. ej. 0.1 ms de recuperación) son ruido.
+    """
+    now, before = _flatten(current.get("results", {})), _flatten(baseline.get("results", {}))
+    rows, regressions = [], []
+    for key in sorted(now.keys() & before.keys()):
+        leaf = key.rsplit(".", 1)[-1]
+        if leaf in NOT_METRICS or not before[key]:
+            continue
+        delta = (now[key] - before[key]) / abs(before[key])
+        worse = -delta if leaf in HIGHER_IS_BETTER else delta
+        row = {"metric": key, "baseline": before[key], "current": now[key], "delta_pct": round(delta * 100, 1)}
+        rows.append(row)
+        if worse > threshold and abs(now[key] - before[key]) >= min_abs:
+            regressions.append(row)
+    return rows, regressions
+
+
+def _main(args: argparse.Namespace) -> int:
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    server, base_url = start_fake_server(
+        latency_ms=args.latency_ms, token_ms=args.token_ms,
+        embed_latency_ms=args.embed_latency_ms, seed=args.seed,
+    )
+    print(f"🧪 Servidor OpenAI falso en {base_url}")
+
+    results = {}
+    try:
+        for size in sizes:
+            results[f"docs_{size}"] = _run_size(size, base_url, args)
+            print(f"✅ {size} documentos: {json.dumps(results[f'docs_{size}']['ingest'])}")
+    finally:
+        server.shutdown()
+
+    report = {
+        "meta": {
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "params": {
+                key: getattr(args, key)
+                for key in ("sizes", "pages", "seed", "queries", "repeats", "concurrency", "requests",
+                            "latency_ms", "token_ms", "embed_latency_ms")
+            },
+            "fake_server": server.config.counters,
+        },
+        "results": results,
+    }
+    Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"💾 Resultados en {args.out}")
+
+    if not args.baseline:
+        return 0
+    baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+    rows, regressions = compare(report, baseline, args.threshold, args.min_abs)
+    print(f"📊 Comparación con {args.baseline} (umbral {args.threshold:.0%}):")
+    flagged = {row["metric"] for row in regressions}
+    for row in rows:
+        mark = "❌" if row["metric"] in flagged else "  "
+        print(f"{mark} {row['metric']:<55} {row['baseline']:>12.2f} -> {row['current']:>12.2f} ({row['delta_pct']:+.1f} %)")
+    print(f"{len(regressions)} regresiones de {len(rows)} métricas")
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark offline (servidor OpenAI falso + corpus sintético)")
+    parser.add_argument("--sizes", default="10,50", help="Tamaños de corpus (número de PDFs)")
+    parser.add_argument("--pages", type=int, default=8, help="Páginas por PDF")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=50, help="Consultas distintas")
+    parser.add_argument("--repeats", type=int, default=3, help="Repeticiones de cada consulta en recuperación")
+    parser.add_argument("--concurrency", default="1,8,32", help="Niveles de concurrencia para /api/teacher")
+    parser.add_argument("--requests", type=int, default=64, help="Requests por nivel de concurrencia")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Latencia simulada del LLM")
+    parser.add_argument("--token-ms", type=float, default=0.0, help="Pausa entre tokens en streaming")
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0, help="Latencia simulada de embeddings")
+    parser.add_argument("--out", default="bench.json", help="Fichero JSON de resultados")
+    parser.add_argument("--baseline", default=None, help="JSON de una ejecución anterior para comparar")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Variación tolerada antes de marcar regresión")
+    parser.add_argument("--min-abs", type=float, default=0.5, help="Diferencia absoluta mínima para contar como regresión")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Código de salida 1 si hay regresiones")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar la salida de la ingesta")
+    # Uso interno (subproceso por tamaño)
+    parser.add_argument("--_child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--result", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args._child:
+        _child(args)
+    else:
+        sys.exit(_main(args))
@@ -0,0 +1,324 @@
+# backend/bulk.py
+"""
+Evaluación masiva: muchas preguntas por los modos baseline / engineered /
+teacher en una sola pasada.
+
+    python -m backend.bulk preguntas.jsonl -o resultados.jsonl --modes baseline,engineered,teacher
+
+Entrada JSONL, una pregunta por línea:
+    {"id": "q1", "text": "¿Qué es UbD?", "mode": "teacher", "history": "", "top_k": 6}
+(solo "text" —o "question"— es obligatorio; con --modes cada pregunta se
+ejecuta en todos esos modos y el id pasa a ser "q1:teacher").
+
+Pipeline por lotes:
+  1. embeddings -> UNA llamada para todas las preguntas distintas
+  2. retrieve   -> búsqueda vectorizada (search_contexts_many)
+  3. generate   -> completions concurrentes con límite de concurrencia y de
+                   requests por minuto (BULK_CONCURRENCY / BULK_RPM)
+
+Las llamadas a OpenAI van con prioridad "bulk" en el planificador (ver
+backend/scheduler.py): las requests en vivo pasan antes.
+
+Cada resultado se escribe en cuanto termina (latencia y uso de tokens por
+ítem). Al relanzar con el mismo fichero de salida, se saltan los ids que ya
+terminaron bien: las ejecuciones se pueden reanudar.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from backend.config import BULK_CONCURRENCY, BULK_RPM
+from backend.prompt_baseline import BASELINE_SYSTEM_PROMPT
+from backend.rag_pipeline import (
+    FALLBACK_NO_CONTEXT,
+    agenerate_with_usage,
+    assemble_rag_messages,
+    assemble_teacher_messages,
+    candidates_k,
+    rerank_contexts,
+)
+from backend.resources import registry
+from backend.scheduler import priority
+
+try:
+    from backend.prompt_baseline import ENGINEERED_SYSTEM_PROMPT
+except Exception:
+    ENGINEERED_SYSTEM_PROMPT = BASELINE_SYSTEM_PROMPT
+
+MODES = ("baseline", "engineered", "teacher")
+
+# Mismos k por defecto que /api/answer
+DEFAULT_K = {"baseline": 5, "engineered": 5, "teacher": 6}
+
+
+@dataclass
+class BulkItem:
+    id: str
+    question: str
+    mode: str = "engineered"
+    history: str = ""
+    k: int = 5
+
+
+# ========================================
+# Entrada / salida
+# ========================================
+
+def parse_items(lines: Iterable[str], modes: Optional[Sequence[str]] = None) -> List[BulkItem]:
+    """
+    Lee las líneas JSONL. Con modes, cada pregunta se expande a esos modos.
+    Lanza ValueError indicando la línea si algo no es válido.
+    """
+    items: List[BulkItem] = []
+    for line_no, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Línea {line_no}: JSON inválido ({e})")
+
+        question = str(row.get("text") or row.get("question") or "").strip()
+        if not question:
+            raise ValueError(f"Línea {line_no}: falta 'text'")
+        base_id = str(row.get("id", line_no))
+
+        item_modes = list(modes) if modes else [str(row.get("mode", "engineered")).lower()]
+        for mode in item_modes:
+            if mode not in MODES:
+                raise ValueError(f"Línea {line_no}: modo desconocido {mode!r} (opciones: {', '.join(MODES)})")
+            items.append(BulkItem(
+                id=f"{base_id}:{mode}" if modes else base_id,
+                question=question,
+                mode=mode,
+                history=str(row.get("history") or ""),
+                k=int(row.get("top_k") or DEFAULT_K[mode]),
+            ))
+    return items
+
+
+def load_done_ids(path: Path) -> Set[str]:
+    """Ids que ya terminaron bien en una ejecución anterior (para reanudar)."""
+    done: Set[str] = set()
+    if not path.exists():
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue   # última línea a medias si se cortó la ejecución
+            if row.get("status") == "ok":
+                done.add(str(row.get("id")))
+    return done
+
+
+def repair_tail(path: Path) -> None:
+    """
+    Deja el fichero de resultados listo para seguir escribiendo en modo "a":
+    si se cortó a mitad de una línea, esa línea se descarta (se repite el
+    ítem) o, si el JSON está completo y solo falta el salto, se termina.
+    """
+    if not path.exists():
+        return
+    with open(path, "rb+") as f:
+        data = f.read()
+        if not data or data.endswith(b"\n"):
+            return
+        cut = data.rfind(b"\n") + 1
+        try:
+            json.loads(data[cut:])
+        except ValueError:
+            f.truncate(cut)
+            return
+        f.write(b"\n")
+
+
+# ========================================
+# Límite de ritmo
+# ========================================
+
+class RateLimiter:
+    """Espacia los inicios de llamada para no superar rpm requests por minuto (0 = sin límite)."""
+
+    def __init__(self, rpm: float):
+        self.interval = 60.0 / rpm if rpm > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            wait = self._next - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next = max(self._next, loop.time()) + self.interval
+
+
+# ========================================
+# Ejecución
+# ========================================
+
+def _messages_for(item: BulkItem, contexts: List[Any]) -> Tuple[List[Dict], List[str]]:
+    if item.mode == "teacher":
+        return assemble_teacher_messages(item.question, contexts, item.history)
+    system_prompt = BASELINE_SYSTEM_PROMPT if item.mode == "baseline" else ENGINEERED_SYSTEM_PROMPT
+    return assemble_rag_messages(item.question, contexts, system_prompt)
+
+
+def _result(item: BulkItem, **fields: Any) -> Dict[str, Any]:
+    return {"id": item.id, "mode": item.mode, "question": item.question, **fields}
+
+
+async def _retrieve_all(items: List[BulkItem], summary: Dict[str, Any]) -> Dict[Tuple[str, int], List[Any]]:
+    """Embeddings en una llamada + recuperación vectorizada por cada k distinto."""
+    from backend.retrieve import search_contexts_many   # diferido: LangChain fuera del import de la app
+
+    questions = list(dict.fromkeys(item.question for item in items))
+
+    t0 = time.perf_counter()
+    with priority("bulk"):
+        vectors = await registry.embeddings.aembed_documents(questions)
+    summary["embed_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    by_question = dict(zip(questions, vectors))
+
+    await registry.arefresh_index_if_stale()
+    t0 = time.perf_counter()
+    vectordb, lexical_index, reranker = registry.vectordb, registry.lexical_index, registry.reranker
+    contexts: Dict[Tuple[str, int], List[Any]] = {}
+    for k in sorted({item.k for item in items}):
+        qs = list(dict.fromkeys(item.question for item in items if item.k == k))
+        found = await asyncio.to_thread(
+            search_contexts_many, vectordb, qs, [by_question[q] for q in qs],
+            k=candidates_k(k, reranker), lexical_index=lexical_index,
+        )
+        if reranker is not None:
+            found = await asyncio.to_thread(lambda: [
+                rerank_contexts(reranker, q, by_question[q], docs, vectordb, k) for q, docs in zip(qs, found)
+            ])
+        contexts.update({(q, k): docs for q, docs in zip(qs, found)})
+    summary["retrieve_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    return contexts
+
+
+async def _answer(item: BulkItem, contexts: List[Any], slots: asyncio.Semaphore, limiter: RateLimiter) -> Dict[str, Any]:
+    if not contexts:
+        return _result(item, status="ok", text=FALLBACK_NO_CONTEXT, sources=[], latency_ms=0.0,
+                       timings={}, usage={"input_tokens": 0, "output_tokens": 0, "total_tokens": 0})
+
+    t0 = time.perf_counter()
+    async with slots:
+        await limiter.acquire()
+        queued = time.perf_counter()
+        try:
+            messages, sources = _messages_for(item, contexts)
+            with priority("bulk"):
+                text, usage = await agenerate_with_usage(messages)
+        except Exception as e:
+            return _result(item, status="error", error=str(e),
+                           latency_ms=round((time.perf_counter() - t0) * 1000, 2))
+    done = time.perf_counter()
+    return _result(
+        item,
+        status="ok",
+        text=text,
+        sources=sources,
+        latency_ms=round((done - t0) * 1000, 2),
+        timings={
+            "queue_ms": round((queued - t0) * 1000, 2),
+            "generate_ms": round((done - queued) * 1000, 2),
+        },
+        usage=usage,
+    )
+
+
+async def run_batch(
+    items: List[BulkItem],
+    concurrency: int = BULK_CONCURRENCY,
+    rpm: float = BULK_RPM,
+    summary: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Ejecuta el lote y produce cada resultado en cuanto termina (no en orden).
+    Si se pasa summary, se rellena con tiempos y totales del lote.
+    """
+    summary = summary if summary is not None else {}
+    t_start = time.perf_counter()
+    summary.update(items=len(items), ok=0, errors=0, total_tokens=0)
+    if not items:
+        return
+
+    try:
+        contexts = await _retrieve_all(items, summary)
+    except Exception as e:
+        print(f"[bulk] Error en embeddings/recuperación: {e}")
+        for item in items:
+            summary["errors"] += 1
+            yield _result(item, status="error", error=f"Recuperación: {e}", latency_ms=0.0)
+        return
+
+    slots = asyncio.Semaphore(max(1, concurrency))
+    limiter = RateLimiter(rpm)
+    tasks = [
+        asyncio.create_task(_answer(item, contexts[(item.question, item.k)], slots, limiter))
+        for item in items
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            if result["status"] == "ok":
+                summary["ok"] += 1
+                summary["total_tokens"] += result.get("usage", {}).get("total_tokens", 0)
+            else:
+                summary["errors"] += 1
+            yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+        summary["wall_ms"] = round((time.perf_counter() - t_start) * 1000, 2)
+
+
+# ========================================
+# CLI
+# ========================================
+
+async def _main(args: argparse.Namespace) -> None:
+    modes = [m.strip().lower() for m in args.modes.split(",")] if args.modes else None
+    with open(args.input, encoding="utf-8") as f:
+        items = parse_items(f, modes)
+
+    output = Path(args.output)
+    repair_tail(output)
+    done = load_done_ids(output)
+    pending = [item for item in items if item.id not in done]
+    print(f"📄 {len(items)} ítems · {len(done)} ya hechos · {len(pending)} pendientes")
+
+    summary: Dict[str, Any] = {}
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "a", encoding="utf-8") as out:
+        async for result in run_batch(pending, concurrency=args.concurrency, rpm=args.rpm, summary=summary):
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            mark = "✅" if result["status"] == "ok" else "❌"
+            print(f"{mark} {result['id']} ({result.get('latency_ms', 0):.0f} ms)")
+
+    print(f"📊 Resumen: {json.dumps(summary, ensure_ascii=False)}")
+    await registry.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluación masiva de preguntas (JSONL -> JSONL)")
+    parser.add_argument("input", help="Fichero JSONL de entrada")
+    parser.add_argument("-o", "--output", default="bulk_results.jsonl", help="Fichero JSONL de resultados (se reanuda si existe)")
+    parser.add_argument("--modes", default=None, help="Modos a ejecutar por pregunta, p. ej. baseline,engineered,teacher")
+    parser.add_argument("--concurrency", type=int, default=BULK_CONCURRENCY, help="Completions simultáneas")
+    parser.add_argument("--rpm", type=float, default=BULK_RPM, help="Máximo de completions por minuto (0 = sin límite)")
+    asyncio.run(_main(parser.parse_args()))
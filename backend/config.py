@@ -1,11 +1,19 @@
 import os
 from pathlib import Path
-from dotenv import load_dotenv
 
 # ============================
 # Carga variables de entorno
 # ============================
-load_dotenv()
+# Va aquí y no en el arranque: todas las constantes de este módulo se leen
+# con os.getenv al importarlo. Solo se mira backend/.env y la raíz del repo
+# (find_dotenv subía directorio a directorio hasta la raíz del disco) y
+# python-dotenv se importa solo si hay fichero (en Render no lo hay).
+for _env_file in (Path(__file__).resolve().parent / ".env", Path(__file__).resolve().parents[1] / ".env"):
+    if _env_file.is_file():
+        from dotenv import load_dotenv
+
+        load_dotenv(_env_file)
+        break
 
 # ========================================
 # Paths base
@@ -20,10 +28,18 @@ DATA_DIR = Path(os.getenv("DATA_DIR", str(BACKEND_DIR / "data")))
 # Subcarpetas
 DOCS_DIR = DATA_DIR / "docs"
 CHROMA_DIR = DATA_DIR / "chroma"
+CACHE_DIR = DATA_DIR / "cache"
+
 
-# Asegura que existan
-DOCS_DIR.mkdir(parents=True, exist_ok=True)
-CHROMA_DIR.mkdir(parents=True, exist_ok=True)
+
+def ensure_dirs() -> None:
+    """
+    Crea las carpetas de datos. No se hace al importar config: importar no
+    debe tocar el disco (arranque en frío); lo llaman la ingesta y el
+    calentamiento de la app.
+    """
+    DOCS_DIR.mkdir(parents=True, exist_ok=True)
+    CHROMA_DIR.mkdir(parents=True, exist_ok=True)
 
 # ========================================
 # Modelos y parámetros de embeddings/chat
@@ -35,12 +51,215 @@ EMBEDDINGS_PROVIDER = os.getenv("EMBEDDINGS_PROVIDER", "openai")
 # Modelo de embeddings por defecto
 EMBEDDINGS_MODEL = os.getenv("EMBEDDINGS_MODEL", "text-embedding-3-large")
 
+# Modelo local usado cuando EMBEDDINGS_PROVIDER="hf"
+HF_EMBEDDINGS_MODEL = os.getenv("HF_EMBEDDINGS_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+# Motor de los embeddings locales ("hf"):
+#   "onnx"  -> ONNX Runtime en CPU, sin PyTorch (backend/onnx_embeddings.py)
+#   "torch" -> HuggingFaceEmbeddings (sentence-transformers + PyTorch)
+HF_EMBEDDINGS_BACKEND = os.getenv("HF_EMBEDDINGS_BACKEND", "onnx").lower()
+
+# Pesos cuantizados int8 (más rápidos y ~4x más pequeños; coseno >0.99 con fp32)
+HF_EMBEDDINGS_QUANTIZED = os.getenv("HF_EMBEDDINGS_QUANTIZED", "true").lower() == "true"
+
+# Fichero .onnx dentro del repo del modelo (vacío = según HF_EMBEDDINGS_QUANTIZED)
+HF_EMBEDDINGS_ONNX_FILE = os.getenv("HF_EMBEDDINGS_ONNX_FILE", "")
+
+# Carpeta local con tokenizer.json + el .onnx (sin descarga desde el Hub)
+HF_EMBEDDINGS_DIR = os.getenv("HF_EMBEDDINGS_DIR") or None
+
+# Hilos de ONNX Runtime por forward pass (0 = los decide ONNX Runtime)
+HF_EMBEDDINGS_THREADS = int(os.getenv("HF_EMBEDDINGS_THREADS", "0"))
+
+# Micro-batching de consultas: las que llegan a la vez van en un solo forward
+EMBED_MICROBATCH_MAX = int(os.getenv("EMBED_MICROBATCH_MAX", "32"))
+EMBED_MICROBATCH_WAIT_MS = float(os.getenv("EMBED_MICROBATCH_WAIT_MS", "1.0"))
+
+# Caché de embeddings por contenido (provider, model, sha256(texto))
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = Path(os.getenv("EMBEDDING_CACHE_PATH", str(CACHE_DIR / "embeddings.sqlite3")))
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "10000"))
+
+# Endpoint compatible con la API de OpenAI (vacío = api.openai.com). Permite
+# apuntar a un proxy o al servidor falso de los benchmarks (backend/bench)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+
+# Si True, OpenAIEmbeddings tokeniza con tiktoken para trocear textos largos
+# (requiere poder descargar el encoding; los chunks de la ingesta son cortos)
+EMBEDDINGS_CHECK_CTX_LENGTH = os.getenv("EMBEDDINGS_CHECK_CTX_LENGTH", "true").lower() == "true"
+
 # Modelo de chat por defecto
 CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o-mini")
 
 # Temperatura para generación (0 = determinista, >0 = más creativo)
 CHAT_TEMPERATURE = float(os.getenv("CHAT_TEMPERATURE", "0.2"))
 
+# Modelo de respaldo si el principal falla o su circuito está abierto ("" = sin respaldo)
+CHAT_FALLBACK_MODEL = os.getenv("CHAT_FALLBACK_MODEL", "")
+
+# ========================================
+# Contexto del prompt (presupuesto en tokens, ver context_packer.py)
+# ========================================
+
+# Tokens máximos de contexto recuperado por prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1800"))
+
+# Presupuesto por modelo, p. ej. "gpt-4o-mini:1800,gpt-4o:3000" (sobrescribe el global)
+CONTEXT_TOKEN_BUDGETS = {
+    model.strip(): int(tokens)
+    for model, _, tokens in (
+        item.partition(":") for item in os.getenv("CONTEXT_TOKEN_BUDGETS", "").split(",") if ":" in item
+    )
+}
+
+# Tokens máximos de un solo bloque (chunks fusionados incluidos)
+CONTEXT_MAX_TOKENS_PER_BLOCK = int(os.getenv("CONTEXT_MAX_TOKENS_PER_BLOCK", "400"))
+
+# ========================================
+# Caché de respuestas (exacta + semántica)
+# ========================================
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_MAX_ITEMS = int(os.getenv("ANSWER_CACHE_MAX_ITEMS", "2000"))
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", "900"))
+
+# Distancia coseno máxima para reutilizar una respuesta (0 = solo exacta)
+ANSWER_CACHE_SEMANTIC_DISTANCE = float(os.getenv("ANSWER_CACHE_SEMANTIC_DISTANCE", "0.05"))
+
+# ========================================
+# Sesiones de conversación (session_id en /api/teacher y /api/answer)
+# ========================================
+
+# Turnos (pregunta + respuesta) que se mantienen literales en el prompt;
+# los anteriores se condensan en un resumen en segundo plano
+SESSION_RECENT_TURNS = int(os.getenv("SESSION_RECENT_TURNS", "4"))
+
+# Tokens máximos de cada turno guardado y del resumen acumulado
+SESSION_TURN_MAX_TOKENS = int(os.getenv("SESSION_TURN_MAX_TOKENS", "250"))
+SESSION_SUMMARY_MAX_TOKENS = int(os.getenv("SESSION_SUMMARY_MAX_TOKENS", "300"))
+
+# Sesiones en memoria por proceso (LRU) y caducidad por inactividad
+SESSION_MEMORY_ITEMS = int(os.getenv("SESSION_MEMORY_ITEMS", "1000"))
+SESSION_TTL_S = float(os.getenv("SESSION_TTL_S", str(7 * 24 * 3600)))
+SESSION_DB_PATH = Path(os.getenv("SESSION_DB_PATH", str(CACHE_DIR / "sessions.sqlite3")))
+
+# Con historial previo, reescribir la pregunta como consulta autónoma para
+# la recuperación ("¿y en primaria?" -> "uso de ChatGPT en primaria")
+QUERY_REWRITE_ENABLED = os.getenv("QUERY_REWRITE_ENABLED", "true").lower() == "true"
+
+# ========================================
+# Ingesta
+# ========================================
+
+# Procesos para parsear PDFs en paralelo (1 = sin pool, en el proceso principal)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Chunks por llamada de embeddings y lotes de embeddings en vuelo a la vez
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "128"))
+INGEST_EMBED_CONCURRENCY = int(os.getenv("INGEST_EMBED_CONCURRENCY", "4"))
+
+# Reintentos ante 429 / errores transitorios al embeber un lote
+INGEST_MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", "6"))
+
+# Versiones del índice que se conservan en DATA_DIR/chroma/versions (la
+# servida incluida; ver backend/index_versions.py). Las que algún worker
+# tiene aún abiertas se conservan además de estas (INDEX_LEASE_TTL_S)
+INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "2"))
+
+# ========================================
+# Evaluación masiva (python -m backend.bulk y /api/answer/batch)
+# ========================================
+
+# Completions simultáneas y máximo por minuto (0 = sin límite) de un lote
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "8"))
+BULK_RPM = float(os.getenv("BULK_RPM", "300"))
+
+# Máximo de ítems por request a /api/answer/batch
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "500"))
+
+# ========================================
+# Backend de recuperación
+# ========================================
+
+# "chroma" (por defecto) o "numpy" (matriz float32 memory-mapped en proceso)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "chroma").lower()
+
+# Índice NumPy de los índices sin versiones (las versiones lo llevan en
+# versions/<v>/npindex)
+NUMPY_INDEX_DIR = Path(os.getenv("NUMPY_INDEX_DIR", str(CHROMA_DIR / "npindex")))
+
+# Exportar el índice NumPy al terminar cada ingesta (siempre si el backend es
+# "numpy"). Con Chroma hace de sidecar: MMR vectorizado sobre sus vectores
+# (ver retrieve.SidecarChroma)
+EXPORT_NUMPY_INDEX = (
+    os.getenv("EXPORT_NUMPY_INDEX", "true").lower() == "true" or RETRIEVAL_BACKEND == "numpy"
+)
+
+# "vector" (solo embeddings) o "hybrid" (embeddings + BM25 fusionados con RRF)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+
+# Índice léxico BM25 de los índices sin versiones (versions/<v>/bm25 si no)
+LEXICAL_INDEX_DIR = Path(os.getenv("LEXICAL_INDEX_DIR", str(CHROMA_DIR / "bm25")))
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+# Constante de Reciprocal Rank Fusion: score = sum(1 / (HYBRID_RRF_K + rank))
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+
+# ========================================
+# Reranking (ver backend/rerank.py)
+# ========================================
+
+# Reordena los candidatos recuperados y se queda con menos bloques (prompt más corto)
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+
+# Cross-encoder ONNX local (repo del Hub con onnx/model.onnx, p. ej.
+# "cross-encoder/ms-marco-MiniLM-L-6-v2"). Vacío: coseno contra los
+# embeddings ya guardados de los fragmentos (sin modelo extra).
+RERANK_MODEL = os.getenv("RERANK_MODEL", "")
+RERANK_MODEL_DIR = os.getenv("RERANK_MODEL_DIR", "")   # copia local (sin descarga)
+RERANK_ONNX_FILE = os.getenv("RERANK_ONNX_FILE", "onnx/model.onnx")
+RERANK_THREADS = int(os.getenv("RERANK_THREADS", "1"))
+
+# Candidatos que se piden a la recuperación antes de reordenar (≥ k)
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "12"))
+
+# Corte adaptativo: se corta en el mayor salto de score entre posiciones
+# consecutivas si supera esta fracción del rango de scores; nunca menos de
+# RERANK_MIN_KEEP bloques ni más de k
+RERANK_MIN_KEEP = int(os.getenv("RERANK_MIN_KEEP", "2"))
+RERANK_GAP_RATIO = float(os.getenv("RERANK_GAP_RATIO", "0.25"))
+
+# Presupuesto de latencia: si la estimación (media móvil del coste por
+# candidato) lo supera, la etapa se salta y se usan los k primeros candidatos
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "80"))
+
+# ========================================
+# Enrutado de consultas en /api/answer (ver backend/query_router.py)
+# ========================================
+
+# Saludos / agradecimientos -> respuesta fija; fuera del corpus -> chat
+# simple; solo las preguntas con respaldo en el corpus pasan por RAG
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "true").lower() == "true"
+
+# Clasificador por embeddings (ejemplos de cada intención):
+#   "auto" -> solo con embeddings locales (EMBEDDINGS_PROVIDER="hf")
+#   "true" / "false"
+ROUTER_EMBEDDINGS = os.getenv("ROUTER_EMBEDDINGS", "auto").lower()
+
+# Ventaja mínima de similitud sobre los ejemplos del corpus para sacar una
+# pregunta de RAG por el clasificador
+ROUTER_EMBEDDINGS_MARGIN = float(os.getenv("ROUTER_EMBEDDINGS_MARGIN", "0.05"))
+
+# Un término de la consulta "ancla" en el corpus si aparece en el índice BM25
+# en menos de esta fracción de fragmentos (solo se descartan los casi universales)
+ROUTER_MAX_TERM_DF = float(os.getenv("ROUTER_MAX_TERM_DF", "0.9"))
+
+# Sin términos que anclen (p. ej. pregunta en español sobre un corpus en
+# inglés), la consulta solo sale de RAG si además su similitud coseno con el
+# fragmento más cercano del índice queda por debajo de este valor
+ROUTER_MIN_SIMILARITY = float(os.getenv("ROUTER_MIN_SIMILARITY", "0.2"))
+
 # ========================================
 # CORS
 # ========================================
@@ -49,6 +268,140 @@ CHAT_TEMPERATURE = float(os.getenv("CHAT_TEMPERATURE", "0.2"))
 # En producción: pon la URL real del frontend
 FRONTEND_ORIGIN = os.getenv("FRONTEND_ORIGIN", "*")
 
+# ========================================
+# Pool HTTP compartido (keep-alive hacia OpenAI)
+# ========================================
+
+# Conexiones simultáneas máximas por cliente HTTP
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+
+# Conexiones ociosas que se mantienen abiertas (evita handshakes TLS en frío)
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+
+# Segundos que una conexión ociosa sigue viva antes de cerrarse
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+
+# Timeout total (segundos) de cada llamada HTTP saliente
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+
+# ========================================
+# Concurrencia del request path asíncrono
+# ========================================
+
+# Timeout total (segundos) de cada request a /api/* (incluye la espera en cola)
+REQUEST_TIMEOUT_S = float(os.getenv("REQUEST_TIMEOUT_S", "45"))
+
+# Requests del pipeline en vuelo simultáneamente por proceso
+MAX_INFLIGHT_REQUESTS = int(os.getenv("MAX_INFLIGHT_REQUESTS", "256"))
+
+# Llamadas simultáneas al modelo de chat por proceso
+MAX_CONCURRENT_LLM_CALLS = int(os.getenv("MAX_CONCURRENT_LLM_CALLS", "64"))
+
+# Requests idénticas en vuelo comparten un único cálculo (ver singleflight.py)
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "true").lower() == "true"
+
+# ========================================
+# Planificador de llamadas salientes a OpenAI (ver backend/scheduler.py)
+# ========================================
+
+# Cubos de requests y tokens por minuto por modelo, compartidos por todo el
+# proceso; las llamadas interactivas pasan antes que bulk e ingest
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+
+# Límites iniciales por modelo; se ajustan con las cabeceras x-ratelimit-*
+# de cada respuesta (límite real de la clave y lo que queda disponible)
+SCHEDULER_RPM = float(os.getenv("SCHEDULER_RPM", "500"))
+SCHEDULER_TPM = float(os.getenv("SCHEDULER_TPM", "200000"))
+
+# Fracción de cada cubo que las clases en segundo plano no pueden gastar
+# (ingest respeta la reserva entera, bulk la mitad): deja margen a las
+# requests en vivo aunque la ingesta corra en otro proceso con la misma clave
+SCHEDULER_RESERVE = float(os.getenv("SCHEDULER_RESERVE", "0.2"))
+
+# Tokens de respuesta estimados si la request no fija max_tokens
+SCHEDULER_COMPLETION_TOKENS = int(os.getenv("SCHEDULER_COMPLETION_TOKENS", "400"))
+
+# ========================================
+# Llamadas al modelo de chat (ver backend/llm_client.py)
+# ========================================
+
+# Plazo total (segundos) de cada llamada: reintentos, cobertura y respaldo
+# incluidos. Menor que REQUEST_TIMEOUT_S para que el error llegue como
+# resultado y no como timeout de la request
+LLM_DEADLINE_S = float(os.getenv("LLM_DEADLINE_S", "30"))
+
+# Plazo (segundos) de cada intento dentro del total
+LLM_ATTEMPT_TIMEOUT_S = float(os.getenv("LLM_ATTEMPT_TIMEOUT_S", "20"))
+
+# Reintentos ante 429 / 5xx / timeout / error de conexión (backoff exponencial con jitter)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_MS = float(os.getenv("LLM_RETRY_BASE_MS", "250"))
+LLM_RETRY_MAX_MS = float(os.getenv("LLM_RETRY_MAX_MS", "4000"))
+
+# Petición duplicada ("hedged") si la primera tarda más que el percentil
+# LLM_HEDGE_QUANTILE de las latencias recientes (nunca antes de LLM_HEDGE_MIN_MS
+# ni sin LLM_HEDGE_MIN_SAMPLES mediciones); gana la primera que responde
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_MS = float(os.getenv("LLM_HEDGE_MIN_MS", "500"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+# Circuito: tras N fallos seguidos el modelo se deja de llamar durante
+# LLM_BREAKER_COOLDOWN_S (se pasa al respaldo); luego se prueba con una llamada
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN_S = float(os.getenv("LLM_BREAKER_COOLDOWN_S", "30"))
+
+# ========================================
+# Arranque
+# ========================================
+
+# Carga de embeddings / chat / índice al arrancar la app:
+#   "background" -> en un hilo tras abrir el puerto (/health responde ya,
+#                   /ready pasa a 200 al terminar)
+#   "blocking"   -> antes de aceptar tráfico (comportamiento anterior)
+#   "lazy"       -> nada al arrancar; cada recurso se carga en su primer uso
+WARMUP_MODE = os.getenv("WARMUP_MODE", "background").lower()
+
+# Token de POST /admin/reload (reconstruye los clientes sin reiniciar, p. ej.
+# tras rotar la clave o cambiar de modelo). Vacío = endpoint desactivado
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# ========================================
+# Varios workers (uvicorn --workers N)
+# ========================================
+
+# Segundo nivel de las cachés (respuestas y embeddings) común a los workers:
+#   "local"  -> solo la memoria de cada proceso (un worker)
+#   "sqlite" -> fichero SHARED_CACHE_PATH (varios workers en la misma máquina)
+#   "redis"  -> REDIS_URL (varias máquinas; requiere el paquete `redis`)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "local").lower()
+SHARED_CACHE_PATH = Path(os.getenv("SHARED_CACHE_PATH", str(CACHE_DIR / "shared.sqlite3")))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Cada cuántos segundos se borran las entradas caducadas de los ficheros
+# SQLite compartidos (0 = nunca; Redis las expira solo)
+CACHE_PURGE_INTERVAL_S = float(os.getenv("CACHE_PURGE_INTERVAL_S", "3600"))
+
+# Cada cuántos segundos mira cada worker si la ingesta publicó una versión
+# nueva del índice para cargarla sin reiniciar (0 = nunca)
+INDEX_WATCH_INTERVAL_S = float(os.getenv("INDEX_WATCH_INTERVAL_S", "2"))
+
+# Cada worker registra la versión del índice que tiene abierta y la renueva
+# cada INDEX_LEASE_TTL_S / 3; la recolección de versiones no borra una
+# versión con un registro más reciente que esto (un worker que murió deja de
+# retenerla pasado este tiempo)
+INDEX_LEASE_TTL_S = float(os.getenv("INDEX_LEASE_TTL_S", "300"))
+
+# ========================================
+# Observabilidad
+# ========================================
+
+# Histogramas por etapa, tokens y caché en /metrics (formato Prometheus)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Cabecera Server-Timing con la duración de cada etapa en cada respuesta
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "false").lower() == "true"
+
 
 
 
@@ -0,0 +1,257 @@
+# backend/context_packer.py
+"""
+Empaquetado del contexto recuperado por presupuesto de TOKENS (tiktoken).
+
+Sustituye a los límites por caracteres:
+- cuenta tokens con el encoding del modelo de chat (n_tokens precalculado en
+  la ingesta cuando está disponible en la metadata del chunk),
+- fusiona chunks contiguos de la misma página (chunk_index consecutivos)
+  quitando el solapamiento que deja chunk_overlap,
+- descarta chunks repetidos,
+- rellena el presupuesto de forma voraz en orden de relevancia: si un bloque
+  no cabe se salta y se prueba con el siguiente (no se corta en el primero).
+
+Si el encoding de tiktoken no está disponible (p. ej. sin red para
+descargarlo), se usa una estimación conservadora por caracteres.
+"""
+
+import hashlib
+import math
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.config import (
+    CHAT_MODEL,
+    CONTEXT_MAX_TOKENS_PER_BLOCK,
+    CONTEXT_TOKEN_BUDGET,
+    CONTEXT_TOKEN_BUDGETS,
+)
+
+# Caracteres por token usados en la estimación de respaldo (a la baja: en
+# español con o200k_base suelen ser ~4, así la estimación sobra, no falta)
+_FALLBACK_CHARS_PER_TOKEN = 3.0
+
+# Mayor solapamiento que se busca entre chunks contiguos (>= chunk_overlap de la ingesta)
+MAX_OVERLAP_CHARS = 200
+
+
+# ========================================
+# Conteo de tokens
+# ========================================
+
+@lru_cache(maxsize=8)
+def get_encoder(model: str = CHAT_MODEL):
+    """Encoding de tiktoken del modelo (o200k_base si no se conoce); None si no carga."""
+    try:
+        import tiktoken
+    except ImportError:
+        print("[context] ⚠️ tiktoken no instalado: tokens estimados por caracteres")
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        print(f"[context] ⚠️ No se pudo cargar el encoding de {model}: {e}. Tokens estimados por caracteres")
+        return None
+
+
+def tokenizer_name(model: str = CHAT_MODEL) -> Optional[str]:
+    """Nombre del encoding (se guarda junto a n_tokens para validar la caché)."""
+    encoder = get_encoder(model)
+    return encoder.name if encoder is not None else None
+
+
+def count_tokens(text: str, model: str = CHAT_MODEL) -> int:
+    encoder = get_encoder(model)
+    if encoder is None:
+        return math.ceil(len(text) / _FALLBACK_CHARS_PER_TOKEN)
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = CHAT_MODEL) -> str:
+    """Recorta a max_tokens por un límite de palabra y añade "…"."""
+    encoder = get_encoder(model)
+    if encoder is None:
+        cut = text[: int(max_tokens * _FALLBACK_CHARS_PER_TOKEN)]
+    else:
+        tokens = encoder.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        cut = encoder.decode(tokens[:max_tokens])
+    if len(cut) >= len(text):
+        return text
+    return cut.rsplit(" ", 1)[0] + "…"
+
+
+def token_budget_for(model: str = CHAT_MODEL) -> int:
+    """Presupuesto de tokens de contexto para el modelo (CONTEXT_TOKEN_BUDGETS o el global)."""
+    return CONTEXT_TOKEN_BUDGETS.get(model, CONTEXT_TOKEN_BUDGET)
+
+
+def _chunk_tokens(text: str, metadata: Dict[str, Any], model: str) -> int:
+    """Usa n_tokens de la ingesta si se calculó con el mismo encoding."""
+    cached = metadata.get("n_tokens")
+    if cached is not None and metadata.get("tokenizer") == tokenizer_name(model):
+        return int(cached)
+    return count_tokens(text, model)
+
+
+# ========================================
+# Fusión de chunks contiguos
+# ========================================
+
+def _overlap(left: str, right: str, max_chars: int = MAX_OVERLAP_CHARS) -> int:
+    """Longitud del mayor sufijo de left que es prefijo de right."""
+    limit = min(len(left), len(right), max_chars)
+    for size in range(limit, 0, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def merge_texts(left: str, right: str) -> str:
+    """Une dos chunks contiguos quitando el texto repetido por el solapamiento."""
+    size = _overlap(left, right)
+    if size:
+        return left + right[size:]
+    return f"{left} {right}"
+
+
+@dataclass
+class _Block:
+    rank: int                                  # mejor posición de recuperación del bloque
+    metadata: Dict[str, Any]
+    parts: List[Tuple[int, str]] = field(default_factory=list)   # (chunk_index, texto)
+
+    def text(self) -> str:
+        ordered = sorted(self.parts)
+        merged = ordered[0][1]
+        for _, text in ordered[1:]:
+            merged = merge_texts(merged, text)
+        return merged
+
+    def tokens(self, model: str) -> int:
+        if len(self.parts) == 1:
+            return _chunk_tokens(self.parts[0][1], self.metadata, model)
+        return count_tokens(self.text(), model)
+
+
+def _group_blocks(contexts: List[Any]) -> List[_Block]:
+    """
+    Agrupa los documentos: descarta textos repetidos y fusiona chunks de la
+    misma página con chunk_index consecutivo (en cadena: 3, 4, 5 -> un bloque).
+    """
+    blocks: List[_Block] = []
+    seen_text = set()
+    by_position: Dict[Tuple[Any, Any, int], _Block] = {}
+
+    for rank, c in enumerate(contexts):
+        md = getattr(c, "metadata", {}) or {}
+        text = (getattr(c, "page_content", "") or "").strip()
+        digest = hashlib.sha1(" ".join(text.split()).encode("utf-8")).digest()
+        if not text or digest in seen_text:
+            continue
+        seen_text.add(digest)
+
+        index = md.get("chunk_index")
+        key = (md.get("doc_id", md.get("source")), md.get("page"))
+        block = None
+        if index is not None:
+            left = by_position.get((*key, index - 1))
+            right = by_position.get((*key, index + 1))
+            block = left or right
+            if left is not None and right is not None and left is not right:
+                # Este chunk une dos bloques ya existentes (p. ej. llegan 3, 5 y luego 4)
+                left.parts.extend(right.parts)
+                left.rank = min(left.rank, right.rank)
+                blocks.remove(right)
+                for idx, _ in right.parts:
+                    by_position[(*key, idx)] = left
+
+        if block is None:
+            block = _Block(rank=rank, metadata=md)
+            blocks.append(block)
+        block.parts.append((index if index is not None else 0, text))
+        if index is not None:
+            by_position[(*key, index)] = block
+
+    return blocks
+
+
+# ========================================
+# Empaquetado
+# ========================================
+
+@dataclass
+class PackedContext:
+    text: str
+    sources: List[str]
+    tokens: int
+    blocks: int
+    skipped: int
+
+
+def _header(md: Dict[str, Any]) -> Tuple[str, str, Any]:
+    title = md.get("title", md.get("source", "Desconocido"))
+    authors = md.get("authors", "Autores desconocidos")
+    page = md.get("page", "N/A")
+    source = md.get("source", "Fuente desconocida")
+    header = (
+        f"Título: {title}\n"
+        f"Autores: {authors}\n"
+        f"Página: {page}\n"
+        f"Fuente: {source}"
+    )
+    return header, title, page
+
+
+def pack_contexts(
+    contexts: List[Any],
+    enumerate_blocks: bool = True,
+    model: str = CHAT_MODEL,
+    max_tokens: Optional[int] = None,
+    max_tokens_per_block: int = CONTEXT_MAX_TOKENS_PER_BLOCK,
+) -> PackedContext:
+    """
+    Convierte documentos recuperados en texto enumerado + referencias,
+    sin pasar de max_tokens (por defecto, el presupuesto del modelo).
+    """
+    budget = token_budget_for(model) if max_tokens is None else max_tokens
+    separator = count_tokens("\n\n", model)
+
+    parts: List[str] = []
+    sources: List[str] = []
+    total, skipped = 0, 0
+
+    for block in sorted(_group_blocks(contexts), key=lambda b: b.rank):
+        header, title, page = _header(block.metadata)
+        body_text = block.text()
+        body_tokens = block.tokens(model)
+        if body_tokens > max_tokens_per_block:
+            body_text = truncate_to_tokens(body_text, max_tokens_per_block, model)
+            body_tokens = count_tokens(body_text, model)
+
+        prefix = f"[{len(parts) + 1}] " if enumerate_blocks else ""
+        head = f"{prefix}{header}\nContenido:\n"
+        cost = count_tokens(head, model) + body_tokens + (separator if parts else 0)
+        if total + cost > budget:
+            skipped += 1
+            continue
+
+        parts.append(head + body_text)
+        total += cost
+
+        ref = f"{title} (p.{page})"
+        if ref not in sources:
+            sources.append(ref)
+
+    return PackedContext(
+        text="\n\n".join(parts).strip(),
+        sources=sources,
+        tokens=total,
+        blocks=len(parts),
+        skipped=skipped,
+    )
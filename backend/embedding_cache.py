@@ -0,0 +1,248 @@
+# backend/embedding_cache.py
+"""
+Caché persistente de embeddings direccionada por contenido.
+
+Clave: (provider, model, sha256(texto)). Valor: vector float32.
+- Nivel 1: LRU en memoria (OrderedDict) para consultas calientes.
+- Nivel 2: SQLite en DATA_DIR/cache/embeddings.sqlite3 (sobrevive reinicios
+  y rebuilds del índice; en WAL, la comparten los workers de una máquina).
+- Nivel 3 (opcional, CACHE_BACKEND="redis"): Redis, compartido entre
+  máquinas. Lo que se encuentra ahí se copia a los niveles locales.
+
+CachedEmbeddings envuelve cualquier Embeddings de LangChain: solo llama a la
+API por los textos que no están en caché. Así un rebuild de un corpus sin
+cambios hace cero llamadas de embeddings y las preguntas repetidas no salen
+a la red.
+"""
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from backend.config import CACHE_BACKEND, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MEMORY_ITEMS
+from backend.shared_store import open_shared_store
+
+Key = Tuple[str, str, str]
+
+
+def text_hash(text: str) -> str:
+    """sha256 hex del texto (UTF-8)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Almacén (provider, model, hash) -> vector, thread-safe.
+    """
+
+    def __init__(
+        self,
+        path: Path = EMBEDDING_CACHE_PATH,
+        memory_items: int = EMBEDDING_CACHE_MEMORY_ITEMS,
+        shared: Any = None,
+    ):
+        self.path = Path(path)
+        self.memory_items = memory_items
+        self.shared = shared
+        self._memory: "OrderedDict[Key, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                provider  TEXT NOT NULL,
+                model     TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector    BLOB NOT NULL,
+                PRIMARY KEY (provider, model, text_hash)
+            )
+            """
+        )
+        self._conn.commit()
+
+    # ========================================
+    # LRU en memoria
+    # ========================================
+
+    def _remember(self, key: Key, vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    # ========================================
+    # API
+    # ========================================
+
+    def get_many(self, provider: str, model: str, hashes: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Devuelve el vector de cada hash (None si no está en caché)."""
+        found: Dict[str, np.ndarray] = {}
+
+        with self._lock:
+            missing = []
+            for h in hashes:
+                key = (provider, model, h)
+                vec = self._memory.get(key)
+                if vec is not None:
+                    self._memory.move_to_end(key)
+                    found[h] = vec
+                else:
+                    missing.append(h)
+
+            # SQLite limita el número de parámetros: consultas por lotes
+            unique_missing = list(dict.fromkeys(missing))
+            for i in range(0, len(unique_missing), 500):
+                batch = unique_missing[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE provider = ? AND model = ? AND text_hash IN ({placeholders})",
+                    (provider, model, *batch),
+                ).fetchall()
+                for h, blob in rows:
+                    vec = np.frombuffer(blob, dtype=np.float32)
+                    found[h] = vec
+                    self._remember((provider, model, h), vec)
+
+        # Fuera del lock: una llamada lenta a Redis no frena al resto de hilos
+        if self.shared is not None:
+            self._get_shared(provider, model, [h for h in unique_missing if h not in found], found)
+
+        result = [found.get(h) for h in hashes]
+        hit_count = sum(v is not None for v in result)
+        with self._lock:
+            self.hits += hit_count
+            self.misses += len(result) - hit_count
+        return result
+
+    def put_many(self, provider: str, model: str, items: Sequence[Tuple[str, Sequence[float]]]) -> None:
+        """Guarda pares (hash, vector) en memoria y en SQLite."""
+        rows = []
+        with self._lock:
+            for h, vector in items:
+                vec = np.asarray(vector, dtype=np.float32)
+                self._remember((provider, model, h), vec)
+                rows.append((provider, model, h, vec.tobytes()))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (provider, model, text_hash, vector) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+        if self.shared is not None:
+            try:
+                self.shared.set_many([(f"{provider}:{model}:{h}", blob) for _, _, h, blob in rows])
+            except Exception as e:
+                print(f"[embedding_cache] ⚠️ No se pudo escribir en el almacén compartido: {e}")
+
+    def _get_shared(self, provider: str, model: str, hashes: List[str], found: Dict[str, np.ndarray]) -> None:
+        """Busca en el almacén compartido y copia los aciertos a memoria y SQLite. Llamar SIN el lock."""
+        if not hashes:
+            return
+        try:
+            blobs = self.shared.get_many([f"{provider}:{model}:{h}" for h in hashes])
+        except Exception as e:
+            print(f"[embedding_cache] ⚠️ Almacén compartido no disponible: {e}")
+            return
+        rows = []
+        for h, blob in zip(hashes, blobs):
+            if blob is not None:
+                found[h] = np.frombuffer(blob, dtype=np.float32)
+                rows.append((provider, model, h, blob))
+        if rows:
+            with self._lock:
+                for _, _, h, _ in rows:
+                    self._remember((provider, model, h), found[h])
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (provider, model, text_hash, vector) VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+                self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "memory_items": len(self._memory)}
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Caché compartida por todo el proceso (se abre una sola vez)."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                # Con "sqlite" el fichero de esta caché ya es compartido: solo Redis añade un nivel
+                shared = open_shared_store("embeddings") if CACHE_BACKEND == "redis" else None
+                _cache = EmbeddingCache(shared=shared)
+    return _cache
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings de LangChain con caché por contenido delante.
+
+    - inner: proveedor real (OpenAIEmbeddings, HuggingFaceEmbeddings, ...)
+    - provider / model: forman parte de la clave, así cambiar de modelo
+      nunca reutiliza vectores incompatibles.
+    """
+
+    def __init__(self, inner: Embeddings, provider: str, model: str, cache: Optional[EmbeddingCache] = None):
+        self.inner = inner
+        self.provider = provider
+        self.model = model
+        self.cache = cache or get_embedding_cache()
+
+    def _lookup(self, texts: List[str]) -> Tuple[List[str], List[Optional[np.ndarray]], List[str]]:
+        hashes = [text_hash(t) for t in texts]
+        vectors = self.cache.get_many(self.provider, self.model, hashes)
+        # Textos a embeber (sin duplicados), en orden de aparición
+        pending = {}
+        for t, h, v in zip(texts, hashes, vectors):
+            if v is None and h not in pending:
+                pending[h] = t
+        return hashes, vectors, list(pending.values())
+
+    def _merge(self, hashes, vectors, pending: List[str], computed: List[List[float]]) -> List[List[float]]:
+        if pending:
+            new_items = [(text_hash(t), v) for t, v in zip(pending, computed)]
+            self.cache.put_many(self.provider, self.model, new_items)
+            by_hash = {h: np.asarray(v, dtype=np.float32) for h, v in new_items}
+            vectors = [v if v is not None else by_hash[h] for h, v in zip(hashes, vectors)]
+        return [v.tolist() for v in vectors]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes, vectors, pending = self._lookup(texts)
+        computed = self.inner.embed_documents(pending) if pending else []
+        return self._merge(hashes, vectors, pending, computed)
+
+    def embed_query(self, text: str) -> List[float]:
+        hashes, vectors, pending = self._lookup([text])
+        computed = [self.inner.embed_query(text)] if pending else []
+        return self._merge(hashes, vectors, pending, computed)[0]
+
+    # Versiones async: las lecturas y escrituras de la caché (SQLite y, con
+    # CACHE_BACKEND=redis, llamadas de red) corren en un hilo, fuera del event loop
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes, vectors, pending = await asyncio.to_thread(self._lookup, texts)
+        computed = await self.inner.aembed_documents(pending) if pending else []
+        return await asyncio.to_thread(self._merge, hashes, vectors, pending, computed)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        hashes, vectors, pending = await asyncio.to_thread(self._lookup, [text])
+        computed = [await self.inner.aembed_query(text)] if pending else []
+        return (await asyncio.to_thread(self._merge, hashes, vectors, pending, computed))[0]
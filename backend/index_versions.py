@@ -0,0 +1,178 @@
+# backend/index_versions.py
+"""
+Versiones del índice en disco y puntero a la que se sirve.
+
+    DATA_DIR/chroma/
+        current.json          {"version": "...", "path": "versions/<v>", "published_at": ...}
+        versions/<version>/   Chroma + manifest.json + bm25/ + npindex/
+        leases/<proceso>.json {"version": "...", "renewed_at": ...}  (versión abierta por cada worker)
+
+La ingesta construye siempre en un directorio nuevo (copiando la versión
+actual si es incremental), lo valida con una consulta de prueba y solo
+entonces reescribe current.json (tmp + os.replace: atómico, también en
+Windows, a diferencia de un symlink). Los workers ven el cambio y cargan la
+versión nueva entre requests (resources.refresh_index_if_stale); mientras,
+siguen sirviendo la anterior. Se conservan INDEX_KEEP_VERSIONS versiones.
+
+Un worker inactivo no ve current.json hasta su siguiente request y puede
+seguir con una versión más antigua que esas (Chroma lee sus ficheros en
+cada consulta). Por eso cada proceso registra la versión que tiene abierta
+en leases/<proceso>.json y la renueva periódicamente; collect_garbage no
+borra ninguna versión con un registro vigente (INDEX_LEASE_TTL_S).
+
+Sin current.json (índices construidos antes de este esquema) se usa el
+layout anterior: Chroma y manifiesto en CHROMA_DIR, NUMPY_INDEX_DIR y
+LEXICAL_INDEX_DIR.
+"""
+
+import json
+import os
+import shutil
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from backend.config import CHROMA_DIR, INDEX_KEEP_VERSIONS, INDEX_LEASE_TTL_S, LEXICAL_INDEX_DIR, NUMPY_INDEX_DIR
+
+CURRENT_NAME = "current.json"
+VERSIONS_NAME = "versions"
+LEASES_NAME = "leases"
+
+# Un registro por proceso (el pid solo podría repetirse entre contenedores)
+_LEASE_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+@dataclass(frozen=True)
+class IndexPaths:
+    """Ficheros de una versión del índice."""
+    root: Path            # persist_directory de Chroma + manifest.json
+    numpy_dir: Path
+    lexical_dir: Path
+    version: Optional[str] = None
+
+
+def versions_dir() -> Path:
+    return CHROMA_DIR / VERSIONS_NAME
+
+
+def pointer_path() -> Path:
+    return CHROMA_DIR / CURRENT_NAME
+
+
+def version_paths(version: str) -> IndexPaths:
+    root = versions_dir() / version
+    return IndexPaths(root=root, numpy_dir=root / "npindex", lexical_dir=root / "bm25", version=version)
+
+
+def legacy_paths() -> IndexPaths:
+    return IndexPaths(root=CHROMA_DIR, numpy_dir=NUMPY_INDEX_DIR, lexical_dir=LEXICAL_INDEX_DIR)
+
+
+# ========================================
+# Puntero a la versión servida
+# ========================================
+
+def read_pointer() -> Optional[Dict[str, Any]]:
+    try:
+        pointer = json.loads(pointer_path().read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return pointer if pointer.get("version") else None
+
+
+def current_version() -> Optional[str]:
+    """Versión publicada; None si nunca se publicó ninguna (layout anterior)."""
+    pointer = read_pointer()
+    return pointer["version"] if pointer else None
+
+
+def current_paths() -> IndexPaths:
+    """Ficheros de la versión que debe servirse ahora."""
+    pointer = read_pointer()
+    if pointer is None:
+        return legacy_paths()
+    return version_paths(pointer["version"])
+
+
+def publish_version(version: str) -> None:
+    """Cambia la versión servida. Llamar solo con la versión ya escrita y validada."""
+    path = pointer_path()
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(
+        json.dumps({"version": version, "path": f"{VERSIONS_NAME}/{version}", "published_at": time.time()}),
+        encoding="utf-8",
+    )
+    os.replace(tmp, path)
+
+
+# ========================================
+# Versiones abiertas por los workers
+# ========================================
+
+def leases_dir() -> Path:
+    return CHROMA_DIR / LEASES_NAME
+
+
+def hold_version(version: Optional[str]) -> None:
+    """Registra (o renueva) que este proceso tiene abierta `version`."""
+    if not version:
+        return
+    path = leases_dir() / f"{_LEASE_ID}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps({"version": version, "renewed_at": time.time()}), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def release_version() -> None:
+    """Borra el registro de este proceso (al apagarse)."""
+    (leases_dir() / f"{_LEASE_ID}.json").unlink(missing_ok=True)
+
+
+def held_versions(ttl_s: float = INDEX_LEASE_TTL_S) -> Set[str]:
+    """Versiones con un registro vigente. Los caducados (procesos que murieron) se borran."""
+    held: Set[str] = set()
+    if not leases_dir().exists():
+        return held
+    now = time.time()
+    for path in leases_dir().glob("*.json"):
+        try:
+            lease = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        if now - float(lease.get("renewed_at", 0)) <= ttl_s:
+            held.add(str(lease.get("version")))
+        else:
+            path.unlink(missing_ok=True)
+    return held
+
+
+# ========================================
+# Recolección de versiones antiguas
+# ========================================
+
+def list_versions() -> List[str]:
+    """Versiones en disco, de la más antigua a la más nueva (los ids son ordenables)."""
+    if not versions_dir().exists():
+        return []
+    return sorted(p.name for p in versions_dir().iterdir() if p.is_dir())
+
+
+def collect_garbage(keep: int = INDEX_KEEP_VERSIONS, lease_ttl_s: float = INDEX_LEASE_TTL_S) -> List[str]:
+    """
+    Borra las versiones anteriores a la actual salvo las keep - 1 más
+    recientes y las que algún worker tiene registradas como abiertas (ver
+    hold_version). Las posteriores a la actual (una ingesta en curso o una
+    que falló) no se tocan: se borran cuando se publique otra más nueva.
+    """
+    current = current_version()
+    if current is None:
+        return []
+    older = [v for v in list_versions() if v < current]
+    held = held_versions(lease_ttl_s)
+    doomed = [v for v in older[:max(0, len(older) - max(0, keep - 1))] if v not in held]
+    for version in doomed:
+        shutil.rmtree(versions_dir() / version, ignore_errors=True)
+    return doomed
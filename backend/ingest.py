@@ -1,34 +1,95 @@
 # backend/ingest.py
+"""
+Ingesta incremental de PDFs en el índice Chroma.
+
+Pipeline en streaming (memoria acotada, no depende del tamaño del corpus):
+
+  1. parseo   -> pool de procesos; cada PDF se abre UNA vez (texto + metadatos)
+                 y se trocea en el propio worker. Solo hay unos pocos
+                 ficheros en vuelo a la vez.
+  2. troceado -> generador de chunks, agrupados en lotes de INGEST_EMBED_BATCH.
+  3. embedding-> lotes concurrentes (INGEST_EMBED_CONCURRENCY) con backoff
+                 exponencial ante 429 / errores transitorios. Las llamadas
+                 van con prioridad "ingest" en el planificador (ver
+                 backend/scheduler.py): ceden el paso y una reserva del
+                 límite de la clave a la app en vivo.
+  4. upsert   -> por lotes en Chroma con los vectores ya calculados.
+  5. derivados-> índice BM25 (bm25/, recuperación híbrida, ver
+                 backend/lexical_index.py) y volcado de los vectores a
+                 npindex/ (backend "numpy" y sidecar de MMR para Chroma,
+                 ver backend/vector_index.py; EXPORT_NUMPY_INDEX).
+  6. publicación -> prueba de humo sobre la versión nueva y cambio atómico
+                 de la versión servida (ver backend/index_versions.py).
+
+Todo se escribe en un directorio de versión nuevo; la versión que sirve la
+app no se toca, así que reindexar no deja la API sin índice. El manifiesto
+(ver backend/manifest.py) de la versión registra los chunks de cada fichero.
+"""
 
 import argparse
+import random
 import shutil
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import resource   # solo Unix; en Windows el pico de RSS sale de psutil (si está)
+except ImportError:
+    resource = None
+
 from pypdf import PdfReader
-from langchain_openai import OpenAIEmbeddings
+from chromadb.api.client import SharedSystemClient
 from langchain_community.vectorstores import Chroma
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFDirectoryLoader
 
-from backend.config import DOCS_DIR, CHROMA_DIR, EMBEDDINGS_MODEL
+from backend.config import (
+    ensure_dirs,
+    DOCS_DIR,
+    EMBEDDINGS_PROVIDER,
+    INGEST_WORKERS,
+    INGEST_EMBED_BATCH,
+    INGEST_EMBED_CONCURRENCY,
+    INGEST_MAX_RETRIES,
+    EXPORT_NUMPY_INDEX,
+)
+from backend.context_packer import count_tokens, tokenizer_name
+from backend.llm_loader import embeddings_model_id, get_embeddings
+from backend.scheduler import priority, set_default_priority
+from backend.manifest import (
+    CHUNK_ID_SCHEME,
+    chunk_id,
+    empty_manifest,
+    file_sha256,
+    load_manifest,
+    new_index_version,
+    save_manifest,
+)
+from backend.index_versions import (
+    CURRENT_NAME,
+    VERSIONS_NAME,
+    IndexPaths,
+    collect_garbage,
+    current_paths,
+    publish_version,
+    version_paths,
+)
+from backend.lexical_index import build_lexical_index, has_lexical_index
+from backend.vector_index import has_numpy_index, read_index_meta, write_numpy_index
 
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 80
 
-def clear_chroma_dir():
-    """Elimina todo el contenido de CHROMA_DIR (archivos y subcarpetas)."""
-    if CHROMA_DIR.exists():
-        for f in CHROMA_DIR.iterdir():
-            if f.is_file():
-                f.unlink()
-            elif f.is_dir():
-                shutil.rmtree(f)
+# Máximo de chunks por upsert/delete (Chroma limita el tamaño de lote)
+UPSERT_BATCH_SIZE = 1000
 
 
-def extract_pdf_metadata(pdf_path: Path) -> dict:
-    """
-    Extrae metadatos útiles (title, author, etc.) del PDF si existen.
-    """
+def _metadata_from_reader(reader: PdfReader, pdf_path: Path) -> dict:
     try:
-        reader = PdfReader(str(pdf_path))
         info = reader.metadata or {}
 
         title = info.get("/Title") or pdf_path.stem
@@ -46,47 +107,555 @@ def extract_pdf_metadata(pdf_path: Path) -> dict:
         }
 
 
-def main(rebuild: bool = False):
-    if rebuild:
-        print("🧹 Limpiando índice Chroma…")
-        clear_chroma_dir()
-
-    print(f"📂 Cargando PDFs desde {DOCS_DIR}…")
-    loader = PyPDFDirectoryLoader(str(DOCS_DIR))
-    docs = loader.load()
-    print(f"📄 Total de documentos cargados: {len(docs)}")
-
-    # Enriquecer metadata de cada documento
-    for d in docs:
-        raw_path = d.metadata.get("source", "")
-        path = Path(raw_path)
-        meta = extract_pdf_metadata(path)
-
-        d.metadata["doc_id"] = path.name
-        d.metadata["title"] = meta["title"]
-        d.metadata["authors"] = meta["authors"]
-        d.metadata["page"] = d.metadata.get("page", "N/A")
-        d.metadata["source"] = path.name
-
-    # Trocear documentos en chunks
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500,
-        chunk_overlap=80,
+def extract_pdf_metadata(pdf_path: Path) -> dict:
+    """
+    Extrae metadatos útiles (title, author, etc.) del PDF si existen.
+    """
+    try:
+        reader = PdfReader(str(pdf_path))
+    except Exception as e:
+        print(f"[!] Error extrayendo metadatos de {pdf_path.name}: {e}")
+        return {
+            "title": pdf_path.stem,
+            "authors": "Autor desconocido"
+        }
+    return _metadata_from_reader(reader, pdf_path)
+
+
+def scan_docs(docs_dir: Path = DOCS_DIR) -> Dict[str, Path]:
+    """PDFs en docs_dir (recursivo), indexados por ruta relativa."""
+    return {
+        p.relative_to(docs_dir).as_posix(): p
+        for p in sorted(docs_dir.rglob("*.pdf"))
+        if not p.name.startswith(".")
+    }
+
+
+def plan_changes(manifest: Dict, files: Dict[str, Path]) -> Tuple[List[str], List[str], List[str], Dict[str, str]]:
+    """
+    Compara el disco con el manifiesto.
+    Devuelve (nuevos, modificados, eliminados, hashes) donde hashes tiene el
+    sha256 de cada fichero nuevo o modificado. mtime+size iguales se toman
+    como "sin cambios" sin leer el fichero; si difieren se compara el hash.
+    """
+    known = manifest["files"]
+    added, changed, hashes = [], [], {}
+
+    for name, path in files.items():
+        st = path.stat()
+        entry = known.get(name)
+        if entry and entry["mtime"] == st.st_mtime and entry["size"] == st.st_size:
+            continue
+
+        sha = file_sha256(path)
+        if entry and entry["sha256"] == sha:
+            # Solo cambió el mtime (p. ej. copia): se actualiza sin reindexar
+            entry["mtime"], entry["size"] = st.st_mtime, st.st_size
+            continue
+
+        hashes[name] = sha
+        (changed if entry else added).append(name)
+
+    removed = [name for name in known if name not in files]
+    return added, changed, removed, hashes
+
+
+# ========================================
+# Etapa 1: parseo (en procesos worker)
+# ========================================
+
+@dataclass
+class ParsedFile:
+    name: str
+    path: Path
+    sha: str
+    pages: int = 0
+    chunks: List[Tuple[str, str, dict]] = field(default_factory=list)   # (id, texto, metadata)
+    error: Optional[str] = None
+
+
+_splitter: Optional[RecursiveCharacterTextSplitter] = None
+
+
+def _get_splitter() -> RecursiveCharacterTextSplitter:
+    # Uno por proceso worker
+    global _splitter
+    if _splitter is None:
+        _splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+        )
+    return _splitter
+
+
+def parse_pdf(name: str, path: Path, sha: str) -> ParsedFile:
+    """
+    Abre el PDF una sola vez: lee metadatos y texto página a página y trocea
+    cada página. Se ejecuta en un proceso del pool.
+    """
+    parsed = ParsedFile(name=name, path=path, sha=sha)
+    try:
+        reader = PdfReader(str(path))
+        meta = _metadata_from_reader(reader, path)
+        splitter = _get_splitter()
+        # Tokens de cada chunk con el encoding del modelo de chat (los usa
+        # context_packer sin volver a tokenizar en cada request)
+        tokenizer = tokenizer_name()
+
+        for page_no, page in enumerate(reader.pages):
+            parsed.pages += 1
+            text = page.extract_text() or ""
+            for i, chunk in enumerate(splitter.split_text(text)):
+                cid = chunk_id(name, sha, page_no, i)
+                metadata = {
+                    "doc_id": name,
+                    "title": meta["title"],
+                    "authors": meta["authors"],
+                    "page": page_no,
+                    "source": name,
+                    "chunk_index": i,
+                    "chunk_id": cid,
+                }
+                if tokenizer is not None:
+                    metadata["n_tokens"] = count_tokens(chunk)
+                    metadata["tokenizer"] = tokenizer
+                parsed.chunks.append((cid, chunk, metadata))
+    except Exception as e:
+        parsed.error = str(e)
+    return parsed
+
+
+def iter_parsed_files(jobs: List[Tuple[str, Path, str]], workers: int = INGEST_WORKERS) -> Iterator[ParsedFile]:
+    """
+    Parsea los PDFs en paralelo manteniendo como máximo 2×workers ficheros en
+    vuelo, y los entrega en orden.
+    """
+    if workers <= 1:
+        for job in jobs:
+            yield parse_pdf(*job)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        job_iter = iter(jobs)
+        for job in job_iter:
+            pending.append(pool.submit(parse_pdf, *job))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            parsed = pending.popleft().result()
+            next_job = next(job_iter, None)
+            if next_job is not None:
+                pending.append(pool.submit(parse_pdf, *next_job))
+            yield parsed
+
+
+# ========================================
+# Etapas 2-4: troceado, embeddings y upsert
+# ========================================
+
+def _batched(items: Iterable, size: int) -> Iterator[List]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _is_retryable(error: Exception) -> bool:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(error).__name__ in {"RateLimitError", "APITimeoutError", "APIConnectionError"}
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def embed_with_backoff(embeddings, texts: List[str], max_retries: int = INGEST_MAX_RETRIES) -> List[List[float]]:
+    """
+    Embebe un lote reintentando ante 429/5xx con backoff exponencial + jitter
+    (respeta Retry-After si la API lo envía).
+    Corre en los hilos del pool de embeddings, así que fija aquí la prioridad.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            with priority("ingest"):
+                return embeddings.embed_documents(texts)
+        except Exception as e:
+            if attempt >= max_retries or not _is_retryable(e):
+                raise
+            delay = _retry_after(e) or min(60.0, 2 ** attempt) * (0.5 + random.random())
+            print(f"⏳ Límite de la API ({type(e).__name__}); reintento en {delay:.1f}s")
+            time.sleep(delay)
+
+
+def upsert_batch(vectordb: Chroma, batch: List[Tuple[str, str, dict]], vectors: List[List[float]]) -> None:
+    """Upsert con vectores precalculados (sin volver a embeber)."""
+    for i in range(0, len(batch), UPSERT_BATCH_SIZE):
+        part = batch[i:i + UPSERT_BATCH_SIZE]
+        vectordb._collection.upsert(
+            ids=[cid for cid, _, _ in part],
+            documents=[text for _, text, _ in part],
+            metadatas=[md for _, _, md in part],
+            embeddings=vectors[i:i + UPSERT_BATCH_SIZE],
+        )
+
+
+def delete_chunks(vectordb: Chroma, ids: List[str]) -> None:
+    for i in range(0, len(ids), UPSERT_BATCH_SIZE):
+        vectordb.delete(ids=ids[i:i + UPSERT_BATCH_SIZE])
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Pico de memoria residente del proceso en MB; None si no se puede medir."""
+    if resource is not None:
+        # ru_maxrss en KB en Linux y en bytes en macOS
+        scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+    try:
+        import psutil
+    except ImportError:
+        return None
+    info = psutil.Process().memory_info()
+    return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)   # peak_wset: Windows
+
+
+class Progress:
+    """Contadores y reporte de throughput de la ingesta."""
+
+    def __init__(self, total_files: int, every_s: float = 5.0):
+        self.total_files = total_files
+        self.every_s = every_s
+        self.t0 = self._last = time.perf_counter()
+        self.files = self.pages = self.chunks = self.embedded = 0
+
+    def stats(self) -> Dict[str, float]:
+        elapsed = max(time.perf_counter() - self.t0, 1e-9)
+        return {
+            "files": self.files,
+            "pages": self.pages,
+            "chunks": self.embedded,
+            "seconds": round(elapsed, 3),
+            "pages_per_s": round(self.pages / elapsed, 2),
+            "chunks_per_s": round(self.embedded / elapsed, 2),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+    def report(self, force: bool = False) -> None:
+        now = time.perf_counter()
+        if not force and now - self._last < self.every_s:
+            return
+        self._last = now
+        elapsed = max(now - self.t0, 1e-9)
+        peak_mb = peak_rss_mb()
+        print(
+            f"📊 {self.files}/{self.total_files} PDFs · {self.pages} págs ({self.pages / elapsed:.1f}/s) · "
+            f"{self.embedded}/{self.chunks} chunks indexados ({self.embedded / elapsed:.1f}/s) · "
+            f"{elapsed:.1f}s" + (f" · pico RSS {peak_mb:.0f} MB" if peak_mb is not None else "")
+        )
+
+
+def _iter_collection(
+    vectordb: Chroma,
+    include: Tuple[str, ...] = ("documents", "metadatas", "embeddings"),
+    page_size: int = UPSERT_BATCH_SIZE,
+) -> Iterator[Tuple[str, str, dict, Optional[List[float]]]]:
+    """
+    Recorre la colección de Chroma por páginas: (id, texto, metadata, vector).
+    Lo que no se pide en include llega como None.
+    """
+    offset = 0
+    while True:
+        page = vectordb._collection.get(include=list(include), limit=page_size, offset=offset)
+        ids = page["ids"]
+        if not ids:
+            return
+        none = [None] * len(ids)
+        documents = page["documents"] if "documents" in include else none
+        metadatas = page["metadatas"] if "metadatas" in include else none
+        vectors = page["embeddings"] if "embeddings" in include else none
+        yield from zip(ids, documents, metadatas, vectors)
+        offset += len(ids)
+
+
+def _derived_is_current(index_dir: Path, exists: bool, manifest: Dict) -> bool:
+    meta = read_index_meta(index_dir) if exists else None
+    return bool(meta) and meta.get("index_version") == manifest.get("index_version")
+
+
+def _derived_info(manifest: Dict) -> Dict:
+    return {
+        "provider": manifest.get("provider"),
+        "model": manifest.get("model"),
+        "index_version": manifest.get("index_version"),
+    }
+
+
+def export_numpy_index(vectordb: Chroma, manifest: Dict, paths: IndexPaths) -> int:
+    """
+    Exporta el contenido de Chroma (vectores ya calculados, sin volver a
+    llamar a la API) al índice NumPy memory-mapped.
+    """
+    t0 = time.time()
+    count = write_numpy_index(_iter_collection(vectordb), _derived_info(manifest), index_dir=paths.numpy_dir)
+    print(f"📦 Índice NumPy exportado: {count} vectores en {paths.numpy_dir} ({time.time() - t0:.1f}s)")
+    return count
+
+
+def export_lexical_index(vectordb: Chroma, manifest: Dict, paths: IndexPaths) -> int:
+    """Construye el índice BM25 a partir de los textos ya guardados en Chroma."""
+    t0 = time.time()
+    rows = ((cid, text) for cid, text, _, _ in _iter_collection(vectordb, include=("documents",)))
+    count = build_lexical_index(rows, _derived_info(manifest), index_dir=paths.lexical_dir)
+    print(f"🔤 Índice BM25 construido: {count} chunks en {paths.lexical_dir} ({time.time() - t0:.1f}s)")
+    return count
+
+
+def _stale_derived(manifest: Dict, paths: IndexPaths, export_numpy: bool) -> Tuple[bool, bool]:
+    """(BM25 desactualizado, NumPy desactualizado) respecto a la versión del manifiesto."""
+    lexical = not _derived_is_current(paths.lexical_dir, has_lexical_index(paths.lexical_dir), manifest)
+    numpy_ = export_numpy and not _derived_is_current(
+        paths.numpy_dir, has_numpy_index(paths.numpy_dir), manifest
     )
-    splits = text_splitter.split_documents(docs)
-    print(f"✂️ Total de chunks: {len(splits)}")
+    return lexical, numpy_
+
+
+def export_derived_indexes(
+    vectordb: Chroma, manifest: Dict, paths: IndexPaths, lexical: bool = True, numpy_: bool = False
+) -> None:
+    """Regenera los índices derivados de Chroma (BM25 y, si se pide, NumPy)."""
+    if lexical:
+        export_lexical_index(vectordb, manifest, paths)
+    if numpy_:
+        export_numpy_index(vectordb, manifest, paths)
+
+
+# ========================================
+# Versiones: preparar, validar y publicar
+# ========================================
+
+def stage_version(live: IndexPaths, target: IndexPaths, copy: bool) -> None:
+    """
+    Crea el directorio de la versión nueva. En una ingesta incremental copia
+    el Chroma de la versión servida (solo se lee: los workers siguen
+    usándola). Los derivados no se copian, se regeneran al final.
+    """
+    target.root.mkdir(parents=True, exist_ok=False)
+    if not copy or not live.root.exists():
+        return
+    skip = {VERSIONS_NAME, CURRENT_NAME, live.numpy_dir.name, live.lexical_dir.name}
+    for item in live.root.iterdir():
+        if item.name in skip or item.name.endswith(".tmp"):
+            continue
+        if item.is_dir():
+            shutil.copytree(item, target.root / item.name)
+        else:
+            shutil.copy2(item, target.root / item.name)
+
+
+def validate_version(paths: IndexPaths, manifest: Dict, embeddings, numpy_: bool) -> None:
+    """
+    Prueba de humo antes de publicar: abre la versión como lo hará la app,
+    comprueba el número de chunks y hace una consulta en cada índice con un
+    vector ya guardado (sin llamar a la API). Lanza RuntimeError si algo falla.
+    """
+    from backend.lexical_index import load_lexical_index
+    from backend.vector_index import NumpyVectorStore
+
+    expected = len({cid for entry in manifest["files"].values() for cid in entry["chunk_ids"]})
+    vectordb = Chroma(persist_directory=str(paths.root), embedding_function=embeddings)
+    count = vectordb._collection.count()
+    if count != expected:
+        raise RuntimeError(f"Chroma tiene {count} chunks y el manifiesto {expected}")
+    if not expected:
+        return
+
+    sample = vectordb._collection.get(limit=1, include=["embeddings", "documents"])
+    vector, text = list(sample["embeddings"][0]), sample["documents"][0]
+    if not vectordb.similarity_search_by_vector(vector, k=1):
+        raise RuntimeError("la consulta de prueba en Chroma no devolvió resultados")
 
-    # Crear embeddings
-    embeddings = OpenAIEmbeddings(model=EMBEDDINGS_MODEL)
+    lexical = load_lexical_index(paths.lexical_dir)
+    if lexical is None or len(lexical) != count or not lexical.search(text, k=1):
+        raise RuntimeError("el índice BM25 no coincide con Chroma")
 
-    # Crear base de datos vectorial
-    Chroma.from_documents(
-        documents=splits,
-        embedding=embeddings,
-        persist_directory=str(CHROMA_DIR),
+    if numpy_:
+        store = NumpyVectorStore(paths.numpy_dir, embedding_function=embeddings)
+        if len(store.ids) != count or not store.similarity_search_by_vector(vector, k=1):
+            raise RuntimeError("el índice NumPy no coincide con Chroma")
+
+
+def publish(paths: IndexPaths) -> None:
+    """Cambia la versión servida y borra las antiguas (ver index_versions.py)."""
+    publish_version(paths.version)
+    print(f"📣 Versión {paths.version} publicada")
+    removed = collect_garbage()
+    if removed:
+        print(f"🧹 Versiones antiguas eliminadas: {', '.join(removed)}")
+
+
+def discard_version(paths: IndexPaths) -> None:
+    """Borra una versión que no llegó a publicarse."""
+    # Chroma cachea un cliente por ruta; se suelta antes de borrar sus ficheros
+    SharedSystemClient.clear_system_cache()
+    shutil.rmtree(paths.root, ignore_errors=True)
+
+
+def main(rebuild: bool = False, export_numpy: bool = EXPORT_NUMPY_INDEX) -> Dict[str, float]:
+    """
+    Ejecuta la ingesta y devuelve sus estadísticas (ver Progress.stats).
+
+    Nunca escribe en la versión servida: construye una versión nueva en
+    DATA_DIR/chroma/versions/, la valida y solo entonces la publica. Si algo
+    falla, la app sigue sirviendo la anterior y la versión a medias se borra.
+    """
+    ensure_dirs()
+    provider = EMBEDDINGS_PROVIDER
+    model = embeddings_model_id(provider)   # con "hf", cambiar de motor/pesos reconstruye el índice
+    live = current_paths()
+
+    manifest = None if rebuild else load_manifest(live.root)
+    if manifest and (
+        manifest.get("provider"), manifest.get("model"),
+        manifest.get("chunk_size"), manifest.get("chunk_overlap"), manifest.get("id_scheme", 1),
+    ) != (provider, model, CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_ID_SCHEME):
+        print("⚠️ Cambió el modelo, el troceado o el formato de ids desde la última ingesta: se reconstruye todo.")
+        manifest = None
+
+    incremental = manifest is not None
+    if not incremental:
+        manifest = empty_manifest(provider, model, CHUNK_SIZE, CHUNK_OVERLAP)
+
+    print(f"📂 Buscando PDFs en {DOCS_DIR}…")
+    files = scan_docs()
+    added, changed, removed, hashes = plan_changes(manifest, files)
+    unchanged = len(files) - len(added) - len(changed)
+    print(
+        f"📄 {len(files)} PDFs: {len(added)} nuevos, {len(changed)} modificados, "
+        f"{len(removed)} eliminados, {unchanged} sin cambios"
     )
 
-    print(f"✅ Embeddings guardados en {CHROMA_DIR}")
+    stale_lexical, stale_numpy = _stale_derived(manifest, live, export_numpy) if incremental else (True, True)
+    up_to_date = incremental and not (added or changed or removed)
+    if up_to_date and live.version is not None and not (stale_lexical or stale_numpy):
+        save_manifest(manifest, live.root)  # puede haber mtimes actualizados
+        print("✅ El índice ya está al día")
+        return Progress(total_files=0).stats()
+
+    target = version_paths(new_index_version())
+    print(f"🏗️ Construyendo la versión {target.version} ({'incremental' if incremental else 'desde cero'})…")
+    stage_version(live, target, copy=incremental)
+    try:
+        embeddings = get_embeddings()
+        vectordb = Chroma(persist_directory=str(target.root), embedding_function=embeddings)
+        progress = _index_changes(vectordb, embeddings, manifest, files, hashes, added, changed, removed)
+
+        manifest["index_version"] = target.version
+        save_manifest(manifest, target.root)
+        progress.report(force=True)
+        print(f"✅ {progress.embedded} chunks indexados en {target.root}")
+        if hasattr(embeddings, "cache"):
+            print(f"💾 Caché de embeddings: {embeddings.cache.stats()}")
+
+        export_derived_indexes(vectordb, manifest, target, lexical=True, numpy_=export_numpy)
+        validate_version(target, manifest, embeddings, numpy_=export_numpy)
+    except BaseException:
+        print(f"❌ La versión {target.version} no se publica; se sigue sirviendo {live.version or 'la anterior'}")
+        discard_version(target)
+        raise
+
+    # Al final, con todo escrito y validado: los workers en marcha cambian a esta versión
+    publish(target)
+    return progress.stats()
+
+
+def _index_changes(
+    vectordb: Chroma,
+    embeddings,
+    manifest: Dict,
+    files: Dict[str, Path],
+    hashes: Dict[str, str],
+    added: List[str],
+    changed: List[str],
+    removed: List[str],
+) -> Progress:
+    """Borra los chunks de ficheros eliminados/modificados e indexa los nuevos/modificados."""
+    for name in removed + changed:
+        old_ids = manifest["files"][name]["chunk_ids"]
+        if old_ids:
+            delete_chunks(vectordb, old_ids)
+        if name in removed:
+            del manifest["files"][name]
+            print(f"🗑️ {name}: {len(old_ids)} chunks eliminados")
+
+    to_index = added + changed
+    progress = Progress(total_files=len(to_index))
+    remaining: Dict[str, int] = {}       # chunks pendientes de escribir por fichero
+    parsed_files: Dict[str, ParsedFile] = {}
+
+    def finish_file(parsed: ParsedFile) -> None:
+        st = parsed.path.stat()
+        manifest["files"][parsed.name] = {
+            "sha256": parsed.sha,
+            "mtime": st.st_mtime,
+            "size": st.st_size,
+            "chunk_ids": [cid for cid, _, _ in parsed.chunks],
+        }
+        parsed_files.pop(parsed.name, None)
+
+    def chunk_stream() -> Iterator[Tuple[str, Tuple[str, str, dict]]]:
+        jobs = [(name, files[name], hashes[name]) for name in to_index]
+        for parsed in iter_parsed_files(jobs):
+            progress.files += 1
+            progress.pages += parsed.pages
+            if parsed.error:
+                print(f"[!] Error procesando {parsed.name}: {parsed.error}")
+                manifest["files"].pop(parsed.name, None)
+                continue
+            progress.chunks += len(parsed.chunks)
+            if not parsed.chunks:
+                finish_file(parsed)
+                continue
+            remaining[parsed.name] = len(parsed.chunks)
+            parsed_files[parsed.name] = parsed
+            for chunk in parsed.chunks:
+                yield parsed.name, chunk
+
+    def write(batch, vectors) -> None:
+        upsert_batch(vectordb, [chunk for _, chunk in batch], vectors)
+        progress.embedded += len(batch)
+        for name, _ in batch:
+            remaining[name] -= 1
+            if remaining[name] == 0:
+                del remaining[name]
+                finish_file(parsed_files[name])
+        progress.report()
+
+    with ThreadPoolExecutor(max_workers=INGEST_EMBED_CONCURRENCY) as pool:
+        in_flight = deque()
+        for batch in _batched(chunk_stream(), INGEST_EMBED_BATCH):
+            texts = [text for _, (_, text, _) in batch]
+            in_flight.append((batch, pool.submit(embed_with_backoff, embeddings, texts)))
+            # Contrapresión: no más de N lotes embebiéndose a la vez
+            while len(in_flight) >= INGEST_EMBED_CONCURRENCY:
+                done_batch, future = in_flight.popleft()
+                write(done_batch, future.result())
+        while in_flight:
+            done_batch, future = in_flight.popleft()
+            write(done_batch, future.result())
+
+    return progress
 
 
 if __name__ == "__main__":
@@ -94,13 +663,13 @@ if __name__ == "__main__":
     parser.add_argument(
         "--rebuild",
         action="store_true",
-        help="Recrear el índice desde cero"
+        help="Recrear el índice desde cero (por defecto: ingesta incremental)"
+    )
+    parser.add_argument(
+        "--export-numpy",
+        action="store_true",
+        help="Exportar el índice NumPy aunque EXPORT_NUMPY_INDEX=false (backend numpy / sidecar de MMR)"
     )
     args = parser.parse_args()
-    main(rebuild=args.rebuild)
-
-
-
-
-
-
+    set_default_priority("ingest")   # todo el proceso cede el paso a la app en vivo
+    main(rebuild=args.rebuild, export_numpy=args.export_numpy or EXPORT_NUMPY_INDEX)
@@ -0,0 +1,196 @@
+# backend/lexical_index.py
+"""
+Índice léxico BM25 (español) para la recuperación híbrida.
+
+Complementa a los embeddings en consultas con términos exactos (autores,
+siglas como "UbD", nombres de marcos). Lo construye ingest.py a partir de los
+chunks ya indexados y se guarda en LEXICAL_INDEX_DIR:
+
+- meta.json     -> {"count", "avgdl", "k1", "b", "index_version"}
+- vocab.json    -> {termino: [inicio, df]}  (rango dentro de las postings)
+- postings.npy  -> int32, filas (documentos) de cada término, contiguas por término
+- tf.npy        -> uint16, frecuencia del término en cada posting
+- doc_len.npy   -> int32, longitud (en términos) de cada documento
+- ids.json      -> chunk_id de cada fila
+
+Los .npy se abren con mmap: cargar el índice no copia las postings a memoria
+y una consulta solo toca las postings de sus términos.
+"""
+
+import json
+import math
+import re
+import shutil
+import unicodedata
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from backend.config import BM25_B, BM25_K1, LEXICAL_INDEX_DIR
+from backend.vector_index import publish_dir, top_k
+
+META_NAME = "meta.json"
+INDEX_FILES = (META_NAME, "vocab.json", "postings.npy", "tf.npy", "doc_len.npy", "ids.json")
+
+# ========================================
+# Análisis de texto (español, con algo de inglés en el corpus)
+# ========================================
+
+_STOPWORDS = frozenset("""
+a al algo algunas algunos ante antes como con contra cual cuales cuando de del desde donde
+durante e el ella ellas ellos en entre era eran es esa esas ese eso esos esta estas este esto
+estos fue fueron ha han hasta hay la las le les lo los mas me mi mis muy ni no nos o otra otras
+otro otros para pero por porque que quien quienes se sea segun ser si sin sino sobre son su sus
+tambien tanto te tiene tienen todo todos tu tus un una uno unas unos y ya yo
+the of and to in is are for on with as by an be this that it from at or not was were which
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Stemming ligero (sin tildes) al estilo de los "light stemmers" para
+# español: se quitan plural y vocal de género, así alumno / alumnos / alumnas
+# -> "alumn" y evaluación / evaluaciones -> "evaluacion".
+_PLURAL_GENDER = ("os", "as", "es")
+_GENDER = ("o", "a", "e")
+
+
+def _strip_accents(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def _stem(token: str) -> str:
+    if token.isdigit() or len(token) < 4:
+        return token
+    if token.endswith("ces"):                        # luces -> luz
+        return token[:-3] + "z"
+    if token.endswith("mente") and len(token) > 8:   # efectivamente -> efectiva
+        token = token[:-5]
+    if token.endswith(_PLURAL_GENDER):
+        return token[:-2]
+    if token.endswith(_GENDER) or token.endswith("s"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Minúsculas, sin tildes, sin stopwords y con stemming ligero."""
+    text = _strip_accents((text or "").lower())
+    return [_stem(t) for t in _TOKEN_RE.findall(text) if t not in _STOPWORDS and len(t) > 1]
+
+
+# ========================================
+# Construcción (la usa ingest.py)
+# ========================================
+
+def build_lexical_index(
+    rows: Iterable[Tuple[str, str]],
+    info: Dict[str, Any],
+    index_dir: Path = LEXICAL_INDEX_DIR,
+) -> int:
+    """
+    Construye el índice a partir de (chunk_id, texto) y lo publica de forma
+    atómica en index_dir. Devuelve el número de documentos.
+    """
+    ids: List[str] = []
+    doc_len: List[int] = []
+    term_postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+
+    for row, (cid, text) in enumerate(rows):
+        counts = Counter(tokenize(text))
+        ids.append(cid)
+        doc_len.append(sum(counts.values()))
+        for term, tf in counts.items():
+            term_postings[term].append((row, tf))
+
+    vocab: Dict[str, List[int]] = {}
+    postings: List[int] = []
+    tfs: List[int] = []
+    for term in sorted(term_postings):
+        plist = term_postings[term]
+        vocab[term] = [len(postings), len(plist)]
+        postings.extend(r for r, _ in plist)
+        tfs.extend(min(tf, 65535) for _, tf in plist)
+
+    index_dir = Path(index_dir)
+    tmp_dir = index_dir.with_name(index_dir.name + ".tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    np.save(tmp_dir / "postings.npy", np.asarray(postings, dtype=np.int32))
+    np.save(tmp_dir / "tf.npy", np.asarray(tfs, dtype=np.uint16))
+    np.save(tmp_dir / "doc_len.npy", np.asarray(doc_len, dtype=np.int32))
+    (tmp_dir / "vocab.json").write_text(json.dumps(vocab, ensure_ascii=False), encoding="utf-8")
+    (tmp_dir / "ids.json").write_text(json.dumps(ids), encoding="utf-8")
+    meta = {
+        **info,
+        "count": len(ids),
+        "terms": len(vocab),
+        "avgdl": (sum(doc_len) / len(doc_len)) if doc_len else 0.0,
+        "k1": BM25_K1,
+        "b": BM25_B,
+    }
+    (tmp_dir / META_NAME).write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    publish_dir(tmp_dir, index_dir)
+    return len(ids)
+
+
+def has_lexical_index(index_dir: Path = LEXICAL_INDEX_DIR) -> bool:
+    index_dir = Path(index_dir)
+    return all((index_dir / name).exists() for name in INDEX_FILES)
+
+
+# ========================================
+# Búsqueda
+# ========================================
+
+class LexicalIndex:
+    """Índice BM25 de solo lectura (postings memory-mapped)."""
+
+    def __init__(self, index_dir: Path = LEXICAL_INDEX_DIR):
+        self.index_dir = Path(index_dir)
+        self.meta = json.loads((self.index_dir / META_NAME).read_text(encoding="utf-8"))
+        self.vocab: Dict[str, List[int]] = json.loads((self.index_dir / "vocab.json").read_text(encoding="utf-8"))
+        self.ids: List[str] = json.loads((self.index_dir / "ids.json").read_text(encoding="utf-8"))
+        self.postings = np.load(self.index_dir / "postings.npy", mmap_mode="r")
+        self.tf = np.load(self.index_dir / "tf.npy", mmap_mode="r")
+
+        self.k1 = float(self.meta.get("k1", BM25_K1))
+        self.b = float(self.meta.get("b", BM25_B))
+        doc_len = np.load(self.index_dir / "doc_len.npy", mmap_mode="r")
+        avgdl = float(self.meta.get("avgdl") or 1.0)
+        # Denominador BM25 precalculado por documento: k1 * (1 - b + b * dl / avgdl)
+        self._norm = (self.k1 * (1.0 - self.b + self.b * np.asarray(doc_len, dtype=np.float32) / avgdl)).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query: str, k: int = 6) -> List[Tuple[str, float]]:
+        """Top-k (chunk_id, score BM25) para la consulta; solo documentos con score > 0."""
+        n_docs = len(self.ids)
+        if not n_docs:
+            return []
+
+        scores = np.zeros(n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            entry = self.vocab.get(term)
+            if entry is None:
+                continue
+            start, df = entry
+            docs = self.postings[start:start + df]
+            tf = self.tf[start:start + df].astype(np.float32)
+            idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            # Las postings de un término no repiten documento: suma directa
+            scores[docs] += idf * tf * (self.k1 + 1.0) / (tf + self._norm[docs])
+
+        hits = top_k(scores, k)
+        return [(self.ids[int(i)], float(scores[i])) for i in hits if scores[i] > 0]
+
+
+def load_lexical_index(index_dir: Path = LEXICAL_INDEX_DIR) -> Optional[LexicalIndex]:
+    """Abre el índice si existe; None si aún no se ha construido."""
+    return LexicalIndex(index_dir) if has_lexical_index(index_dir) else None
@@ -0,0 +1,501 @@
+# backend/llm_client.py
+"""
+Capa resiliente sobre el cliente de chat (registry.chat_llm).
+
+Cada llamada:
+- tiene un plazo total (LLM_DEADLINE_S) y otro por intento (LLM_ATTEMPT_TIMEOUT_S);
+- reintenta ante 429 / 5xx / timeout / error de conexión con backoff
+  exponencial y jitter completo (respeta Retry-After si llega);
+- lanza una petición duplicada ("hedged") si la primera tarda más que el
+  p95 de las latencias recientes: gana la primera que responde y la otra se
+  cancela. Recorta la cola de latencia de OpenAI a costa de pocas llamadas extra;
+- pasa por un circuito por modelo: tras LLM_BREAKER_FAILURES fallos
+  seguidos el modelo no se llama durante LLM_BREAKER_COOLDOWN_S;
+- si el modelo principal se agota, su circuito está abierto o falla con un
+  error no reintentable (modelo inexistente, cliente sin configurar) se usa
+  CHAT_FALLBACK_MODEL.
+
+El resultado es un LLMResult: texto y uso, o el tipo de error ("timeout",
+"rate_limit", "server", "connection", "client", "circuit_open"). El error
+nunca se devuelve como texto de la respuesta.
+
+En streaming los reintentos, la cobertura y el respaldo aplican hasta el
+primer fragmento; si no llega ninguno se lanza LLMUnavailable.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from backend.config import (
+    CHAT_FALLBACK_MODEL,
+    CHAT_MODEL,
+    LLM_ATTEMPT_TIMEOUT_S,
+    LLM_BREAKER_COOLDOWN_S,
+    LLM_BREAKER_FAILURES,
+    LLM_DEADLINE_S,
+    LLM_HEDGE_ENABLED,
+    LLM_HEDGE_MIN_MS,
+    LLM_HEDGE_MIN_SAMPLES,
+    LLM_HEDGE_QUANTILE,
+    LLM_MAX_RETRIES,
+    LLM_RETRY_BASE_MS,
+    LLM_RETRY_MAX_MS,
+)
+
+# Latencias recientes por modelo para calcular el retraso de la cobertura
+LATENCY_WINDOW = 200
+
+# Espera máxima que se acepta de un Retry-After (segundos)
+MAX_RETRY_AFTER_S = 10.0
+
+
+@dataclass
+class LLMResult:
+    text: str = ""
+    usage: Dict[str, int] = field(default_factory=dict)
+    model: Optional[str] = None
+    error: Optional[str] = None      # None si la llamada tuvo éxito
+    detail: str = ""
+    attempts: int = 0
+    hedged: bool = False
+    fallback: bool = False
+    latency_ms: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def error_info(self) -> Dict[str, Any]:
+        """Error para la respuesta de la API (sin trazas internas)."""
+        return {"kind": self.error, "detail": self.detail, "model": self.model, "attempts": self.attempts}
+
+
+class LLMUnavailable(Exception):
+    """Ningún modelo respondió a tiempo (streaming y llamadas que deben propagar el error)."""
+
+    def __init__(self, result: LLMResult):
+        super().__init__(f"{result.error}: {result.detail}")
+        self.result = result
+
+
+def classify_error(exc: BaseException) -> Tuple[str, bool]:
+    """(tipo, reintentable) de una excepción del SDK de OpenAI / httpx."""
+    name = type(exc).__name__
+    if isinstance(exc, TimeoutError) or "Timeout" in name:
+        return "timeout", True
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    if status == 429:
+        return "rate_limit", True
+    if status in (408, 409) or (isinstance(status, int) and status >= 500):
+        return "server", True
+    if isinstance(status, int):
+        return "client", False
+    if "Connection" in name or isinstance(exc, ConnectionError):
+        return "connection", True
+    return "client", False
+
+
+def _retry_after_s(exc: BaseException) -> float:
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return min(float(headers.get("retry-after", 0)), MAX_RETRY_AFTER_S)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def response_text(response: Any) -> str:
+    if hasattr(response, "content"):
+        return response.content
+    if isinstance(response, dict) and "content" in response:
+        return response["content"]
+    return str(response)
+
+
+def response_usage(response: Any) -> Dict[str, int]:
+    usage = getattr(response, "usage_metadata", None) or {}
+    return {
+        "input_tokens": int(usage.get("input_tokens", 0)),
+        "output_tokens": int(usage.get("output_tokens", 0)),
+        "total_tokens": int(usage.get("total_tokens", 0)),
+    }
+
+
+async def _aclose(stream: Any) -> None:
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+
+# ========================================
+# Circuito y latencias
+# ========================================
+
+class CircuitBreaker:
+    """
+    closed -> open tras `failures` fallos seguidos; open -> half_open pasado
+    cooldown_s (se deja pasar UNA llamada de prueba); su éxito cierra el
+    circuito y su fallo lo vuelve a abrir. Si la prueba acaba sin veredicto
+    (error no reintentable, cancelación) se libera con release() para que
+    pueda pasar otra.
+    """
+
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, cooldown_s: float = LLM_BREAKER_COOLDOWN_S,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failures = failures
+        self.cooldown_s = cooldown_s
+        self.clock = clock
+        self.state = "closed"
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self.opened = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def admit(self) -> Optional[str]:
+        """"call" (circuito cerrado), "probe" (la llamada de prueba) o None (rechazada)."""
+        with self._lock:
+            if self.state == "closed" or self.failures <= 0:
+                return "call"
+            if self.state == "open" and self.clock() - self.opened_at >= self.cooldown_s:
+                self.state, self._probing = "half_open", False
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return "probe"
+            return None
+
+    def allow(self) -> bool:
+        return self.admit() is not None
+
+    def release(self) -> None:
+        """La prueba terminó sin success()/failure(): la siguiente llamada vuelve a probar."""
+        with self._lock:
+            if self.state == "half_open":
+                self._probing = False
+
+    def success(self) -> None:
+        with self._lock:
+            self.state, self.consecutive, self._probing = "closed", 0, False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.consecutive += 1
+            if self.state == "half_open" or (self.failures > 0 and self.consecutive >= self.failures):
+                if self.state != "open":
+                    self.opened += 1
+                    print(f"[llm] 🔌 Circuito abierto tras {self.consecutive} fallos seguidos")
+                self.state, self.opened_at, self._probing = "open", self.clock(), False
+
+
+class LatencyTracker:
+    """Latencias de las llamadas con éxito; de ellas sale el retraso de la cobertura."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def hedge_delay_s(self, quantile: float = LLM_HEDGE_QUANTILE, min_ms: float = LLM_HEDGE_MIN_MS,
+                      min_samples: int = LLM_HEDGE_MIN_SAMPLES) -> Optional[float]:
+        """None mientras no haya suficientes mediciones (no se cubre a ciegas)."""
+        if len(self.samples) < max(1, min_samples):
+            return None
+        ordered = sorted(self.samples)
+        value = ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+        return max(value, min_ms / 1000)
+
+
+@dataclass
+class _Target:
+    label: str                              # "primary" | "fallback"
+    model: str
+    get_llm: Callable[[], Any]
+    breaker: CircuitBreaker
+    latency: LatencyTracker = field(default_factory=LatencyTracker)
+    first_chunk: LatencyTracker = field(default_factory=LatencyTracker)
+
+
+# ========================================
+# Cliente
+# ========================================
+
+class ResilientChat:
+    """
+    Envuelve el cliente principal y, opcionalmente, uno de respaldo.
+    get_primary / get_fallback se llaman en cada intento, así una recarga
+    del registro se aplica sin reconstruir el cliente (y sin perder el
+    estado de los circuitos ni las latencias).
+    """
+
+    def __init__(
+        self,
+        get_primary: Callable[[], Any],
+        get_fallback: Optional[Callable[[], Any]] = None,
+        primary_model: str = CHAT_MODEL,
+        fallback_model: str = CHAT_FALLBACK_MODEL,
+        deadline_s: float = LLM_DEADLINE_S,
+        attempt_timeout_s: float = LLM_ATTEMPT_TIMEOUT_S,
+        max_retries: int = LLM_MAX_RETRIES,
+        retry_base_ms: float = LLM_RETRY_BASE_MS,
+        retry_max_ms: float = LLM_RETRY_MAX_MS,
+        hedge: bool = LLM_HEDGE_ENABLED,
+        hedge_min_ms: float = LLM_HEDGE_MIN_MS,
+        hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+        breaker_failures: int = LLM_BREAKER_FAILURES,
+        breaker_cooldown_s: float = LLM_BREAKER_COOLDOWN_S,
+    ):
+        self.targets = [_Target("primary", primary_model, get_primary, CircuitBreaker(breaker_failures, breaker_cooldown_s))]
+        if get_fallback is not None:
+            self.targets.append(
+                _Target("fallback", fallback_model, get_fallback, CircuitBreaker(breaker_failures, breaker_cooldown_s))
+            )
+        self.deadline_s = deadline_s
+        self.attempt_timeout_s = attempt_timeout_s
+        self.max_retries = max_retries
+        self.retry_base_ms = retry_base_ms
+        self.retry_max_ms = retry_max_ms
+        self.hedge = hedge
+        self.hedge_min_ms = hedge_min_ms
+        self.hedge_min_samples = hedge_min_samples
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {
+            "calls": 0, "failed_calls": 0, "attempts": 0, "retries": 0,
+            "hedges": 0, "hedge_wins": 0, "fallbacks": 0, "circuit_rejections": 0,
+        }
+        self.errors: Dict[str, int] = {}
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def _hedge_delay_s(self, tracker: LatencyTracker) -> Optional[float]:
+        if not self.hedge:
+            return None
+        return tracker.hedge_delay_s(min_ms=self.hedge_min_ms, min_samples=self.hedge_min_samples)
+
+    def _backoff_s(self, retry: int, exc: BaseException) -> float:
+        cap = min(self.retry_max_ms, self.retry_base_ms * (2 ** retry)) / 1000
+        return max(random.uniform(0, cap), _retry_after_s(exc))
+
+    # ========================================
+    # Carrera entre la petición y su duplicado
+    # ========================================
+
+    async def _race(
+        self,
+        start: Callable[[], Awaitable[Any]],
+        timeout_s: float,
+        hedge_delay_s: Optional[float],
+        discard: Callable[[Any], None] = lambda value: None,
+    ) -> Tuple[Any, bool, bool]:
+        """
+        Ejecuta start(); si no termina en hedge_delay_s lanza un duplicado.
+        Devuelve (valor, se cubrió, ganó el duplicado). Si fallan todas,
+        relanza el último error; TimeoutError si se agota timeout_s.
+        discard(valor) recibe los resultados que llegan tarde.
+        """
+        t0 = time.monotonic()
+        tasks: Dict[asyncio.Future, bool] = {asyncio.ensure_future(start()): False}
+        hedged = False
+        error: Optional[BaseException] = None
+        try:
+            while tasks:
+                remaining = timeout_s - (time.monotonic() - t0)
+                if remaining <= 0:
+                    raise TimeoutError(f"sin respuesta en {timeout_s:.1f}s")
+                wait_s = remaining
+                if hedge_delay_s is not None and not hedged:
+                    wait_s = min(remaining, max(0.0, hedge_delay_s - (time.monotonic() - t0)))
+                done, _ = await asyncio.wait(list(tasks), timeout=wait_s, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    is_hedge = tasks.pop(task)
+                    if task.exception() is None:
+                        return task.result(), hedged, is_hedge
+                    error = task.exception()
+                if not done and hedge_delay_s is not None and not hedged:
+                    tasks[asyncio.ensure_future(start())] = True
+                    hedged = True
+                    self._count("hedges")
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+                task.add_done_callback(
+                    lambda t: discard(t.result()) if not t.cancelled() and t.exception() is None else None
+                )
+
+    # ========================================
+    # Bucle de intentos (común a invoke / stream)
+    # ========================================
+
+    async def _arun(
+        self,
+        call: Callable[[Any], Awaitable[Any]],
+        deadline_s: Optional[float],
+        streaming: bool = False,
+        discard: Callable[[Any], None] = lambda value: None,
+    ) -> Tuple[Any, LLMResult]:
+        """(valor, resultado). valor es None si no respondió ningún modelo."""
+        t0 = time.monotonic()
+        deadline = t0 + (deadline_s or self.deadline_s)
+        result = LLMResult()
+        self._count("calls")
+
+        for target in self.targets:
+            if time.monotonic() >= deadline:
+                break
+            admitted = target.breaker.admit()
+            if admitted is None:
+                self._count("circuit_rejections")
+                result.error, result.detail, result.model = "circuit_open", f"circuito abierto para {target.model}", target.model
+                continue
+            if target.label == "fallback":
+                self._count("fallbacks")
+                result.fallback = True
+                print(f"[llm] ↪️ Respaldo con {target.model} ({result.error})")
+
+            tracker = target.first_chunk if streaming else target.latency
+            try:
+                for retry in range(self.max_retries + 1):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        result.error, result.detail = "timeout", f"plazo de {deadline - t0:.1f}s agotado"
+                        break
+                    if retry:
+                        self._count("retries")
+                    result.attempts += 1
+                    result.model = target.model
+                    self._count("attempts")
+                    started = time.monotonic()
+                    hedge_delay = self._hedge_delay_s(tracker)
+                    try:
+                        # Dentro del try: un cliente que no se puede construir
+                        # (falta OPENAI_API_KEY, modelo mal configurado) es un
+                        # error más y pasa al respaldo
+                        llm = target.get_llm()
+                        value, hedged, hedge_won = await self._race(
+                            lambda: call(llm), min(self.attempt_timeout_s, remaining), hedge_delay, discard
+                        )
+                    except Exception as e:
+                        kind, retryable = classify_error(e)
+                        result.error, result.detail = kind, str(e)[:300]
+                        with self._lock:
+                            self.errors[kind] = self.errors.get(kind, 0) + 1
+                        print(f"[llm] ⚠️ {target.model} intento {result.attempts}: {kind} ({result.detail[:120]})")
+                        if not retryable:
+                            break   # reintentar no sirve; el respaldo quizá sí (p. ej. modelo inexistente)
+                        target.breaker.failure()
+                        if target.breaker.state == "open" or retry == self.max_retries:
+                            break
+                        pause = min(self._backoff_s(retry, e), max(0.0, deadline - time.monotonic()))
+                        await asyncio.sleep(pause)
+                        continue
+
+                    target.breaker.success()
+                    tracker.add(time.monotonic() - started)
+                    if hedge_won:
+                        self._count("hedge_wins")
+                    result.error, result.detail, result.hedged = None, "", hedged
+                    return value, self._finish(result, t0)
+            finally:
+                # Una prueba sin veredicto (no reintentable, plazo, cobertura,
+                # cliente desconectado) no puede dejar el circuito bloqueado
+                if admitted == "probe":
+                    target.breaker.release()
+
+        return None, self._finish(result, t0)
+
+    def _finish(self, result: LLMResult, t0: float) -> LLMResult:
+        result.latency_ms = round((time.monotonic() - t0) * 1000, 2)
+        if not result.ok:
+            self._count("failed_calls")
+        return result
+
+    # ========================================
+    # API
+    # ========================================
+
+    async def ainvoke(self, messages: List[Dict], deadline_s: Optional[float] = None) -> LLMResult:
+        response, result = await self._arun(lambda llm: llm.ainvoke(messages), deadline_s)
+        if response is not None:
+            result.text = response_text(response)
+            result.usage = response_usage(response)
+        return result
+
+    def invoke(self, messages: List[Dict], deadline_s: Optional[float] = None) -> LLMResult:
+        """
+        Versión síncrona para el pipeline sync (hilos sin event loop): cada
+        intento es llm.invoke en un hilo, con la misma lógica de plazos y
+        cobertura. Un intento abandonado termina en segundo plano.
+
+        Los hilos son de un pool propio que se cierra sin esperarlos:
+        asyncio.run() sí esperaría a los del executor por defecto (to_thread)
+        y el plazo no se cumpliría.
+        """
+        # Hilos suficientes para que un intento abandonado no retrase al siguiente
+        workers = 2 * (self.max_retries + 1) * len(self.targets)
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm-invoke")
+
+        async def _main():
+            loop = asyncio.get_running_loop()
+            response, result = await self._arun(
+                lambda llm: loop.run_in_executor(executor, llm.invoke, messages), deadline_s
+            )
+            if response is not None:
+                result.text = response_text(response)
+                result.usage = response_usage(response)
+            return result
+
+        try:
+            return asyncio.run(_main())
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def astream(self, messages: List[Dict], deadline_s: Optional[float] = None) -> AsyncIterator[Any]:
+        """
+        Fragmentos del modelo (llm.astream). El plazo, los reintentos, la
+        cobertura y el respaldo aplican hasta el primer fragmento; un error
+        posterior se propaga tal cual.
+        """
+        async def _open(llm):
+            stream = llm.astream(messages).__aiter__()
+            try:
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                first = None
+            except BaseException:
+                await _aclose(stream)
+                raise
+            return first, stream
+
+        def _close(opened) -> None:
+            asyncio.ensure_future(_aclose(opened[1]))
+
+        opened, result = await self._arun(_open, deadline_s, streaming=True, discard=_close)
+        if opened is None:
+            raise LLMUnavailable(result)
+        first, stream = opened
+        try:
+            if first is None:
+                return
+            yield first
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await _aclose(stream)
+
+    def stats(self) -> Dict[str, float]:
+        out: Dict[str, float] = dict(self.counters)
+        out.update({f"errors_{kind}": n for kind, n in self.errors.items()})
+        for target in self.targets:
+            out[f"{target.label}_circuit_open"] = int(target.breaker.state == "open")
+            out[f"{target.label}_circuit_opened"] = target.breaker.opened
+            delay = self._hedge_delay_s(target.latency)
+            out[f"{target.label}_hedge_delay_ms"] = round(delay * 1000, 1) if delay else 0.0
+        return out
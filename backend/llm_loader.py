@@ -1,90 +1,150 @@
 import os
-from dotenv import load_dotenv
+from functools import lru_cache
 from backend.config import (
     EMBEDDINGS_PROVIDER,
     CHAT_MODEL,
     CHAT_TEMPERATURE,
     EMBEDDINGS_MODEL,
+    HF_EMBEDDINGS_MODEL,
+    HF_EMBEDDINGS_BACKEND,
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDINGS_CHECK_CTX_LENGTH,
+    OPENAI_BASE_URL,
 )
+from backend.scheduler import scheduled_http_clients
 
-# Carga variables de entorno desde .env si existe
-load_dotenv()
 
-# 🚑 Fix para Pydantic v2 con LangChain
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-ChatOpenAI.model_rebuild()
-OpenAIEmbeddings.model_rebuild()
+@lru_cache(maxsize=1)
+def _openai_classes():
+    """
+    Import diferido de langchain_openai (~0.6 s): solo se paga al construir
+    el primer cliente, no al importar la app.
+    """
+    from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 
+    # 🚑 Fix para Pydantic v2 con LangChain
+    ChatOpenAI.model_rebuild()
+    OpenAIEmbeddings.model_rebuild()
+    return ChatOpenAI, OpenAIEmbeddings
 
-def get_chat_llm():
+
+def get_chat_llm(http_client=None, http_async_client=None, model: str = None, max_retries: int = None):
     """
     Devuelve el modelo de chat principal (OpenAI).
     Configurable desde config.py.
     Requiere la variable de entorno OPENAI_API_KEY.
+
+    - http_client / http_async_client: clientes httpx opcionales para
+      reutilizar un pool de conexiones keep-alive (ver backend/resources.py).
+      Sin ellos se usan los del proceso con el planificador de llamadas
+      (backend/scheduler.py).
+    - model: otro modelo (p. ej. CHAT_FALLBACK_MODEL); por defecto CHAT_MODEL.
+    - max_retries: reintentos del SDK; el registro usa 0 porque los
+      reintentos los hace backend/llm_client.py.
     """
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise ValueError("⚠️ Falta definir la variable de entorno OPENAI_API_KEY")
+    if http_client is None and http_async_client is None:
+        http_client, http_async_client = scheduled_http_clients()
 
+    ChatOpenAI, _ = _openai_classes()
+    extra = {} if max_retries is None else {"max_retries": max_retries}
     return ChatOpenAI(
-        model=CHAT_MODEL,
+        model=model or CHAT_MODEL,
         temperature=CHAT_TEMPERATURE,
         api_key=api_key,   # ✅ en openai>=1.42.0 el parámetro correcto es api_key
+        base_url=OPENAI_BASE_URL,
+        stream_usage=True,   # uso de tokens también en streaming (métricas)
+        http_client=http_client,
+        http_async_client=http_async_client,
+        **extra,
     )
 
 
-def get_embeddings(provider: str = None):
+def embeddings_model_id(provider: str = None) -> str:
+    """
+    Modelo de embeddings tal y como se registra en la caché de embeddings y
+    en el manifiesto del índice. Con "hf" incluye el motor y, en ONNX, el
+    fichero de pesos: PyTorch fp32, ONNX fp32 e int8 dan vectores distintos
+    y no deben compartir caché ni índice.
+    """
+    provider = provider or EMBEDDINGS_PROVIDER
+    if provider != "hf":
+        return EMBEDDINGS_MODEL
+    if HF_EMBEDDINGS_BACKEND == "onnx":
+        from backend.onnx_embeddings import _onnx_file
+
+        return f"{HF_EMBEDDINGS_MODEL}@onnx:{_onnx_file()}"
+    return f"{HF_EMBEDDINGS_MODEL}@torch"
+
+
+def get_embeddings(
+    provider: str = None,
+    http_client=None,
+    http_async_client=None,
+    cached: bool = EMBEDDING_CACHE_ENABLED,
+):
     """
     Devuelve el proveedor de embeddings (Hugging Face o OpenAI),
     definido de manera centralizada en config.py
+
+    Los clientes httpx opcionales solo aplican al proveedor "openai"; sin
+    ellos se usan los del proceso con el planificador (backend/scheduler.py).
+    Con cached=True se envuelve en CachedEmbeddings (ver embedding_cache.py),
+    con embeddings_model_id() como modelo de la clave.
     """
     provider = provider or EMBEDDINGS_PROVIDER
 
     if provider == "hf":
-        from langchain_huggingface import HuggingFaceEmbeddings
+        if HF_EMBEDDINGS_BACKEND == "onnx":
+            # ONNX Runtime sin PyTorch, compartido por el proceso (backend/onnx_embeddings.py)
+            from backend.onnx_embeddings import get_onnx_embeddings
 
-        return HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2",
-            encode_kwargs={"normalize_embeddings": True},
-        )
+            embeddings = get_onnx_embeddings()
+        else:
+            from langchain_huggingface import HuggingFaceEmbeddings
+
+            embeddings = HuggingFaceEmbeddings(
+                model_name=HF_EMBEDDINGS_MODEL,
+                encode_kwargs={"normalize_embeddings": True},
+            )
 
     elif provider == "openai":
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("⚠️ Falta definir la variable de entorno OPENAI_API_KEY")
 
-        return OpenAIEmbeddings(
+        if http_client is None and http_async_client is None:
+            http_client, http_async_client = scheduled_http_clients()
+        _, OpenAIEmbeddings = _openai_classes()
+        embeddings = OpenAIEmbeddings(
             model=EMBEDDINGS_MODEL,
             api_key=api_key,   # ✅ corregido igual que arriba
+            base_url=OPENAI_BASE_URL,
+            check_embedding_ctx_length=EMBEDDINGS_CHECK_CTX_LENGTH,
+            http_client=http_client,
+            http_async_client=http_async_client,
         )
 
     else:
         raise ValueError("EMBEDDINGS_PROVIDER debe ser 'hf' o 'openai'")
 
+    if cached:
+        from backend.embedding_cache import CachedEmbeddings
+
+        return CachedEmbeddings(embeddings, provider=provider, model=embeddings_model_id(provider))
+    return embeddings
+
 
 # 🚀 NUEVO: función generate para invocar rápido al LLM
-def generate(prompt: str) -> str:
+def generate(prompt: str):
     """
-    Ejecuta el modelo de chat con un prompt simple y devuelve la respuesta.
+    Ejecuta el modelo de chat con un prompt simple.
+    Usa el cliente resiliente del registro de recursos (reintentos, plazo,
+    respaldo) y devuelve un LLMResult: result.text si result.ok, si no
+    result.error / result.detail.
     """
-    llm = get_chat_llm()
-    try:
-        response = llm.invoke(prompt)
-        if hasattr(response, "content"):
-            return response.content
-        if isinstance(response, dict) and "content" in response:
-            return response["content"]
-        return str(response)
-    except Exception as e:
-        return f"⚠️ Error al generar respuesta: {e}"
-
-
-
-
-
-
-
-
-
-
+    from backend.resources import registry  # import diferido: evita ciclo
 
+    return registry.chat_client.invoke([{"role": "user", "content": prompt}])
@@ -0,0 +1,104 @@
+# backend/manifest.py
+"""
+Manifiesto del índice vectorial (manifest.json en el directorio de cada
+versión, ver backend/index_versions.py).
+
+Registra, por cada PDF indexado, su hash, mtime, tamaño y los ids de sus
+chunks, junto con el proveedor/modelo de embeddings y los parámetros de
+troceado. ingest.py lo usa para indexar solo lo que cambió:
+
+{
+  "provider": "openai",
+  "model": "text-embedding-3-large",
+  "chunk_size": 500,
+  "chunk_overlap": 80,
+  "id_scheme": 2,
+  "index_version": "20250101T120000-3f2a…",
+  "files": {
+    "paper.pdf": {"sha256": "…", "mtime": 1700000000.0, "size": 12345,
+                  "chunk_ids": ["3f2a…-9c1e…-0-0", …]}
+  }
+}
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from backend.config import CHROMA_DIR
+
+MANIFEST_NAME = "manifest.json"
+
+# Formato de los ids de chunk (ver chunk_id). Si el manifiesto trae otro, la
+# ingesta reconstruye el índice entero en lugar de mezclar ids de dos formatos
+CHUNK_ID_SCHEME = 2
+
+
+def manifest_path(index_dir: Path = CHROMA_DIR) -> Path:
+    return Path(index_dir) / MANIFEST_NAME
+
+
+def empty_manifest(provider: str, model: str, chunk_size: int, chunk_overlap: int) -> Dict[str, Any]:
+    return {
+        "provider": provider,
+        "model": model,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "id_scheme": CHUNK_ID_SCHEME,
+        "index_version": None,
+        "files": {},
+    }
+
+
+def load_manifest(index_dir: Path = CHROMA_DIR) -> Optional[Dict[str, Any]]:
+    """Lee el manifiesto; None si no existe o está corrupto."""
+    path = manifest_path(index_dir)
+    if not path.exists():
+        return None
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except Exception as e:
+        print(f"[!] Manifiesto ilegible ({path}): {e}")
+        return None
+
+
+def save_manifest(manifest: Dict[str, Any], index_dir: Path = CHROMA_DIR) -> None:
+    """Escritura atómica (tmp + os.replace) para no dejar un JSON a medias."""
+    path = manifest_path(index_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def new_index_version() -> str:
+    """Identificador único y ordenable de una versión del índice."""
+    return time.strftime("%Y%m%dT%H%M%S", time.gmtime()) + "-" + uuid.uuid4().hex[:8]
+
+
+def get_index_version(index_dir: Path = CHROMA_DIR) -> Optional[str]:
+    manifest = load_manifest(index_dir)
+    return manifest.get("index_version") if manifest else None
+
+
+def file_sha256(path: Path, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_id(name: str, file_sha: str, page: Any, index: int) -> str:
+    """
+    Id estable y determinista de un chunk: misma ruta, mismo contenido de
+    fichero, misma página y misma posición => mismo id (los upserts son
+    idempotentes). La ruta relativa entra en el id: dos copias idénticas del
+    mismo PDF en rutas distintas no comparten chunks (borrar una no borra la otra).
+    """
+    path_hash = hashlib.sha256(name.encode("utf-8")).hexdigest()[:8]
+    return f"{file_sha[:16]}-{path_hash}-{page}-{index}"
@@ -0,0 +1,257 @@
+# backend/metrics.py
+"""
+Métricas del pipeline en formato de texto de Prometheus (GET /metrics) y
+cabecera Server-Timing opcional.
+
+Qué se mide:
+- zoltar_stage_seconds{stage}          duración de cada etapa (embed, cache,
+                                       retrieve, assemble, generate, total)
+- zoltar_llm_tokens{kind}              tokens de prompt / completion por llamada
+- zoltar_llm_errors_total              llamadas al modelo que fallaron
+- zoltar_context_tokens                tamaño del contexto empaquetado
+- zoltar_retrieved_docs                fragmentos recuperados (k efectivo)
+- zoltar_answer_cache_total{result}    hit_exact / hit_semantic / miss
+- zoltar_http_request_seconds{...}     latencia por ruta de /api
+- zoltar_outbound_wait_seconds{priority} espera en el planificador de llamadas
+                                       a OpenAI (ver backend/scheduler.py)
+
+Sin dependencias: histogramas acumulativos con un lock (el pipeline síncrono
+corre en hilos). Con METRICS_ENABLED=false cada observe() retorna en la
+primera línea y el middleware no se instala.
+"""
+
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from backend.config import METRICS_ENABLED, SERVER_TIMING_ENABLED
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+DOCS_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 12, 20)
+
+# Duraciones (ms) por etapa de la request actual, para Server-Timing
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def _label_str(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+# ========================================
+# Tipos de métrica
+# ========================================
+
+class Counter:
+    def __init__(self, name: str, help_: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help_, tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_str(self.labelnames, labels)} {_fmt(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, *labels: str, value: float) -> None:
+        with self._lock:
+            self._values[labels] = float(value)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_: str, buckets: Iterable[float], labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help_, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [conteos por bucket (+Inf al final), suma, total]
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(s[0]), s[1], s[2]) for labels, s in sorted(self._series.items())]
+        for labels, counts, total_sum, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = _label_str(self.labelnames, labels, f'le="{_fmt(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            plain = _label_str(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{plain} {_fmt(round(total_sum, 6))}")
+            lines.append(f"{self.name}_count{plain} {total}")
+        return lines
+
+
+# ========================================
+# Métricas del proceso
+# ========================================
+
+stage_seconds = Histogram("zoltar_stage_seconds", "Duración de cada etapa del pipeline", LATENCY_BUCKETS, ("stage",))
+llm_tokens = Histogram("zoltar_llm_tokens", "Tokens por llamada al modelo de chat", TOKEN_BUCKETS, ("kind",))
+llm_errors = Counter("zoltar_llm_errors_total", "Llamadas al modelo de chat que fallaron")
+context_tokens = Histogram("zoltar_context_tokens", "Tokens del contexto empaquetado en el prompt", TOKEN_BUCKETS)
+retrieved_docs = Histogram("zoltar_retrieved_docs", "Fragmentos recuperados por consulta", DOCS_BUCKETS)
+answer_cache = Counter("zoltar_answer_cache_total", "Consultas a la caché de respuestas", ("result",))
+http_seconds = Histogram(
+    "zoltar_http_request_seconds", "Latencia de las requests a /api", LATENCY_BUCKETS, ("method", "route", "status")
+)
+outbound_wait = Histogram(
+    "zoltar_outbound_wait_seconds", "Espera en cola antes de llamar a OpenAI", LATENCY_BUCKETS, ("priority",)
+)
+# Se rellenan al servir /metrics (ver app.py)
+component_stats = Gauge("zoltar_component_stat", "Contadores de cachés y coalescencia", ("component", "stat"))
+
+_ALL = (
+    stage_seconds, llm_tokens, llm_errors, context_tokens, retrieved_docs, answer_cache, http_seconds,
+    outbound_wait, component_stats,
+)
+
+
+# ========================================
+# API para el pipeline
+# ========================================
+
+def observe_stage(stage: str, elapsed_ms: float) -> None:
+    """Etapa terminada: histograma + acumulado para Server-Timing de esta request."""
+    if not METRICS_ENABLED and not SERVER_TIMING_ENABLED:
+        return
+    if METRICS_ENABLED:
+        stage_seconds.observe(elapsed_ms / 1000, stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + elapsed_ms
+
+
+def observe_usage(usage: Optional[Dict[str, int]]) -> None:
+    if not METRICS_ENABLED or not usage:
+        return
+    if usage.get("input_tokens"):
+        llm_tokens.observe(usage["input_tokens"], "prompt")
+    if usage.get("output_tokens"):
+        llm_tokens.observe(usage["output_tokens"], "completion")
+
+
+def observe_llm_error() -> None:
+    if METRICS_ENABLED:
+        llm_errors.inc()
+
+
+def observe_context(n_tokens: int) -> None:
+    if METRICS_ENABLED:
+        context_tokens.observe(n_tokens)
+
+
+def observe_retrieved(n_docs: int) -> None:
+    if METRICS_ENABLED:
+        retrieved_docs.observe(n_docs)
+
+
+def observe_cache(result: str) -> None:
+    """result: "hit_exact" | "hit_semantic" | "miss"."""
+    if METRICS_ENABLED:
+        answer_cache.inc(result)
+
+
+def observe_outbound_wait(priority: str, waited_ms: float) -> None:
+    """priority: "interactive" | "bulk" | "ingest"."""
+    if METRICS_ENABLED:
+        outbound_wait.observe(waited_ms / 1000, priority)
+
+
+def set_component_stats(component: str, stats: Dict) -> None:
+    for stat, value in stats.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            component_stats.set(component, stat, value=value)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _ALL:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ========================================
+# Middleware ASGI
+# ========================================
+
+def _server_timing(timings: Dict[str, float]) -> bytes:
+    return ", ".join(f"{stage};dur={ms:.1f}" for stage, ms in timings.items()).encode("latin-1")
+
+
+class MetricsMiddleware:
+    """
+    Mide cada request a /api y, con SERVER_TIMING_ENABLED, añade la cabecera
+    Server-Timing con las etapas registradas hasta que se envían las
+    cabeceras (en streaming solo llegan las previas a la generación).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api"):
+            await self.app(scope, receive, send)
+            return
+
+        timings: Dict[str, float] = {}
+        token = _request_timings.set(timings)
+        status = {"code": 500}
+        t0 = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if SERVER_TIMING_ENABLED:
+                    timings["app"] = (time.perf_counter() - t0) * 1000
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", _server_timing(timings))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_timings.reset(token)
+            if METRICS_ENABLED:
+                route = scope.get("route")
+                http_seconds.observe(
+                    time.perf_counter() - t0,
+                    scope["method"], getattr(route, "path", "unmatched"), str(status["code"]),
+                )
@@ -0,0 +1,291 @@
+# backend/onnx_embeddings.py
+"""
+Embeddings locales con ONNX Runtime (EMBEDDINGS_PROVIDER="hf",
+HF_EMBEDDINGS_BACKEND="onnx").
+
+Mismo modelo que HuggingFaceEmbeddings (HF_EMBEDDINGS_MODEL, por defecto
+all-MiniLM-L6-v2) y mismo post-proceso que sentence-transformers (mean
+pooling con máscara + normalización L2), así que los vectores son
+compatibles con un índice construido con el proveedor "hf" de siempre.
+Sin PyTorch: onnxruntime + tokenizers, pesos int8 opcionales.
+
+- OnnxEmbeddingEngine: sesión ONNX + tokenizer, UNA por proceso y
+  compartida entre hilos (InferenceSession.run es thread-safe).
+- MicroBatcher: las consultas concurrentes se agrupan en un solo forward
+  pass (hasta EMBED_MICROBATCH_MAX, esperando como mucho
+  EMBED_MICROBATCH_WAIT_MS a que lleguen más).
+- OnnxEmbeddings: interfaz Embeddings de LangChain sobre ambos.
+"""
+
+import asyncio
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from backend.config import (
+    EMBED_MICROBATCH_MAX,
+    EMBED_MICROBATCH_WAIT_MS,
+    HF_EMBEDDINGS_DIR,
+    HF_EMBEDDINGS_MODEL,
+    HF_EMBEDDINGS_ONNX_FILE,
+    HF_EMBEDDINGS_QUANTIZED,
+    HF_EMBEDDINGS_THREADS,
+)
+
+# Ficheros ONNX publicados en los repos de sentence-transformers
+ONNX_FP32_FILE = "onnx/model.onnx"
+ONNX_INT8_FILE = "onnx/model_quint8_avx2.onnx"   # int8 dinámico, cualquier x86-64 con AVX2
+
+# Longitud máxima por defecto de sentence-transformers para MiniLM
+DEFAULT_MAX_SEQ_LENGTH = 256
+
+# Lote de embed_documents (ingesta): textos ordenados por longitud para
+# minimizar el padding
+DOCUMENT_BATCH = 32
+
+
+def mean_pool_normalize(hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    """Mean pooling con máscara + L2, como Pooling(mean) + Normalize de sentence-transformers."""
+    mask = attention_mask[..., None].astype(np.float32)
+    summed = (hidden * mask).sum(axis=1)
+    pooled = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+    norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+    return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+
+# ========================================
+# Motor (sesión + tokenizer)
+# ========================================
+
+def _onnx_file() -> str:
+    if HF_EMBEDDINGS_ONNX_FILE:
+        return HF_EMBEDDINGS_ONNX_FILE
+    return ONNX_INT8_FILE if HF_EMBEDDINGS_QUANTIZED else ONNX_FP32_FILE
+
+
+def resolve_model_dir(model: str = HF_EMBEDDINGS_MODEL, onnx_file: Optional[str] = None) -> Path:
+    """
+    HF_EMBEDDINGS_DIR si está definido; si no, descarga (o reutiliza la
+    caché del Hub) solo el tokenizer, la config de pooling y el .onnx.
+    """
+    if HF_EMBEDDINGS_DIR:
+        return Path(HF_EMBEDDINGS_DIR)
+    from huggingface_hub import snapshot_download
+
+    return Path(snapshot_download(
+        model,
+        allow_patterns=[
+            "tokenizer.json", "config.json", "sentence_bert_config.json",
+            "1_Pooling/config.json", onnx_file or _onnx_file(),
+        ],
+    ))
+
+
+class OnnxEmbeddingEngine:
+    """
+    Forward pass por lotes: textos -> matriz (n, dim) float32 normalizada.
+    session / tokenizer se pueden inyectar (tests); si no, se cargan de model_dir.
+    """
+
+    def __init__(
+        self,
+        model_dir: Optional[Path] = None,
+        onnx_file: Optional[str] = None,
+        session: Any = None,
+        tokenizer: Any = None,
+        max_seq_length: Optional[int] = None,
+        threads: int = HF_EMBEDDINGS_THREADS,
+    ):
+        onnx_file = onnx_file or _onnx_file()
+        if session is None or tokenizer is None:
+            model_dir = Path(model_dir) if model_dir else resolve_model_dir(onnx_file=onnx_file)
+
+        self.max_seq_length = max_seq_length or self._read_max_seq_length(model_dir)
+        self.tokenizer = tokenizer or self._load_tokenizer(model_dir)
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        self.tokenizer.enable_padding()
+        self.session = session or self._load_session(model_dir / onnx_file, threads)
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        outputs = [o.name for o in self.session.get_outputs()]
+        # Algunos exports ya traen la frase agregada; si no, last_hidden_state
+        self.output_name = "sentence_embedding" if "sentence_embedding" in outputs else outputs[0]
+        self.forward_passes = 0
+        self.encoded_texts = 0
+
+    @staticmethod
+    def _read_max_seq_length(model_dir: Optional[Path]) -> int:
+        try:
+            config = json.loads((Path(model_dir) / "sentence_bert_config.json").read_text(encoding="utf-8"))
+            return int(config.get("max_seq_length") or DEFAULT_MAX_SEQ_LENGTH)
+        except (OSError, TypeError, ValueError):
+            return DEFAULT_MAX_SEQ_LENGTH
+
+    @staticmethod
+    def _load_tokenizer(model_dir: Path):
+        from tokenizers import Tokenizer
+
+        return Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+
+    @staticmethod
+    def _load_session(path: Path, threads: int):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        return ort.InferenceSession(str(path), sess_options=options, providers=["CPUExecutionProvider"])
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """Un forward pass para todos los textos."""
+        encodings = self.tokenizer.encode_batch(list(texts))
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        output = self.session.run([self.output_name], {k: v for k, v in feeds.items() if k in self.input_names})[0]
+        self.forward_passes += 1
+        self.encoded_texts += len(encodings)
+        if output.ndim == 2:   # sentence_embedding
+            norms = np.linalg.norm(output, axis=1, keepdims=True)
+            return (output / np.clip(norms, 1e-12, None)).astype(np.float32)
+        return mean_pool_normalize(output, attention_mask)
+
+    def encode_documents(self, texts: Sequence[str], batch_size: int = DOCUMENT_BATCH) -> np.ndarray:
+        """Lotes de textos de longitud parecida (menos padding); respeta el orden original."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        out: Optional[np.ndarray] = None
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            vectors = self.encode([texts[i] for i in idx])
+            if out is None:
+                out = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            out[idx] = vectors
+        return out
+
+
+# ========================================
+# Micro-batching de consultas
+# ========================================
+
+class MicroBatcher:
+    """
+    Cola de consultas con un hilo consumidor: agrupa las que están
+    esperando (y las que lleguen en max_wait_ms) en una sola llamada a
+    encode_batch. Cada llamante recibe un Future con su vector.
+    """
+
+    def __init__(
+        self,
+        encode_batch: Callable[[List[str]], np.ndarray],
+        max_batch: int = EMBED_MICROBATCH_MAX,
+        max_wait_ms: float = EMBED_MICROBATCH_WAIT_MS,
+    ):
+        self.encode_batch = encode_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embed-microbatch", daemon=True)
+                    self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        future: Future = Future()
+        self._ensure_thread()
+        self._queue.put((text, future))
+        return future
+
+    def encode(self, text: str) -> np.ndarray:
+        return self.submit(text).result()
+
+    def _collect(self) -> List[Tuple[str, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                # Lo ya encolado se toma sin esperar; después, hasta el plazo
+                remaining = deadline - time.monotonic()
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = [(text, f) for text, f in self._collect() if f.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                vectors = self.encode_batch([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+        }
+
+
+# ========================================
+# Interfaz de LangChain
+# ========================================
+
+class OnnxEmbeddings(Embeddings):
+    """Embeddings de LangChain sobre un motor ONNX compartido y su micro-batcher."""
+
+    def __init__(self, engine: OnnxEmbeddingEngine, batcher: Optional[MicroBatcher] = None):
+        self.engine = engine
+        self.batcher = batcher or MicroBatcher(engine.encode)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self.engine.encode_documents(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.batcher.encode(text).tolist()
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        # El forward corre en el hilo del batcher: el event loop no se bloquea
+        return (await asyncio.wrap_future(self.batcher.submit(text))).tolist()
+
+
+@lru_cache(maxsize=1)
+def get_onnx_embeddings() -> OnnxEmbeddings:
+    """Instancia del proceso: un solo modelo en memoria aunque se recarguen los clientes."""
+    t0 = time.perf_counter()
+    embeddings = OnnxEmbeddings(OnnxEmbeddingEngine())
+    print(f"🧠 Embeddings ONNX ({HF_EMBEDDINGS_MODEL}, {_onnx_file()}) cargados en {time.perf_counter() - t0:.1f}s")
+    return embeddings
@@ -0,0 +1,312 @@
+# backend/query_router.py
+"""
+Enrutado de consultas antes del pipeline (/api/answer y /api/answer/stream).
+
+No todas las preguntas necesitan embeddings + recuperación + un prompt con
+contexto:
+
+- "canned": saludos, agradecimientos, despedidas, "¿quién eres?", "ok"...
+            -> respuesta fija, sin llamar al modelo (reglas sobre el texto)
+- "short":  charla trivial que no cubren las reglas (clasificador)
+            -> chat simple con un prompt de respuesta breve
+- "simple": preguntas fuera del corpus: el clasificador las ve lejos del
+            corpus o, sin clasificador, ningún término ancla en el índice
+            BM25 Y el fragmento más cercano del índice vectorial queda por
+            debajo de ROUTER_MIN_SIMILARITY -> chatbot_simple con el prompt pedido
+- "rag":    el resto -> pipeline RAG de siempre
+
+El clasificador (ROUTER_EMBEDDINGS) compara el embedding de la consulta con
+frases de ejemplo de cada intención. El embedding queda en la caché de
+embeddings, así que si la pregunta acaba en RAG no se vuelve a calcular.
+
+Que no haya términos BM25 en común no basta para sacar una pregunta de RAG:
+el corpus está en inglés y los usuarios preguntan en español. En caso de
+duda (sin índice, sin embeddings, error) la consulta va a RAG.
+
+Cada decisión se registra en el log con la latencia ahorrada estimada
+(media móvil de lo que tardan las respuestas RAG menos lo que tardó esta).
+"""
+
+import asyncio
+import re
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import numpy as np
+
+from backend.config import (
+    EMBEDDINGS_PROVIDER,
+    ROUTER_EMBEDDINGS,
+    ROUTER_EMBEDDINGS_MARGIN,
+    ROUTER_ENABLED,
+    ROUTER_MAX_TERM_DF,
+    ROUTER_MIN_SIMILARITY,
+)
+from backend.metrics import observe_stage
+from backend.resources import registry
+
+# ========================================
+# Reglas (texto normalizado: minúsculas, sin tildes ni puntuación)
+# ========================================
+
+_NAME = r"(?: (?:zoltar|oraculo|amigo|crack))?"
+
+RULES = (
+    ("greeting", re.compile(
+        rf"(?:hola|holi|buenas|buenos dias|buenas tardes|buenas noches|hey|hi|hello|saludos)"
+        rf"{_NAME}(?: (?:que tal|como estas|como va|como andas))?{_NAME}"
+        rf"|(?:que tal|como estas|como va|como andas){_NAME}"
+    )),
+    ("thanks", re.compile(
+        rf"(?:muchas |mil )?gracias{_NAME}(?: por (?:todo|la ayuda|tu ayuda|la respuesta))?"
+        rf"|(?:thanks|thank you|te lo agradezco){_NAME}"
+    )),
+    ("goodbye", re.compile(rf"(?:adios|chao|chau|bye|hasta (?:luego|pronto|manana)|nos vemos){_NAME}")),
+    ("ack", re.compile(r"(?:ok|okay|vale|perfecto|genial|entendido|de acuerdo|listo|muy bien|excelente|super)")),
+    ("identity", re.compile(
+        rf"(?:quien eres|que eres|como te llamas|que puedes hacer|que sabes hacer|en que me puedes ayudar|ayuda|help){_NAME}"
+    )),
+)
+
+CANNED_REPLIES = {
+    "greeting": (
+        "¡Hola! Soy Zoltar 🔮, tu oráculo sobre inteligencia artificial en educación. "
+        "Pregúntame, por ejemplo, cómo usar la IA en la evaluación formativa."
+    ),
+    "thanks": "¡Con gusto! Si te surge otra duda sobre IA en educación, aquí estoy. 🔮",
+    "goodbye": "¡Hasta pronto! Que tus clases sigan inspirando. 🔮",
+    "ack": "Perfecto. ¿Quieres profundizar en algún aspecto o tienes otra pregunta?",
+    "identity": (
+        "Soy Zoltar 🔮, un asistente sobre el uso de la inteligencia artificial en educación. "
+        "Respondo a partir de los documentos cargados: evaluación, diseño curricular, "
+        "chatbots educativos, ética de la IA en el aula y más."
+    ),
+}
+
+SHORT_REPLY_PROMPT = (
+    "Eres Zoltar, un asistente amable sobre IA en educación. El usuario está conversando "
+    "de forma casual: responde en español en una o dos frases y, si encaja, invítale a "
+    "preguntar sobre IA en educación."
+)
+
+# ========================================
+# Ejemplos para el clasificador por embeddings
+# ========================================
+
+EXAMPLES = {
+    "smalltalk": (
+        "hola, ¿cómo estás?", "buenos días, ¿qué tal te va?", "muchas gracias por la ayuda",
+        "cuéntame un chiste", "¿te gusta tu trabajo?", "adiós, hasta luego",
+    ),
+    "offtopic": (
+        "¿qué tiempo hará mañana?", "receta de tortilla de patatas", "¿quién ganó el partido de fútbol?",
+        "¿cuál es la capital de Australia?", "recomiéndame una película", "¿cuánto cuesta un billete de avión?",
+    ),
+    "corpus": (
+        "¿cómo usar la inteligencia artificial en la evaluación formativa?",
+        "diseño inverso UbD de Wiggins y McTighe", "ventajas de los chatbots educativos en secundaria",
+        "rúbricas y retroalimentación con IA", "ética de la IA generativa en el aula",
+        "planificación de una unidad didáctica con ChatGPT",
+    ),
+}
+
+
+def normalize(text: str) -> str:
+    """Minúsculas, sin tildes, sin puntuación ni emojis, espacios colapsados."""
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(re.sub(r"[^a-z0-9ñ ]+", " ", text).split())
+
+
+@dataclass
+class Route:
+    route: str                       # "canned" | "short" | "simple" | "rag"
+    reason: str                      # regla / señal que decidió
+    intent: Optional[str] = None
+    reply: Optional[str] = None
+    route_ms: float = 0.0
+    scores: Dict[str, float] = field(default_factory=dict)
+
+
+def match_rules(question: str) -> Optional[Route]:
+    text = normalize(question)
+    if not text:
+        return Route("canned", "vacía", intent="greeting", reply=CANNED_REPLIES["greeting"])
+    for intent, pattern in RULES:
+        if pattern.fullmatch(text):
+            return Route("canned", "regla", intent=intent, reply=CANNED_REPLIES[intent])
+    return None
+
+
+def corpus_anchor_terms(question: str, lexical_index: Any, max_df: float = ROUTER_MAX_TERM_DF) -> Optional[List[str]]:
+    """
+    Términos de la consulta presentes en el índice BM25 y no demasiado
+    frecuentes. None si no hay índice (no se puede decidir).
+    """
+    if lexical_index is None or not len(lexical_index):
+        return None
+    from backend.lexical_index import tokenize
+
+    limit = max_df * len(lexical_index)
+    return [t for t in dict.fromkeys(tokenize(question)) if t in lexical_index.vocab and lexical_index.vocab[t][1] < limit]
+
+
+# ========================================
+# Router
+# ========================================
+
+def _use_embeddings() -> bool:
+    if ROUTER_EMBEDDINGS == "auto":
+        return EMBEDDINGS_PROVIDER == "hf"
+    return ROUTER_EMBEDDINGS == "true"
+
+
+class QueryRouter:
+    """Decide la ruta de cada consulta y lleva la cuenta de la latencia ahorrada."""
+
+    def __init__(self, use_embeddings: Optional[bool] = None, margin: float = ROUTER_EMBEDDINGS_MARGIN):
+        self.use_embeddings = _use_embeddings() if use_embeddings is None else use_embeddings
+        self.margin = margin
+        self._examples: Optional[Dict[str, np.ndarray]] = None
+        self._examples_for: Any = None
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {"canned": 0, "short": 0, "simple": 0, "rag": 0}
+        self.rag_ms: Optional[float] = None   # media móvil de las respuestas RAG
+        self.saved_ms = 0.0
+
+    async def _example_vectors(self, embeddings: Any) -> Dict[str, np.ndarray]:
+        # Se recalculan si cambia el cliente de embeddings (reload); van a la caché de embeddings
+        if self._examples is None or self._examples_for is not embeddings:
+            texts = [t for examples in EXAMPLES.values() for t in examples]
+            vectors = _unit(np.asarray(await embeddings.aembed_documents(texts), dtype=np.float32))
+            out, i = {}, 0
+            for label, examples in EXAMPLES.items():
+                out[label] = vectors[i:i + len(examples)]
+                i += len(examples)
+            self._examples, self._examples_for = out, embeddings
+        return self._examples
+
+    async def aclassify(self, question: str) -> Dict[str, float]:
+        """Similitud máxima de la consulta con los ejemplos de cada intención."""
+        embeddings = registry.embeddings
+        examples = await self._example_vectors(embeddings)
+        query = _unit(np.asarray(await embeddings.aembed_query(question), dtype=np.float32)[None, :])[0]
+        return {label: round(float((vectors @ query).max()), 4) for label, vectors in examples.items()}
+
+    async def aroute(self, question: str, allow_simple: bool = True) -> Route:
+        """
+        Ruta de la consulta. allow_simple=False (oráculo docente): las
+        preguntas fuera del corpus siguen yendo a RAG, que ya responde con su
+        fallback honesto en lugar de contestar sin documentos.
+        """
+        t0 = time.perf_counter()
+        decision = match_rules(question) if ROUTER_ENABLED else Route("rag", "desactivado")
+        if decision is None:
+            decision = await self._aroute_content(question, allow_simple)
+        decision.route_ms = round((time.perf_counter() - t0) * 1000, 2)
+        observe_stage("route", decision.route_ms)
+        with self._lock:
+            self.counts[decision.route] += 1
+        return decision
+
+    async def acorpus_similarity(self, question: str) -> Optional[float]:
+        """
+        Similitud coseno de la consulta con el fragmento más cercano del
+        índice vectorial. None si no hay índice.
+        """
+        vectordb = registry.vectordb
+        if vectordb is None:
+            return None
+        embedding = await registry.embeddings.aembed_query(question)
+        found = await asyncio.to_thread(vectordb.similarity_search_by_vector_with_relevance_scores, embedding, k=1)
+        if not found:
+            return None
+        # Ambos backends devuelven la distancia l2 al cuadrado: d = 2 - 2·coseno
+        return round(1.0 - found[0][1] / 2.0, 4)
+
+    async def _aroute_content(self, question: str, allow_simple: bool) -> Route:
+        anchors = corpus_anchor_terms(question, registry.lexical_index)
+
+        if self.use_embeddings:
+            try:
+                scores = await self.aclassify(question)
+            except Exception as e:
+                print(f"[router] ⚠️ Clasificador no disponible: {e}")
+                return Route("rag", "sin clasificador")
+            label = max(scores, key=scores.get)
+            ahead = scores[label] - scores["corpus"] >= self.margin
+            # Con términos del corpus solo la charla trivial sale de RAG
+            if label == "smalltalk" and ahead:
+                return Route("short", "clasificador", intent="smalltalk", scores=scores)
+            if label == "offtopic" and ahead and allow_simple and not anchors:
+                return Route("simple", "clasificador", intent="offtopic", scores=scores)
+            return Route("rag", "clasificador", scores=scores)
+
+        # Sin índice BM25 (anchors None) no hay segunda señal: se queda en RAG
+        if anchors != [] or not allow_simple:
+            return Route("rag", "términos del corpus" if anchors else "por defecto")
+        # Sin términos en común: puede ser otro idioma; decide la similitud vectorial
+        try:
+            similarity = await self.acorpus_similarity(question)
+        except Exception as e:
+            print(f"[router] ⚠️ Similitud con el corpus no disponible: {e}")
+            return Route("rag", "sin similitud")
+        if similarity is not None and similarity < ROUTER_MIN_SIMILARITY:
+            return Route("simple", "lejos del corpus", scores={"corpus": similarity})
+        scores = {"corpus": similarity} if similarity is not None else {}
+        return Route("rag", "similar al corpus" if scores else "por defecto", scores=scores)
+
+    def record(self, decision: Route, elapsed_ms: float) -> None:
+        """Latencia total de la respuesta: actualiza la media de RAG o el ahorro, y lo registra."""
+        with self._lock:
+            if decision.route == "rag":
+                self.rag_ms = elapsed_ms if self.rag_ms is None else 0.9 * self.rag_ms + 0.1 * elapsed_ms
+                saved = 0.0
+            else:
+                saved = max(0.0, (self.rag_ms or 0.0) - elapsed_ms)
+                self.saved_ms += saved
+        intent = f"/{decision.intent}" if decision.intent else ""
+        suffix = f" · ~{saved:.0f} ms ahorrados" if saved else ""
+        print(f"[router] 🧭 {decision.route}{intent} ({decision.reason}) en {decision.route_ms} ms · total {elapsed_ms:.0f} ms{suffix}")
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            **{f"routed_{name}": count for name, count in self.counts.items()},
+            "rag_avg_ms": round(self.rag_ms or 0.0, 1),
+            "saved_ms_total": round(self.saved_ms, 1),
+        }
+
+
+def _unit(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.clip(norms, 1e-12, None)
+
+
+def canned_events(decision: Route) -> List[Dict]:
+    """Respuesta fija con los mismos eventos que un pipeline en streaming."""
+    return [
+        {"event": "token", "data": {"text": decision.reply}},
+        {"event": "done", "data": {"timings": {"route_ms": decision.route_ms, "total_ms": decision.route_ms}}},
+    ]
+
+
+async def arecorded_events(decision: Route, events: AsyncIterator[Dict]) -> AsyncIterator[Dict]:
+    """Reenvía los eventos y, al llegar "done", registra la decisión con la latencia total."""
+    t0 = time.perf_counter()
+    async for event in events:
+        if event["event"] == "done":
+            event = {"event": "done", "data": {**event["data"], "route": decision.route}}
+            router.record(decision, decision.route_ms + (time.perf_counter() - t0) * 1000)
+        yield event
+
+
+async def aiter_list(events: List[Dict]) -> AsyncIterator[Dict]:
+    for event in events:
+        yield event
+
+
+# Instancia del proceso
+router = QueryRouter()
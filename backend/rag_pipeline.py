@@ -1,72 +1,116 @@
 # backend/rag_pipeline.py
 
-from typing import List, Dict, Any, Tuple
-from backend.llm_loader import get_chat_llm
-from backend.retrieve import get_retriever
+import asyncio
+import time
+from contextlib import contextmanager
+from functools import partial
+from typing import AsyncIterator, Awaitable, List, Dict, Any, Optional, Tuple, TypeVar
+from backend.config import (
+    COALESCE_REQUESTS,
+    MAX_CONCURRENT_LLM_CALLS,
+    MAX_INFLIGHT_REQUESTS,
+    REQUEST_TIMEOUT_S,
+    RERANK_CANDIDATES,
+)
+from backend.answer_cache import answer_cache, normalize_question, prompt_version
+from backend.llm_client import LLMResult, LLMUnavailable, response_text, response_usage
+from backend.resources import registry
 from backend.prompt_teacher import build_teacher_prompt
+from backend.context_packer import pack_contexts
+from backend.singleflight import flight_key, flights
+from backend.metrics import (
+    observe_cache,
+    observe_context,
+    observe_llm_error,
+    observe_retrieved,
+    observe_stage,
+    observe_usage,
+)
 
+T = TypeVar("T")
 
-def safe_response(llm, messages: List[Dict]) -> str:
-    """Envuelve la invocación al LLM y devuelve siempre texto plano."""
-    try:
-        response = llm.invoke(messages)
-        if hasattr(response, "content"):
-            return response.content
-        if isinstance(response, dict) and "content" in response:
-            return response["content"]
-        return str(response)
-    except Exception as e:
-        print(f"[safe_response] Error: {e}")
-        return f"Error al generar respuesta: {e}"
+# Texto para el usuario cuando ningún modelo responde (el detalle va en "error")
+LLM_UNAVAILABLE_TEXT = "⚠️ El modelo no está disponible en este momento. Inténtalo de nuevo en unos segundos."
 
+# Límites de concurrencia del camino asíncrono (por proceso)
+_request_slots = asyncio.Semaphore(MAX_INFLIGHT_REQUESTS)
+_llm_slots = asyncio.Semaphore(MAX_CONCURRENT_LLM_CALLS)
 
-def _contexts_to_text_and_sources(
-    contexts: List[Any],
-    enumerate_blocks: bool = True,
-    max_chars_total: int = 6000,
-    max_chars_per_block: int = 1200,
-) -> Tuple[str, List[str]]:
+
+def complete(messages: List[Dict]) -> LLMResult:
     """
-    Convierte documentos recuperados en texto enumerado + lista de referencias.
+    Llamada al modelo de chat con el cliente resiliente (plazo, reintentos,
+    cobertura, circuito y respaldo; ver backend/llm_client.py). Los errores
+    vuelven en el LLMResult, nunca como texto de la respuesta.
     """
-    parts, total = [], 0
-    sources: List[str] = []
+    return _observed(registry.chat_client.invoke(messages))
+
+
+async def acomplete(messages: List[Dict]) -> LLMResult:
+    """Versión asíncrona de complete, limitada por MAX_CONCURRENT_LLM_CALLS."""
+    async with _llm_slots:
+        result = await registry.chat_client.ainvoke(messages)
+    return _observed(result)
+
+
+def _observed(result: LLMResult) -> LLMResult:
+    if result.ok:
+        observe_usage(result.usage)
+    else:
+        observe_llm_error()
+    return result
 
-    for i, c in enumerate(contexts, start=1):
-        md = getattr(c, "metadata", {}) or {}
-        doc_id = md.get("doc_id", "N/A")
-        title = md.get("title", md.get("source", "Desconocido"))
-        authors = md.get("authors", "Autores desconocidos")
-        page = md.get("page", "N/A")
-        source = md.get("source", "Fuente desconocida")
 
-        block_txt = getattr(c, "page_content", "") or ""
-        if len(block_txt) > max_chars_per_block:
-            block_txt = block_txt[:max_chars_per_block].rsplit(" ", 1)[0] + "…"
+async def run_with_limits(coro: Awaitable[T]) -> T:
+    """
+    Ejecuta una corrutina del pipeline respetando MAX_INFLIGHT_REQUESTS y
+    REQUEST_TIMEOUT_S (el timeout incluye el tiempo de espera en cola).
+    Lanza asyncio.TimeoutError si se supera el plazo.
+    """
+    async def _run():
+        async with _request_slots:
+            return await coro
 
-        header = (
-            f"Título: {title}\n"
-            f"Autores: {authors}\n"
-            f"Página: {page}\n"
-            f"Fuente: {source}"
-        )
+    return await asyncio.wait_for(_run(), timeout=REQUEST_TIMEOUT_S)
 
-        if enumerate_blocks:
-            body = f"[{i}] {header}\nContenido:\n{block_txt}"
-        else:
-            body = f"{header}\nContenido:\n{block_txt}"
 
-        if total + len(body) > max_chars_total:
-            break
+async def stream_with_limits(events: AsyncIterator[Dict]) -> AsyncIterator[Dict]:
+    """
+    Equivalente de run_with_limits para los pipelines en streaming: ocupa un
+    slot de MAX_INFLIGHT_REQUESTS mientras dura el stream y aplica el mismo
+    plazo REQUEST_TIMEOUT_S a la respuesta completa.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + REQUEST_TIMEOUT_S
 
-        parts.append(body)
-        total += len(body)
+    await asyncio.wait_for(_request_slots.acquire(), timeout=REQUEST_TIMEOUT_S)
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            try:
+                event = await asyncio.wait_for(events.__anext__(), timeout=remaining)
+            except StopAsyncIteration:
+                break
+            yield event
+    finally:
+        _request_slots.release()
+        await events.aclose()
 
-        ref = f"{title} (p.{page})"
-        if ref not in sources:
-            sources.append(ref)
 
-    return "\n\n".join(parts).strip(), sources
+def _contexts_to_text_and_sources(
+    contexts: List[Any],
+    enumerate_blocks: bool = True,
+    max_tokens: Optional[int] = None,
+) -> Tuple[str, List[str]]:
+    """
+    Convierte documentos recuperados en texto enumerado + lista de referencias,
+    dentro del presupuesto de tokens del modelo (ver backend/context_packer.py).
+    """
+    packed = pack_contexts(contexts, enumerate_blocks=enumerate_blocks, max_tokens=max_tokens)
+    observe_context(packed.tokens)
+    return packed.text, packed.sources
 
 
 FALLBACK_NO_CONTEXT = (
@@ -79,6 +123,253 @@ FALLBACK_NO_CONTEXT = (
 )
 
 
+DEFAULT_RAG_SYSTEM_PROMPT = (
+    "Eres un experto en tecnología educativa.\n"
+    "Responde preguntas sobre el uso de la inteligencia artificial y la generación artificial (GenIA) en educación.\n"
+    "Usa solamente la información proporcionada en el contexto.\n"
+    "No inventes ni rellenes con conocimiento externo."
+)
+
+
+@contextmanager
+def _timed(timings: Dict[str, float], stage: str):
+    """
+    Acumula en timings[f"{stage}_ms"] la duración del bloque y la publica
+    en las métricas / Server-Timing (ver backend/metrics.py).
+    """
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - t0) * 1000
+        key = f"{stage}_ms"
+        timings[key] = round(timings.get(key, 0.0) + elapsed, 2)
+        observe_stage(stage, elapsed)
+
+
+# Versión del prompt docente (plantilla sin rellenar) para las claves de caché
+_TEACHER_PROMPT_VERSION = prompt_version(build_teacher_prompt("{context}", "{question}", ""))
+
+
+# ========================================
+# Etapas: embed → retrieve (→ rerank) → assemble → generate
+# ========================================
+
+def embed_question(question: str) -> List[float]:
+    """Etapa 0: embedding de la pregunta (con caché de embeddings)."""
+    return registry.embeddings.embed_query(question)
+
+
+async def aembed_question(question: str) -> List[float]:
+    """Etapa 0 (async): embedding nativo asíncrono de la pregunta."""
+    return await registry.embeddings.aembed_query(question)
+
+
+def candidates_k(k: int, reranker: Any) -> int:
+    """Candidatos a recuperar: k, o RERANK_CANDIDATES si después se reordenan."""
+    return max(k, RERANK_CANDIDATES) if reranker is not None else k
+
+
+def rerank_contexts(
+    reranker: Any, question: str, embedding: List[float], candidates: List[Any], vectordb: Any, k: int
+) -> List[Any]:
+    """Etapa 1b: reordena los candidatos y se queda con ≤ k (ver backend/rerank.py)."""
+    if reranker is None:
+        return candidates[:k]
+    t0 = time.perf_counter()
+    contexts = reranker.rerank(question, embedding, candidates, vectordb, k)
+    observe_stage("rerank", (time.perf_counter() - t0) * 1000)
+    return contexts
+
+
+def _search_contexts(vectordb, lexical_index, reranker, question: str, embedding: List[float], k: int) -> List[Any]:
+    from backend.retrieve import search_contexts   # diferido: LangChain fuera del import de la app
+
+    candidates = search_contexts(
+        vectordb, question, embedding, k=candidates_k(k, reranker), lexical_index=lexical_index
+    ) or []
+    return rerank_contexts(reranker, question, embedding, candidates, vectordb, k)
+
+
+def retrieve_contexts(question: str, k: int = 5, embedding: Optional[List[float]] = None) -> List[Any]:
+    """
+    Etapa 1: recupera los k fragmentos (MMR, + BM25 en modo híbrido; con
+    RERANK_ENABLED, más candidatos reordenados y recortados). La pregunta se
+    embebe UNA vez; si ya se calculó su embedding, se reutiliza.
+    """
+    if embedding is None:
+        embedding = embed_question(question)
+    registry.refresh_index_if_stale()
+    contexts = _search_contexts(
+        registry.vectordb, registry.lexical_index, registry.reranker, question, embedding, k
+    )
+    observe_retrieved(len(contexts))
+    return contexts
+
+
+async def aretrieve_contexts(question: str, k: int = 5, embedding: Optional[List[float]] = None) -> List[Any]:
+    """
+    Etapa 1 (async): la búsqueda local en el índice y el reranking (CPU)
+    corren en un hilo para no bloquear el event loop.
+    """
+    if embedding is None:
+        embedding = await aembed_question(question)
+    await registry.arefresh_index_if_stale()
+    vectordb, lexical_index, reranker = registry.vectordb, registry.lexical_index, registry.reranker
+    contexts = await asyncio.to_thread(
+        _search_contexts, vectordb, lexical_index, reranker, question, embedding, k
+    )
+    observe_retrieved(len(contexts))
+    return contexts
+
+
+def assemble_rag_messages(
+    question: str,
+    contexts: List[Any],
+    system_prompt: str = "",
+) -> Tuple[List[Dict], List[str]]:
+    """
+    Etapa 2 (modo RAG genérico): system_prompt + contexto en el mensaje de usuario.
+    """
+    context_text, sources = _contexts_to_text_and_sources(contexts)
+    messages = [
+        {"role": "system", "content": system_prompt or DEFAULT_RAG_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Contexto:\n{context_text}\n\nPregunta:\n{question}"}
+    ]
+    return messages, sources
+
+
+def assemble_teacher_messages(
+    question: str,
+    contexts: List[Any],
+    history: str = "",
+) -> Tuple[List[Dict], List[str]]:
+    """
+    Etapa 2 (modo docente): el prompt docente ya contiene el contexto y la
+    pregunta, así que el contexto viaja una sola vez.
+    """
+    context_text, sources = _contexts_to_text_and_sources(contexts)
+    messages = [
+        {"role": "system", "content": build_teacher_prompt(context_text, question, history)},
+        {"role": "user", "content": question},
+    ]
+    return messages, sources
+
+
+def generate_answer(messages: List[Dict]) -> LLMResult:
+    """
+    Etapa 3: invoca al modelo de chat compartido.
+    """
+    return complete(messages)
+
+
+async def agenerate_answer(messages: List[Dict]) -> LLMResult:
+    """
+    Etapa 3 (async): llm.ainvoke, limitado por MAX_CONCURRENT_LLM_CALLS.
+    """
+    return await acomplete(messages)
+
+
+def _generation_result(reply: LLMResult, sources: List[str], timings: Dict[str, float], empty_text: str = "") -> Dict:
+    """Dict del pipeline: texto del modelo, o LLM_UNAVAILABLE_TEXT + "error" si no respondió."""
+    if not reply.ok:
+        return {"text": LLM_UNAVAILABLE_TEXT, "sources": sources, "timings": timings, "error": reply.error_info()}
+    return {"text": reply.text.strip() or empty_text, "sources": sources, "timings": timings}
+
+
+async def agenerate_with_usage(messages: List[Dict]) -> Tuple[str, Dict[str, int]]:
+    """
+    Etapa 3 (async) devolviendo también el uso de tokens. A diferencia de
+    agenerate_answer, si el modelo no responde se lanza LLMUnavailable (lo
+    registra bulk.py).
+    """
+    reply = await acomplete(messages)
+    if not reply.ok:
+        raise LLMUnavailable(reply)
+    return reply.text.strip(), reply.usage
+
+
+# ========================================
+# Caché de respuestas (ver backend/answer_cache.py)
+# ========================================
+
+def _rag_scope(system_prompt: str, k: int) -> Dict[str, Any]:
+    return {"mode": "rag", "prompt": prompt_version(system_prompt or DEFAULT_RAG_SYSTEM_PROMPT), "k": k}
+
+
+def _teacher_scope(history: str, k: int) -> Dict[str, Any]:
+    return {"mode": "teacher", "prompt": _TEACHER_PROMPT_VERSION, "k": k, "history": normalize_question(history)}
+
+
+def _simple_cache_question(conversation: List[Dict]) -> Optional[str]:
+    """Solo se cachean conversaciones de un único turno de usuario."""
+    if len(conversation) == 1 and conversation[0].get("role") == "user":
+        return conversation[0].get("content") or None
+    return None
+
+
+def _cache_get(
+    question: str,
+    scope: Dict[str, Any],
+    timings: Dict[str, float],
+    embedding: Optional[List[float]] = None,
+    count_miss: bool = True,
+) -> Optional[Dict]:
+    """
+    Nivel exacto (sin embedding) o exacto+semántico (con embedding).
+    Con count_miss=False un fallo no cuenta como miss: se usa para el
+    chequeo exacto previo al embedding, que se repite después.
+    """
+    if answer_cache is None:
+        return None
+    with _timed(timings, "cache"):
+        hit = answer_cache.get(question, scope, embedding=embedding, count_miss=count_miss)
+    return _observed_hit(hit, timings, count_miss)
+
+
+async def _acache_get(
+    question: str,
+    scope: Dict[str, Any],
+    timings: Dict[str, float],
+    embedding: Optional[List[float]] = None,
+    count_miss: bool = True,
+) -> Optional[Dict]:
+    """Igual que _cache_get, con la E/S de la caché fuera del event loop."""
+    if answer_cache is None:
+        return None
+    with _timed(timings, "cache"):
+        hit = await answer_cache.aget(question, scope, embedding=embedding, count_miss=count_miss)
+    return _observed_hit(hit, timings, count_miss)
+
+
+def _observed_hit(hit: Optional[Dict], timings: Dict[str, float], count_miss: bool) -> Optional[Dict]:
+    if hit is not None:
+        observe_cache(f"hit_{hit.get('cache', 'exact')}")
+        hit["timings"] = timings
+    elif count_miss:
+        observe_cache("miss")
+    return hit
+
+
+def _cacheable(result: Dict) -> bool:
+    text = result.get("text") or ""
+    return answer_cache is not None and bool(text) and not result.get("error") and text != FALLBACK_NO_CONTEXT
+
+
+def _cache_put(question: str, scope: Dict[str, Any], result: Dict, embedding: Optional[List[float]] = None) -> None:
+    if _cacheable(result):
+        answer_cache.put(question, scope, result, embedding=embedding)
+
+
+async def _acache_put(question: str, scope: Dict[str, Any], result: Dict, embedding: Optional[List[float]] = None) -> None:
+    if _cacheable(result):
+        await answer_cache.aput(question, scope, result, embedding=embedding)
+
+
+# ========================================
+# Pipelines completos
+# ========================================
+
 def answer_with_rag(
     question: str,
     system_prompt: str = "",
@@ -89,85 +380,471 @@ def answer_with_rag(
     Devuelve un dict con:
     - text: respuesta del modelo
     - sources: lista de referencias citadas
+    - timings: duración (ms) de cada etapa
+    - cache: "exact" | "semantic" si la respuesta viene de la caché
     """
-    llm = get_chat_llm()
+    timings: Dict[str, float] = {}
+    scope = _rag_scope(system_prompt, k)
 
-    try:
-        retriever = get_retriever(k=k)
-        contexts = retriever.invoke(question) or []
-    except Exception:
-        if not allow_fallback:
-            return {"text": "No se pudo recuperar información desde el índice.", "sources": []}
-        return {"text": FALLBACK_NO_CONTEXT, "sources": []}
-
-    if not contexts:
-        return {"text": FALLBACK_NO_CONTEXT, "sources": []}
+    with _timed(timings, "total"):
+        cached = _cache_get(question, scope, timings, count_miss=False)
+        if cached:
+            return cached
 
-    context_text, sources = _contexts_to_text_and_sources(contexts)
+        try:
+            with _timed(timings, "embed"):
+                embedding = embed_question(question)
+            cached = _cache_get(question, scope, timings, embedding=embedding)
+            if cached:
+                return cached
+            with _timed(timings, "retrieve"):
+                contexts = retrieve_contexts(question, k=k, embedding=embedding)
+        except Exception:
+            if not allow_fallback:
+                return {"text": "No se pudo recuperar información desde el índice.", "sources": [], "timings": timings}
+            return {"text": FALLBACK_NO_CONTEXT, "sources": [], "timings": timings}
 
-    prompt = (
-        system_prompt or
-        "Eres un experto en tecnología educativa.\n"
-        "Responde preguntas sobre el uso de la inteligencia artificial y la generación artificial (GenIA) en educación.\n"
-        "Usa solamente la información proporcionada en el contexto.\n"
-        "No inventes ni rellenes con conocimiento externo."
-    )
+        if not contexts:
+            return {"text": FALLBACK_NO_CONTEXT, "sources": [], "timings": timings}
 
-    messages = [
-        {"role": "system", "content": prompt},
-        {"role": "user", "content": f"Contexto:\n{context_text}\n\nPregunta:\n{question}"}
-    ]
+        with _timed(timings, "assemble"):
+            messages, sources = assemble_rag_messages(question, contexts, system_prompt)
 
-    answer = safe_response(llm, messages)
+        with _timed(timings, "generate"):
+            reply = generate_answer(messages)
 
-    return {"text": answer.strip(), "sources": sources}
+    result = _generation_result(reply, sources, timings)
+    _cache_put(question, scope, result, embedding)
+    return result
 
 
 def chatbot_simple(conversation: List[Dict], system_prompt: str = "") -> Dict:
     """
     Chat directo sin retrieval, solo con historial + system_prompt.
+    Las preguntas de un solo turno pasan por la caché exacta.
     """
-    llm = get_chat_llm()
+    timings: Dict[str, float] = {}
+    scope = {"mode": "simple", "prompt": prompt_version(system_prompt)}
+    question = _simple_cache_question(conversation)
+    if question:
+        cached = _cache_get(question, scope, timings)
+        if cached:
+            timings["total_ms"] = timings["cache_ms"]
+            return cached
+
     messages = []
 
     if system_prompt:
         messages.append({"role": "system", "content": system_prompt})
 
     messages.extend(conversation)
-    answer = safe_response(llm, messages)
 
-    return {"text": answer.strip(), "sources": []}
+    with _timed(timings, "generate"):
+        reply = generate_answer(messages)
+    timings["total_ms"] = round(timings.get("cache_ms", 0.0) + timings["generate_ms"], 2)
 
+    result = _generation_result(reply, [], timings)
+    if question:
+        _cache_put(question, scope, result)
+    return result
 
-def chatbot_teacher(question: str, history: str = "", k: int = 5) -> Dict:
+
+def chatbot_teacher(question: str, history: str = "", k: int = 5, retrieval_query: Optional[str] = None) -> Dict:
     """
     Chat para docentes, usando prompt especial + history si aplica.
+    Una sola recuperación: los contextos pasan directamente a la etapa de
+    ensamblado, sin volver a embeber ni buscar la pregunta.
+    - retrieval_query: consulta autónoma para embeddings/BM25 (ver
+      backend/sessions.py); por defecto, la propia pregunta.
     """
-    retriever = get_retriever(k=k)
-    contexts = retriever.invoke(question) or []
+    search_query = retrieval_query or question
+    timings: Dict[str, float] = {}
+    scope = _teacher_scope(history, k)
+
+    with _timed(timings, "total"):
+        cached = _cache_get(question, scope, timings, count_miss=False)
+        if cached:
+            return cached
+
+        with _timed(timings, "embed"):
+            embedding = embed_question(search_query)
+        cached = _cache_get(question, scope, timings, embedding=embedding)
+        if cached:
+            return cached
+
+        with _timed(timings, "retrieve"):
+            contexts = retrieve_contexts(search_query, k=k, embedding=embedding)
+
+        if not contexts:
+            return {"text": FALLBACK_NO_CONTEXT, "sources": [], "timings": timings}
+
+        with _timed(timings, "assemble"):
+            messages, sources = assemble_teacher_messages(question, contexts, history)
+
+        with _timed(timings, "generate"):
+            reply = generate_answer(messages)
+
+    result = _generation_result(reply, sources, timings, empty_text="⚠️ Sin respuesta generada.")
+    _cache_put(question, scope, result, embedding)
+    return result
+
+
+# ========================================
+# Pipelines asíncronos (usados por las rutas)
+# ========================================
+
+async def _aanswer_with_rag(
+    question: str,
+    system_prompt: str = "",
+    k: int = 5,
+    allow_fallback: bool = True
+) -> Dict:
+    """Versión asíncrona de answer_with_rag."""
+    timings: Dict[str, float] = {}
+    scope = _rag_scope(system_prompt, k)
+
+    with _timed(timings, "total"):
+        cached = await _acache_get(question, scope, timings, count_miss=False)
+        if cached:
+            return cached
+
+        try:
+            with _timed(timings, "embed"):
+                embedding = await aembed_question(question)
+            cached = await _acache_get(question, scope, timings, embedding=embedding)
+            if cached:
+                return cached
+            with _timed(timings, "retrieve"):
+                contexts = await aretrieve_contexts(question, k=k, embedding=embedding)
+        except Exception:
+            if not allow_fallback:
+                return {"text": "No se pudo recuperar información desde el índice.", "sources": [], "timings": timings}
+            return {"text": FALLBACK_NO_CONTEXT, "sources": [], "timings": timings}
+
+        if not contexts:
+            return {"text": FALLBACK_NO_CONTEXT, "sources": [], "timings": timings}
+
+        with _timed(timings, "assemble"):
+            messages, sources = assemble_rag_messages(question, contexts, system_prompt)
+
+        with _timed(timings, "generate"):
+            reply = await agenerate_answer(messages)
+
+    result = _generation_result(reply, sources, timings)
+    await _acache_put(question, scope, result, embedding)
+    return result
+
+
+async def _achatbot_simple(conversation: List[Dict], system_prompt: str = "") -> Dict:
+    """Versión asíncrona de chatbot_simple."""
+    timings: Dict[str, float] = {}
+    scope = {"mode": "simple", "prompt": prompt_version(system_prompt)}
+    question = _simple_cache_question(conversation)
+    if question:
+        cached = await _acache_get(question, scope, timings)
+        if cached:
+            timings["total_ms"] = timings["cache_ms"]
+            return cached
+
+    messages = []
+
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+
+    messages.extend(conversation)
+
+    with _timed(timings, "generate"):
+        reply = await agenerate_answer(messages)
+    timings["total_ms"] = round(timings.get("cache_ms", 0.0) + timings["generate_ms"], 2)
+
+    result = _generation_result(reply, [], timings)
+    if question:
+        await _acache_put(question, scope, result)
+    return result
+
+
+async def _achatbot_teacher(
+    question: str, history: str = "", k: int = 5, retrieval_query: Optional[str] = None
+) -> Dict:
+    """Versión asíncrona de chatbot_teacher (una sola recuperación)."""
+    search_query = retrieval_query or question
+    timings: Dict[str, float] = {}
+    scope = _teacher_scope(history, k)
+
+    with _timed(timings, "total"):
+        cached = await _acache_get(question, scope, timings, count_miss=False)
+        if cached:
+            return cached
+
+        with _timed(timings, "embed"):
+            embedding = await aembed_question(search_query)
+        cached = await _acache_get(question, scope, timings, embedding=embedding)
+        if cached:
+            return cached
+
+        with _timed(timings, "retrieve"):
+            contexts = await aretrieve_contexts(search_query, k=k, embedding=embedding)
+
+        if not contexts:
+            return {"text": FALLBACK_NO_CONTEXT, "sources": [], "timings": timings}
+
+        with _timed(timings, "assemble"):
+            messages, sources = assemble_teacher_messages(question, contexts, history)
+
+        with _timed(timings, "generate"):
+            reply = await agenerate_answer(messages)
+
+    result = _generation_result(reply, sources, timings, empty_text="⚠️ Sin respuesta generada.")
+    await _acache_put(question, scope, result, embedding)
+    return result
+
+
+# ========================================
+# Pipelines en streaming (eventos para SSE)
+# ========================================
+#
+# Cada pipeline produce dicts {"event": ..., "data": {...}}:
+#   token   -> {"text": fragmento}            (uno por fragmento del modelo)
+#   sources -> {"sources": [...]}             (solo rutas RAG, al final)
+#   done    -> {"timings": {...}}             (siempre, último evento)
+
+async def astream_answer(messages: List[Dict], timings: Dict[str, float]) -> AsyncIterator[str]:
+    """
+    Etapa 3 en streaming: emite los fragmentos de texto a medida que el modelo
+    los produce y registra first_token_ms (time-to-first-token de la etapa).
+    """
+    t0 = time.perf_counter()
+    async with _llm_slots:
+        try:
+            async for chunk in registry.chat_client.astream(messages):
+                if getattr(chunk, "usage_metadata", None):   # último chunk (stream_usage)
+                    observe_usage(response_usage(chunk))
+                text = response_text(chunk)
+                if not text:
+                    continue
+                if "first_token_ms" not in timings:
+                    timings["first_token_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+                yield text
+        except LLMUnavailable:   # ningún modelo empezó a responder (ver llm_client.py)
+            observe_llm_error()
+            raise
+
+
+async def _astream_generation(
+    messages: List[Dict],
+    sources: List[str],
+    timings: Dict[str, float],
+    t0: float,
+    with_sources: bool = True,
+    cache_key: Optional[Tuple[str, Dict[str, Any], Optional[List[float]]]] = None,
+) -> AsyncIterator[Dict]:
+    """
+    Emite token* → sources → done. Si se pasa cache_key=(pregunta, ámbito,
+    embedding), la respuesta completa se guarda en la caché al terminar.
+    """
+    parts: List[str] = []
+    with _timed(timings, "generate"):
+        async for text in astream_answer(messages, timings):
+            parts.append(text)
+            yield {"event": "token", "data": {"text": text}}
+
+    if with_sources:
+        yield {"event": "sources", "data": {"sources": sources}}
+    timings["total_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    if cache_key is not None:
+        question, scope, embedding = cache_key
+        await _acache_put(question, scope, {"text": "".join(parts).strip(), "sources": sources}, embedding)
+    yield {"event": "done", "data": {"timings": timings}}
+
+
+def _fallback_events(text: str, timings: Dict[str, float], t0: float, sources: Optional[List[str]] = None) -> List[Dict]:
+    timings["total_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    return [
+        {"event": "token", "data": {"text": text}},
+        {"event": "sources", "data": {"sources": sources or []}},
+        {"event": "done", "data": {"timings": timings}},
+    ]
+
+
+def _cached_events(hit: Dict, timings: Dict[str, float], t0: float, with_sources: bool = True) -> List[Dict]:
+    """Respuesta cacheada completa como un único evento token."""
+    events = _fallback_events(hit["text"], timings, t0, hit.get("sources"))
+    return events if with_sources else [events[0], events[2]]
+
+
+async def _astream_answer_with_rag(
+    question: str,
+    system_prompt: str = "",
+    k: int = 5,
+    allow_fallback: bool = True
+) -> AsyncIterator[Dict]:
+    """Versión en streaming de answer_with_rag."""
+    t0 = time.perf_counter()
+    timings: Dict[str, float] = {}
+    scope = _rag_scope(system_prompt, k)
+
+    cached = await _acache_get(question, scope, timings, count_miss=False)
+    if not cached:
+        try:
+            with _timed(timings, "embed"):
+                embedding = await aembed_question(question)
+            cached = await _acache_get(question, scope, timings, embedding=embedding)
+            if not cached:
+                with _timed(timings, "retrieve"):
+                    contexts = await aretrieve_contexts(question, k=k, embedding=embedding)
+        except Exception:
+            text = FALLBACK_NO_CONTEXT if allow_fallback else "No se pudo recuperar información desde el índice."
+            for event in _fallback_events(text, timings, t0):
+                yield event
+            return
+
+    if cached:
+        for event in _cached_events(cached, timings, t0):
+            yield event
+        return
 
     if not contexts:
-        return {"text": FALLBACK_NO_CONTEXT, "sources": []}
+        for event in _fallback_events(FALLBACK_NO_CONTEXT, timings, t0):
+            yield event
+        return
+
+    with _timed(timings, "assemble"):
+        messages, sources = assemble_rag_messages(question, contexts, system_prompt)
+
+    async for event in _astream_generation(messages, sources, timings, t0, cache_key=(question, scope, embedding)):
+        yield event
+
+
+async def _astream_chatbot_simple(conversation: List[Dict], system_prompt: str = "") -> AsyncIterator[Dict]:
+    """Versión en streaming de chatbot_simple (sin evento sources)."""
+    t0 = time.perf_counter()
+    timings: Dict[str, float] = {}
+    scope = {"mode": "simple", "prompt": prompt_version(system_prompt)}
+    question = _simple_cache_question(conversation)
+    if question:
+        cached = await _acache_get(question, scope, timings)
+        if cached:
+            for event in _cached_events(cached, timings, t0, with_sources=False):
+                yield event
+            return
 
-    context_text, sources = _contexts_to_text_and_sources(contexts)
-    system_prompt = build_teacher_prompt(context_text, question, history)
+    messages = []
 
-    # ✅ Versión corregida: siempre devolvemos dict con text + sources
-    response = answer_with_rag(question=question, system_prompt=system_prompt, k=k)
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
 
-    return {
-        "text": response.get("text", "⚠️ Sin respuesta generada."),
-        "sources": response.get("sources", [])
-    }
+    messages.extend(conversation)
 
+    cache_key = (question, scope, None) if question else None
+    async for event in _astream_generation(messages, [], timings, t0, with_sources=False, cache_key=cache_key):
+        yield event
+
+
+async def _astream_chatbot_teacher(
+    question: str, history: str = "", k: int = 5, retrieval_query: Optional[str] = None
+) -> AsyncIterator[Dict]:
+    """Versión en streaming de chatbot_teacher."""
+    search_query = retrieval_query or question
+    t0 = time.perf_counter()
+    timings: Dict[str, float] = {}
+    scope = _teacher_scope(history, k)
+
+    cached = await _acache_get(question, scope, timings, count_miss=False)
+    if not cached:
+        with _timed(timings, "embed"):
+            embedding = await aembed_question(search_query)
+        cached = await _acache_get(question, scope, timings, embedding=embedding)
+    if cached:
+        for event in _cached_events(cached, timings, t0):
+            yield event
+        return
+
+    with _timed(timings, "retrieve"):
+        contexts = await aretrieve_contexts(search_query, k=k, embedding=embedding)
 
+    if not contexts:
+        for event in _fallback_events(FALLBACK_NO_CONTEXT, timings, t0):
+            yield event
+        return
 
+    with _timed(timings, "assemble"):
+        messages, sources = assemble_teacher_messages(question, contexts, history)
 
+    async for event in _astream_generation(messages, sources, timings, t0, cache_key=(question, scope, embedding)):
+        yield event
 
 
+# ========================================
+# Coalescencia de requests idénticas (single-flight)
+# ========================================
+#
+# Las requests concurrentes con la misma clave normalizada (pipeline, texto,
+# modo/prompt, historial, k) comparten un único cálculo en vuelo; en
+# streaming, quien llega tarde recibe primero los tokens ya emitidos.
 
+async def aanswer_with_rag(
+    question: str,
+    system_prompt: str = "",
+    k: int = 5,
+    allow_fallback: bool = True
+) -> Dict:
+    """Versión asíncrona de answer_with_rag (con coalescencia)."""
+    call = partial(_aanswer_with_rag, question, system_prompt, k, allow_fallback)
+    if not COALESCE_REQUESTS:
+        return await call()
+    key = flight_key("rag", question, prompt=prompt_version(system_prompt), k=k, fallback=allow_fallback)
+    return await flights.do(key, call)
 
 
+async def achatbot_simple(conversation: List[Dict], system_prompt: str = "") -> Dict:
+    """Versión asíncrona de chatbot_simple (con coalescencia)."""
+    call = partial(_achatbot_simple, conversation, system_prompt)
+    if not COALESCE_REQUESTS:
+        return await call()
+    key = flight_key("simple", "", conversation=conversation, prompt=prompt_version(system_prompt))
+    return await flights.do(key, call)
 
 
+async def achatbot_teacher(
+    question: str, history: str = "", k: int = 5, retrieval_query: Optional[str] = None
+) -> Dict:
+    """Versión asíncrona de chatbot_teacher (una sola recuperación, con coalescencia)."""
+    call = partial(_achatbot_teacher, question, history, k, retrieval_query)
+    if not COALESCE_REQUESTS:
+        return await call()
+    key = flight_key("teacher", question, history=history.strip(), k=k, retrieval_query=retrieval_query or question)
+    return await flights.do(key, call)
 
+
+def astream_answer_with_rag(
+    question: str,
+    system_prompt: str = "",
+    k: int = 5,
+    allow_fallback: bool = True
+) -> AsyncIterator[Dict]:
+    """Versión en streaming de answer_with_rag (con coalescencia)."""
+    call = partial(_astream_answer_with_rag, question, system_prompt, k, allow_fallback)
+    if not COALESCE_REQUESTS:
+        return call()
+    key = flight_key("rag", question, prompt=prompt_version(system_prompt), k=k, fallback=allow_fallback)
+    return flights.stream(key, call)
+
+
+def astream_chatbot_simple(conversation: List[Dict], system_prompt: str = "") -> AsyncIterator[Dict]:
+    """Versión en streaming de chatbot_simple (sin evento sources, con coalescencia)."""
+    call = partial(_astream_chatbot_simple, conversation, system_prompt)
+    if not COALESCE_REQUESTS:
+        return call()
+    key = flight_key("simple", "", conversation=conversation, prompt=prompt_version(system_prompt))
+    return flights.stream(key, call)
+
+
+def astream_chatbot_teacher(
+    question: str, history: str = "", k: int = 5, retrieval_query: Optional[str] = None
+) -> AsyncIterator[Dict]:
+    """Versión en streaming de chatbot_teacher (con coalescencia)."""
+    call = partial(_astream_chatbot_teacher, question, history, k, retrieval_query)
+    if not COALESCE_REQUESTS:
+        return call()
+    key = flight_key("teacher", question, history=history.strip(), k=k, retrieval_query=retrieval_query or question)
+    return flights.stream(key, call)
@@ -0,0 +1,263 @@
+# backend/rerank.py
+"""
+Etapa de reranking entre la recuperación y el ensamblado (RERANK_ENABLED).
+
+La recuperación pide RERANK_CANDIDATES candidatos (MMR / híbrida) en lugar
+de k; aquí se puntúan contra la pregunta y se pasan al prompt solo los
+mejores, con un número de bloques adaptativo: se corta en el mayor salto de
+score (≤ k, ≥ RERANK_MIN_KEEP). Menos bloques = prompt más corto = respuesta
+más rápida.
+
+Puntuación:
+- RERANK_MODEL definido: cross-encoder ONNX local en CPU (pregunta, fragmento).
+- Si no (o si no se puede cargar): coseno entre el embedding de la pregunta
+  y los vectores de los fragmentos que ya están guardados (matriz NumPy,
+  Chroma o la caché de embeddings). Nunca se llama a la API.
+
+Presupuesto: con una media móvil del coste por candidato se estima la
+duración; si supera RERANK_BUDGET_MS la etapa se salta y se usan los k
+primeros candidatos en el orden de la recuperación.
+"""
+
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from backend.config import (
+    RERANK_BUDGET_MS,
+    RERANK_GAP_RATIO,
+    RERANK_MIN_KEEP,
+    RERANK_MODEL,
+    RERANK_MODEL_DIR,
+    RERANK_ONNX_FILE,
+    RERANK_THREADS,
+)
+
+# Longitud máxima (pregunta + fragmento) del cross-encoder
+CROSS_ENCODER_MAX_LENGTH = 512
+
+# Peso de la última medición en la media móvil del coste por candidato
+COST_ALPHA = 0.2
+
+# Cada vez que se salta la etapa la estimación baja un poco: si la carga
+# desaparece, se vuelve a probar en vez de quedarse saltada para siempre
+SKIP_DECAY = 0.9
+
+
+def adaptive_cutoff(
+    scores: Sequence[float],
+    k: int,
+    min_keep: int = RERANK_MIN_KEEP,
+    gap_ratio: float = RERANK_GAP_RATIO,
+) -> int:
+    """
+    Cuántos bloques conservar de scores (ordenados de mayor a menor): corta
+    en el mayor salto entre posiciones consecutivas si ese salto es al menos
+    gap_ratio del rango total; si no hay un salto claro, k. Si el salto
+    queda antes de min_keep, se conservan min_keep.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    n = min(k, len(scores))
+    lo = max(1, min(min_keep, n))
+    span = float(scores[0] - scores[-1]) if len(scores) else 0.0
+    if n <= lo or span <= 0:
+        return n
+    # gaps[c - 1]: caída entre el bloque c-1 (último conservado) y c
+    gaps = scores[:n - 1] - scores[1:n]
+    cut = int(np.argmax(gaps)) + 1
+    return max(lo, cut) if gaps[cut - 1] >= gap_ratio * span else n
+
+
+# ========================================
+# Puntuadores
+# ========================================
+
+def _chunk_id(doc: Any) -> Optional[str]:
+    return doc.metadata.get("chunk_id") or getattr(doc, "id", None)
+
+
+def stored_vectors(vectordb: Any, docs: Sequence[Any]) -> Optional[np.ndarray]:
+    """
+    Vectores ya calculados de los fragmentos, sin llamar a la API: matriz
+    del índice NumPy (o sidecar de Chroma), embeddings guardados en Chroma o
+    caché de embeddings.
+    None si falta alguno.
+    """
+    ids = [_chunk_id(doc) for doc in docs]
+    if hasattr(vectordb, "rows_for_ids"):
+        rows = vectordb.rows_for_ids(ids)
+        if all(row is not None for row in rows):
+            return np.asarray(vectordb.vectors[rows], dtype=np.float32)
+    if hasattr(vectordb, "_collection") and all(ids):
+        found = vectordb.get(ids=list(ids), include=["embeddings"])
+        by_id = dict(zip(found["ids"], found["embeddings"]))
+        if all(cid in by_id for cid in ids):
+            return np.asarray([by_id[cid] for cid in ids], dtype=np.float32)
+
+    embeddings = getattr(vectordb, "embeddings", None)
+    cache = getattr(embeddings, "cache", None)
+    if cache is None:
+        return None
+    from backend.embedding_cache import text_hash
+
+    vectors = cache.get_many(embeddings.provider, embeddings.model, [text_hash(doc.page_content) for doc in docs])
+    if any(v is None for v in vectors):
+        return None
+    return np.stack(vectors).astype(np.float32)
+
+
+class CosineScorer:
+    """Coseno pregunta-fragmento con los vectores guardados (coste casi nulo)."""
+
+    name = "cosine"
+
+    def score(self, question: str, embedding: Sequence[float], docs: Sequence[Any], vectordb: Any) -> Optional[np.ndarray]:
+        vectors = stored_vectors(vectordb, docs)
+        if vectors is None:
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1) * max(float(np.linalg.norm(query)), 1e-12)
+        return (vectors @ query) / np.clip(norms, 1e-12, None)
+
+
+class OnnxCrossEncoder:
+    """
+    Cross-encoder (p. ej. ms-marco-MiniLM) con ONNX Runtime: un forward pass
+    para todos los pares (pregunta, fragmento). session / tokenizer se pueden
+    inyectar (tests); si no, se cargan de model_dir.
+    """
+
+    def __init__(
+        self,
+        model_dir: Optional[Path] = None,
+        session: Any = None,
+        tokenizer: Any = None,
+        max_length: int = CROSS_ENCODER_MAX_LENGTH,
+        threads: int = RERANK_THREADS,
+    ):
+        from backend.onnx_embeddings import OnnxEmbeddingEngine
+
+        if session is None or tokenizer is None:
+            model_dir = Path(model_dir) if model_dir else _resolve_model_dir()
+        self.tokenizer = tokenizer or OnnxEmbeddingEngine._load_tokenizer(model_dir)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        self.session = session or OnnxEmbeddingEngine._load_session(model_dir / RERANK_ONNX_FILE, threads)
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def predict(self, question: str, texts: Sequence[str]) -> np.ndarray:
+        """Logit de relevancia de cada texto (mayor = más relevante)."""
+        encodings = self.tokenizer.encode_batch([(question, text) for text in texts])
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        logits = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+        return logits[:, -1] if logits.ndim == 2 else logits
+
+
+def _resolve_model_dir() -> Path:
+    if RERANK_MODEL_DIR:
+        return Path(RERANK_MODEL_DIR)
+    from huggingface_hub import snapshot_download
+
+    return Path(snapshot_download(RERANK_MODEL, allow_patterns=["tokenizer.json", "config.json", RERANK_ONNX_FILE]))
+
+
+class CrossEncoderScorer:
+    name = "cross_encoder"
+
+    def __init__(self, model: OnnxCrossEncoder):
+        self.model = model
+
+    def score(self, question: str, embedding: Sequence[float], docs: Sequence[Any], vectordb: Any) -> Optional[np.ndarray]:
+        return self.model.predict(question, [doc.page_content for doc in docs])
+
+
+# ========================================
+# Etapa
+# ========================================
+
+class Reranker:
+    """Puntúa, reordena y recorta los candidatos dentro del presupuesto de latencia."""
+
+    def __init__(
+        self,
+        scorer: Any,
+        budget_ms: float = RERANK_BUDGET_MS,
+        min_keep: int = RERANK_MIN_KEEP,
+        gap_ratio: float = RERANK_GAP_RATIO,
+    ):
+        self.scorer = scorer
+        self.budget_ms = budget_ms
+        self.min_keep = min_keep
+        self.gap_ratio = gap_ratio
+        self.ms_per_doc: Optional[float] = None
+        self._lock = threading.Lock()
+        self.reranked = 0
+        self.skipped_budget = 0
+        self.skipped_missing = 0
+        self.docs_in = 0
+        self.docs_out = 0
+
+    def estimate_ms(self, n_docs: int) -> float:
+        return (self.ms_per_doc or 0.0) * n_docs
+
+    def rerank(self, question: str, embedding: Sequence[float], docs: List[Any], vectordb: Any, k: int) -> List[Any]:
+        """Los mejores ≤ k candidatos, o los k primeros si la etapa se salta."""
+        if len(docs) <= 1:
+            return docs[:k]
+        if self.budget_ms > 0 and self.estimate_ms(len(docs)) > self.budget_ms:
+            with self._lock:
+                self.skipped_budget += 1
+                self.ms_per_doc *= SKIP_DECAY
+            return docs[:k]
+
+        t0 = time.perf_counter()
+        try:
+            scores = self.scorer.score(question, embedding, docs, vectordb)
+        except Exception as e:
+            print(f"[rerank] ⚠️ Error puntuando candidatos ({self.scorer.name}): {e}")
+            scores = None
+        elapsed = (time.perf_counter() - t0) * 1000
+        if scores is None:
+            with self._lock:
+                self.skipped_missing += 1
+            return docs[:k]
+
+        order = np.argsort(-np.asarray(scores), kind="stable")
+        keep = adaptive_cutoff(np.asarray(scores)[order], k, self.min_keep, self.gap_ratio)
+        with self._lock:
+            cost = elapsed / len(docs)
+            self.ms_per_doc = cost if self.ms_per_doc is None else (1 - COST_ALPHA) * self.ms_per_doc + COST_ALPHA * cost
+            self.reranked += 1
+            self.docs_in += len(docs)
+            self.docs_out += keep
+        return [docs[int(i)] for i in order[:keep]]
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "reranked": self.reranked,
+            "skipped_budget": self.skipped_budget,
+            "skipped_missing": self.skipped_missing,
+            "avg_kept": round(self.docs_out / self.reranked, 2) if self.reranked else 0.0,
+            "avg_candidates": round(self.docs_in / self.reranked, 2) if self.reranked else 0.0,
+            "ms_per_doc": round(self.ms_per_doc or 0.0, 4),
+        }
+
+
+def build_reranker() -> Reranker:
+    """Cross-encoder si RERANK_MODEL está definido y carga; si no, coseno."""
+    if RERANK_MODEL or RERANK_MODEL_DIR:
+        try:
+            t0 = time.perf_counter()
+            scorer = CrossEncoderScorer(OnnxCrossEncoder())
+            print(f"[rerank] 🧠 Cross-encoder {RERANK_MODEL or RERANK_MODEL_DIR} cargado en {time.perf_counter() - t0:.1f}s")
+            return Reranker(scorer)
+        except Exception as e:
+            print(f"[rerank] ⚠️ No se pudo cargar el cross-encoder, se usa coseno: {e}")
+    return Reranker(CosineScorer())
@@ -0,0 +1,444 @@
+# backend/resources.py
+"""
+Registro de recursos de larga duración ("warm pool") del proceso.
+
+Mantiene UNA sola instancia de:
+- cliente httpx (sync y async) con pool keep-alive compartido hacia OpenAI,
+- cliente de embeddings,
+- vector store (Chroma o NumPy, según RETRIEVAL_BACKEND),
+- índice léxico BM25 (opcional, para la recuperación híbrida),
+- reranker (opcional, RERANK_ENABLED; ver backend/rerank.py),
+- cliente de chat (y el de respaldo, CHAT_FALLBACK_MODEL), envueltos en el
+  cliente resiliente de backend/llm_client.py.
+
+Se inicializa una vez al arrancar FastAPI (ver backend/app.py) y el pipeline
+toma de aquí sus clientes, en lugar de construirlos en cada request.
+
+Con varios workers cada proceso tiene su registro; cuando la ingesta publica
+una versión nueva del índice (current.json, ver backend/index_versions.py),
+cada uno la carga en su siguiente request (refresh_index_if_stale) sin
+reiniciar.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+from backend.config import (
+    CHAT_FALLBACK_MODEL,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP_TIMEOUT,
+    INDEX_LEASE_TTL_S,
+    INDEX_WATCH_INTERVAL_S,
+    RERANK_ENABLED,
+)
+from backend.context_packer import get_encoder
+from backend.index_versions import IndexPaths, current_paths, current_version, hold_version, release_version
+from backend.scheduler import http_client_kwargs
+
+# LangChain, Chroma y los índices se importan al construir cada recurso (no
+# al importar este módulo): importar la app es rápido y la carga pesada
+# ocurre en el calentamiento en segundo plano (ver backend/app.py).
+
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+class ResourceRegistry:
+    """
+    Contenedor thread-safe de clientes compartidos.
+
+    Cada recurso se construye de forma perezosa la primera vez que se pide
+    (o en bloque con init()). reload() construye los reemplazos ANTES de
+    intercambiarlos, así las requests en curso siguen usando los anteriores.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._http_client: Optional[httpx.Client] = None
+        self._http_async_client: Optional[httpx.AsyncClient] = None
+        self._embeddings: Any = None
+        self._vectordb: Any = None
+        self._chat_llm: Any = None
+        self._fallback_llm: Any = None
+        self._chat_client: Any = None
+        self._lexical_index: Any = None
+        self._lexical_loaded = False
+        self._reranker: Any = None
+        self._reranker_loaded = False
+        self._errors: Dict[str, str] = {}
+        self._loaded_at: Optional[float] = None
+        self._warming = False
+        self._index_version: Optional[str] = None
+        self._next_index_check = 0.0
+
+    # ========================================
+    # Construcción
+    # ========================================
+
+    def _ensure_http_clients(self) -> None:
+        # Cada request a OpenAI pasa por el planificador (cubos RPM/TPM y prioridades, ver backend/scheduler.py)
+        if self._http_client is None:
+            self._http_client = httpx.Client(limits=_http_limits(), timeout=HTTP_TIMEOUT, **http_client_kwargs())
+        if self._http_async_client is None:
+            self._http_async_client = httpx.AsyncClient(
+                limits=_http_limits(), timeout=HTTP_TIMEOUT, **http_client_kwargs(asynchronous=True)
+            )
+
+    def _build_embeddings(self):
+        from backend.llm_loader import get_embeddings
+
+        self._ensure_http_clients()
+        return get_embeddings(
+            http_client=self._http_client,
+            http_async_client=self._http_async_client,
+        )
+
+    def _build_chat_llm(self):
+        from backend.llm_loader import get_chat_llm
+
+        self._ensure_http_clients()
+        return get_chat_llm(
+            http_client=self._http_client,
+            http_async_client=self._http_async_client,
+            max_retries=0,   # los reintentos los hace el cliente resiliente
+        )
+
+    def _build_fallback_llm(self):
+        from backend.llm_loader import get_chat_llm
+
+        self._ensure_http_clients()
+        return get_chat_llm(
+            http_client=self._http_client,
+            http_async_client=self._http_async_client,
+            model=CHAT_FALLBACK_MODEL,
+            max_retries=0,
+        )
+
+    def _build_vectordb(self, embeddings, paths: IndexPaths):
+        from backend.retrieve import get_vectordb
+
+        return get_vectordb(embeddings=embeddings, paths=paths)
+
+    def init(self) -> None:
+        """
+        Precalienta todos los recursos. No lanza excepción: los fallos quedan
+        registrados y se reportan en health() (p. ej. índice aún no construido).
+        """
+        with self._lock:
+            for name in ("embeddings", "chat_llm", "vectordb"):
+                try:
+                    getattr(self, name)
+                except Exception as e:
+                    print(f"[resources] ⚠️ No se pudo inicializar {name}: {e}")
+            self.lexical_index
+            self.reranker
+            get_encoder()  # carga el encoding de tiktoken antes de la primera request
+            self._loaded_at = time.time()
+
+    async def awarm_up(self) -> None:
+        """
+        init() en un hilo, sin bloquear el event loop: la app ya atiende
+        /health mientras se importan LangChain/Chroma y se abre el índice.
+        Las requests que lleguen antes esperan al recurso que necesiten.
+        """
+        self._warming = True
+        t0 = time.perf_counter()
+        try:
+            await asyncio.to_thread(self.init)
+            print(f"[resources] 🔥 Recursos listos en {time.perf_counter() - t0:.1f}s")
+        finally:
+            self._warming = False
+
+    # ========================================
+    # Acceso
+    # ========================================
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    self._embeddings = self._track("embeddings", self._build_embeddings)
+        return self._embeddings
+
+    @property
+    def chat_llm(self):
+        if self._chat_llm is None:
+            with self._lock:
+                if self._chat_llm is None:
+                    self._chat_llm = self._track("chat_llm", self._build_chat_llm)
+        return self._chat_llm
+
+    @property
+    def fallback_llm(self):
+        if self._fallback_llm is None:
+            with self._lock:
+                if self._fallback_llm is None:
+                    self._fallback_llm = self._track("fallback_llm", self._build_fallback_llm)
+        return self._fallback_llm
+
+    @property
+    def chat_client(self):
+        """
+        Cliente resiliente (reintentos, cobertura, circuito, respaldo). Toma
+        chat_llm / fallback_llm en cada intento, así sobrevive a reload().
+        """
+        if self._chat_client is None:
+            with self._lock:
+                if self._chat_client is None:
+                    from backend.llm_client import ResilientChat
+
+                    fallback = (lambda: self.fallback_llm) if CHAT_FALLBACK_MODEL else None
+                    self._chat_client = ResilientChat(lambda: self.chat_llm, fallback)
+        return self._chat_client
+
+    def chat_client_stats(self) -> Optional[Dict[str, float]]:
+        """Contadores del cliente de chat (None si aún no se ha usado)."""
+        return self._chat_client.stats() if self._chat_client is not None else None
+
+    @property
+    def vectordb(self):
+        if self._vectordb is None:
+            with self._lock:
+                if self._vectordb is None:
+                    embeddings = self.embeddings
+                    paths = current_paths()
+                    self._vectordb = self._track("vectordb", lambda: self._build_vectordb(embeddings, paths))
+                    self._set_index_version(paths.version)
+        return self._vectordb
+
+    @property
+    def lexical_index(self):
+        """Índice BM25 o None si no existe (la recuperación cae a solo vectorial)."""
+        if not self._lexical_loaded:
+            with self._lock:
+                if not self._lexical_loaded:
+                    self._lexical_index = self._load_lexical_index(current_paths())
+                    self._lexical_loaded = True
+        return self._lexical_index
+
+    @property
+    def reranker(self):
+        """Reranker o None si RERANK_ENABLED es false (no depende de la versión del índice)."""
+        if not self._reranker_loaded:
+            with self._lock:
+                if not self._reranker_loaded:
+                    if RERANK_ENABLED:
+                        from backend.rerank import build_reranker
+
+                        self._reranker = build_reranker()
+                    self._reranker_loaded = True
+        return self._reranker
+
+    def reranker_stats(self) -> Optional[Dict[str, float]]:
+        """Contadores del reranker sin forzar su carga (None si no está cargado)."""
+        return self._reranker.stats() if self._reranker is not None else None
+
+    def _load_lexical_index(self, paths: IndexPaths):
+        from backend.lexical_index import load_lexical_index
+
+        try:
+            index = load_lexical_index(paths.lexical_dir)
+        except Exception as e:
+            self._errors["lexical_index"] = str(e)
+            print(f"[resources] ⚠️ Índice BM25 ilegible, solo búsqueda vectorial: {e}")
+            return None
+        self._errors.pop("lexical_index", None)
+        return index
+
+    def _track(self, name: str, factory):
+        """Ejecuta factory() registrando el error (si lo hay) para health()."""
+        try:
+            value = factory()
+        except Exception as e:
+            self._errors[name] = str(e)
+            raise
+        self._errors.pop(name, None)
+        return value
+
+    # ========================================
+    # Recarga y cierre
+    # ========================================
+
+    def reload(self) -> bool:
+        """
+        Reconstruye embeddings, chat y vector store y los intercambia de forma
+        atómica. El pool HTTP se conserva (las conexiones siguen calientes).
+        Si algo falla, se mantienen los recursos anteriores y devuelve False.
+        Se dispara con POST /admin/reload (ver backend/app.py).
+        """
+        with self._lock:
+            paths = current_paths()
+            t0 = time.perf_counter()
+            try:
+                embeddings = self._track("embeddings", self._build_embeddings)
+                chat_llm = self._track("chat_llm", self._build_chat_llm)
+                vectordb = self._track("vectordb", lambda: self._build_vectordb(embeddings, paths))
+            except Exception as e:
+                print(f"[resources] ⚠️ Recarga fallida, se mantienen los clientes anteriores: {e}")
+                return False
+            lexical_index = self._load_lexical_index(paths)
+
+            self._embeddings = embeddings
+            self._chat_llm = chat_llm
+            self._fallback_llm = None   # se reconstruye en su primer uso
+            self._vectordb = vectordb
+            self._lexical_index = lexical_index
+            self._lexical_loaded = True
+            self._set_index_version(paths.version)
+            self._loaded_at = time.time()
+        print(f"[resources] 🔄 Clientes recargados en {time.perf_counter() - t0:.2f}s")
+        return True
+
+    async def areload(self) -> bool:
+        """reload() en un hilo (la construcción abre el índice y puede tardar)."""
+        return await asyncio.to_thread(self.reload)
+
+    # ========================================
+    # Versión del índice (hot-swap sin reinicio)
+    # ========================================
+
+    def _set_index_version(self, version: Optional[str]) -> None:
+        """Versión abierta; se registra para que la ingesta no borre sus ficheros."""
+        self._index_version = version
+        self.renew_index_lease()
+
+    def renew_index_lease(self) -> None:
+        if self._vectordb is None:
+            return
+        try:
+            hold_version(self._index_version)
+        except OSError as e:
+            print(f"[resources] ⚠️ No se pudo registrar la versión del índice {self._index_version}: {e}")
+
+    async def akeep_index_lease(self, interval_s: float = INDEX_LEASE_TTL_S / 3) -> None:
+        """
+        Renueva el registro de la versión abierta cada interval_s, también en
+        un worker sin tráfico (que no verá current.json hasta su siguiente
+        request). Corre hasta que se cancela (al apagar la app).
+        """
+        while True:
+            await asyncio.sleep(interval_s)
+            await asyncio.to_thread(self.renew_index_lease)
+
+    def index_update_pending(self) -> Optional[str]:
+        """
+        Versión publicada por la ingesta si difiere de la cargada, o None.
+        Lee current.json como mucho una vez cada INDEX_WATCH_INTERVAL_S;
+        el resto de llamadas retorna al instante.
+        """
+        if INDEX_WATCH_INTERVAL_S <= 0 or self._vectordb is None:
+            return None
+        now = time.monotonic()
+        if now < self._next_index_check:
+            return None
+        self._next_index_check = now + INDEX_WATCH_INTERVAL_S
+        version = current_version()
+        if version is None or version == self._index_version:
+            return None
+        return version
+
+    def refresh_index(self) -> bool:
+        """
+        Abre la versión publicada del vector store y del BM25 y los
+        intercambia. Las requests en curso terminan con los anteriores (el
+        mmap del índice NumPy sigue siendo válido aunque la recolección de
+        versiones borre sus ficheros). Si la apertura falla, se sigue
+        sirviendo la versión anterior.
+        """
+        from backend.retrieve import reset_chroma_clients
+
+        paths = current_paths()
+        version = paths.version
+        with self._lock:
+            if version is None or version == self._index_version:
+                return False
+            embeddings = self.embeddings
+            t0 = time.perf_counter()
+            try:
+                reset_chroma_clients()
+                vectordb = self._track("vectordb", lambda: self._build_vectordb(embeddings, paths))
+            except Exception as e:
+                print(f"[resources] ⚠️ No se pudo cargar el índice {version}, se mantiene {self._index_version}: {e}")
+                return False
+            lexical_index = self._load_lexical_index(paths)
+
+            self._vectordb = vectordb
+            self._lexical_index = lexical_index
+            self._lexical_loaded = True
+            self._set_index_version(version)
+        print(f"[resources] 🔄 Índice {version} cargado en {time.perf_counter() - t0:.2f}s")
+        return True
+
+    def refresh_index_if_stale(self) -> None:
+        if self.index_update_pending() is not None:
+            self.refresh_index()
+
+    async def arefresh_index_if_stale(self) -> None:
+        """Igual, pero la apertura del índice nuevo corre en un hilo."""
+        if self.index_update_pending() is not None:
+            await asyncio.to_thread(self.refresh_index)
+
+    async def aclose(self) -> None:
+        """Cierra los pools HTTP (se llama al apagar la app)."""
+        with self._lock:
+            http_client, self._http_client = self._http_client, None
+            http_async_client, self._http_async_client = self._http_async_client, None
+            self._embeddings = self._chat_llm = self._fallback_llm = self._vectordb = None
+            self._lexical_index, self._lexical_loaded = None, False
+        if http_client is not None:
+            http_client.close()
+        if http_async_client is not None:
+            await http_async_client.aclose()
+        try:
+            release_version()
+        except OSError:
+            pass   # caduca solo pasado INDEX_LEASE_TTL_S
+
+    # ========================================
+    # Health / readiness
+    # ========================================
+
+    def health(self) -> Dict[str, Any]:
+        """
+        Estado de cada recurso: "ok", "not_loaded" o el mensaje de error.
+        ready=True solo si los tres recursos están cargados (el índice BM25
+        es opcional y se informa aparte).
+        """
+        components = {}
+        for name in ("embeddings", "chat_llm", "vectordb"):
+            if getattr(self, f"_{name}") is not None:
+                components[name] = "ok"
+            else:
+                components[name] = self._errors.get(name, "not_loaded")
+
+        ready = all(v == "ok" for v in components.values())
+        if self._lexical_index is not None:
+            components["lexical_index"] = "ok"
+        else:
+            components["lexical_index"] = self._errors.get("lexical_index", "not_loaded")
+        if RERANK_ENABLED:
+            components["reranker"] = self._reranker.scorer.name if self._reranker is not None else "not_loaded"
+
+        return {
+            "ready": ready,
+            "warming": self._warming,
+            "index_version": self._index_version,
+            "components": components,
+            "loaded_at": self._loaded_at,
+        }
+
+
+# Instancia única del proceso
+registry = ResourceRegistry()
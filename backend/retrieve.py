@@ -1,14 +1,33 @@
 # backend/retrieve.py
 from pathlib import Path
-from typing import Dict, Any
+from typing import Callable, Dict, Any, List, Optional
+
+import numpy as np
+
 from backend.llm_loader import get_embeddings
-from backend.config import CHROMA_DIR
+from backend.config import (
+    HYBRID_RRF_K,
+    RETRIEVAL_BACKEND,
+    RETRIEVAL_MODE,
+)
+from backend.index_versions import IndexPaths, current_paths
+from backend.vector_index import ChunkMatrix, load_chunk_matrix, mmr_select, normalize_rows
 from langchain_community.vectorstores import Chroma
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+
+
+# Parámetros de búsqueda por defecto (compartidos por get_retriever y search_by_vector)
+DEFAULT_FETCH_K = 24
+DEFAULT_LAMBDA_MULT = 0.5
+DEFAULT_SCORE_THRESHOLD = 0.55
 
 
 def _has_chroma_index(dirpath: Path) -> bool:
     """
-    Comprueba si el directorio de CHROMA_DIR contiene un índice válido.
+    Comprueba si el directorio contiene un índice Chroma válido.
 
     En Chroma <0.4.x se buscaba chroma.sqlite3.
     En Chroma 0.4+ el índice se guarda en subcarpetas (ej: "index", "index_uuid").
@@ -29,42 +48,168 @@ def _has_chroma_index(dirpath: Path) -> bool:
     return False
 
 
-def get_vectordb() -> Chroma:
+class SidecarChroma(Chroma):
     """
-    Devuelve la instancia de Chroma persistente usando las embeddings actuales.
-    Lanza excepción clara si el índice no existe.
+    Chroma con MMR vectorizado: Chroma solo devuelve los fetch_k candidatos
+    (sin embeddings) y MMR corre en NumPy sobre la submatriz de sus vectores
+    en el sidecar (npindex/vectors.f32 de la misma versión del índice). Sin
+    sidecar, o si le falta algún candidato, MMR es el de LangChain.
     """
-    chroma_dir = Path(CHROMA_DIR)
+
+    def __init__(self, *args: Any, chunk_matrix: Optional[ChunkMatrix] = None, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.chunk_matrix = chunk_matrix
+
+    # Mismo acceso a los vectores que NumpyVectorStore (lo usa backend/rerank.py)
+    @property
+    def vectors(self):
+        return self.chunk_matrix.vectors
+
+    def rows_for_ids(self, ids: List[str]) -> List[Optional[int]]:
+        if self.chunk_matrix is None:
+            return [None] * len(ids)
+        return self.chunk_matrix.rows_for_ids(ids)
+
+    def max_marginal_relevance_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: Optional[Dict[str, str]] = None,
+        where_document: Optional[Dict[str, str]] = None,
+        **kwargs: Any,
+    ) -> List[Document]:
+        if self.chunk_matrix is None:
+            return super().max_marginal_relevance_search_by_vector(
+                embedding, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult,
+                filter=filter, where_document=where_document, **kwargs,
+            )
+        candidates = [
+            doc for doc, _ in self.similarity_search_by_vector_with_relevance_scores(
+                embedding, k=fetch_k, filter=filter, where_document=where_document, **kwargs
+            )
+        ]
+        rows = self.rows_for_ids([_doc_id(doc) for doc in candidates])
+        if any(row is None for row in rows):
+            return super().max_marginal_relevance_search_by_vector(
+                embedding, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult,
+                filter=filter, where_document=where_document, **kwargs,
+            )
+        query = normalize_rows(embedding)
+        chosen = mmr_select(query, np.asarray(self.chunk_matrix.vectors[rows]), k, lambda_mult)
+        return [candidates[i] for i in chosen]
+
+
+def _open_chroma(embeddings, paths: IndexPaths) -> Chroma:
+    chroma_dir = Path(paths.root)
     if not _has_chroma_index(chroma_dir):
         raise RuntimeError(
             f"❌ No se encontró un índice Chroma en {chroma_dir}. "
             "Ejecuta `python -m backend.ingest --rebuild` primero."
         )
-
-    embeddings = get_embeddings()
-    return Chroma(
+    return SidecarChroma(
         persist_directory=str(chroma_dir),
         embedding_function=embeddings,
+        chunk_matrix=load_chunk_matrix(paths.numpy_dir),
     )
 
 
+def _open_numpy(embeddings, paths: IndexPaths) -> VectorStore:
+    from backend.vector_index import NumpyVectorStore, has_numpy_index
+
+    if not has_numpy_index(paths.numpy_dir):
+        raise RuntimeError(
+            f"❌ No se encontró un índice NumPy en {paths.numpy_dir}. "
+            "Ejecuta `python -m backend.ingest --export-numpy` primero."
+        )
+    return NumpyVectorStore(paths.numpy_dir, embedding_function=embeddings)
+
+
+def reset_chroma_clients() -> None:
+    """
+    Olvida los clientes Chroma cacheados por ruta en este proceso: el
+    siguiente _open_chroma vuelve a leer el índice del disco (el HNSW se
+    carga en memoria una sola vez por cliente) y el de la versión anterior
+    se libera cuando terminan las búsquedas que aún lo usan.
+    """
+    from chromadb.api.client import SharedSystemClient
+
+    SharedSystemClient.clear_system_cache()
+
+
+# Backends de recuperación disponibles (RETRIEVAL_BACKEND). Todos devuelven un
+# VectorStore de LangChain, así get_retriever / search_by_vector no cambian.
+RETRIEVAL_BACKENDS: Dict[str, Callable[[Any, IndexPaths], VectorStore]] = {
+    "chroma": _open_chroma,
+    "numpy": _open_numpy,
+}
+
+
+def get_vectordb(embeddings=None, backend: Optional[str] = None, paths: Optional[IndexPaths] = None) -> VectorStore:
+    """
+    Devuelve el vector store del backend configurado usando las embeddings actuales.
+    Lanza excepción clara si el índice no existe.
+
+    - embeddings: cliente de embeddings ya construido (p. ej. el del registro
+      de recursos). Si es None, se crea uno nuevo.
+    - backend: "chroma" | "numpy"; por defecto RETRIEVAL_BACKEND.
+    - paths: versión del índice a abrir; por defecto la publicada (current.json).
+    """
+    backend = (backend or RETRIEVAL_BACKEND).lower()
+    if backend not in RETRIEVAL_BACKENDS:
+        raise ValueError(
+            f"RETRIEVAL_BACKEND desconocido: {backend!r} "
+            f"(opciones: {', '.join(RETRIEVAL_BACKENDS)})"
+        )
+
+    if embeddings is None:
+        embeddings = get_embeddings()
+    return RETRIEVAL_BACKENDS[backend](embeddings, paths or current_paths())
+
+
 def get_retriever(
     k: int = 6,
     use_mmr: bool = True,
-    fetch_k: int = 24,
-    lambda_mult: float = 0.5,
-    score_threshold: float = 0.55,
+    fetch_k: int = DEFAULT_FETCH_K,
+    lambda_mult: float = DEFAULT_LAMBDA_MULT,
+    score_threshold: float = DEFAULT_SCORE_THRESHOLD,
+    vectordb: Optional[VectorStore] = None,
+    lexical_index=None,
 ):
     """
-    Construye un retriever de Chroma.
+    Construye un retriever sobre el backend configurado (Chroma o NumPy).
+    Con RETRIEVAL_MODE="hybrid" y un índice BM25 disponible, devuelve un
+    HybridRetriever (mismos parámetros para la parte vectorial).
 
     - k: número de documentos a devolver
     - use_mmr: si True, usa Maximal Marginal Relevance ("mmr") para diversidad
     - fetch_k: candidatos iniciales (solo relevante para MMR)
     - lambda_mult: balance relevancia/diversidad en MMR
     - score_threshold: umbral de similitud (solo cuando use_mmr=False)
+    - vectordb: instancia ya abierta (p. ej. la del registro de recursos);
+      si es None, se abre una nueva.
+    - lexical_index: índice BM25 ya abierto; si es None, se intenta cargar.
     """
-    vectordb = get_vectordb()
+    if vectordb is None:
+        vectordb = get_vectordb()
+
+    if RETRIEVAL_MODE == "hybrid":
+        if lexical_index is None:
+            from backend.lexical_index import load_lexical_index
+            lexical_index = load_lexical_index()
+        if lexical_index is not None:
+            return HybridRetriever(
+                vectordb=vectordb,
+                lexical_index=lexical_index,
+                search_kwargs={
+                    "k": k,
+                    "use_mmr": use_mmr,
+                    "fetch_k": fetch_k,
+                    "lambda_mult": lambda_mult,
+                    "score_threshold": score_threshold,
+                },
+            )
 
     if use_mmr:
         search_type = "mmr"
@@ -82,3 +227,171 @@ def get_retriever(
 
     return vectordb.as_retriever(search_type=search_type, search_kwargs=search_kwargs)
 
+
+def search_by_vector(
+    vectordb: VectorStore,
+    embedding: List[float],
+    k: int = 6,
+    use_mmr: bool = True,
+    fetch_k: int = DEFAULT_FETCH_K,
+    lambda_mult: float = DEFAULT_LAMBDA_MULT,
+    score_threshold: float = DEFAULT_SCORE_THRESHOLD,
+) -> List[Any]:
+    """
+    Igual que get_retriever(...).invoke(query), pero a partir de un embedding
+    ya calculado. Permite separar el embedding de la consulta (que puede ser
+    asíncrono, ver rag_pipeline.aretrieve_contexts) de la búsqueda local.
+    Mismas semánticas de k / fetch_k / lambda_mult / score_threshold.
+    """
+    if use_mmr:
+        return vectordb.max_marginal_relevance_search_by_vector(
+            embedding, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult
+        )
+
+    # Los backends devuelven distancias: se convierten a relevancia [0, 1] con la
+    # misma función que usa "similarity_score_threshold".
+    relevance_fn = vectordb._select_relevance_score_fn()
+    docs_and_distances = vectordb.similarity_search_by_vector_with_relevance_scores(embedding, k=k)
+    return [
+        doc for doc, distance in docs_and_distances
+        if relevance_fn(distance) >= score_threshold
+    ]
+
+
+# ========================================
+# Recuperación híbrida (vectorial + BM25)
+# ========================================
+
+def _doc_id(doc: Document) -> Optional[str]:
+    return doc.metadata.get("chunk_id") or doc.id
+
+
+def get_documents(vectordb: VectorStore, ids: List[str]) -> Dict[str, Document]:
+    """Documentos por chunk_id (Chroma no implementa get_by_ids en LangChain)."""
+    if not ids:
+        return {}
+    if isinstance(vectordb, Chroma):
+        found = vectordb.get(ids=ids, include=["documents", "metadatas"])
+        return {
+            cid: Document(page_content=text, metadata=metadata or {}, id=cid)
+            for cid, text, metadata in zip(found["ids"], found["documents"], found["metadatas"])
+        }
+    return {doc.id: doc for doc in vectordb.get_by_ids(ids)}
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], rrf_k: int = HYBRID_RRF_K) -> List[str]:
+    """Fusiona listas ordenadas de ids: score(id) = sum(1 / (rrf_k + rank))."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, cid in enumerate(ranking, start=1):
+            scores[cid] = scores.get(cid, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def hybrid_search(
+    vectordb: VectorStore,
+    lexical_index,
+    question: str,
+    embedding: List[float],
+    k: int = 6,
+    use_mmr: bool = True,
+    fetch_k: int = DEFAULT_FETCH_K,
+    lambda_mult: float = DEFAULT_LAMBDA_MULT,
+    score_threshold: float = DEFAULT_SCORE_THRESHOLD,
+    rrf_k: int = HYBRID_RRF_K,
+) -> List[Document]:
+    """
+    Búsqueda vectorial (mismas semánticas que search_by_vector) + BM25 sobre
+    la pregunta, fusionadas con Reciprocal Rank Fusion. Devuelve k documentos.
+    """
+    dense = search_by_vector(
+        vectordb, embedding, k=k, use_mmr=use_mmr, fetch_k=fetch_k,
+        lambda_mult=lambda_mult, score_threshold=score_threshold,
+    )
+    return fuse_with_lexical(vectordb, lexical_index, question, dense, k=k, rrf_k=rrf_k)
+
+
+def fuse_with_lexical(
+    vectordb: VectorStore,
+    lexical_index,
+    question: str,
+    dense: List[Document],
+    k: int = 6,
+    rrf_k: int = HYBRID_RRF_K,
+) -> List[Document]:
+    """Fusiona (RRF) resultados vectoriales ya calculados con BM25 sobre la pregunta."""
+    lexical = lexical_index.search(question, k=k)
+
+    docs = {_doc_id(doc): doc for doc in dense}
+    fused = reciprocal_rank_fusion([list(docs), [cid for cid, _ in lexical]], rrf_k)[:k]
+    docs.update(get_documents(vectordb, [cid for cid in fused if cid not in docs]))
+    return [docs[cid] for cid in fused if cid in docs]
+
+
+def search_contexts(
+    vectordb: VectorStore,
+    question: str,
+    embedding: List[float],
+    k: int = 6,
+    lexical_index=None,
+    **search_kwargs: Any,
+) -> List[Document]:
+    """
+    Punto de entrada del pipeline: híbrida si RETRIEVAL_MODE="hybrid" y hay
+    índice BM25; si no, solo vectorial.
+    """
+    if RETRIEVAL_MODE == "hybrid" and lexical_index is not None:
+        return hybrid_search(vectordb, lexical_index, question, embedding, k=k, **search_kwargs)
+    return search_by_vector(vectordb, embedding, k=k, **search_kwargs)
+
+
+def search_contexts_many(
+    vectordb: VectorStore,
+    questions: List[str],
+    embeddings: List[List[float]],
+    k: int = 6,
+    lexical_index=None,
+    use_mmr: bool = True,
+    fetch_k: int = DEFAULT_FETCH_K,
+    lambda_mult: float = DEFAULT_LAMBDA_MULT,
+    score_threshold: float = DEFAULT_SCORE_THRESHOLD,
+) -> List[List[Document]]:
+    """
+    search_contexts para muchas consultas a la vez. Con el backend NumPy la
+    parte vectorial es un único producto de matrices (search_many_by_vector);
+    con Chroma se hace consulta a consulta.
+    """
+    if hasattr(vectordb, "search_many_by_vector"):
+        dense_all = vectordb.search_many_by_vector(
+            embeddings, k=k, use_mmr=use_mmr, fetch_k=fetch_k,
+            lambda_mult=lambda_mult, score_threshold=score_threshold,
+        )
+    else:
+        dense_all = [
+            search_by_vector(
+                vectordb, embedding, k=k, use_mmr=use_mmr, fetch_k=fetch_k,
+                lambda_mult=lambda_mult, score_threshold=score_threshold,
+            )
+            for embedding in embeddings
+        ]
+
+    if RETRIEVAL_MODE != "hybrid" or lexical_index is None:
+        return dense_all
+    return [
+        fuse_with_lexical(vectordb, lexical_index, question, dense, k=k)
+        for question, dense in zip(questions, dense_all)
+    ]
+
+
+class HybridRetriever(BaseRetriever):
+    """Retriever de LangChain sobre hybrid_search (embebe la consulta con el vector store)."""
+
+    vectordb: Any
+    lexical_index: Any
+    search_kwargs: Dict[str, Any] = {}
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        embedding = self.vectordb.embeddings.embed_query(query)
+        return hybrid_search(self.vectordb, self.lexical_index, query, embedding, **self.search_kwargs)
@@ -1,8 +1,32 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel, Field
-from typing import Optional
+import asyncio
+import json
+import time
 
-from backend.rag_pipeline import answer_with_rag, chatbot_teacher
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Any, Dict, Optional
+
+from backend.rag_pipeline import (
+    aanswer_with_rag,
+    achatbot_simple,
+    achatbot_teacher,
+    astream_answer_with_rag,
+    astream_chatbot_simple,
+    astream_chatbot_teacher,
+    run_with_limits,
+)
+from backend import sessions
+from backend.query_router import (
+    SHORT_REPLY_PROMPT,
+    aiter_list,
+    arecorded_events,
+    canned_events,
+    router as query_router,
+)
+from backend.sse import sse_response
+from backend.bulk import parse_items, run_batch
+from backend.config import BULK_MAX_ITEMS
 from backend.prompt_baseline import BASELINE_SYSTEM_PROMPT
 
 # ENGINEERED opcional
@@ -14,6 +38,10 @@ except Exception:
 router = APIRouter(tags=["answer"])
 
 
+def _system_prompt(mode: str) -> str:
+    return BASELINE_SYSTEM_PROMPT if mode == "baseline" else ENGINEERED_SYSTEM_PROMPT
+
+
 # =====================
 # Models de request/resp
 # =====================
@@ -23,6 +51,9 @@ class AnswerIn(BaseModel):
     rag: bool = Field(False, description="Si true, usa el oráculo docente (RAG)")
     mode: str = Field("engineered", description='Usado cuando rag=false. "baseline" o "engineered"')
     history: Optional[str] = Field(default=None, description="Historial breve opcional para el oráculo docente")
+    session_id: Optional[str] = Field(
+        default=None, max_length=128, description="Con rag=true: historial guardado en el servidor (ignora 'history')"
+    )
     top_k: Optional[int] = Field(default=None, ge=1, le=12, description="Override del número de pasajes a recuperar (k)")
 
 
@@ -30,6 +61,9 @@ class AnswerOut(BaseModel):
     text: str
     rag: bool
     mode: str
+    timings: Dict[str, float] = {}
+    route: Optional[str] = None
+    error: Optional[Dict[str, Any]] = None   # el modelo no respondió (ver backend/llm_client.py)
 
 
 # ============
@@ -37,7 +71,7 @@ class AnswerOut(BaseModel):
 # ============
 
 @router.post("/answer", response_model=AnswerOut)
-def universal_answer(inp: AnswerIn):
+async def universal_answer(inp: AnswerIn):
     """
     Endpoint universal:
     - rag=true  -> Oráculo Docente (RAG) con historial opcional (sí hace fallback).
@@ -48,47 +82,144 @@ def universal_answer(inp: AnswerIn):
         raise HTTPException(status_code=400, detail="Falta 'text'")
 
     k = int(inp.top_k) if inp.top_k else None
+    mode = "teacher" if inp.rag else ("baseline" if (inp.mode or "").lower() == "baseline" else "engineered")
+
+    # Saludos, charla y preguntas fuera del corpus no pasan por RAG (ver backend/query_router.py)
+    t0 = time.perf_counter()
+    decision = await query_router.aroute(q, allow_simple=not inp.rag)
+    if decision.route != "rag":
+        try:
+            if decision.route == "canned":
+                answer_dict = {"text": decision.reply, "timings": {}}
+            else:
+                prompt = SHORT_REPLY_PROMPT if decision.route == "short" else _system_prompt(mode)
+                answer_dict = await run_with_limits(achatbot_simple([{"role": "user", "content": q}], prompt))
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Tiempo de espera agotado")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error en respuesta directa: {e}")
+        query_router.record(decision, (time.perf_counter() - t0) * 1000)
+        return AnswerOut(
+            text=answer_dict.get("text", "⚠️ Respuesta vacía"),
+            rag=inp.rag,
+            mode=mode,
+            timings={**answer_dict.get("timings", {}), "route_ms": decision.route_ms},
+            route=decision.route,
+            error=answer_dict.get("error"),
+        )
 
     if inp.rag:
         try:
-            answer_dict = chatbot_teacher(
-                question=q,
-                history=inp.history or "",
-                k=(k or 6)
-            )
+            if inp.session_id:
+                answer_dict = await run_with_limits(
+                    sessions.achatbot_teacher_session(inp.session_id, question=q, k=(k or 6))
+                )
+            else:
+                answer_dict = await run_with_limits(achatbot_teacher(
+                    question=q,
+                    history=inp.history or "",
+                    k=(k or 6)
+                ))
+            query_router.record(decision, (time.perf_counter() - t0) * 1000)
             return AnswerOut(
                 text=answer_dict.get("text", "⚠️ Respuesta vacía"),
                 rag=True,
-                mode="teacher"
+                mode="teacher",
+                timings=answer_dict.get("timings", {}),
+                route=decision.route,
+                error=answer_dict.get("error"),
             )
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Tiempo de espera agotado")
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error en RAG docente: {e}")
 
     # Modelo simple (sin fallback)
     try:
-        mode = (inp.mode or "engineered").lower()
-        system_prompt = BASELINE_SYSTEM_PROMPT if mode == "baseline" else ENGINEERED_SYSTEM_PROMPT
-
-        answer_dict = answer_with_rag(
+        answer_dict = await run_with_limits(aanswer_with_rag(
             question=q,
-            system_prompt=system_prompt,
+            system_prompt=_system_prompt(mode),
             k=(k or 5),
             allow_fallback=False
-        )
+        ))
+        query_router.record(decision, (time.perf_counter() - t0) * 1000)
         return AnswerOut(
             text=answer_dict.get("text", "⚠️ Respuesta vacía"),
             rag=False,
-            mode="baseline" if mode == "baseline" else "engineered"
+            mode=mode,
+            timings=answer_dict.get("timings", {}),
+            route=decision.route,
+            error=answer_dict.get("error"),
         )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Tiempo de espera agotado")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en modelo simple: {e}")
 
 
+@router.post("/answer/stream")
+async def universal_answer_stream(inp: AnswerIn):
+    """
+    Versión SSE de /answer: mismos modos, con eventos "token", "sources" y "done".
+    """
+    q = (inp.text or "").strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="Falta 'text'")
 
+    k = int(inp.top_k) if inp.top_k else None
+    mode = "teacher" if inp.rag else ("baseline" if (inp.mode or "").lower() == "baseline" else "engineered")
 
+    decision = await query_router.aroute(q, allow_simple=not inp.rag)
+    if decision.route == "canned":
+        return sse_response(arecorded_events(decision, aiter_list(canned_events(decision))), tag="answer")
+    if decision.route != "rag":
+        prompt = SHORT_REPLY_PROMPT if decision.route == "short" else _system_prompt(mode)
+        events = astream_chatbot_simple([{"role": "user", "content": q}], prompt)
+        return sse_response(arecorded_events(decision, events), tag="answer")
 
+    if inp.rag:
+        if inp.session_id:
+            events = sessions.astream_chatbot_teacher_session(inp.session_id, question=q, k=(k or 6))
+        else:
+            events = astream_chatbot_teacher(
+                question=q,
+                history=inp.history or "",
+                k=(k or 6)
+            )
+        return sse_response(arecorded_events(decision, events), tag="answer")
 
+    events = astream_answer_with_rag(
+        question=q,
+        system_prompt=_system_prompt(mode),
+        k=(k or 5),
+        allow_fallback=False
+    )
+    return sse_response(arecorded_events(decision, events), tag="answer")
 
 
-
-
+@router.post("/answer/batch")
+async def universal_answer_batch(request: Request, modes: Optional[str] = None):
+    """
+    Lote de preguntas en JSONL (una por línea: {"id", "text", "mode", "history", "top_k"}).
+    - modes: opcional, p. ej. "baseline,engineered,teacher" para ejecutar cada
+      pregunta en todos esos modos.
+    Responde en streaming NDJSON: una línea por resultado en cuanto termina
+    (latencia y uso de tokens por ítem) y una última línea {"summary": {...}}.
+    """
+    body = (await request.body()).decode("utf-8")
+    try:
+        items = parse_items(body.splitlines(), [m.strip().lower() for m in modes.split(",")] if modes else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not items:
+        raise HTTPException(status_code=400, detail="El lote está vacío")
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Máximo {BULK_MAX_ITEMS} ítems por lote")
+
+    async def lines():
+        summary: Dict = {}
+        async for result in run_batch(items, summary=summary):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+        yield json.dumps({"summary": summary}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
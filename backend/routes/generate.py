@@ -1,8 +1,12 @@
+import asyncio
+
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
+from typing import Any, Dict, Optional
 
 # RAG y prompts
-from backend.rag_pipeline import chatbot_simple
+from backend.rag_pipeline import achatbot_simple, astream_chatbot_simple, run_with_limits
+from backend.sse import sse_response
 from backend.prompt_baseline import BASELINE_SYSTEM_PROMPT
 
 # Si no existe ENGINEERED, cae a BASELINE
@@ -23,10 +27,16 @@ class GenerateIn(BaseModel):
 
 class GenerateOut(BaseModel):
     text: str
+    timings: Dict[str, float] = {}
+    error: Optional[Dict[str, Any]] = None   # el modelo no respondió (ver backend/llm_client.py)
+
+def _system_prompt_for(mode: str) -> str:
+    return BASELINE_SYSTEM_PROMPT if mode.lower() == "baseline" else ENGINEERED_SYSTEM_PROMPT
+
 
 # ==== Endpoint ====
 @router.post("/generate", response_model=GenerateOut)
-def generate_endpoint(inp: GenerateIn):
+async def generate_endpoint(inp: GenerateIn):
     """
     Chatbot simple (baseline / engineered) sin RAG.
     - Aquí el modelo puede alucinar, porque no está grounded en documentos.
@@ -36,29 +46,35 @@ def generate_endpoint(inp: GenerateIn):
         raise HTTPException(status_code=400, detail="Falta 'text'")
 
     # Elegir prompt
-    system_prompt = (
-        BASELINE_SYSTEM_PROMPT if inp.mode.lower() == "baseline"
-        else ENGINEERED_SYSTEM_PROMPT
-    )
+    system_prompt = _system_prompt_for(inp.mode)
 
     try:
         # ✅ Enviar mensaje como lista de mensajes
         conversation = [{"role": "user", "content": q}]
-        answer_dict = chatbot_simple(conversation, system_prompt)
-        return GenerateOut(text=answer_dict.get("text", "⚠️ Respuesta vacía"))
+        answer_dict = await run_with_limits(achatbot_simple(conversation, system_prompt))
+        return GenerateOut(
+            text=answer_dict.get("text", "⚠️ Respuesta vacía"),
+            timings=answer_dict.get("timings", {}),
+            error=answer_dict.get("error"),
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Tiempo de espera agotado")
     except Exception as e:
         print(f"[generate] Error interno: {e}")
         raise HTTPException(status_code=500, detail="Error en generación simple")
 
 
+@router.post("/generate/stream")
+async def generate_stream_endpoint(inp: GenerateIn):
+    """
+    Igual que /generate, pero en streaming SSE (eventos "token" y "done").
+    """
+    q = (inp.text or "").strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="Falta 'text'")
 
-
-
-
-
-
-
-
-
-
-
+    conversation = [{"role": "user", "content": q}]
+    return sse_response(
+        astream_chatbot_simple(conversation, _system_prompt_for(inp.mode)),
+        tag="generate",
+    )
@@ -1,10 +1,14 @@
 # backend/routes/teacher.py
+import asyncio
+
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 # Import correcto desde backend
-from backend.rag_pipeline import chatbot_teacher
+from backend import sessions
+from backend.rag_pipeline import achatbot_teacher, astream_chatbot_teacher, run_with_limits
+from backend.sse import sse_response
 
 router = APIRouter(tags=["teacher"])
 
@@ -16,20 +20,29 @@ class TeacherIn(BaseModel):
         default=None,
         description="Historial breve opcional para dar continuidad al docente"
     )
+    session_id: Optional[str] = Field(
+        default=None,
+        max_length=128,
+        description="Id de conversación: el servidor guarda el historial (resumido) y se ignora 'history'"
+    )
 
 
 class TeacherOut(BaseModel):
     text: str
     sources: List[str] = []   # 🔥 nuevo campo para referencias
+    timings: Dict[str, float] = {}   # ms por etapa (retrieve/assemble/generate)
+    session_id: Optional[str] = None
+    error: Optional[Dict[str, Any]] = None   # el modelo no respondió (ver backend/llm_client.py)
 
 
 # ==== Endpoint ====
 @router.post("/teacher", response_model=TeacherOut)
-def teacher_endpoint(inp: TeacherIn):
+async def teacher_endpoint(inp: TeacherIn):
     """
     Oráculo Docente (RAG):
     - Usa retrieval mejorado (MMR / formateo enumerado) y fallback honesto.
     - history es opcional; si viene, se inyecta al prompt docente.
+    - Con session_id el historial lo guarda el servidor (backend/sessions.py).
     - Devuelve tanto la respuesta como la lista de fuentes consultadas.
     """
     q = (inp.text or "").strip()
@@ -37,25 +50,48 @@ def teacher_endpoint(inp: TeacherIn):
         raise HTTPException(status_code=400, detail="Falta 'text'")
 
     try:
-        answer_dict = chatbot_teacher(question=q, history=inp.history or "")
+        if inp.session_id:
+            answer_dict = await run_with_limits(
+                sessions.achatbot_teacher_session(inp.session_id, question=q)
+            )
+        else:
+            answer_dict = await run_with_limits(
+                achatbot_teacher(question=q, history=inp.history or "")
+            )
         return TeacherOut(
             text=answer_dict.get("text", "⚠️ Respuesta vacía"),
             sources=answer_dict.get("sources", []),
+            timings=answer_dict.get("timings", {}),
+            session_id=inp.session_id,
+            error=answer_dict.get("error"),
         )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Tiempo de espera agotado")
     except Exception as e:
         # Log interno para debug
         print(f"[teacher] Error interno: {e}")
         raise HTTPException(status_code=500, detail="Error en RAG")
 
 
+@router.post("/teacher/stream")
+async def teacher_stream_endpoint(inp: TeacherIn):
+    """
+    Igual que /teacher, pero en streaming SSE:
+    eventos "token" a medida que el modelo escribe, "sources" al final y "done".
+    """
+    q = (inp.text or "").strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="Falta 'text'")
 
+    if inp.session_id:
+        events = sessions.astream_chatbot_teacher_session(inp.session_id, question=q)
+    else:
+        events = astream_chatbot_teacher(question=q, history=inp.history or "")
+    return sse_response(events, tag="teacher")
 
 
-
-
-
-
-
-
-
-
+@router.delete("/teacher/session/{session_id}")
+async def teacher_session_delete(session_id: str):
+    """Olvida el historial guardado de una conversación."""
+    await sessions.store.adelete(session_id)
+    return {"ok": True, "session_id": session_id}
@@ -0,0 +1,400 @@
+# backend/scheduler.py
+"""
+Planificador de las llamadas salientes a OpenAI (chat y embeddings).
+
+La ingesta, la evaluación masiva y el tráfico en vivo comparten la misma
+OPENAI_API_KEY. Aquí cada request HTTP pasa, antes de salir, por dos cubos
+de tokens por modelo:
+
+- requests por minuto (RPM)
+- tokens por minuto (TPM), con los tokens estimados del cuerpo de la request
+
+y por una cola con prioridad por clase:
+
+    interactive (0)  /api/*: pueden gastar el cubo entero
+    bulk        (1)  backend/bulk.py, resúmenes de sesión: respetan la mitad de SCHEDULER_RESERVE
+    ingest      (2)  backend/ingest.py: respetan SCHEDULER_RESERVE entera
+
+Los cubos se ajustan con las cabeceras de cada respuesta
+(x-ratelimit-limit-*, x-ratelimit-remaining-*, x-ratelimit-reset-*) y un 429
+pausa el modelo hasta el reset. Como "remaining" lo calcula OpenAI para toda
+la clave, una ingesta en otro proceso ve también lo que gasta la app y deja
+la reserva libre para ella.
+
+Se engancha con event hooks de httpx (ver scheduled_http_clients y
+backend/resources.py), así que cubre cualquier cliente de LangChain que use
+esos clientes HTTP. La clase se toma de una ContextVar:
+
+    with priority("bulk"):
+        await registry.embeddings.aembed_documents(textos)
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from backend.config import (
+    SCHEDULER_COMPLETION_TOKENS,
+    SCHEDULER_ENABLED,
+    SCHEDULER_RESERVE,
+    SCHEDULER_RPM,
+    SCHEDULER_TPM,
+)
+from backend.metrics import observe_outbound_wait
+
+PRIORITIES = {"interactive": 0, "bulk": 1, "ingest": 2}
+
+# Fracción de SCHEDULER_RESERVE que respeta cada clase
+RESERVE_SHARE = {"interactive": 0.0, "bulk": 0.5, "ingest": 1.0}
+
+# Espera máxima entre comprobaciones de una request en cola (segundos)
+POLL_S = 0.05
+
+# Pausa tras un 429 sin cabeceras de reset
+DEFAULT_PAUSE_S = 1.0
+
+_priority: ContextVar[Optional[str]] = ContextVar("outbound_priority", default=None)
+_default_priority = "interactive"
+
+
+@contextmanager
+def priority(name: str) -> Iterator[None]:
+    """Clase de las llamadas salientes dentro del bloque (se hereda en tareas e hilos de to_thread)."""
+    if name not in PRIORITIES:
+        raise ValueError(f"Prioridad desconocida: {name}")
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def set_default_priority(name: str) -> None:
+    """Clase por defecto del proceso (p. ej. "ingest" en python -m backend.ingest)."""
+    global _default_priority
+    if name not in PRIORITIES:
+        raise ValueError(f"Prioridad desconocida: {name}")
+    _default_priority = name
+
+
+def current_priority() -> str:
+    return _priority.get() or _default_priority
+
+
+# ========================================
+# Cubos de tokens
+# ========================================
+
+class TokenBucket:
+    """capacity unidades, repuestas a capacity/60 por segundo (límite por minuto)."""
+
+    def __init__(self, per_minute: float, clock=time.monotonic):
+        self.clock = clock
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = clock()
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / 60.0
+
+    def refill(self) -> None:
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def seconds_until(self, amount: float, floor: float = 0.0) -> float:
+        """0 si se pueden gastar amount unidades sin bajar de floor; si no, la espera estimada."""
+        missing = amount + floor - self.level
+        if missing <= 0:
+            return 0.0
+        return missing / self.rate if self.rate > 0 else POLL_S
+
+    def adapt(self, limit: Optional[float], remaining: Optional[float]) -> None:
+        """Límite real de la clave y lo que OpenAI dice que queda (nunca se sube el nivel)."""
+        self.refill()
+        if limit and limit > 0:
+            self.capacity = float(limit)
+            self.level = min(self.level, self.capacity)
+        if remaining is not None:
+            self.level = min(self.level, max(0.0, float(remaining)))
+
+
+class ModelLimits:
+    def __init__(self, rpm: float, tpm: float, clock=time.monotonic):
+        self.requests = TokenBucket(rpm, clock)
+        self.tokens = TokenBucket(tpm, clock)
+        self.paused_until = 0.0
+        self.waiters: List[Tuple[int, int]] = []   # heap (prioridad, orden de llegada)
+
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """Duraciones de OpenAI ("20ms", "1s", "6m0s", "1h2m3.5s") en segundos."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    return sum(float(n) * _UNITS[unit] for n, unit in parts) if parts else None
+
+
+def _header_float(headers: Any, name: str) -> Optional[float]:
+    try:
+        value = headers.get(name)
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_request(path: str, body: bytes) -> Optional[Tuple[str, int]]:
+    """
+    (modelo, tokens estimados) de una request de chat o embeddings; None si
+    no es una de ellas. ~4 caracteres por token, más la respuesta esperada.
+    """
+    if not (path.endswith("/chat/completions") or path.endswith("/embeddings")):
+        return None
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        return None
+    model = str(payload.get("model") or "desconocido")
+    if path.endswith("/embeddings"):
+        inputs = payload.get("input")
+        items = inputs if isinstance(inputs, list) and inputs and not isinstance(inputs[0], int) else [inputs]
+        tokens = sum(len(item) if isinstance(item, list) else len(str(item or "")) // 4 for item in items)
+        return model, max(1, tokens)
+    chars = sum(len(str(m.get("content") or "")) for m in payload.get("messages", []))
+    completion = payload.get("max_completion_tokens") or payload.get("max_tokens") or SCHEDULER_COMPLETION_TOKENS
+    return model, max(1, chars // 4 + int(completion))
+
+
+# ========================================
+# Planificador
+# ========================================
+
+class OutboundScheduler:
+    """Cubos RPM/TPM por modelo y cola por prioridad, compartidos por hilos y event loop."""
+
+    def __init__(self, rpm: float = SCHEDULER_RPM, tpm: float = SCHEDULER_TPM,
+                 reserve: float = SCHEDULER_RESERVE, clock=time.monotonic):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.reserve = reserve
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._models: Dict[str, ModelLimits] = {}
+        self._seq = itertools.count()
+        self.queued = {name: 0 for name in PRIORITIES}
+        self.granted = {name: 0 for name in PRIORITIES}
+        self.throttled = {name: 0 for name in PRIORITIES}
+        self.wait_ms = {name: 0.0 for name in PRIORITIES}
+        self.max_wait_ms = {name: 0.0 for name in PRIORITIES}
+        self.rate_limited = 0
+
+    def _limits(self, model: str) -> ModelLimits:
+        limits = self._models.get(model)
+        if limits is None:
+            limits = self._models[model] = ModelLimits(self.rpm, self.tpm, self.clock)
+        return limits
+
+    def _enqueue(self, model: str, prio: str) -> Tuple[ModelLimits, Tuple[int, int]]:
+        with self._lock:
+            limits = self._limits(model)
+            ticket = (PRIORITIES[prio], next(self._seq))
+            heapq.heappush(limits.waiters, ticket)
+            self.queued[prio] += 1
+        return limits, ticket
+
+    def _try_take(self, limits: ModelLimits, ticket: Tuple[int, int], prio: str, tokens: int) -> float:
+        """0 si la request puede salir (y se descuenta); si no, segundos a esperar."""
+        with self._lock:
+            if limits.waiters[0] != ticket:
+                return POLL_S   # hay alguien delante (más prioritario o anterior)
+            now = self.clock()
+            if now < limits.paused_until:
+                return limits.paused_until - now
+            limits.requests.refill()
+            limits.tokens.refill()
+            share = self.reserve * RESERVE_SHARE[prio]
+            cost = min(float(tokens), limits.tokens.capacity * (1 - share))
+            wait = max(
+                limits.requests.seconds_until(1, share * limits.requests.capacity),
+                limits.tokens.seconds_until(cost, share * limits.tokens.capacity),
+            )
+            if wait > 0:
+                return wait
+            limits.requests.level -= 1
+            limits.tokens.level -= cost
+            return 0.0
+
+    def _dequeue(self, limits: ModelLimits, ticket: Tuple[int, int], prio: str, started: float, granted: bool) -> None:
+        waited = (self.clock() - started) * 1000
+        with self._lock:
+            limits.waiters.remove(ticket)
+            heapq.heapify(limits.waiters)
+            self.queued[prio] -= 1
+            if granted:
+                self.granted[prio] += 1
+                self.wait_ms[prio] += waited
+                self.max_wait_ms[prio] = max(self.max_wait_ms[prio], waited)
+                if waited >= 1:
+                    self.throttled[prio] += 1
+        if granted:
+            observe_outbound_wait(prio, waited)
+
+    def acquire(self, model: str, tokens: int, prio: Optional[str] = None) -> float:
+        """Bloquea el hilo hasta que la request puede salir. Devuelve la espera (ms)."""
+        prio = prio or current_priority()
+        limits, ticket = self._enqueue(model, prio)
+        started, granted = self.clock(), False
+        try:
+            while True:
+                wait = self._try_take(limits, ticket, prio, tokens)
+                if wait <= 0:
+                    granted = True
+                    return (self.clock() - started) * 1000
+                time.sleep(min(wait, POLL_S))
+        finally:
+            self._dequeue(limits, ticket, prio, started, granted)
+
+    async def aacquire(self, model: str, tokens: int, prio: Optional[str] = None) -> float:
+        """Versión asíncrona (no bloquea el event loop)."""
+        prio = prio or current_priority()
+        limits, ticket = self._enqueue(model, prio)
+        started, granted = self.clock(), False
+        try:
+            while True:
+                wait = self._try_take(limits, ticket, prio, tokens)
+                if wait <= 0:
+                    granted = True
+                    return (self.clock() - started) * 1000
+                await asyncio.sleep(min(wait, POLL_S))
+        finally:
+            self._dequeue(limits, ticket, prio, started, granted)
+
+    def observe_response(self, model: str, status: int, headers: Any) -> None:
+        """Ajusta los cubos con las cabeceras x-ratelimit-* y pausa el modelo ante un 429."""
+        with self._lock:
+            limits = self._limits(model)
+            limits.requests.adapt(
+                _header_float(headers, "x-ratelimit-limit-requests"),
+                _header_float(headers, "x-ratelimit-remaining-requests"),
+            )
+            limits.tokens.adapt(
+                _header_float(headers, "x-ratelimit-limit-tokens"),
+                _header_float(headers, "x-ratelimit-remaining-tokens"),
+            )
+            if status == 429:
+                self.rate_limited += 1
+                pause = _header_float(headers, "retry-after") or max(
+                    parse_reset(headers.get("x-ratelimit-reset-requests")) or 0.0,
+                    parse_reset(headers.get("x-ratelimit-reset-tokens")) or 0.0,
+                ) or DEFAULT_PAUSE_S
+                limits.paused_until = max(limits.paused_until, self.clock() + pause)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            out: Dict[str, float] = {"rate_limited": self.rate_limited}
+            for name in PRIORITIES:
+                out[f"queued_{name}"] = self.queued[name]
+                out[f"granted_{name}"] = self.granted[name]
+                out[f"throttled_{name}"] = self.throttled[name]
+                out[f"avg_wait_ms_{name}"] = round(self.wait_ms[name] / self.granted[name], 2) if self.granted[name] else 0.0
+                out[f"max_wait_ms_{name}"] = round(self.max_wait_ms[name], 2)
+            for model, limits in self._models.items():
+                out[f"rpm_limit:{model}"] = limits.requests.capacity
+                out[f"tpm_limit:{model}"] = limits.tokens.capacity
+            return out
+
+
+# ========================================
+# Enganche con httpx
+# ========================================
+
+def _request_info(request: Any) -> Optional[Tuple[str, int]]:
+    try:
+        body = request.content
+    except Exception:   # cuerpo en streaming (no lo usan chat ni embeddings)
+        return None
+    return estimate_request(request.url.path, body)
+
+
+def event_hooks(sched: "OutboundScheduler") -> Dict[str, list]:
+    """Hooks para httpx.Client (el hilo espera su turno antes de enviar)."""
+    def on_request(request):
+        info = _request_info(request)
+        if info is not None:
+            request.extensions["zoltar_model"] = info[0]
+            sched.acquire(*info)
+
+    def on_response(response):
+        model = response.request.extensions.get("zoltar_model")
+        if model is not None:
+            sched.observe_response(model, response.status_code, response.headers)
+
+    return {"request": [on_request], "response": [on_response]}
+
+
+def async_event_hooks(sched: "OutboundScheduler") -> Dict[str, list]:
+    """Hooks para httpx.AsyncClient."""
+    async def on_request(request):
+        info = _request_info(request)
+        if info is not None:
+            request.extensions["zoltar_model"] = info[0]
+            await sched.aacquire(*info)
+
+    async def on_response(response):
+        model = response.request.extensions.get("zoltar_model")
+        if model is not None:
+            sched.observe_response(model, response.status_code, response.headers)
+
+    return {"request": [on_request], "response": [on_response]}
+
+
+def http_client_kwargs(asynchronous: bool = False) -> Dict[str, Any]:
+    """event_hooks para pasar a httpx.Client / AsyncClient ({} si el planificador está desactivado)."""
+    if not SCHEDULER_ENABLED:
+        return {}
+    return {"event_hooks": async_event_hooks(scheduler) if asynchronous else event_hooks(scheduler)}
+
+
+_shared_clients: Optional[Tuple[Any, Any]] = None
+_shared_lock = threading.Lock()
+
+
+def scheduled_http_clients() -> Tuple[Any, Any]:
+    """
+    (httpx.Client, httpx.AsyncClient) del proceso con el planificador
+    enganchado, para los clientes de OpenAI construidos fuera del registro
+    (ingesta, scripts). La app usa los del registro (backend/resources.py).
+    """
+    global _shared_clients
+    if _shared_clients is None:
+        with _shared_lock:
+            if _shared_clients is None:
+                import httpx
+
+                from backend.config import HTTP_TIMEOUT
+
+                _shared_clients = (
+                    httpx.Client(timeout=HTTP_TIMEOUT, **http_client_kwargs()),
+                    httpx.AsyncClient(timeout=HTTP_TIMEOUT, **http_client_kwargs(asynchronous=True)),
+                )
+    return _shared_clients
+
+
+# Instancia del proceso
+scheduler = OutboundScheduler()
@@ -0,0 +1,361 @@
+# backend/sessions.py
+"""
+Sesiones de conversación en el servidor (session_id en /api/teacher y
+/api/answer con rag=true).
+
+En lugar de reenviar el historial completo en cada request, el cliente manda
+un session_id (cualquier id opaco, p. ej. un UUID) y el servidor guarda:
+- los últimos SESSION_RECENT_TURNS turnos literales (pregunta + respuesta,
+  cada uno recortado a SESSION_TURN_MAX_TOKENS),
+- un resumen acumulado de los anteriores (≤ SESSION_SUMMARY_MAX_TOKENS), que
+  se actualiza en segundo plano cuando un turno sale de la ventana.
+
+Así el historial que llega al prompt tiene un tamaño acotado por mucho que
+dure la conversación. Con historial previo, además, la pregunta se reescribe
+como consulta autónoma para la recuperación ("¿y en primaria?" -> "uso de
+ChatGPT para evaluar en educación primaria"); el prompt de generación sigue
+usando la pregunta original.
+
+Almacén: LRU en memoria + SQLite (SESSION_DB_PATH) para sobrevivir a
+reinicios. Con varios workers (CACHE_BACKEND distinto de "local") cada
+lectura va a SQLite, que es lo que comparten. Las sesiones caducadas se
+borran del fichero cada CACHE_PURGE_INTERVAL_S.
+
+Los cambios van por update(), que relee y escribe la sesión en una sola
+transacción: dos turnos a la vez sobre el mismo session_id (o un turno y el
+resumen en segundo plano) no se pisan. Desde el event loop se usan las
+variantes a* (SQLite en un hilo).
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+from backend.config import (
+    CACHE_BACKEND,
+    QUERY_REWRITE_ENABLED,
+    SESSION_DB_PATH,
+    SESSION_MEMORY_ITEMS,
+    SESSION_RECENT_TURNS,
+    SESSION_SUMMARY_MAX_TOKENS,
+    SESSION_TTL_S,
+    SESSION_TURN_MAX_TOKENS,
+)
+from backend.context_packer import truncate_to_tokens
+from backend.scheduler import priority
+from backend.rag_pipeline import (
+    _timed,
+    achatbot_teacher,
+    acomplete,
+    astream_chatbot_teacher,
+)
+
+REWRITE_PROMPT = (
+    "Reescribe la última pregunta del estudiante como una consulta de búsqueda autónoma, "
+    "en español, que se entienda sin la conversación (resuelve pronombres y referencias "
+    "como «eso», «y en primaria?», «el autor anterior»). Si ya es autónoma, devuélvela igual. "
+    "Responde solo con la consulta, sin comillas ni explicaciones."
+)
+
+SUMMARY_PROMPT = (
+    "Mantienes el resumen de una conversación entre un estudiante y un oráculo docente sobre "
+    "IA en educación. Integra los turnos nuevos en el resumen actual: temas tratados, "
+    "conclusiones, autores o fuentes citadas y lo que el estudiante quiere lograr. "
+    "Máximo {words} palabras, en prosa, sin saludos. Responde solo con el resumen."
+)
+
+
+@dataclass
+class Session:
+    id: str
+    summary: str = ""
+    # Turnos {"q", "a"} del más antiguo al más reciente
+    turns: List[Dict[str, str]] = field(default_factory=list)
+    # Salieron de la ventana y esperan a entrar en el resumen
+    pending: List[Dict[str, str]] = field(default_factory=list)
+    updated_at: float = 0.0
+
+    @property
+    def empty(self) -> bool:
+        return not (self.summary or self.turns or self.pending)
+
+
+def render_history(session: Session, max_turns: Optional[int] = None) -> str:
+    """Historial para el prompt: resumen + turnos pendientes de resumir + recientes."""
+    turns = session.pending + session.turns
+    if max_turns is not None:
+        turns = turns[-max_turns:] if max_turns else []
+    parts = [f"Resumen de la conversación anterior: {session.summary}"] if session.summary else []
+    parts.extend(f"Estudiante: {t['q']}\nOráculo: {t['a']}" for t in turns)
+    return "\n\n".join(parts)
+
+
+# ========================================
+# Almacén (LRU + SQLite)
+# ========================================
+
+class SessionStore:
+    """session_id -> Session, thread-safe, con caducidad por inactividad."""
+
+    def __init__(
+        self,
+        path: Path = SESSION_DB_PATH,
+        memory_items: int = SESSION_MEMORY_ITEMS,
+        ttl_s: float = SESSION_TTL_S,
+        shared: bool = CACHE_BACKEND != "local",
+    ):
+        self.path = Path(path)
+        self.memory_items = memory_items
+        self.ttl_s = ttl_s
+        self.shared = shared
+        self._memory: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """Se abre en el primer uso. Llamar con el lock."""
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._connection = conn
+        return self._connection
+
+    def _remember(self, session: Session) -> None:
+        self._memory[session.id] = session
+        self._memory.move_to_end(session.id)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _load(self, session_id: str) -> Session:
+        """Llamar con el lock."""
+        now = time.time()
+        session = None if self.shared else self._memory.get(session_id)
+        if session is None:
+            row = self._conn.execute("SELECT data FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            session = Session(**json.loads(row[0])) if row else None
+        if session is None or now - session.updated_at > self.ttl_s:
+            session = Session(id=session_id, updated_at=now)
+        self._remember(session)
+        return session
+
+    def _write(self, session: Session) -> None:
+        """Llamar con el lock; el commit lo hace quien llama."""
+        session.updated_at = time.time()
+        self._remember(session)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sessions (id, data, updated_at) VALUES (?, ?, ?)",
+            (session.id, json.dumps(asdict(session), ensure_ascii=False), session.updated_at),
+        )
+
+    def get(self, session_id: str) -> Session:
+        """Sesión existente o una nueva vacía (si no existe o caducó)."""
+        with self._lock:
+            return self._load(session_id)
+
+    def save(self, session: Session) -> None:
+        with self._lock:
+            self._write(session)
+            self._conn.commit()
+
+    def update(self, session_id: str, change: Callable[[Session], None]) -> Session:
+        """
+        Lee la sesión, le aplica change() y la guarda de forma atómica: con
+        el lock dentro del proceso y, con varios workers, en una transacción
+        BEGIN IMMEDIATE (otro worker espera en vez de pisar el cambio).
+        """
+        with self._lock:
+            conn = self._conn
+            if self.shared:
+                conn.execute("BEGIN IMMEDIATE")
+            try:
+                session = self._load(session_id)
+                change(session)
+                self._write(session)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                self._memory.pop(session_id, None)   # pudo quedar a medio cambiar
+                raise
+            return session
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._memory.pop(session_id, None)
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._conn.commit()
+
+    # Variantes para el event loop: la E/S de SQLite va a un hilo
+
+    async def aget(self, session_id: str) -> Session:
+        return await asyncio.to_thread(self.get, session_id)
+
+    async def aupdate(self, session_id: str, change: Callable[[Session], None]) -> Session:
+        return await asyncio.to_thread(self.update, session_id, change)
+
+    async def adelete(self, session_id: str) -> None:
+        await asyncio.to_thread(self.delete, session_id)
+
+    def purge_expired(self) -> int:
+        """Borra las sesiones caducadas (la app lo llama periódicamente, ver backend/app.py)."""
+        with self._lock:
+            if self._connection is None and not self.path.exists():
+                return 0   # nadie ha usado sesiones: no crear el fichero solo para purgarlo
+            cur = self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl_s,))
+            self._conn.commit()
+        return cur.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        return {"memory_items": len(self._memory)}
+
+
+# Instancia del proceso
+store = SessionStore()
+
+
+# ========================================
+# Turnos y resumen en segundo plano
+# ========================================
+
+_summarizing: Set[str] = set()
+_background: Set["asyncio.Task"] = set()
+
+
+async def arecord_turn(session_id: str, question: str, answer: str) -> None:
+    """
+    Añade el turno a la sesión. Los que salen de la ventana pasan a pending
+    y se programa su resumen (sin esperar: la respuesta ya se envió).
+    """
+    if not answer:
+        return
+    turn = {
+        "q": truncate_to_tokens(question.strip(), SESSION_TURN_MAX_TOKENS),
+        "a": truncate_to_tokens(answer.strip(), SESSION_TURN_MAX_TOKENS),
+    }
+
+    def append(session: Session) -> None:
+        session.turns.append(turn)
+        overflow = len(session.turns) - max(0, SESSION_RECENT_TURNS)
+        if overflow > 0:
+            session.pending.extend(session.turns[:overflow])
+            del session.turns[:overflow]
+        # Si el resumen lleva tiempo fallando, no se deja crecer el historial
+        if len(session.pending) > max(1, SESSION_RECENT_TURNS):
+            del session.pending[:len(session.pending) - max(1, SESSION_RECENT_TURNS)]
+
+    session = await store.aupdate(session_id, append)
+
+    if session.pending and session_id not in _summarizing:
+        _summarizing.add(session_id)
+        task = asyncio.get_running_loop().create_task(_afold_pending(session_id))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+
+
+async def _afold_pending(session_id: str) -> None:
+    """Integra los turnos pendientes en el resumen con una llamada al modelo."""
+    try:
+        while True:
+            session = await store.aget(session_id)
+            batch = list(session.pending)
+            if not batch:
+                return
+            new_turns = "\n\n".join(f"Estudiante: {t['q']}\nOráculo: {t['a']}" for t in batch)
+            messages = [
+                {"role": "system", "content": SUMMARY_PROMPT.format(words=int(SESSION_SUMMARY_MAX_TOKENS * 0.6))},
+                {"role": "user", "content": f"Resumen actual:\n{session.summary or '(vacío)'}\n\nTurnos nuevos:\n{new_turns}"},
+            ]
+            with priority("bulk"):   # en segundo plano: no compite con las requests en vivo
+                reply = await acomplete(messages)
+            summary = reply.text.strip()
+            if not reply.ok or not summary:
+                return   # se reintenta en el siguiente turno
+
+            def fold(session: Session) -> None:
+                session.summary = truncate_to_tokens(summary, SESSION_SUMMARY_MAX_TOKENS)
+                # Solo se quitan los turnos resumidos (pudieron llegar otros mientras tanto)
+                session.pending = [t for t in session.pending if t not in batch]
+
+            await store.aupdate(session_id, fold)
+    except Exception as e:
+        print(f"[sessions] ⚠️ No se pudo resumir la sesión {session_id}: {e}")
+    finally:
+        _summarizing.discard(session_id)
+
+
+async def adrain() -> None:
+    """Espera a los resúmenes en curso (al apagar la app)."""
+    if _background:
+        await asyncio.gather(*list(_background), return_exceptions=True)
+
+
+# ========================================
+# Reescritura de la consulta
+# ========================================
+
+async def arewrite_query(session: Session, question: str) -> str:
+    """
+    Consulta autónoma para embeddings/BM25. Sin historial (o si el modelo
+    falla o divaga) se usa la pregunta tal cual.
+    """
+    if not QUERY_REWRITE_ENABLED or session.empty:
+        return question
+    messages = [
+        {"role": "system", "content": REWRITE_PROMPT},
+        {"role": "user", "content": f"Conversación:\n{render_history(session, max_turns=2)}\n\nÚltima pregunta: {question}"},
+    ]
+    reply = await acomplete(messages)
+    rewritten = reply.text.strip().strip('"«»')
+    if not reply.ok or not rewritten or len(rewritten) > 3 * len(question) + 200:
+        return question
+    return rewritten
+
+
+async def aprepare_turn(session_id: str, question: str, timings: Dict[str, float]) -> Tuple[str, str]:
+    """(historial para el prompt, consulta para la recuperación) de este turno."""
+    session = await store.aget(session_id)
+    with _timed(timings, "rewrite"):
+        retrieval_query = await arewrite_query(session, question)
+    if retrieval_query != question:
+        print(f"[sessions] 🔎 {question!r} -> {retrieval_query!r}")
+    return render_history(session), retrieval_query
+
+
+# ========================================
+# Pipelines docentes con sesión
+# ========================================
+
+async def achatbot_teacher_session(session_id: str, question: str, k: int = 5) -> Dict[str, Any]:
+    """achatbot_teacher con historial del servidor; guarda el turno al terminar."""
+    timings: Dict[str, float] = {}
+    history, retrieval_query = await aprepare_turn(session_id, question, timings)
+    result = await achatbot_teacher(question=question, history=history, k=k, retrieval_query=retrieval_query)
+    if not result.get("error"):   # un fallo del modelo no entra en el historial
+        await arecord_turn(session_id, question, result.get("text", ""))
+    return {**result, "timings": {**result.get("timings", {}), **timings}}
+
+
+async def astream_chatbot_teacher_session(session_id: str, question: str, k: int = 5) -> AsyncIterator[Dict]:
+    """Versión en streaming: el turno se guarda con el texto completo al llegar "done"."""
+    timings: Dict[str, float] = {}
+    history, retrieval_query = await aprepare_turn(session_id, question, timings)
+    parts: List[str] = []
+    async for event in astream_chatbot_teacher(question=question, history=history, k=k, retrieval_query=retrieval_query):
+        if event["event"] == "token":
+            parts.append(event["data"]["text"])
+        elif event["event"] == "done":
+            await arecord_turn(session_id, question, "".join(parts))
+            event = {"event": "done", "data": {**event["data"], "timings": {**event["data"]["timings"], **timings}}}
+        yield event
@@ -0,0 +1,179 @@
+# backend/shared_store.py
+"""
+Almacén clave -> bytes compartido entre workers (CACHE_BACKEND).
+
+Con `uvicorn --workers N` cada worker es un proceso con su propia memoria:
+las cachés en memoria (LRU) no se ven entre sí. Este módulo da un segundo
+nivel común a todos:
+
+- "local":  sin almacén compartido (un solo worker, comportamiento anterior)
+- "sqlite": fichero SQLite en WAL (SHARED_CACHE_PATH); sirve para varios
+            workers en la misma máquina/disco
+- "redis":  REDIS_URL; sirve además entre máquinas (requiere `redis`)
+
+Las claves se prefijan con un namespace ("answers", "embeddings", ...).
+Los fallos del almacén nunca rompen una request: quien lo usa los trata
+como un fallo de caché.
+
+get() ignora las filas caducadas pero no las borra: la app llama a
+purge_expired() periódicamente (apurge_periodically, ver backend/app.py)
+para que los ficheros SQLite no crezcan sin límite.
+"""
+
+import asyncio
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from backend.config import CACHE_BACKEND, REDIS_URL, SHARED_CACHE_PATH
+
+
+class SqliteStore:
+    """Tabla kv(key, value, expires_at) en un fichero SQLite compartido."""
+
+    def __init__(self, path: Path = SHARED_CACHE_PATH, namespace: str = "default"):
+        self.path = Path(path)
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """Se abre en el primer uso (importar la app no toca el disco). Llamar con el lock."""
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # timeout: espera (en vez de fallar) si otro worker tiene el lock de escritura
+            conn = sqlite3.connect(str(self.path), timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS kv (
+                    key        TEXT PRIMARY KEY,
+                    value      BLOB NOT NULL,
+                    expires_at REAL
+                )
+                """
+            )
+            conn.commit()
+            self._connection = conn
+        return self._connection
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key])[0]
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        found: Dict[str, bytes] = {}
+        now = time.time()
+        unique = list(dict.fromkeys(self._key(k) for k in keys))
+        with self._lock:
+            for i in range(0, len(unique), 500):
+                batch = unique[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM kv WHERE key IN ({placeholders}) "
+                    f"AND (expires_at IS NULL OR expires_at > ?)",
+                    (*batch, now),
+                ).fetchall()
+                found.update((k, bytes(v)) for k, v in rows)
+        return [found.get(self._key(k)) for k in keys]
+
+    def set(self, key: str, value: bytes, ttl_s: Optional[float] = None) -> None:
+        self.set_many([(key, value)], ttl_s)
+
+    def set_many(self, items: Sequence[Tuple[str, bytes]], ttl_s: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl_s if ttl_s else None
+        rows = [(self._key(k), v, expires_at) for k, v in items]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+            self._conn.commit()
+        return cur.rowcount
+
+
+def _expire_s(ttl_s: Optional[float]) -> Optional[int]:
+    """EX de Redis en segundos enteros (mínimo 1); None = sin caducidad."""
+    return max(1, int(ttl_s)) if ttl_s else None
+
+
+class RedisStore:
+    """Mismo contrato que SqliteStore sobre Redis (GET/MGET, SET con EX)."""
+
+    def __init__(self, url: str = REDIS_URL, namespace: str = "default"):
+        self.url = url
+        self.namespace = namespace
+        self._redis = None
+
+    @property
+    def _client(self):
+        if self._redis is None:
+            import redis
+
+            self._redis = redis.Redis.from_url(self.url, socket_timeout=1.0, socket_connect_timeout=1.0)
+        return self._redis
+
+    def _key(self, key: str) -> str:
+        return f"zoltar:{self.namespace}:{key}"
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._client.get(self._key(key))
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        if not keys:
+            return []
+        return self._client.mget([self._key(k) for k in keys])
+
+    def set(self, key: str, value: bytes, ttl_s: Optional[float] = None) -> None:
+        self._client.set(self._key(key), value, ex=_expire_s(ttl_s))
+
+    def set_many(self, items: Sequence[Tuple[str, bytes]], ttl_s: Optional[float] = None) -> None:
+        pipe = self._client.pipeline(transaction=False)
+        for key, value in items:
+            pipe.set(self._key(key), value, ex=_expire_s(ttl_s))
+        pipe.execute()
+
+    def purge_expired(self) -> int:
+        return 0   # Redis expira las claves solo
+
+
+def open_shared_store(namespace: str, backend: Optional[str] = None):
+    """
+    Almacén compartido según CACHE_BACKEND, o None con "local". La conexión
+    se abre en el primer uso; si entonces falla, quien lo usa lo cuenta como
+    fallo de caché y sigue con la memoria del proceso.
+    """
+    backend = (backend or CACHE_BACKEND).lower()
+    if backend == "local":
+        return None
+    if backend == "sqlite":
+        return SqliteStore(namespace=namespace)
+    if backend == "redis":
+        return RedisStore(namespace=namespace)
+    raise ValueError(f"CACHE_BACKEND desconocido: {backend!r} (opciones: local, sqlite, redis)")
+
+
+async def apurge_periodically(purgers: Dict[str, Callable[[], int]], interval_s: float) -> None:
+    """
+    Cada interval_s llama a cada purge_expired() (en un hilo: son DELETE en
+    SQLite). Los fallos se registran y se reintenta en la siguiente vuelta.
+    Corre hasta que se cancela (al apagar la app).
+    """
+    while True:
+        await asyncio.sleep(interval_s)
+        for name, purge in purgers.items():
+            try:
+                removed = await asyncio.to_thread(purge)
+            except Exception as e:
+                print(f"[shared_store] ⚠️ No se pudo purgar {name}: {e}")
+                continue
+            if removed:
+                print(f"[shared_store] 🧹 {name}: {removed} entradas caducadas borradas")
@@ -0,0 +1,180 @@
+# backend/singleflight.py
+"""
+Coalescencia de requests idénticas en vuelo ("single-flight").
+
+Cuando muchas personas envían la misma pregunta a la vez (la pregunta del
+proyector), solo la primera lanza recuperación + LLM; el resto espera ese
+mismo cálculo y recibe su resultado.
+
+- SingleFlight.do(key, factory): para respuestas completas.
+- SingleFlight.stream(key, factory): para pipelines en streaming; quien se
+  une tarde recibe primero los eventos ya producidos (replay) y después
+  sigue en directo.
+
+El cálculo compartido corre en su propia tarea: si un cliente se desconecta
+o agota su plazo, los demás siguen esperando. Solo se cancela cuando ya no
+queda nadie esperando.
+"""
+
+import asyncio
+import hashlib
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from backend.answer_cache import normalize_question
+
+T = TypeVar("T")
+
+
+def flight_key(endpoint: str, text: str, **parts: Any) -> str:
+    """Clave normalizada: (endpoint, texto normalizado, modo, historial, k, ...)."""
+    payload = {"endpoint": endpoint, "text": normalize_question(text), **parts}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class _Call:
+    """Cálculo compartido de do(): una tarea y el número de esperas activas."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _Broadcast:
+    """
+    Un pipeline en streaming compartido: una tarea productora guarda cada
+    evento en self.events y despierta a los suscriptores.
+    """
+
+    def __init__(self, source: AsyncIterator[Dict]):
+        self.events: List[Dict] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Condition()
+        self.task = asyncio.create_task(self._produce(source))
+
+    async def _produce(self, source: AsyncIterator[Dict]) -> None:
+        try:
+            async for event in source:
+                async with self._changed:
+                    self.events.append(event)
+                    self._changed.notify_all()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            await source.aclose()
+            async with self._changed:
+                self.done = True
+                self._changed.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[Dict]:
+        """Replay de lo ya emitido y después eventos en directo."""
+        i = 0
+        while True:
+            async with self._changed:
+                while i >= len(self.events) and not self.done:
+                    await self._changed.wait()
+                pending = self.events[i:]
+                finished = self.done
+            for event in pending:
+                yield event
+            i += len(pending)
+            if finished and i >= len(self.events):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class SingleFlight:
+    """Grupo de coalescencia del proceso (un event loop)."""
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _Broadcast] = {}
+        self.counters = {
+            "leaders": 0,
+            "collapsed": 0,
+            "stream_leaders": 0,
+            "stream_collapsed": 0,
+        }
+
+    # ========================================
+    # Respuestas completas
+    # ========================================
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[T]]) -> T:
+        """
+        Ejecuta factory() una sola vez por clave mientras esté en vuelo.
+        Todos los que esperan reciben el mismo resultado (o la misma excepción).
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.create_task(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _t, k=key, c=call: self._forget(self._calls, k, c))
+            self.counters["leaders"] += 1
+        else:
+            self.counters["collapsed"] += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+
+    # ========================================
+    # Streaming
+    # ========================================
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[Dict]]) -> AsyncIterator[Dict]:
+        """
+        Comparte un pipeline en streaming. Los que llegan tarde reciben los
+        eventos ya emitidos (tokens incluidos) y continúan en directo.
+        """
+        broadcast = self._streams.get(key)
+        if broadcast is None or broadcast.task.done():
+            broadcast = _Broadcast(factory())
+            self._streams[key] = broadcast
+            broadcast.task.add_done_callback(lambda _t, k=key, b=broadcast: self._forget(self._streams, k, b))
+            self.counters["stream_leaders"] += 1
+        else:
+            self.counters["stream_collapsed"] += 1
+
+        broadcast.subscribers += 1
+        try:
+            async for event in broadcast.subscribe():
+                yield event
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.task.done():
+                broadcast.task.cancel()
+
+    # ========================================
+    # Utilidades
+    # ========================================
+
+    @staticmethod
+    def _forget(table: Dict[str, Any], key: str, value: Any) -> None:
+        # Solo si sigue siendo la misma entrada (pudo reemplazarse)
+        if table.get(key) is value:
+            del table[key]
+
+    def stats(self) -> Dict[str, Any]:
+        leaders = self.counters["leaders"] + self.counters["stream_leaders"]
+        collapsed = self.counters["collapsed"] + self.counters["stream_collapsed"]
+        total = leaders + collapsed
+        return {
+            **self.counters,
+            "in_flight": len(self._calls) + len(self._streams),
+            "collapse_rate": round(collapsed / total, 4) if total else 0.0,
+        }
+
+
+# Grupo del proceso
+flights = SingleFlight()
@@ -0,0 +1,58 @@
+# backend/sse.py
+"""
+Utilidades para responder en streaming con Server-Sent Events (SSE).
+
+Los pipelines de backend/rag_pipeline.py (astream_*) producen eventos
+{"event": ..., "data": {...}}; aquí se serializan al formato text/event-stream:
+
+    event: token
+    data: {"text": "Hola"}
+
+Si el pipeline falla o se agota el plazo, se emite un evento "error" y se
+cierra el stream (el status HTTP ya fue enviado como 200). Si el modelo no
+llegó a responder, el evento lleva el error estructurado de
+backend/llm_client.py ({"detail", "error": {"kind", ...}}).
+"""
+
+import asyncio
+import json
+from typing import AsyncIterator, Dict
+
+from fastapi.responses import StreamingResponse
+
+from backend.llm_client import LLMUnavailable
+from backend.rag_pipeline import LLM_UNAVAILABLE_TEXT, stream_with_limits
+
+
+def format_sse(event: str, data: Dict) -> str:
+    """Serializa un evento SSE (JSON en una sola línea de data)."""
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+async def _sse_lines(events: AsyncIterator[Dict], tag: str) -> AsyncIterator[str]:
+    try:
+        async for event in stream_with_limits(events):
+            yield format_sse(event["event"], event["data"])
+    except LLMUnavailable as e:
+        yield format_sse("error", {"detail": LLM_UNAVAILABLE_TEXT, "error": e.result.error_info()})
+    except asyncio.TimeoutError:
+        yield format_sse("error", {"detail": "Tiempo de espera agotado"})
+    except Exception as e:
+        print(f"[{tag}] Error interno en streaming: {e}")
+        yield format_sse("error", {"detail": "Error en generación"})
+
+
+def sse_response(events: AsyncIterator[Dict], tag: str = "stream") -> StreamingResponse:
+    """
+    Envuelve un pipeline en streaming en una StreamingResponse SSE.
+    - tag: prefijo para los logs de error.
+    """
+    return StreamingResponse(
+        _sse_lines(events, tag),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",   # evita buffering en proxies (nginx/Render)
+        },
+    )
@@ -0,0 +1,98 @@
+# backend/tests/test_answer_cache.py
+import asyncio
+import json
+import time
+
+from backend import answer_cache as ac
+from backend.answer_cache import AnswerCache
+from backend.manifest import save_manifest
+
+
+def _use_index_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(ac, "manifest_path", lambda: tmp_path / "manifest.json")
+    monkeypatch.setattr(ac, "pointer_path", lambda: tmp_path / "current.json")
+    monkeypatch.setattr(ac, "load_manifest", lambda: json.loads((tmp_path / "manifest.json").read_text()))
+
+
+def test_exact_and_semantic_hits(monkeypatch, tmp_path):
+    _use_index_dir(monkeypatch, tmp_path)
+    cache = AnswerCache(max_items=10, ttl_s=60, semantic_distance=0.05)
+    scope = {"mode": "teacher", "k": 5}
+
+    cache.put("¿Qué es UbD?", scope, {"text": "respuesta", "sources": ["A (p.1)"]}, embedding=[1.0, 0.0])
+
+    assert cache.get("qué es  ubd", scope)["cache"] == "exact"
+    assert cache.get("otra forma de preguntar", scope, embedding=[0.99, 0.05])["cache"] == "semantic"
+    assert cache.get("algo distinto", scope, embedding=[0.0, 1.0]) is None
+    assert cache.get("¿Qué es UbD?", {"mode": "teacher", "k": 6}) is None
+
+
+def test_new_index_version_invalidates(monkeypatch, tmp_path):
+    _use_index_dir(monkeypatch, tmp_path)
+    save_manifest({"index_version": "v1", "files": {}}, tmp_path)
+    cache = AnswerCache(max_items=10, ttl_s=60)
+    scope = {"mode": "rag", "k": 5}
+
+    cache.put("pregunta", scope, {"text": "respuesta"})
+    assert cache.get("pregunta", scope) is not None
+
+    save_manifest({"index_version": "v2", "files": {}}, tmp_path)
+    # Fuerza a releer el manifiesto aunque el mtime tenga poca resolución
+    cache._manifest_mtime = -1
+    assert cache.get("pregunta", scope) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_lru_eviction():
+    cache = AnswerCache(max_items=2, ttl_s=60)
+    for q in ("a", "b", "c"):
+        cache.put(q, {}, {"text": q})
+    assert cache.get("a", {}) is None
+    assert cache.get("c", {})["text"] == "c"
+    assert cache.stats()["evictions"] == 1
+
+
+class SlowStore:
+    """Almacén compartido (tipo Redis) que tarda en responder."""
+
+    def __init__(self, delay_s):
+        self.delay_s = delay_s
+        self.data = {}
+
+    def get(self, key):
+        time.sleep(self.delay_s)
+        return self.data.get(key)
+
+    def set(self, key, value, ttl_s=None):
+        time.sleep(self.delay_s)
+        self.data[key] = value
+
+
+def test_async_api_keeps_shared_store_off_the_event_loop(monkeypatch, tmp_path):
+    _use_index_dir(monkeypatch, tmp_path)
+    store = SlowStore(delay_s=0.2)
+    cache = AnswerCache(max_items=10, ttl_s=60, store=store)
+    scope = {"mode": "rag", "k": 5}
+
+    async def main():
+        ticks = []
+
+        async def ticker():
+            for _ in range(10):
+                ticks.append(time.perf_counter())
+                await asyncio.sleep(0.02)
+
+        await asyncio.gather(ticker(), cache.aput("pregunta", scope, {"text": "respuesta"}))
+        put_ticks, ticks[:] = list(ticks), []
+        missed = await asyncio.gather(ticker(), cache.aget("otra", scope))
+        return put_ticks, ticks, missed[1]
+
+    put_ticks, get_ticks, missed = asyncio.run(main())
+    # El loop siguió atendiendo mientras el almacén respondía (0,2 s por llamada)
+    for ticks in (put_ticks, get_ticks):
+        assert max(b - a for a, b in zip(ticks, ticks[1:])) < 0.1
+    assert missed is None and store.data
+
+    # Otro worker (memoria vacía) encuentra la respuesta en el almacén compartido
+    other = AnswerCache(max_items=10, ttl_s=60, store=store)
+    assert asyncio.run(other.aget("pregunta", scope))["text"] == "respuesta"
@@ -0,0 +1,36 @@
+# backend/tests/test_bench.py
+import hashlib
+
+from pypdf import PdfReader
+
+from backend.bench.corpus import generate_corpus
+from backend.bench.run import compare
+
+
+def test_corpus_is_deterministic_and_readable(tmp_path):
+    first = generate_corpus(tmp_path / "a", n_docs=2, pages_per_doc=3, seed=7)
+    second = generate_corpus(tmp_path / "b", n_docs=2, pages_per_doc=3, seed=7)
+
+    digest = lambda p: hashlib.sha256(p.read_bytes()).hexdigest()
+    assert [digest(p) for p in first] == [digest(p) for p in second]
+
+    reader = PdfReader(str(first[0]))
+    assert len(reader.pages) == 3
+    assert reader.metadata.title == "Documento 0 sobre convivencia"
+    assert "convivencia" in reader.pages[0].extract_text()
+
+
+def test_compare_is_direction_aware():
+    baseline = {"results": {"docs_10": {
+        "ingest": {"pages_per_s": 100.0, "pages": 80},
+        "teacher": {"c8": {"p95_ms": 200.0, "rps": 40.0}},
+    }}}
+    current = {"results": {"docs_10": {
+        "ingest": {"pages_per_s": 80.0, "pages": 80},        # más lento: regresión
+        "teacher": {"c8": {"p95_ms": 150.0, "rps": 44.0}},   # mejor en ambos
+    }}}
+
+    rows, regressions = compare(current, baseline, threshold=0.1)
+
+    assert {r["metric"] for r in regressions} == {"docs_10.ingest.pages_per_s"}
+    assert "docs_10.ingest.pages" not in {r["metric"] for r in rows}
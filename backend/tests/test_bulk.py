@@ -0,0 +1,98 @@
+# backend/tests/test_bulk.py
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+
+from backend import bulk
+from backend.bulk import load_done_ids, parse_items, repair_tail, run_batch
+
+
+def test_parse_items_expands_modes():
+    lines = ['{"id": "q1", "text": "¿Qué es UbD?"}', "", '{"question": "chatbots", "top_k": 3}']
+    items = parse_items(lines, modes=["baseline", "teacher"])
+
+    assert [i.id for i in items] == ["q1:baseline", "q1:teacher", "3:baseline", "3:teacher"]
+    assert items[1].k == 6 and items[2].k == 3
+
+
+def test_parse_items_rejects_bad_lines():
+    with pytest.raises(ValueError, match="Línea 1"):
+        parse_items(['{"text": "x", "mode": "otro"}'])
+    with pytest.raises(ValueError, match="falta 'text'"):
+        parse_items(['{"id": 1}'])
+
+
+def test_resume_skips_only_successful_ids(tmp_path):
+    out = tmp_path / "r.jsonl"
+    out.write_text(
+        json.dumps({"id": "a", "status": "ok"}) + "\n"
+        + json.dumps({"id": "b", "status": "error"}) + "\n"
+        + '{"id": "c", "sta',   # línea a medias de una ejecución cortada
+        encoding="utf-8",
+    )
+    assert load_done_ids(out) == {"a"}
+    repair_tail(out)
+    with open(out, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"id": "c", "status": "ok"}) + "\n")
+    assert load_done_ids(out) == {"a", "c"}   # la línea nueva no queda pegada a la rota
+
+    # JSON completo al que solo le faltaba el salto de línea: se conserva
+    out.write_text(json.dumps({"id": "d", "status": "ok"}), encoding="utf-8")
+    repair_tail(out)
+    assert out.read_text(encoding="utf-8").endswith("}\n") and load_done_ids(out) == {"d"}
+
+
+def test_run_batch_embeds_once_and_limits_generation(monkeypatch):
+    embed_calls, in_flight, starts = [], [0], []
+    peak = [0]
+
+    async def aembed_documents(texts):
+        embed_calls.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+    async def arefresh_index_if_stale():
+        pass
+
+    async def agenerate_with_usage(messages):
+        starts.append(time.perf_counter())
+        in_flight[0] += 1
+        peak[0] = max(peak[0], in_flight[0])
+        await asyncio.sleep(0.05)
+        in_flight[0] -= 1
+        return "respuesta", {"input_tokens": 10, "output_tokens": 5, "total_tokens": 15}
+
+    def search_contexts_many(vectordb, questions, vectors, k, lexical_index=None):
+        return [[Document(page_content=f"pasaje de {q}", metadata={"source": "a.pdf", "page": 1})] for q in questions]
+
+    fake_registry = SimpleNamespace(
+        embeddings=SimpleNamespace(aembed_documents=aembed_documents),
+        arefresh_index_if_stale=arefresh_index_if_stale,
+        vectordb=object(), lexical_index=None, reranker=None,
+    )
+    monkeypatch.setattr(bulk, "registry", fake_registry)
+    monkeypatch.setattr(bulk, "agenerate_with_usage", agenerate_with_usage)
+    monkeypatch.setattr("backend.retrieve.search_contexts_many", search_contexts_many)
+
+    lines = [json.dumps({"id": f"q{i}", "text": f"pregunta {i % 3}"}) for i in range(6)]
+    items = parse_items(lines, modes=["engineered", "teacher"])
+
+    async def collect():
+        summary = {}
+        return [r async for r in run_batch(items, concurrency=2, rpm=1200, summary=summary)], summary
+
+    results, summary = asyncio.run(collect())
+
+    # Una sola llamada de embeddings con las preguntas distintas
+    assert embed_calls == [["pregunta 0", "pregunta 1", "pregunta 2"]]
+    assert summary["ok"] == len(items) == 12 and summary["total_tokens"] == 12 * 15
+    assert peak[0] <= 2
+    # rpm=1200: un inicio cada 50 ms (12 llamadas => al menos ~0,55 s entre la primera y la última)
+    assert max(starts) - min(starts) >= 10 * 0.05
+    for result in results:
+        assert result["status"] == "ok" and result["usage"]["total_tokens"] == 15
+        assert result["latency_ms"] >= result["timings"]["generate_ms"] >= 45
+        assert set(result["timings"]) == {"queue_ms", "generate_ms"}
@@ -0,0 +1,55 @@
+# backend/tests/test_context_packer.py
+import pytest
+from langchain_core.documents import Document
+
+from backend import context_packer as cp
+
+
+@pytest.fixture(autouse=True)
+def _char_estimate(monkeypatch):
+    # Conteo determinista sin depender de descargar el encoding de tiktoken
+    monkeypatch.setattr(cp, "get_encoder", lambda model=None: None)
+
+
+def _doc(text, page=1, index=0, doc_id="a.pdf"):
+    return Document(
+        page_content=text,
+        metadata={"doc_id": doc_id, "source": doc_id, "title": "T", "authors": "A", "page": page, "chunk_index": index},
+    )
+
+
+def test_adjacent_chunks_merge_without_overlap():
+    overlap = "el aprendizaje se diseña desde las metas"
+    first = "Primera parte del texto: " + overlap
+    second = overlap + " y luego se planifica la evaluación."
+    packed = cp.pack_contexts([_doc(second, index=4), _doc(first, index=3)], max_tokens=10_000)
+
+    assert packed.blocks == 1
+    assert packed.text.count(overlap) == 1
+    assert packed.text.index("Primera parte") < packed.text.index("luego se planifica")
+    assert packed.sources == ["T (p.1)"]
+
+
+def test_duplicates_dropped_and_later_blocks_still_fit():
+    long_text = "palabra " * 400
+    contexts = [
+        _doc("Bloque corto inicial.", page=1),
+        _doc(long_text, page=2),
+        _doc("Bloque corto inicial.", page=7, doc_id="copia.pdf"),
+        _doc("Otro bloque corto.", page=3),
+    ]
+    packed = cp.pack_contexts(contexts, max_tokens=120, max_tokens_per_block=1000)
+
+    assert packed.blocks == 2
+    assert packed.skipped == 1
+    assert "Otro bloque corto." in packed.text and "[2]" in packed.text
+    assert packed.tokens <= 120
+
+
+def test_cached_token_counts_only_with_same_tokenizer(monkeypatch):
+    doc = _doc("texto")
+    doc.metadata.update(n_tokens=999, tokenizer="otro")
+    assert cp._chunk_tokens(doc.page_content, doc.metadata, "gpt-4o-mini") == cp.count_tokens("texto")
+
+    monkeypatch.setattr(cp, "tokenizer_name", lambda model=None: "otro")
+    assert cp._chunk_tokens(doc.page_content, doc.metadata, "gpt-4o-mini") == 999
@@ -0,0 +1,92 @@
+# backend/tests/test_embedding_cache.py
+import asyncio
+import time
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from backend.embedding_cache import CachedEmbeddings, EmbeddingCache, text_hash
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    calls: int = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls += 1
+        return super().embed_query(text)
+
+
+def test_rebuild_of_same_texts_makes_no_calls(tmp_path):
+    inner = CountingEmbeddings(size=8)
+    cache = EmbeddingCache(path=tmp_path / "emb.sqlite3", memory_items=2)
+    emb = CachedEmbeddings(inner, provider="fake", model="m", cache=cache)
+
+    first = emb.embed_documents(["a", "b", "a", "c"])
+    assert inner.calls == 3  # "a" duplicado se embebe una sola vez
+
+    # Nueva instancia sobre el mismo fichero: los vectores vienen de SQLite
+    cache2 = EmbeddingCache(path=tmp_path / "emb.sqlite3", memory_items=2)
+    emb2 = CachedEmbeddings(inner, provider="fake", model="m", cache=cache2)
+    second = emb2.embed_documents(["a", "b", "a", "c"])
+
+    assert inner.calls == 3
+    assert second == first
+    assert emb2.embed_query("b") == first[1]
+
+
+def test_model_is_part_of_the_key(tmp_path):
+    inner = CountingEmbeddings(size=8)
+    cache = EmbeddingCache(path=tmp_path / "emb.sqlite3")
+    CachedEmbeddings(inner, provider="fake", model="m1", cache=cache).embed_query("hola")
+    CachedEmbeddings(inner, provider="fake", model="m2", cache=cache).embed_query("hola")
+    assert inner.calls == 2
+
+
+class SlowSharedStore:
+    """Almacén compartido (tipo Redis) que tarda en responder."""
+
+    def __init__(self, delay_s):
+        self.delay_s = delay_s
+        self.data = {}
+
+    def get_many(self, keys):
+        time.sleep(self.delay_s)
+        return [self.data.get(k) for k in keys]
+
+    def set_many(self, items):
+        time.sleep(self.delay_s)
+        self.data.update(items)
+
+
+def test_slow_shared_store_does_not_block_event_loop_or_lock(tmp_path):
+    shared = SlowSharedStore(delay_s=0.3)
+    cache = EmbeddingCache(path=tmp_path / "emb.sqlite3", shared=shared)
+    emb = CachedEmbeddings(CountingEmbeddings(size=8), provider="fake", model="m", cache=cache)
+    emb.embed_query("caliente")   # queda en memoria
+
+    async def main():
+        ticks = []
+
+        async def ticker():
+            for _ in range(10):
+                ticks.append(time.perf_counter())
+                await asyncio.sleep(0.02)
+
+        # Mientras una consulta espera a Redis, el loop sigue atendiendo y
+        # otro hilo lee de memoria sin esperar al lock
+        t0 = time.perf_counter()
+        slow = asyncio.create_task(emb.aembed_query("fría"))
+        await asyncio.sleep(0.05)
+        hot = time.perf_counter()
+        await asyncio.to_thread(cache.get_many, "fake", "m", [text_hash("caliente")])
+        hot = time.perf_counter() - hot
+        await asyncio.gather(ticker(), slow)
+        return ticks, hot, t0
+
+    ticks, hot, t0 = asyncio.run(main())
+    assert hot < 0.1
+    assert ticks[0] - t0 < 0.2   # el ticker arrancó antes de que Redis respondiera
+    assert shared.data   # el vector nuevo se escribió también en el almacén compartido
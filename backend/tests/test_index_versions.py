@@ -0,0 +1,113 @@
+# backend/tests/test_index_versions.py
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from backend import index_versions
+from backend.bench.corpus import generate_corpus
+from backend.index_versions import collect_garbage, current_paths, publish_version
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+
+# Ingesta con embeddings deterministas (sin API) en un DATA_DIR temporal
+INGEST_SCRIPT = """
+import json, os, sys
+from langchain_core.embeddings import DeterministicFakeEmbedding
+import backend.ingest as ing
+from backend.index_versions import current_version, list_versions
+
+ing.get_embeddings = lambda: DeterministicFakeEmbedding(size=16)
+if sys.argv[1] == "broken":
+    def broken(*args, **kwargs):
+        raise RuntimeError("validación fallida")
+    ing.validate_version = broken
+try:
+    ing.main(rebuild=sys.argv[1] == "rebuild")
+except RuntimeError:
+    pass
+print(json.dumps({"current": current_version(), "versions": list_versions()}))
+"""
+
+
+def _ingest(data_dir: Path, mode: str = "incremental") -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", INGEST_SCRIPT, mode], cwd=ROOT_DIR, capture_output=True, text=True, check=True,
+        env={"PATH": "", "PYTHONPATH": str(ROOT_DIR), "DATA_DIR": str(data_dir), "INGEST_WORKERS": "1",
+             "EXPORT_NUMPY_INDEX": "true", "OPENAI_API_KEY": "sk-test"},
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def test_collect_garbage_keeps_recent_and_pending(monkeypatch, tmp_path):
+    monkeypatch.setattr(index_versions, "CHROMA_DIR", tmp_path)
+    for version in ("v1", "v2", "v3", "v4"):
+        (tmp_path / "versions" / version).mkdir(parents=True)
+    assert collect_garbage(keep=2) == []   # sin versión publicada no se borra nada
+
+    publish_version("v3")
+    assert collect_garbage(keep=2) == ["v1"]
+    # v2 sigue para los workers que aún no cambiaron; v4 (en construcción) no se toca
+    assert index_versions.list_versions() == ["v2", "v3", "v4"]
+    assert current_paths().numpy_dir == tmp_path / "versions" / "v3" / "npindex"
+
+
+def test_collect_garbage_spares_versions_workers_still_hold(monkeypatch, tmp_path):
+    monkeypatch.setattr(index_versions, "CHROMA_DIR", tmp_path)
+    for version in ("v1", "v2", "v3", "v4"):
+        (tmp_path / "versions" / version).mkdir(parents=True)
+    publish_version("v4")
+
+    # Este proceso sirve v1 (worker inactivo); otro que murió dejó v2 registrada
+    index_versions.hold_version("v1")
+    stale = tmp_path / "leases" / "muerto.json"
+    stale.write_text(json.dumps({"version": "v2", "renewed_at": time.time() - 600}), encoding="utf-8")
+
+    assert collect_garbage(keep=2, lease_ttl_s=300) == ["v2"]
+    assert index_versions.list_versions() == ["v1", "v3", "v4"]
+    assert not stale.exists()
+
+    # Al cambiar de versión (o apagarse) deja de retener v1
+    index_versions.release_version()
+    assert collect_garbage(keep=2, lease_ttl_s=300) == ["v1"]
+
+
+def test_ingest_builds_new_version_and_keeps_serving_on_failure(tmp_path):
+    data_dir = tmp_path / "data"
+    docs = generate_corpus(data_dir / "docs", n_docs=3, pages_per_doc=2, seed=1)
+
+    first = _ingest(data_dir, "rebuild")
+    assert first["versions"] == [first["current"]]
+    live_files = sorted(p.name for p in (data_dir / "chroma" / "versions" / first["current"]).iterdir())
+    assert {"manifest.json", "bm25", "npindex", "chroma.sqlite3"} <= set(live_files)
+
+    docs[0].unlink()
+    second = _ingest(data_dir)
+    assert second["current"] > first["current"]
+    assert second["versions"] == [first["current"], second["current"]]
+    # La versión anterior no se modificó (se copió antes de borrar chunks)
+    assert sorted(p.name for p in (data_dir / "chroma" / "versions" / first["current"]).iterdir()) == live_files
+
+    generate_corpus(data_dir / "docs", n_docs=1, pages_per_doc=2, seed=2)
+    failed = _ingest(data_dir, "broken")
+    assert failed == second   # sigue publicada la misma versión y no queda la fallida en disco
+
+
+def test_identical_copies_keep_their_own_chunks(tmp_path):
+    data_dir = tmp_path / "data"
+    original = generate_corpus(data_dir / "docs", n_docs=1, pages_per_doc=2, seed=3)[0]
+    copy = data_dir / "docs" / "copias" / original.name
+    copy.parent.mkdir()
+    copy.write_bytes(original.read_bytes())
+
+    first = _ingest(data_dir, "rebuild")
+    manifest = json.loads((data_dir / "chroma" / "versions" / first["current"] / "manifest.json").read_text())
+    ids = [entry["chunk_ids"] for entry in manifest["files"].values()]
+    assert len(ids) == 2 and ids[0] and not set(ids[0]) & set(ids[1])
+
+    # Borrar la copia no se lleva los chunks del original: la validación
+    # (recuento de Chroma = ids del manifiesto) pasa y se publica
+    copy.unlink()
+    second = _ingest(data_dir)
+    assert second["current"] > first["current"]
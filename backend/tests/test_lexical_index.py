@@ -0,0 +1,30 @@
+# backend/tests/test_lexical_index.py
+from backend.lexical_index import build_lexical_index, load_lexical_index, tokenize
+from backend.retrieve import reciprocal_rank_fusion
+
+
+def test_tokenize_spanish():
+    assert tokenize("Evaluaciones y evaluación") == ["evaluacion", "evaluacion"]
+    assert tokenize("los alumnos, las alumnas") == ["alumn", "alumn"]
+    assert tokenize("¿Qué es UbD?") == ["ubd"]
+
+
+def test_bm25_prefers_exact_terms(tmp_path):
+    rows = [
+        ("a", "El diseño inverso de Wiggins y McTighe (UbD) parte de los resultados."),
+        ("b", "La evaluación formativa acompaña el aprendizaje de los estudiantes."),
+        ("c", "Los estudiantes usan ChatGPT para estudiar y para evaluar."),
+    ]
+    build_lexical_index(rows, {"index_version": "v1"}, index_dir=tmp_path / "bm25")
+    index = load_lexical_index(tmp_path / "bm25")
+
+    assert [cid for cid, _ in index.search("¿Qué propone UbD?", k=3)] == ["a"]
+    assert index.search("estudiantes", k=3)[0][0] in ("b", "c")
+    assert index.search("término inexistente", k=3) == []
+    assert load_lexical_index(tmp_path / "nada") is None
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"]], rrf_k=60)
+    assert fused[0] == "c"
+    assert set(fused) == {"a", "b", "c", "d"}
@@ -0,0 +1,204 @@
+# backend/tests/test_llm_client.py
+import asyncio
+import time
+
+import pytest
+
+from backend.bench.fake_openai import start_fake_server
+from backend.llm_client import CircuitBreaker, LLMUnavailable, ResilientChat
+
+MESSAGES = [{"role": "user", "content": "¿Qué es la evaluación formativa?"}]
+
+
+@pytest.fixture
+def fake_server():
+    servers = []
+
+    def start(**config):
+        server, base_url = start_fake_server(**config)
+        servers.append(server)
+        return server, base_url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def _llm(base_url: str, model: str):
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(model=model, api_key="test", base_url=base_url, max_retries=0)
+
+
+def _run_all(client, n):
+    """n llamadas seguidas en un mismo event loop (el pool httpx de LangChain queda ligado a él)."""
+    async def main():
+        return [await client.ainvoke(MESSAGES) for _ in range(n)]
+
+    return asyncio.run(main())
+
+
+def _client(base_url: str, fallback: bool = False, **options) -> ResilientChat:
+    primary, backup = _llm(base_url, "principal"), _llm(base_url, "respaldo")
+    options = {"retry_base_ms": 5, "retry_max_ms": 20, "hedge": False, **options}
+    return ResilientChat(lambda: primary, (lambda: backup) if fallback else None,
+                         primary_model="principal", fallback_model="respaldo", **options)
+
+
+def test_retries_transient_errors_with_backoff(fake_server):
+    # seed=11: las dos primeras llamadas reciben 503 y la tercera responde
+    server, base_url = fake_server(fail_rate=0.8, fail_status=503, seed=11)
+    result = asyncio.run(_client(base_url, max_retries=2).ainvoke(MESSAGES))
+
+    assert result.ok and result.text
+    assert (result.attempts, result.model) == (3, "principal")
+    assert result.usage["total_tokens"] > 0
+    assert server.config.counters["failures"] == 2
+
+
+def test_fallback_model_and_circuit_breaker(fake_server):
+    _, base_url = fake_server(down_models=("principal",))
+    client = _client(base_url, fallback=True, max_retries=1, breaker_failures=2)
+
+    first, second = _run_all(client, 2)
+    assert first.ok and first.fallback and first.model == "respaldo"
+    assert first.attempts == 3   # 2 intentos al principal (abren el circuito) + respaldo
+
+    # Circuito abierto: el principal ya no se llama
+    assert second.ok and second.attempts == 1 and second.model == "respaldo"
+    assert client.stats()["circuit_rejections"] == 1
+    assert client.stats()["primary_circuit_open"] == 1
+
+    # Sin respaldo el error vuelve estructurado, no como texto de la respuesta
+    failed = asyncio.run(_client(base_url, max_retries=1).ainvoke(MESSAGES))
+    assert not failed.ok and failed.text == ""
+    assert failed.error_info()["kind"] == "server" and failed.error_info()["attempts"] == 2
+
+
+def test_hedged_request_cuts_slow_tail(fake_server):
+    # seed=1 con slow_rate=0.5: la primera llamada es lenta y el duplicado no
+    server, base_url = fake_server(latency_ms=20, slow_rate=0.5, slow_ms=3000, seed=1)
+    client = _client(base_url, hedge=True, hedge_min_ms=100, hedge_min_samples=5)
+    client.targets[0].latency.samples.extend([0.05] * 10)
+
+    result = asyncio.run(client.ainvoke(MESSAGES))
+    assert result.ok and result.hedged
+    assert result.latency_ms < 1500
+    assert client.stats()["hedges"] == 1 and client.stats()["hedge_wins"] == 1
+    assert server.config.counters["slow"] == 1
+
+
+def test_deadline_and_streaming(fake_server):
+    _, slow_url = fake_server(latency_ms=1500)
+    result = asyncio.run(_client(slow_url, deadline_s=0.3).ainvoke(MESSAGES))
+    assert result.error == "timeout" and result.latency_ms < 1000
+
+    _, base_url = fake_server(down_models=("principal",))
+
+    async def collect(client):
+        return "".join([chunk.content async for chunk in client.astream(MESSAGES)])
+
+    assert asyncio.run(collect(_client(base_url, fallback=True, max_retries=0))).strip()
+    with pytest.raises(LLMUnavailable) as excinfo:
+        asyncio.run(collect(_client(base_url, max_retries=0)))
+    assert excinfo.value.result.error == "server"
+
+    # Versión síncrona (pipeline sync): misma lógica sobre llm.invoke
+    assert _client(base_url, fallback=True, max_retries=0).invoke(MESSAGES).model == "respaldo"
+
+
+def test_circuit_breaker_half_open_probe():
+    now = [0.0]
+    breaker = CircuitBreaker(failures=2, cooldown_s=10, clock=lambda: now[0])
+    breaker.failure()
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    now[0] = 11
+    assert breaker.allow()        # una sola llamada de prueba
+    assert not breaker.allow()
+    breaker.failure()             # la prueba falla: vuelve a abrirse
+    assert breaker.state == "open" and not breaker.allow()
+
+    now[0] = 22
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_sync_invoke_honours_deadline(fake_server):
+    _, slow_url = fake_server(latency_ms=3000)
+    t0 = time.perf_counter()
+    result = _client(slow_url, deadline_s=0.5).invoke(MESSAGES)
+    elapsed = time.perf_counter() - t0
+
+    # No espera a que termine el hilo del intento abandonado
+    assert result.error == "timeout" and elapsed < 1.5
+
+
+class ScriptedLLM:
+    """Modelo de juguete: cada llamada hace lo siguiente del guion."""
+
+    def __init__(self, *steps):
+        self.steps = list(steps)
+
+    async def ainvoke(self, messages):
+        step = self.steps.pop(0)
+        if step == "hang":
+            await asyncio.sleep(60)
+        if isinstance(step, BaseException):
+            raise step
+        return {"content": step}
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def test_unresolved_probe_does_not_lock_the_circuit():
+    llm = ScriptedLLM(StatusError(503), StatusError(400), "hang", "ok")
+    client = ResilientChat(lambda: llm, primary_model="principal", max_retries=0, hedge=False,
+                           breaker_failures=1, breaker_cooldown_s=0)
+    breaker = client.targets[0].breaker
+
+    async def main():
+        assert (await client.ainvoke(MESSAGES)).error == "server"       # abre el circuito
+        assert (await client.ainvoke(MESSAGES)).error == "client"       # prueba sin veredicto
+        assert breaker.state == "half_open" and not breaker._probing
+
+        probe = asyncio.create_task(client.ainvoke(MESSAGES))           # prueba cancelada
+        await asyncio.sleep(0.05)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert breaker.state == "half_open" and not breaker._probing
+
+        return await client.ainvoke(MESSAGES)
+
+    result = asyncio.run(main())
+    assert result.ok and result.text == "ok" and breaker.state == "closed"
+
+
+def test_client_errors_fall_back_instead_of_escaping():
+    def broken():
+        raise RuntimeError("falta OPENAI_API_KEY")
+
+    backup = ScriptedLLM("respaldo", "respaldo")
+    client = ResilientChat(broken, lambda: backup, primary_model="principal", fallback_model="respaldo",
+                           max_retries=2, hedge=False)
+    result = asyncio.run(client.ainvoke(MESSAGES))
+    assert result.ok and result.fallback and result.text == "respaldo"
+    assert result.attempts == 2   # el error no reintentable no gasta los reintentos
+
+    # Modelo inexistente (404): pasa al respaldo en vez de terminar la llamada
+    primary = ScriptedLLM(StatusError(404))
+    client = ResilientChat(lambda: primary, lambda: backup, primary_model="principal", fallback_model="respaldo",
+                           max_retries=2, hedge=False)
+    assert asyncio.run(client.ainvoke(MESSAGES)).model == "respaldo"
+
+    # Sin respaldo el fallo vuelve como LLMResult, no como excepción
+    failed = asyncio.run(ResilientChat(broken, max_retries=0, hedge=False).ainvoke(MESSAGES))
+    assert failed.error == "client" and "OPENAI_API_KEY" in failed.detail
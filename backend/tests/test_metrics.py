@@ -0,0 +1,24 @@
+# backend/tests/test_metrics.py
+from backend.metrics import Counter, Histogram
+
+
+def test_histogram_renders_cumulative_buckets():
+    h = Histogram("t_seconds", "test", (0.1, 1.0), ("stage",))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        h.observe(value, "retrieve")
+
+    text = "\n".join(h.render())
+
+    assert 't_seconds_bucket{stage="retrieve",le="0.1"} 1' in text
+    assert 't_seconds_bucket{stage="retrieve",le="1"} 3' in text
+    assert 't_seconds_bucket{stage="retrieve",le="+Inf"} 4' in text
+    assert 't_seconds_count{stage="retrieve"} 4' in text
+    assert 't_seconds_sum{stage="retrieve"} 4.25' in text
+
+
+def test_counter_escapes_labels():
+    c = Counter("t_total", "test", ("result",))
+    c.inc('hit"x')
+    c.inc('hit"x', amount=2)
+
+    assert 't_total{result="hit\\"x"} 3' in c.render()
@@ -0,0 +1,133 @@
+# backend/tests/test_onnx_embeddings.py
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from backend.onnx_embeddings import MicroBatcher, OnnxEmbeddingEngine, OnnxEmbeddings, mean_pool_normalize
+
+DIM = 8
+TABLE = np.random.default_rng(0).standard_normal((100, DIM)).astype(np.float32)
+
+
+class _FakeTokenizer:
+    """Una "palabra" = un token; padding con id 0 como tokenizers."""
+
+    def enable_truncation(self, max_length):
+        self.max_length = max_length
+
+    def enable_padding(self):
+        pass
+
+    def encode_batch(self, texts):
+        ids = [[1 + sum(map(ord, w)) % 99 for w in t.split()][: self.max_length] for t in texts]
+        width = max(len(i) for i in ids)
+        return [
+            SimpleNamespace(ids=i + [0] * (width - len(i)), attention_mask=[1] * len(i) + [0] * (width - len(i)),
+                            type_ids=[0] * width)
+            for i in ids
+        ]
+
+
+class _FakeSession:
+    """last_hidden_state = fila de TABLE por token (el padding también produce valores)."""
+
+    def get_inputs(self):
+        return [SimpleNamespace(name=n) for n in ("input_ids", "attention_mask", "token_type_ids")]
+
+    def get_outputs(self):
+        return [SimpleNamespace(name="last_hidden_state")]
+
+    def run(self, names, feeds):
+        return [TABLE[feeds["input_ids"]]]
+
+
+def _engine():
+    return OnnxEmbeddingEngine(session=_FakeSession(), tokenizer=_FakeTokenizer(), max_seq_length=16)
+
+
+def test_mean_pool_ignores_padding():
+    hidden = np.array([[[1.0, 0.0], [3.0, 0.0], [100.0, 100.0]]], dtype=np.float32)
+    pooled = mean_pool_normalize(hidden, np.array([[1, 1, 0]]))
+    assert np.allclose(pooled, [[1.0, 0.0]])
+
+
+def test_batched_vectors_match_single_encodes():
+    engine = _engine()
+    texts = ["rúbrica de evaluación formativa", "ia", "planificación inversa de una unidad didáctica larga"]
+
+    batched = engine.encode_documents(texts, batch_size=2)
+    single = np.vstack([engine.encode([t]) for t in texts])
+
+    assert np.allclose(batched, single, atol=1e-6)
+    assert np.allclose(np.linalg.norm(batched, axis=1), 1.0)
+
+
+def test_microbatcher_groups_concurrent_queries():
+    calls = []
+    started, release = threading.Event(), threading.Event()
+
+    def encode_batch(texts):
+        calls.append(list(texts))
+        started.set()
+        release.wait(1)
+        return [np.array([len(t)], dtype=np.float32) for t in texts]
+
+    batcher = MicroBatcher(encode_batch, max_batch=16, max_wait_ms=0)
+    first = batcher.submit("a")            # ocupa el hilo mientras llegan las demás
+    started.wait(1)
+    rest = [batcher.submit("x" * n) for n in range(2, 10)]
+    release.set()
+
+    assert first.result(1)[0] == 1
+    assert [f.result(1)[0] for f in rest] == list(range(2, 10))
+    assert len(calls) == 2 and len(calls[1]) == 8
+
+
+def test_microbatcher_propagates_errors():
+    def boom(texts):
+        raise RuntimeError("modelo roto")
+
+    with pytest.raises(RuntimeError, match="modelo roto"):
+        MicroBatcher(boom).encode("hola")
+
+
+def test_query_and_document_paths_agree():
+    embeddings = OnnxEmbeddings(_engine())
+    assert np.allclose(embeddings.embed_query("clima de aula"), embeddings.embed_documents(["clima de aula"])[0])
+
+
+def test_parity_with_sentence_transformers():
+    """Con el modelo real disponible (HF_EMBEDDINGS_DIR o caché del Hub): coseno >= 0.99 con PyTorch."""
+    sentence_transformers = pytest.importorskip("sentence_transformers")
+    try:
+        engine = OnnxEmbeddingEngine()
+    except Exception as e:
+        pytest.skip(f"modelo ONNX no disponible: {e}")
+    texts = ["La evaluación formativa usa rúbricas claras.", "Chatbots educativos en secundaria", "UbD"]
+
+    reference = sentence_transformers.SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2").encode(
+        texts, normalize_embeddings=True
+    )
+    cosine = (engine.encode(texts) * reference).sum(axis=1)
+    assert cosine.min() >= 0.99
+
+
+def test_cache_key_depends_on_backend_and_weights(monkeypatch):
+    from backend import llm_loader, onnx_embeddings
+
+    monkeypatch.setattr(onnx_embeddings, "get_onnx_embeddings", lambda: OnnxEmbeddings(_engine()))
+    monkeypatch.setattr(llm_loader, "HF_EMBEDDINGS_BACKEND", "onnx")
+    ids = set()
+    for quantized in (True, False):
+        monkeypatch.setattr(onnx_embeddings, "HF_EMBEDDINGS_QUANTIZED", quantized)
+        embeddings = llm_loader.get_embeddings("hf", cached=True)
+        assert embeddings.model == llm_loader.embeddings_model_id("hf")
+        ids.add(embeddings.model)
+    monkeypatch.setattr(llm_loader, "HF_EMBEDDINGS_BACKEND", "torch")
+    ids.add(llm_loader.embeddings_model_id("hf"))
+
+    # PyTorch fp32, ONNX fp32 e int8: tres espacios de caché (y de manifiesto) distintos
+    assert len(ids) == 3
+    assert all(i.startswith(llm_loader.HF_EMBEDDINGS_MODEL) for i in ids)
@@ -0,0 +1,192 @@
+# backend/tests/test_query_router.py
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from backend import query_router
+from backend.lexical_index import build_lexical_index, load_lexical_index
+from backend.query_router import QueryRouter, corpus_anchor_terms, match_rules
+
+CORPUS = [
+    ("c1", "La evaluación formativa con inteligencia artificial ofrece retroalimentación inmediata."),
+    ("c2", "El diseño inverso de Wiggins y McTighe parte de los resultados de aprendizaje."),
+    ("c3", "Los chatbots educativos apoyan a los alumnos con la inteligencia artificial."),
+]
+
+
+def _lexical(tmp_path):
+    build_lexical_index(CORPUS, {}, index_dir=tmp_path / "bm25")
+    return load_lexical_index(tmp_path / "bm25")
+
+
+def _use_index(monkeypatch, index):
+    monkeypatch.setattr(query_router.registry, "_lexical_index", index)
+    monkeypatch.setattr(query_router.registry, "_lexical_loaded", True)
+
+
+class TopicEmbeddings:
+    """Embeddings "multilingües" de juguete: el eje 0 es el tema del corpus, en cualquier idioma."""
+
+    TOPIC = {"ia", "ai", "inteligencia", "aula", "classroom", "alumnos", "students", "diseno", "design"}
+
+    def _vector(self, text):
+        return [1.0, 0.1] if set(query_router.normalize(text).split()) & self.TOPIC else [0.0, 1.0]
+
+    async def aembed_query(self, text):
+        return self._vector(text)
+
+
+class FakeVectorStore:
+    """Devuelve (doc, distancia l2 al cuadrado) como NumpyVectorStore y Chroma."""
+
+    def __init__(self, texts, embeddings):
+        self.vectors = [(t, embeddings._vector(t)) for t in texts]
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4):
+        def cos(a, b):
+            dot = sum(x * y for x, y in zip(a, b))
+            return dot / (sum(x * x for x in a) ** 0.5 * sum(y * y for y in b) ** 0.5)
+
+        scored = sorted(((t, 2.0 - 2.0 * cos(v, embedding)) for t, v in self.vectors), key=lambda x: x[1])
+        return scored[:k]
+
+
+def _use_vectors(monkeypatch, texts):
+    embeddings = TopicEmbeddings()
+    monkeypatch.setattr(query_router.registry, "_embeddings", embeddings)
+    monkeypatch.setattr(query_router.registry, "_vectordb", FakeVectorStore(texts, embeddings))
+
+
+def test_rules_match_whole_trivial_messages():
+    assert match_rules("¡Hola, Zoltar!").intent == "greeting"
+    assert match_rules("Buenas tardes, ¿qué tal?").intent == "greeting"
+    assert match_rules("Muchas gracias por la ayuda 🙏").intent == "thanks"
+    assert match_rules("ok").intent == "ack"
+    assert match_rules("¿Quién eres?").intent == "identity"
+    assert match_rules("hola").reply
+    # Un saludo seguido de una pregunta real no es trivial
+    assert match_rules("hola, ¿qué es la evaluación formativa?") is None
+    assert match_rules("gracias, ¿y el diseño inverso?") is None
+
+
+def test_off_corpus_questions_skip_retrieval(tmp_path, monkeypatch):
+    index = _lexical(tmp_path)
+    # "inteligencia" está en 2 de 3 fragmentos: con max_df=0.5 no ancla
+    assert corpus_anchor_terms("¿inteligencia?", index, max_df=0.5) == []
+    assert corpus_anchor_terms("evaluación formativa", index) == ["evaluacion", "formativ"]
+    assert corpus_anchor_terms("lo que sea", None) is None
+
+    _use_index(monkeypatch, index)
+    _use_vectors(monkeypatch, [text for _, text in CORPUS])
+    router = QueryRouter(use_embeddings=False)
+
+    async def main():
+        return [
+            await router.aroute("¿Cuál es la capital de Australia?"),
+            await router.aroute("¿Cómo aplico el diseño inverso?"),
+            await router.aroute("¿Cuál es la capital de Australia?", allow_simple=False),
+            await router.aroute("hola"),
+        ]
+
+    off, grounded, teacher, greeting = asyncio.run(main())
+    assert off.route == "simple"
+    assert grounded.route == "rag"
+    assert teacher.route == "rag"   # el oráculo docente no responde sin documentos
+    assert greeting.route == "canned"
+    assert router.stats()["routed_rag"] == 2
+
+
+def test_spanish_questions_over_english_corpus_stay_in_rag(tmp_path, monkeypatch):
+    english = [
+        ("e1", "Risks of using AI in the classroom include bias and over-reliance."),
+        ("e2", "Teachers can use AI with students to give formative feedback."),
+        ("e3", "Backward design starts from the desired learning outcomes."),
+    ]
+    build_lexical_index(english, {}, index_dir=tmp_path / "bm25")
+    _use_index(monkeypatch, load_lexical_index(tmp_path / "bm25"))
+    _use_vectors(monkeypatch, [text for _, text in english])
+    router = QueryRouter(use_embeddings=False)
+    questions = ["¿Qué riesgos tiene la IA en el aula?", "¿Cómo puedo usar la IA con mis alumnos?"]
+
+    async def main():
+        return [await router.aroute(q) for q in questions] + [await router.aroute("¿Quién ganó el mundial de 1998?")]
+
+    *grounded, off = asyncio.run(main())
+    for question, decision in zip(questions, grounded):
+        # Ningún término BM25 en común con el corpus en inglés...
+        assert corpus_anchor_terms(question, query_router.registry.lexical_index) == []
+        # ...pero la similitud vectorial los mantiene en RAG
+        assert decision.route == "rag" and decision.scores["corpus"] > 0.9
+    assert off.route == "simple" and off.scores["corpus"] < 0.2
+
+
+def test_embedding_classifier_routes_smalltalk(monkeypatch):
+    _use_index(monkeypatch, None)
+
+    class FakeEmbeddings:
+        # Dimensión por intención: los ejemplos de cada una apuntan a su eje
+        axes = {label: i for i, label in enumerate(query_router.EXAMPLES)}
+
+        def _vector(self, text):
+            for label, examples in query_router.EXAMPLES.items():
+                if text in examples or text.startswith(label):
+                    v = [0.0, 0.0, 0.0]
+                    v[self.axes[label]] = 1.0
+                    return v
+            return [0.5, 0.5, 0.7]
+
+        async def aembed_documents(self, texts):
+            return [self._vector(t) for t in texts]
+
+        async def aembed_query(self, text):
+            return self._vector(text)
+
+    monkeypatch.setattr(query_router.registry, "_embeddings", FakeEmbeddings())
+    router = QueryRouter(use_embeddings=True, margin=0.05)
+
+    async def main():
+        return [
+            await router.aroute("smalltalk: ¿te gusta la música?"),
+            await router.aroute("offtopic: receta de paella"),
+            await router.aroute("offtopic: receta de paella", allow_simple=False),
+            await router.aroute("corpus: rúbricas"),
+        ]
+
+    short, off, teacher, grounded = asyncio.run(main())
+    assert (short.route, short.intent) == ("short", "smalltalk")
+    assert off.route == "simple"
+    assert teacher.route == "rag"
+    assert grounded.route == "rag" and grounded.scores["corpus"] == 1.0
+
+
+def test_answer_endpoint_follows_route(tmp_path, monkeypatch):
+    from backend.app import app
+    from backend.routes import answer
+
+    _use_index(monkeypatch, _lexical(tmp_path))
+    _use_vectors(monkeypatch, [text for _, text in CORPUS])
+    monkeypatch.setattr(answer, "query_router", QueryRouter(use_embeddings=False))
+    calls = []
+
+    async def fake_simple(conversation, system_prompt=""):
+        calls.append("simple")
+        return {"text": "directo", "timings": {"llm_ms": 1.0}}
+
+    async def fake_rag(question, system_prompt, k, allow_fallback):
+        calls.append("rag")
+        return {"text": "con documentos", "timings": {"retrieve_ms": 1.0}}
+
+    monkeypatch.setattr(answer, "achatbot_simple", fake_simple)
+    monkeypatch.setattr(answer, "aanswer_with_rag", fake_rag)
+
+    client = TestClient(app)
+    greeting = client.post("/api/answer", json={"text": "¡Hola!"}).json()
+    assert greeting["route"] == "canned" and "Zoltar" in greeting["text"]
+    assert calls == []
+
+    assert client.post("/api/answer", json={"text": "¿Quién ganó el partido?"}).json()["text"] == "directo"
+    assert client.post("/api/answer", json={"text": "evaluación formativa"}).json()["route"] == "rag"
+    assert calls == ["simple", "rag"]
+
+    stream = client.post("/api/answer/stream", json={"text": "gracias"})
+    assert "event: token" in stream.text and '"route": "canned"' in stream.text
@@ -0,0 +1,92 @@
+# backend/tests/test_rerank.py
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from backend.rerank import CosineScorer, CrossEncoderScorer, OnnxCrossEncoder, Reranker, adaptive_cutoff
+
+
+def _doc(cid: str, text: str = ""):
+    return SimpleNamespace(page_content=text or cid, metadata={"chunk_id": cid}, id=cid)
+
+
+class _FakeNumpyStore:
+    """Lo que usa stored_vectors del NumpyVectorStore: rows_for_ids + vectors."""
+
+    def __init__(self, vectors):
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        self.ids = [f"c{i}" for i in range(len(vectors))]
+
+    def rows_for_ids(self, ids):
+        return [self.ids.index(cid) if cid in self.ids else None for cid in ids]
+
+
+def test_adaptive_cutoff_keeps_blocks_before_the_largest_drop():
+    assert adaptive_cutoff([0.9, 0.88, 0.86, 0.4, 0.38, 0.1], k=5, min_keep=2) == 3
+    # Sin un salto claro se conservan k
+    assert adaptive_cutoff([0.9, 0.8, 0.7, 0.6, 0.5, 0.4], k=4, min_keep=2) == 4
+    # Nunca menos de min_keep aunque el salto esté antes
+    assert adaptive_cutoff([0.9, 0.1, 0.09, 0.08], k=4, min_keep=2) == 2
+    assert adaptive_cutoff([0.5, 0.5, 0.5], k=2) == 2
+
+
+def test_cosine_rerank_reorders_and_trims():
+    query = np.array([1.0, 0.0])
+    store = _FakeNumpyStore([[0.2, 1.0], [1.0, 0.05], [0.95, 0.1], [0.0, 1.0]])
+    docs = [_doc(f"c{i}") for i in range(4)]
+    reranker = Reranker(CosineScorer(), budget_ms=1000, min_keep=1, gap_ratio=0.25)
+
+    out = reranker.rerank("q", query, docs, store, k=3)
+    assert [d.id for d in out] == ["c1", "c2"]
+    assert reranker.stats()["reranked"] == 1
+
+    # Fragmento sin vector guardado: la etapa se salta y se conserva el orden
+    out = reranker.rerank("q", query, docs + [_doc("nuevo")], store, k=3)
+    assert [d.id for d in out] == ["c0", "c1", "c2"]
+    assert reranker.stats()["skipped_missing"] == 1
+
+
+def test_rerank_skipped_when_over_budget():
+    class SlowScorer:
+        name = "slow"
+
+        def score(self, question, embedding, docs, vectordb):
+            time.sleep(0.02)
+            return np.arange(len(docs), dtype=np.float32)   # invierte el orden
+
+    docs = [_doc(f"c{i}") for i in range(4)]
+    reranker = Reranker(SlowScorer(), budget_ms=10, min_keep=4)
+    assert [d.id for d in reranker.rerank("q", [1.0], docs, None, k=4)] == ["c3", "c2", "c1", "c0"]
+
+    # Ya medido: ~5 ms por candidato × 4 > 10 ms -> se salta
+    assert [d.id for d in reranker.rerank("q", [1.0], docs, None, k=2)] == ["c0", "c1"]
+    assert reranker.stats()["skipped_budget"] == 1
+
+
+def test_cross_encoder_scores_pairs():
+    class FakeTokenizer:
+        def enable_truncation(self, max_length):
+            pass
+
+        def enable_padding(self):
+            pass
+
+        def encode_batch(self, pairs):
+            # Un token por palabra del fragmento que también está en la pregunta
+            rows = [[1] * sum(w in q.split() for w in text.split()) or [0] for q, text in pairs]
+            width = max(len(r) for r in rows)
+            return [SimpleNamespace(ids=r + [0] * (width - len(r)), attention_mask=[1] * width, type_ids=[0] * width)
+                    for r in rows]
+
+    class FakeSession:
+        def get_inputs(self):
+            return [SimpleNamespace(name=n) for n in ("input_ids", "attention_mask")]
+
+        def run(self, names, feeds):
+            return [feeds["input_ids"].sum(axis=1, keepdims=True).astype(np.float32)]
+
+    scorer = CrossEncoderScorer(OnnxCrossEncoder(session=FakeSession(), tokenizer=FakeTokenizer()))
+    docs = [_doc("a", "nada que ver"), _doc("b", "evaluación formativa con ia"), _doc("c", "evaluación")]
+    scores = scorer.score("evaluación formativa ia", None, docs, None)
+    assert list(scores) == [0.0, 3.0, 1.0]
@@ -0,0 +1,57 @@
+# backend/tests/test_resources.py
+from fastapi.testclient import TestClient
+
+import backend.app as app_module
+from backend import index_versions
+from backend.index_versions import publish_version
+from backend.resources import ResourceRegistry
+
+
+def _registry(monkeypatch, tmp_path, builds):
+    monkeypatch.setattr(index_versions, "CHROMA_DIR", tmp_path)
+    publish_version("v1")
+    registry = ResourceRegistry()
+    registry._build_embeddings = lambda: object()
+    registry._build_chat_llm = lambda: object()
+    registry._build_vectordb = lambda embeddings, paths: builds["vectordb"]()
+    registry._load_lexical_index = lambda paths: None
+    return registry
+
+
+def test_reload_swaps_clients_and_keeps_old_ones_on_failure(monkeypatch, tmp_path):
+    builds = {"vectordb": object}
+    registry = _registry(monkeypatch, tmp_path, builds)
+    old = (registry.embeddings, registry.chat_llm, registry.vectordb)
+
+    assert registry.reload() is True
+    new = (registry.embeddings, registry.chat_llm, registry.vectordb)
+    assert all(a is not b for a, b in zip(old, new))
+
+    def broken():
+        raise RuntimeError("índice ilegible")
+
+    builds["vectordb"] = broken
+    assert registry.reload() is False
+    # Sigue sirviendo con los recursos anteriores (nada a medio intercambiar)
+    assert (registry.embeddings, registry.chat_llm, registry.vectordb) == new
+    assert registry.health()["ready"] is True
+
+
+def test_admin_reload_endpoint(monkeypatch, tmp_path):
+    builds = {"vectordb": object}
+    registry = _registry(monkeypatch, tmp_path, builds)
+    monkeypatch.setattr(app_module, "registry", registry)
+    client = TestClient(app_module.app)   # sin lifespan: no se calienta el registro real
+
+    monkeypatch.setattr(app_module, "ADMIN_TOKEN", "")
+    assert client.post("/admin/reload", headers={"X-Admin-Token": ""}).status_code == 404
+
+    monkeypatch.setattr(app_module, "ADMIN_TOKEN", "secreto")
+    assert client.post("/admin/reload", headers={"X-Admin-Token": "otro"}).status_code == 404
+    response = client.post("/admin/reload", headers={"X-Admin-Token": "secreto"})
+    assert response.status_code == 200 and response.json()["reloaded"] is True
+
+    builds["vectordb"] = lambda: 1 / 0
+    response = client.post("/admin/reload", headers={"X-Admin-Token": "secreto"})
+    assert response.status_code == 500 and response.json()["reloaded"] is False
+    assert response.json()["components"]["vectordb"] == "ok"   # el anterior sigue cargado
@@ -0,0 +1,104 @@
+# backend/tests/test_scheduler.py
+import asyncio
+
+import httpx
+import pytest
+
+from backend.bench.fake_openai import start_fake_server
+from backend.scheduler import (
+    OutboundScheduler,
+    current_priority,
+    estimate_request,
+    event_hooks,
+    parse_reset,
+    priority,
+)
+
+
+def test_interactive_jumps_ahead_of_queued_ingest():
+    sched = OutboundScheduler(rpm=600, tpm=1_000_000, reserve=0.0)
+    sched._limits("m").requests.level = 0   # cubo vacío: 1 request cada 0,1 s
+    order = []
+
+    async def call(prio):
+        await sched.aacquire("m", 10, prio)
+        order.append(prio)
+
+    async def main():
+        ingest = asyncio.create_task(call("ingest"))
+        await asyncio.sleep(0.01)
+        await asyncio.gather(call("interactive"), ingest)
+
+    asyncio.run(main())
+    assert order == ["interactive", "ingest"]
+    stats = sched.stats()
+    assert stats["granted_interactive"] == stats["granted_ingest"] == 1
+    assert stats["max_wait_ms_ingest"] > stats["max_wait_ms_interactive"] > 0
+
+
+def test_reserve_is_left_for_interactive_traffic():
+    now = [0.0]
+    sched = OutboundScheduler(rpm=100, tpm=1_000_000, reserve=0.2, clock=lambda: now[0])
+    sched._limits("m").requests.level = 15   # por debajo de la reserva (20)
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(sched.aacquire("m", 10, "ingest"), 0.2)
+        assert await sched.aacquire("m", 10, "bulk") == 0   # respeta solo la mitad (10)
+        assert await sched.aacquire("m", 10, "interactive") == 0
+
+    asyncio.run(main())
+    stats = sched.stats()
+    assert stats["queued_ingest"] == 0 and stats["granted_ingest"] == 0   # cancelada, sale de la cola
+    assert sched._limits("m").requests.level == 13
+
+
+def test_headers_adapt_buckets_and_429_pauses_model():
+    now = [100.0]
+    sched = OutboundScheduler(rpm=500, tpm=200_000, reserve=0.2, clock=lambda: now[0])
+    sched.observe_response("m", 200, {
+        "x-ratelimit-limit-requests": "50",
+        "x-ratelimit-remaining-requests": "3",
+        "x-ratelimit-limit-tokens": "40000",
+    })
+    limits = sched._limits("m")
+    assert (limits.requests.capacity, limits.requests.level) == (50, 3)
+    assert limits.tokens.capacity == 40000
+
+    sched.observe_response("m", 429, {"x-ratelimit-reset-requests": "1m0.5s", "x-ratelimit-reset-tokens": "20ms"})
+    assert limits.paused_until == pytest.approx(160.5)
+    assert sched.stats()["rate_limited"] == 1
+
+    assert parse_reset("6m0s") == 360 and parse_reset("20ms") == pytest.approx(0.02)
+    assert parse_reset("1.5") == 1.5 and parse_reset("") is None
+
+
+def test_priority_context_and_request_estimate():
+    assert current_priority() == "interactive"
+    with priority("bulk"):
+        assert current_priority() == "bulk"
+    assert current_priority() == "interactive"
+    with pytest.raises(ValueError):
+        priority("urgente").__enter__()
+
+    body = b'{"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "12345678"}], "max_tokens": 50}'
+    assert estimate_request("/v1/chat/completions", body) == ("gpt-4o-mini", 52)
+    assert estimate_request("/v1/embeddings", b'{"model": "e", "input": [[1, 2, 3], [4]]}') == ("e", 4)
+    assert estimate_request("/v1/models", b"") is None
+
+
+def test_httpx_hooks_follow_server_rate_limit_headers():
+    server, base_url = start_fake_server(rpm_limit=3)
+    sched = OutboundScheduler(rpm=500, tpm=1_000_000, reserve=0.0)
+    try:
+        with httpx.Client(event_hooks=event_hooks(sched)) as client:
+            for _ in range(2):
+                response = client.post(f"{base_url}/embeddings", json={"model": "e", "input": ["hola"]})
+                assert response.status_code == 200
+    finally:
+        server.shutdown()
+
+    # El cubo adopta el límite real de la clave y lo que queda en la ventana
+    limits = sched._limits("e")
+    assert limits.requests.capacity == 3 and limits.requests.level < 1.1
+    assert sched.stats()["granted_interactive"] == 2
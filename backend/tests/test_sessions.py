@@ -0,0 +1,109 @@
+# backend/tests/test_sessions.py
+import asyncio
+import threading
+import time
+
+from backend import sessions
+from backend.llm_client import LLMResult
+from backend.sessions import Session, SessionStore, render_history
+
+
+def test_session_store_roundtrip_and_ttl(tmp_path):
+    store = SessionStore(tmp_path / "sessions.sqlite3", memory_items=1, ttl_s=60, shared=False)
+    session = store.get("a")
+    assert session.empty
+    session.turns.append({"q": "hola", "a": "qué tal"})
+    store.save(session)
+    store.get("b")   # expulsa "a" de la memoria: se relee de SQLite
+
+    # Otro proceso sobre el mismo fichero ve la sesión
+    other = SessionStore(tmp_path / "sessions.sqlite3", ttl_s=60, shared=True)
+    assert store.get("a").turns == other.get("a").turns == [{"q": "hola", "a": "qué tal"}]
+
+    expired = SessionStore(tmp_path / "sessions.sqlite3", ttl_s=0.01, shared=True)
+    time.sleep(0.05)
+    assert expired.get("a").empty
+    assert expired.purge_expired() == 1
+
+    # Sin sesiones en este proceso ni fichero en disco, purgar no lo crea
+    unused = SessionStore(tmp_path / "otro.sqlite3", ttl_s=60)
+    assert unused.purge_expired() == 0 and not (tmp_path / "otro.sqlite3").exists()
+
+
+def test_app_purges_expired_sessions():
+    import backend.app as app_module
+
+    assert app_module._expiring_stores()["sessions"] == sessions.store.purge_expired
+
+
+def test_history_stays_bounded_with_rolling_summary(monkeypatch, tmp_path):
+    monkeypatch.setattr(sessions, "store", SessionStore(tmp_path / "sessions.sqlite3", shared=False))
+    monkeypatch.setattr(sessions, "SESSION_RECENT_TURNS", 2)
+    calls = []
+
+    async def fake_complete(messages):
+        calls.append(messages[-1]["content"])
+        return LLMResult(text=f"resumen {len(calls)}")
+
+    monkeypatch.setattr(sessions, "acomplete", fake_complete)
+
+    async def main():
+        for i in range(6):
+            await sessions.arecord_turn("s", f"pregunta {i}", f"respuesta {i} " + "palabra " * 2000)
+            await sessions.adrain()
+
+    asyncio.run(main())
+    session = sessions.store.get("s")
+    assert [t["q"] for t in session.turns] == ["pregunta 4", "pregunta 5"]
+    assert session.pending == []
+    assert session.summary == f"resumen {len(calls)}"
+    # Cada llamada de resumen parte del resumen anterior, no de todo el historial
+    assert "resumen 1" in calls[1] and "pregunta 0" not in calls[1]
+    # Turnos recortados: el historial no crece con respuestas largas
+    assert all(len(t["a"]) < 2000 for t in session.turns)
+    assert len(render_history(session)) < 4000
+
+
+def test_rewrite_falls_back_to_question(monkeypatch):
+    session = Session("s", turns=[{"q": "¿Qué es UbD?", "a": "Diseño inverso."}])
+
+    async def failing(messages):
+        return LLMResult(error="connection", detail="sin conexión")
+
+    async def rewriting(messages):
+        return LLMResult(text='"Diseño inverso (UbD) en educación primaria"')
+
+    monkeypatch.setattr(sessions, "acomplete", failing)
+    assert asyncio.run(sessions.arewrite_query(session, "¿y en primaria?")) == "¿y en primaria?"
+    # Sin historial no se llama al modelo
+    assert asyncio.run(sessions.arewrite_query(Session("nueva"), "¿y en primaria?")) == "¿y en primaria?"
+
+    monkeypatch.setattr(sessions, "acomplete", rewriting)
+    assert asyncio.run(sessions.arewrite_query(session, "¿y en primaria?")) == "Diseño inverso (UbD) en educación primaria"
+
+
+def test_concurrent_turns_across_workers_are_not_lost(tmp_path):
+    # Dos "workers" sobre el mismo fichero, escribiendo a la vez en la misma sesión
+    workers = [SessionStore(tmp_path / "sessions.sqlite3", ttl_s=60, shared=True) for _ in range(2)]
+
+    def add_turns(store, name):
+        for i in range(20):
+            def append(session):
+                time.sleep(0.002)   # ensancha la ventana entre leer y escribir
+                session.turns.append({"q": f"{name} {i}", "a": "r"})
+
+            store.update("s", append)
+
+    threads = [threading.Thread(target=add_turns, args=(store, f"w{n}")) for n, store in enumerate(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(workers[0].get("s").turns) == 40
+
+    async def main():
+        await workers[1].aupdate("s", lambda session: session.pending.append({"q": "p", "a": "r"}))
+        return await workers[0].aget("s")
+
+    assert asyncio.run(main()).pending == [{"q": "p", "a": "r"}]
@@ -0,0 +1,88 @@
+# backend/tests/test_shared_store.py
+import asyncio
+import time
+
+from backend import answer_cache as ac
+from backend import index_versions, resources
+from backend.answer_cache import AnswerCache
+from backend.index_versions import publish_version
+from backend.resources import ResourceRegistry
+from backend.shared_store import SqliteStore, apurge_periodically
+
+
+def test_sqlite_store_roundtrip_and_ttl(tmp_path):
+    store = SqliteStore(tmp_path / "shared.sqlite3", namespace="t")
+    store.set_many([("a", b"1"), ("b", b"2")])
+    store.set("c", b"3", ttl_s=0.05)
+
+    assert store.get_many(["a", "x", "b", "a"]) == [b"1", None, b"2", b"1"]
+    assert store.get("c") == b"3"
+    # Otro namespace sobre el mismo fichero no ve estas claves
+    assert SqliteStore(tmp_path / "shared.sqlite3", namespace="otro").get("a") is None
+
+    time.sleep(0.1)
+    assert store.get("c") is None
+    assert store.purge_expired() == 1
+
+
+def test_periodic_purge_deletes_expired_rows(tmp_path):
+    store = SqliteStore(tmp_path / "shared.sqlite3", namespace="t")
+    store.set("viva", b"1")
+    store.set("caduca", b"2", ttl_s=0.01)
+    calls = []
+
+    def broken():
+        calls.append("roto")
+        raise RuntimeError("disco lleno")
+
+    async def main():
+        task = asyncio.create_task(apurge_periodically({"roto": broken, "t": store.purge_expired}, 0.05))
+        await asyncio.sleep(0.12)
+        task.cancel()
+
+    asyncio.run(main())
+    # Un almacén que falla no impide purgar los demás, y se reintenta en cada vuelta
+    assert len(calls) >= 2
+    count = store._conn.execute("SELECT COUNT(*) FROM kv").fetchone()[0]
+    assert count == 1 and store.get("viva") == b"1"
+
+
+def test_answer_cache_shared_between_workers(monkeypatch, tmp_path):
+    monkeypatch.setattr(ac, "manifest_path", lambda: tmp_path / "manifest.json")
+    monkeypatch.setattr(ac, "pointer_path", lambda: tmp_path / "current.json")
+    path = tmp_path / "shared.sqlite3"
+    # Dos workers: memoria propia, mismo fichero compartido
+    worker_a = AnswerCache(ttl_s=60, store=SqliteStore(path, namespace="answers"))
+    worker_b = AnswerCache(ttl_s=60, store=SqliteStore(path, namespace="answers"))
+    scope = {"mode": "teacher", "k": 5}
+
+    worker_a.put("¿Qué es UbD?", scope, {"text": "respuesta", "sources": []}, embedding=[1.0, 0.0])
+    hit = worker_b.get("qué es  ubd", scope)
+    assert hit["text"] == "respuesta" and hit["cache"] == "exact"
+    assert worker_b.stats()["hits_shared"] == 1
+    # El acierto queda en la memoria de B: su nivel semántico ya lo conoce
+    assert worker_b.get("otra forma", scope, embedding=[0.99, 0.05])["cache"] == "semantic"
+
+
+def test_registry_swaps_to_published_index(monkeypatch, tmp_path):
+    monkeypatch.setattr(index_versions, "CHROMA_DIR", tmp_path)
+    monkeypatch.setattr(resources, "INDEX_WATCH_INTERVAL_S", 0.001)
+    publish_version("v1")
+
+    registry = ResourceRegistry()
+    opened = []
+    registry._build_embeddings = lambda: "embeddings"
+    registry._build_vectordb = lambda embeddings, paths: opened.append(paths.version) or object()
+    registry._load_lexical_index = lambda paths: None
+
+    first = registry.vectordb
+    assert registry.health()["index_version"] == "v1"
+    registry.refresh_index_if_stale()
+    assert registry.vectordb is first   # sin cambios publicados no se reabre nada
+
+    publish_version("v2")
+    time.sleep(0.01)
+    registry.refresh_index_if_stale()
+    assert registry.vectordb is not first
+    assert registry.health()["index_version"] == "v2"
+    assert opened == ["v1", "v2"]
@@ -0,0 +1,99 @@
+# backend/tests/test_singleflight.py
+import asyncio
+
+from backend.singleflight import SingleFlight, flight_key
+
+
+def test_key_normalizes_text():
+    assert flight_key("teacher", "¿Qué es UbD?", k=5) == flight_key("teacher", "qué es  ubd", k=5)
+    assert flight_key("teacher", "qué es ubd", k=5) != flight_key("teacher", "qué es ubd", k=6)
+
+
+def test_concurrent_calls_share_one_computation():
+    group = SingleFlight()
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return {"text": "respuesta"}
+
+    async def main():
+        return await asyncio.gather(*(group.do("k", compute) for _ in range(20)))
+
+    results = asyncio.run(main())
+    assert calls == 1
+    assert all(r["text"] == "respuesta" for r in results)
+    assert group.stats()["collapsed"] == 19
+    assert group.stats()["in_flight"] == 0
+
+
+def test_cancelled_waiter_does_not_cancel_others():
+    group = SingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.05)
+        return 42
+
+    async def main():
+        first = asyncio.create_task(group.do("k", compute))
+        second = asyncio.create_task(group.do("k", compute))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == 42
+
+
+def test_late_stream_joiner_replays_tokens():
+    group = SingleFlight()
+    produced = 0
+
+    async def events():
+        nonlocal produced
+        produced += 1
+        for word in ("Hola", " mundo"):
+            yield {"event": "token", "data": {"text": word}}
+            await asyncio.sleep(0.02)
+        yield {"event": "done", "data": {}}
+
+    async def consume(delay):
+        await asyncio.sleep(delay)
+        return [e async for e in group.stream("k", events)]
+
+    async def main():
+        return await asyncio.gather(consume(0), consume(0.03))
+
+    early, late = asyncio.run(main())
+    assert produced == 1
+    assert early == late
+    assert [e["event"] for e in late] == ["token", "token", "done"]
+    assert group.stats()["stream_collapsed"] == 1
+
+
+def test_teacher_calls_with_different_retrieval_queries_do_not_coalesce(monkeypatch):
+    from backend import rag_pipeline
+
+    calls = []
+
+    async def fake_teacher(question, history, k, retrieval_query):
+        calls.append(retrieval_query)
+        await asyncio.sleep(0.05)
+        return {"text": f"según {retrieval_query or question}"}
+
+    monkeypatch.setattr(rag_pipeline, "COALESCE_REQUESTS", True)
+    monkeypatch.setattr(rag_pipeline, "_achatbot_teacher", fake_teacher)
+
+    async def main():
+        ask = rag_pipeline.achatbot_teacher
+        return await asyncio.gather(
+            ask("¿y en primaria?", history="h", retrieval_query="UbD en primaria"),
+            ask("¿y en primaria?", history="h", retrieval_query="chatbots en primaria"),
+            ask("¿y en primaria?", history="h", retrieval_query="chatbots en primaria"),
+        )
+
+    first, second, third = asyncio.run(main())
+    assert first["text"] == "según UbD en primaria"
+    assert second["text"] == third["text"] == "según chatbots en primaria"
+    assert sorted(calls) == ["UbD en primaria", "chatbots en primaria"]
@@ -0,0 +1,22 @@
+# backend/tests/test_startup.py
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from backend.bench.importtime import DEFAULT_FORBIDDEN
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+
+
+def test_importing_app_is_light_and_touches_no_disk(tmp_path):
+    data_dir = tmp_path / "data"
+    code = "import sys, json, backend.app; print(json.dumps(sorted({m.split('.')[0] for m in sys.modules})))"
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT_DIR, capture_output=True, text=True, check=True,
+        env={"PATH": "", "DATA_DIR": str(data_dir), "PYTHONPATH": str(ROOT_DIR)},
+    )
+    loaded = set(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    assert not loaded & set(DEFAULT_FORBIDDEN)
+    assert not data_dir.exists()
@@ -0,0 +1,76 @@
+# backend/tests/test_vector_index.py
+import numpy as np
+from langchain_core.vectorstores.utils import maximal_marginal_relevance
+
+from backend.vector_index import NumpyVectorStore, mmr_select, normalize_rows, write_numpy_index
+
+
+def _build(tmp_path, n=40, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    rows = [(f"c{i}", f"texto {i}", {"chunk_id": f"c{i}", "page": i}, vectors[i]) for i in range(n)]
+    write_numpy_index(rows, {"index_version": "v1"}, index_dir=tmp_path / "npindex")
+    return NumpyVectorStore(tmp_path / "npindex"), normalize_rows(vectors), rng
+
+
+def test_top_k_matches_brute_force(tmp_path):
+    store, unit, rng = _build(tmp_path)
+    query = rng.normal(size=8)
+
+    docs = store.similarity_search_by_vector(query, k=5)
+    expected = np.argsort(-(unit @ normalize_rows(query[None, :])[0]))[:5]
+    assert [d.metadata["chunk_id"] for d in docs] == [f"c{i}" for i in expected]
+
+    # Distancia estilo Chroma "l2" (2 - 2·coseno) y relevancia en [0, 1]
+    relevance = store._select_relevance_score_fn()
+    scores = [relevance(d) for _, d in store.similarity_search_by_vector_with_relevance_scores(query, k=5)]
+    assert scores == sorted(scores, reverse=True)
+    assert all(0.0 <= s <= 1.0 for s in scores)
+
+
+def test_mmr_matches_langchain(tmp_path):
+    _, unit, rng = _build(tmp_path)
+    query = normalize_rows(rng.normal(size=(1, 8)))[0]
+
+    ours = mmr_select(query, unit, k=6, lambda_mult=0.5)
+    reference = maximal_marginal_relevance(query, list(unit), lambda_mult=0.5, k=6)
+    assert ours == reference
+
+
+def test_search_many_equals_single_queries(tmp_path):
+    store, _, rng = _build(tmp_path)
+    queries = rng.normal(size=(3, 8))
+
+    batched = store.search_many_by_vector(queries, k=4, fetch_k=12)
+    single = [store.max_marginal_relevance_search_by_vector(q, k=4, fetch_k=12) for q in queries]
+    assert [[d.id for d in r] for r in batched] == [[d.id for d in r] for r in single]
+
+
+def test_chroma_sidecar_mmr_matches_langchain(tmp_path):
+    from langchain_community.vectorstores import Chroma
+
+    from backend.retrieve import SidecarChroma
+    from backend.vector_index import IDS_NAME, load_chunk_matrix
+
+    _, unit, rng = _build(tmp_path)
+    plain = Chroma(collection_name="test", persist_directory=str(tmp_path / "chroma"))
+    plain._collection.add(
+        ids=[f"c{i}" for i in range(40)], embeddings=unit.tolist(),
+        documents=[f"texto {i}" for i in range(40)], metadatas=[{"chunk_id": f"c{i}"} for i in range(40)],
+    )
+    # Exportaciones anteriores sin ids.txt: los ids se leen de chunks.jsonl
+    (tmp_path / "npindex" / IDS_NAME).unlink()
+    sidecar = SidecarChroma(
+        collection_name="test", persist_directory=str(tmp_path / "chroma"), chunk_matrix=load_chunk_matrix(tmp_path / "npindex")
+    )
+
+    for _ in range(5):
+        query = rng.normal(size=8).tolist()
+        expected = plain.max_marginal_relevance_search_by_vector(query, k=4, fetch_k=12)
+        got = sidecar.max_marginal_relevance_search_by_vector(query, k=4, fetch_k=12)
+        assert {d.metadata["chunk_id"] for d in got} == {d.metadata["chunk_id"] for d in expected}
+
+    # Un candidato que no está en el sidecar: MMR de LangChain
+    plain._collection.add(ids=["nuevo"], embeddings=[unit[0].tolist()], documents=["nuevo"], metadatas=[{"chunk_id": "nuevo"}])
+    docs = sidecar.max_marginal_relevance_search_by_vector(unit[0].tolist(), k=2, fetch_k=4)
+    assert "nuevo" in {d.metadata["chunk_id"] for d in docs}
@@ -0,0 +1,361 @@
+# backend/vector_index.py
+"""
+Índice vectorial en proceso con NumPy (backend alternativo a Chroma).
+
+Formato en disco (NUMPY_INDEX_DIR, lo escribe ingest.py):
+- meta.json     -> {"count", "dim", "provider", "model", "index_version"}
+- vectors.f32   -> matriz float32 (count, dim) con filas normalizadas (L2=1),
+                   contigua y abierta con memmap (solo lectura)
+- chunks.jsonl  -> una línea por fila: {"id", "text", "metadata"}
+- ids.txt       -> solo los ids, una línea por fila (para abrir la matriz
+                   sin leer los textos)
+
+La búsqueda es un producto matriz-vector + top-k (argpartition), y MMR se
+calcula de forma vectorizada sobre la submatriz de candidatos. Al ser un
+VectorStore de LangChain, get_retriever / search_by_vector funcionan igual
+que con Chroma (mismos k / fetch_k / lambda_mult / score_threshold).
+
+Con el backend Chroma la misma matriz sirve de "sidecar" (ChunkMatrix):
+Chroma devuelve los fetch_k candidatos y MMR se calcula aquí con sus
+vectores, sin pedírselos a Chroma fila a fila (ver retrieve.SidecarChroma).
+"""
+
+import json
+import math
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from backend.config import NUMPY_INDEX_DIR
+
+META_NAME = "meta.json"
+VECTORS_NAME = "vectors.f32"
+CHUNKS_NAME = "chunks.jsonl"
+IDS_NAME = "ids.txt"
+
+
+# ========================================
+# Álgebra vectorizada
+# ========================================
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Normaliza cada fila a norma 1 (las filas nulas quedan en cero)."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Índices de los k mayores valores, ordenados de mayor a menor."""
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx])]
+
+
+def mmr_select(
+    query: np.ndarray,
+    candidates: np.ndarray,
+    k: int,
+    lambda_mult: float = 0.5,
+    query_sims: Optional[np.ndarray] = None,
+) -> List[int]:
+    """
+    Maximal Marginal Relevance sobre vectores normalizados (coseno = producto
+    punto). Misma regla que langchain maximal_marginal_relevance, pero con
+    la matriz de similitud entre candidatos calculada una sola vez.
+    Devuelve los índices (sobre candidates) en orden de selección.
+    """
+    n = candidates.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return []
+
+    if query_sims is None:
+        query_sims = candidates @ query
+    pairwise = candidates @ candidates.T
+
+    selected = [int(np.argmax(query_sims))]
+    # Máxima similitud de cada candidato con lo ya seleccionado
+    max_sim_selected = pairwise[selected[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+
+    while len(selected) < k:
+        scores = lambda_mult * query_sims - (1 - lambda_mult) * max_sim_selected
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_sim_selected, pairwise[best], out=max_sim_selected)
+    return selected
+
+
+# ========================================
+# Escritura (la usa ingest.py)
+# ========================================
+
+def write_numpy_index(
+    rows: Iterable[Tuple[str, str, Dict[str, Any], Sequence[float]]],
+    info: Dict[str, Any],
+    index_dir: Path = NUMPY_INDEX_DIR,
+) -> int:
+    """
+    Escribe el índice en streaming (sin cargar todo en memoria) en un
+    directorio temporal y lo mueve a index_dir al terminar.
+    rows: (id, texto, metadata, vector). Devuelve el número de filas.
+    """
+    index_dir = Path(index_dir)
+    tmp_dir = index_dir.with_name(index_dir.name + ".tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    count, dim = 0, None
+    with open(tmp_dir / VECTORS_NAME, "wb") as vf, \
+            open(tmp_dir / CHUNKS_NAME, "w", encoding="utf-8") as cf, \
+            open(tmp_dir / IDS_NAME, "w", encoding="utf-8") as idf:
+        for cid, text, metadata, vector in rows:
+            vec = normalize_rows(np.asarray(vector, dtype=np.float32)[None, :])[0]
+            if dim is None:
+                dim = vec.shape[0]
+            vf.write(vec.tobytes())
+            cf.write(json.dumps({"id": cid, "text": text, "metadata": metadata}, ensure_ascii=False) + "\n")
+            idf.write(cid + "\n")
+            count += 1
+
+    (tmp_dir / META_NAME).write_text(
+        json.dumps({**info, "count": count, "dim": dim or 0}, ensure_ascii=False, indent=2),
+        encoding="utf-8",
+    )
+
+    publish_dir(tmp_dir, index_dir)
+    return count
+
+
+def publish_dir(tmp_dir: Path, index_dir: Path) -> None:
+    """Sustituye index_dir por tmp_dir con renombrados (sin dejar un índice a medias)."""
+    if index_dir.exists():
+        old_dir = index_dir.with_name(index_dir.name + ".old")
+        if old_dir.exists():
+            shutil.rmtree(old_dir)
+        os.replace(index_dir, old_dir)
+        os.replace(tmp_dir, index_dir)
+        shutil.rmtree(old_dir)
+    else:
+        os.replace(tmp_dir, index_dir)
+
+
+def has_numpy_index(index_dir: Path = NUMPY_INDEX_DIR) -> bool:
+    index_dir = Path(index_dir)
+    return all((index_dir / name).exists() for name in (META_NAME, VECTORS_NAME, CHUNKS_NAME))
+
+
+def read_index_meta(index_dir: Path = NUMPY_INDEX_DIR) -> Optional[Dict[str, Any]]:
+    """meta.json del índice; None si no existe o está corrupto."""
+    try:
+        return json.loads((Path(index_dir) / META_NAME).read_text(encoding="utf-8"))
+    except Exception:
+        return None
+
+
+def iter_chunks(index_dir: Path = NUMPY_INDEX_DIR) -> Iterator[Dict[str, Any]]:
+    """Recorre chunks.jsonl en orden de fila."""
+    with open(Path(index_dir) / CHUNKS_NAME, encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def _open_vectors(index_dir: Path, meta: Dict[str, Any]) -> np.ndarray:
+    count, dim = int(meta["count"]), int(meta["dim"])
+    if not count:
+        return np.zeros((0, dim), dtype=np.float32)
+    return np.memmap(Path(index_dir) / VECTORS_NAME, dtype=np.float32, mode="r", shape=(count, dim))
+
+
+class ChunkMatrix:
+    """
+    Solo los vectores (memmap) y chunk_id -> fila: lo que necesita MMR sobre
+    los candidatos de otro backend. No carga textos ni metadatos.
+    """
+
+    def __init__(self, index_dir: Path = NUMPY_INDEX_DIR):
+        self.index_dir = Path(index_dir)
+        self.meta = json.loads((self.index_dir / META_NAME).read_text(encoding="utf-8"))
+        self.vectors = _open_vectors(self.index_dir, self.meta)
+        ids_path = self.index_dir / IDS_NAME
+        if ids_path.exists():
+            ids = ids_path.read_text(encoding="utf-8").splitlines()
+        else:   # exportado antes de ids.txt
+            ids = [chunk["id"] for chunk in iter_chunks(self.index_dir)]
+        self._row_by_id = {cid: i for i, cid in enumerate(ids)}
+
+    def __len__(self) -> int:
+        return len(self._row_by_id)
+
+    def rows_for_ids(self, ids: Sequence[str]) -> List[Optional[int]]:
+        return [self._row_by_id.get(cid) for cid in ids]
+
+
+def load_chunk_matrix(index_dir: Path = NUMPY_INDEX_DIR) -> Optional[ChunkMatrix]:
+    """ChunkMatrix del índice o None si no se exportó (o es ilegible)."""
+    if not has_numpy_index(index_dir):
+        return None
+    try:
+        return ChunkMatrix(index_dir)
+    except Exception as e:
+        print(f"[vector_index] ⚠️ Matriz de vectores ilegible en {index_dir}: {e}")
+        return None
+
+
+# ========================================
+# VectorStore
+# ========================================
+
+class NumpyVectorStore(VectorStore):
+    """VectorStore de solo lectura sobre un índice NumPy memory-mapped."""
+
+    def __init__(self, index_dir: Path = NUMPY_INDEX_DIR, embedding_function: Optional[Embeddings] = None):
+        self.index_dir = Path(index_dir)
+        self._embedding = embedding_function
+
+        self.meta = json.loads((self.index_dir / META_NAME).read_text(encoding="utf-8"))
+        self.vectors = _open_vectors(self.index_dir, self.meta)
+
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        for chunk in iter_chunks(self.index_dir):
+            self.ids.append(chunk["id"])
+            self.texts.append(chunk["text"])
+            self.metadatas.append(chunk["metadata"])
+        self._row_by_id = {cid: i for i, cid in enumerate(self.ids)}
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self._embedding
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _doc(self, row: int) -> Document:
+        return Document(page_content=self.texts[row], metadata=dict(self.metadatas[row]), id=self.ids[row])
+
+    def _query_vector(self, embedding: Sequence[float]) -> np.ndarray:
+        return normalize_rows(np.asarray(embedding, dtype=np.float32)[None, :])[0]
+
+    def rows_for_ids(self, ids: Sequence[str]) -> List[Optional[int]]:
+        return [self._row_by_id.get(cid) for cid in ids]
+
+    def get_by_ids(self, ids: Sequence[str], /) -> List[Document]:
+        return [self._doc(row) for row in self.rows_for_ids(ids) if row is not None]
+
+    # ---- Búsqueda por vector ----
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """
+        Devuelve (doc, distancia) igual que Chroma con su espacio por defecto
+        ("l2", distancia euclídea al cuadrado): sobre vectores unitarios,
+        d = 2 - 2·coseno. Así score_threshold significa lo mismo en ambos backends.
+        """
+        if not len(self):
+            return []
+        sims = self.vectors @ self._query_vector(embedding)
+        return [(self._doc(int(i)), 2.0 - 2.0 * float(sims[i])) for i in top_k(sims, k)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k)]
+
+    def max_marginal_relevance_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        **kwargs: Any,
+    ) -> List[Document]:
+        if not len(self):
+            return []
+        query = self._query_vector(embedding)
+        sims = self.vectors @ query
+        candidates = top_k(sims, fetch_k)
+        chosen = mmr_select(query, np.asarray(self.vectors[candidates]), k, lambda_mult, sims[candidates])
+        return [self._doc(int(candidates[i])) for i in chosen]
+
+    def search_many_by_vector(
+        self,
+        embeddings: Sequence[Sequence[float]],
+        k: int = 4,
+        use_mmr: bool = True,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        score_threshold: Optional[float] = None,
+    ) -> List[List[Document]]:
+        """
+        Búsqueda por lotes: un único producto de matrices (Q × N) para todas
+        las consultas; MMR se aplica después por consulta sobre sus candidatos.
+        score_threshold (relevancia mínima) solo aplica sin MMR, como en
+        retrieve.search_by_vector.
+        """
+        if not len(self) or not len(embeddings):
+            return [[] for _ in embeddings]
+        queries = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        sims = queries @ self.vectors.T
+        results = []
+        for q, row_sims in zip(queries, sims):
+            if use_mmr:
+                candidates = top_k(row_sims, fetch_k)
+                chosen = mmr_select(q, np.asarray(self.vectors[candidates]), k, lambda_mult, row_sims[candidates])
+                results.append([self._doc(int(candidates[i])) for i in chosen])
+            else:
+                relevance = self._select_relevance_score_fn()
+                results.append([
+                    self._doc(int(i)) for i in top_k(row_sims, k)
+                    if score_threshold is None or relevance(2.0 - 2.0 * float(row_sims[i])) >= score_threshold
+                ])
+        return results
+
+    # ---- Búsqueda por texto (requiere embedding_function) ----
+
+    def _embed(self, query: str) -> List[float]:
+        if self._embedding is None:
+            raise ValueError("NumpyVectorStore necesita embedding_function para buscar por texto")
+        return self._embedding.embed_query(query)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self._embed(query), k)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_relevance_scores(self._embed(query), k)
+
+    def _similarity_search_with_relevance_scores(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        relevance = self._select_relevance_score_fn()
+        return [(doc, relevance(d)) for doc, d in self.similarity_search_with_score(query, k)]
+
+    def max_marginal_relevance_search(
+        self, query: str, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5, **kwargs: Any
+    ) -> List[Document]:
+        return self.max_marginal_relevance_search_by_vector(self._embed(query), k, fetch_k, lambda_mult)
+
+    def _select_relevance_score_fn(self):
+        # Misma conversión distancia -> relevancia que Chroma (espacio "l2")
+        return lambda distance: 1.0 - distance / math.sqrt(2)
+
+    # ---- Solo lectura ----
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        raise NotImplementedError("NumpyVectorStore es de solo lectura; usa `python -m backend.ingest`")
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, **kwargs: Any):
+        raise NotImplementedError("NumpyVectorStore se construye con `python -m backend.ingest`")